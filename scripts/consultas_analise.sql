@@ -116,12 +116,47 @@ FROM HISTORICO2024;
 
 -- CONSULTA 12: Relatório de eficiência do sistema
 -- Análise da eficiência do sistema de irrigação
+-- Uma única leitura da tabela (agregação condicional) em vez de uma
+-- subconsulta escalar por coluna
 SELECT 
     'Resumo Executivo do Sistema de Irrigação' AS RELATORIO,
-    (SELECT COUNT(*) FROM HISTORICO2024) AS TOTAL_MEDICOES,
-    (SELECT COUNT(*) FROM HISTORICO2024 WHERE RELAY_STATUS = 1) AS TOTAL_ATIVACOES,
-    ROUND((SELECT COUNT(*) FROM HISTORICO2024 WHERE RELAY_STATUS = 1) * 100.0 / 
-          (SELECT COUNT(*) FROM HISTORICO2024), 2) AS PERCENTUAL_ATIVACAO,
-    (SELECT ROUND(AVG(UMIDADE_DHT), 2) FROM HISTORICO2024) AS UMIDADE_MEDIA_GERAL,
-    (SELECT COUNT(*) FROM HISTORICO2024 WHERE UMIDADE_BAIXA = 1) AS ALERTAS_UMIDADE_BAIXA
-FROM DUAL;
\ No newline at end of file
+    COUNT(*) AS TOTAL_MEDICOES,
+    SUM(CASE WHEN RELAY_STATUS = 1 THEN 1 ELSE 0 END) AS TOTAL_ATIVACOES,
+    ROUND(SUM(CASE WHEN RELAY_STATUS = 1 THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 2) AS PERCENTUAL_ATIVACAO,
+    ROUND(AVG(UMIDADE_DHT), 2) AS UMIDADE_MEDIA_GERAL,
+    SUM(CASE WHEN UMIDADE_BAIXA = 1 THEN 1 ELSE 0 END) AS ALERTAS_UMIDADE_BAIXA
+FROM HISTORICO2024;
+
+-- CONSULTA 13: Ciclos de irrigação por dispositivo
+-- A consulta 9 conta leituras com o relay ligado; aqui cada sequência de
+-- leituras seguidas com o relay ligado é um ciclo, que termina na primeira
+-- leitura com o relay desligado (ou na última leitura, se ainda ligado)
+WITH LEITURAS AS (
+    SELECT
+        DISPOSITIVO,
+        TIMESTAMP,
+        RELAY_STATUS,
+        LEAD(TIMESTAMP) OVER (PARTITION BY DISPOSITIVO ORDER BY TIMESTAMP) AS PROXIMO,
+        ROW_NUMBER() OVER (PARTITION BY DISPOSITIVO ORDER BY TIMESTAMP)
+            - ROW_NUMBER() OVER (PARTITION BY DISPOSITIVO, RELAY_STATUS ORDER BY TIMESTAMP) AS SEQUENCIA
+    FROM HISTORICO2024
+),
+CICLOS AS (
+    SELECT
+        DISPOSITIVO,
+        MIN(TIMESTAMP) AS INICIO,
+        MAX(COALESCE(PROXIMO, TIMESTAMP)) AS FIM,
+        COUNT(*) AS LEITURAS
+    FROM LEITURAS
+    WHERE RELAY_STATUS = 1
+    GROUP BY DISPOSITIVO, SEQUENCIA
+)
+SELECT 
+    DISPOSITIVO,
+    COUNT(*) AS TOTAL_CICLOS,
+    ROUND(SUM(FIM - INICIO) / 3600.0, 2) AS HORAS_LIGADO,
+    ROUND(AVG(FIM - INICIO) / 60.0, 1) AS DURACAO_MEDIA_MIN,
+    MAX(LEITURAS) AS MAIOR_CICLO_LEITURAS
+FROM CICLOS
+GROUP BY DISPOSITIVO
+ORDER BY DISPOSITIVO;
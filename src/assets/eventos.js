@@ -0,0 +1,33 @@
+// Eventos do servidor (SSE) para o dashboard Dash
+//
+// O servidor atualiza os períodos em uso uma única vez por ciclo e publica
+// as versões em /eventos; aqui elas são repassadas ao dcc.Store
+// "versoes-store", que dispara o callback update_data desta aba. O
+// EventSource reconecta sozinho se a conexão cair.
+(function () {
+    if (!window.EventSource) {
+        return;
+    }
+    var pendente = null;
+
+    function aplicar(versoes) {
+        var clientside = window.dash_clientside;
+        try {
+            clientside.set_props('versoes-store', {data: versoes});
+            pendente = null;
+        } catch (erro) {
+            // O Dash ainda não montou a página: tenta de novo em seguida
+            pendente = versoes;
+            setTimeout(function () {
+                if (pendente !== null) {
+                    aplicar(pendente);
+                }
+            }, 500);
+        }
+    }
+
+    var fonte = new EventSource('/eventos');
+    fonte.addEventListener('versoes', function (evento) {
+        aplicar(JSON.parse(evento.data));
+    });
+})();
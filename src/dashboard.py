@@ -5,6 +5,7 @@ Sistema desenvolvido para a Fase 3 do curso FIAP - Tecnologia em IA
 Funcionalidades:
 - Visualização dos níveis de umidade, P, K e pH
 - Status da irrigação (relay_status)
+- Filtro por campo e dispositivo e visão geral de todos os dispositivos
 - Sugestões de irrigação baseadas em dados climáticos
 - Gráficos interativos e análises em tempo real
 """
@@ -14,12 +15,24 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import cx_Oracle
 from datetime import datetime, timedelta
 import numpy as np
 from sqlalchemy import create_engine
 import urllib.parse
 
+from irrigacao import criar_fonte, corrigir_unidades, pegada_memoria
+from irrigacao.esquema import ESCOPO_TODOS, Escopo, adicionar_datetime
+from irrigacao import amostragem
+from irrigacao import anomalias
+from irrigacao import config
+from irrigacao import metricas
+from irrigacao import episodios
+from irrigacao import previsao
+from irrigacao import regras
+from irrigacao.agregados import matriz_correlacao, percentual
+from irrigacao.buffer import BufferJanela
+from irrigacao.consolidacao import Consolidacoes
+
 # Configuração da página
 st.set_page_config(
     page_title="Sistema de Irrigação Inteligente - FIAP",
@@ -71,54 +84,306 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Função para conectar ao Oracle (cx_Oracle tradicional)
+# Fonte de dados (Oracle ou arquivo local, conforme IRRIGACAO_FONTE)
 @st.cache_resource
-def init_connection():
+def init_fonte():
     try:
-        # Configurações de conexão Oracle
-        username = "RM567686"
-        password = "291278"
-        host = "oracle.fiap.com.br"
-        port = "1521"
-        service_name = "ORCL"
-        
-        dsn = cx_Oracle.makedsn(host, port, service_name=service_name)
-        connection = cx_Oracle.connect(username, password, dsn)
-        return connection
+        return criar_fonte()
     except Exception as e:
-        st.error(f"Erro ao conectar com o banco de dados: {e}")
+        st.error(f"Erro ao inicializar a fonte de dados: {e}")
         return None
 
-# Função para executar consultas
+# Fonte restrita a um campo/dispositivo (mesmo pool e cache da principal)
+@st.cache_resource
+def obter_fonte(escopo=ESCOPO_TODOS):
+    fonte = init_fonte()
+    if fonte is None or escopo == ESCOPO_TODOS:
+        return fonte
+    return fonte.com_escopo(escopo)
+
+# Campos e dispositivos com leituras, para os seletores da sidebar
 @st.cache_data(ttl=300)  # Cache por 5 minutos
-def run_query(query):
+def listar_dispositivos():
     try:
-        conn = init_connection()
-        if conn:
-            # Suprimir warning do pandas temporariamente
-            import warnings
-            with warnings.catch_warnings():
-                warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy")
-                df = pd.read_sql(query, conn)
-            conn.close()
-            
-            # Corrigir valores de umidade (dividir por 100 se necessário)
-            if 'UMIDADE_DHT' in df.columns:
-                df['UMIDADE_DHT'] = df['UMIDADE_DHT'] / 100
-                
-            return df
+        fonte = init_fonte()
+        return fonte.dispositivos() if fonte else pd.DataFrame(columns=['CAMPO', 'DISPOSITIVO'])
+    except Exception as e:
+        st.error(f"Erro ao listar dispositivos: {e}")
+        return pd.DataFrame(columns=['CAMPO', 'DISPOSITIVO'])
+
+# Colunas lidas para os cartões, alertas, gráficos de detalhe, tabela e
+# estatísticas contínuas do período (TIMESTAMP é sempre incluído)
+COLUNAS_DETALHE = [
+    'UMIDADE_DHT', 'LDR_VALOR', 'N_PRESENTE', 'P_PRESENTE', 'K_PRESENTE',
+    'RELAY_STATUS', 'UMIDADE_BAIXA', 'NPK_OK', 'PH_OK', 'BLOQUEIO_EXTERNO',
+    'CAMPO', 'DISPOSITIVO',
+]
+
+# Buffer incremental por período e escopo, compartilhado entre sessões: a
+# primeira execução carrega o período inteiro e as seguintes buscam só
+# leituras novas
+@st.cache_resource
+def obter_buffer(filtro, escopo=ESCOPO_TODOS):
+    buffer = BufferJanela(
+        obter_fonte(escopo), filtro, preparar=preparar_dados, intervalo_minimo=5,
+        colunas=COLUNAS_DETALHE
+    )
+    assinatura = obter_assinatura()
+    if assinatura is not None:
+        assinatura.buffers.append(buffer)
+    return buffer
+
+# Correção de unidades e colunas de data, aplicadas uma vez por leitura nova
+def preparar_dados(df):
+    # Corrigir valores de umidade (dividir por 100 se necessário)
+    with metricas.cronometrar('corrigir_unidades'):
+        corrigir_unidades(df)
+    return convert_timestamp(df)
+
+# Buffer do período com as leituras novas. Com o serviço de ingestão
+# conectado elas já chegam pelos lotes dele; o banco só é lido na primeira carga
+def atualizar_buffer(filtro, escopo=ESCOPO_TODOS):
+    buffer = obter_buffer(filtro, escopo)
+    assinatura = obter_assinatura()
+    if assinatura is None or not assinatura.conectado or buffer.marca_dagua is None:
+        buffer.atualizar()
+    return buffer
+
+# Função para carregar os dados de um período
+def run_query(filtro, escopo=ESCOPO_TODOS):
+    try:
+        fonte = init_fonte()
+        if fonte:
+            with metricas.cronometrar('run_query', filtro=filtro):
+                return atualizar_buffer(filtro, escopo).dados()
         return pd.DataFrame()
     except Exception as e:
         st.error(f"Erro ao executar consulta: {e}")
         return pd.DataFrame()
 
+# Série de umidade do período já reduzida na fonte (usada para "Todos os dados",
+# cujas linhas não são todas carregadas). `marca_dagua` (último TIMESTAMP
+# carregado) só entra na chave do cache: leituras novas geram uma série nova
+@st.cache_data(ttl=300)  # Cache por 5 minutos
+def run_series(filtro, escopo=ESCOPO_TODOS, marca_dagua=None, pontos=amostragem.PONTOS_PADRAO):
+    try:
+        fonte = obter_fonte(escopo)
+        if fonte:
+            with metricas.cronometrar('run_series', filtro=filtro):
+                return preparar_dados(fonte.serie(filtro, 'UMIDADE_DHT', pontos))
+        return pd.DataFrame()
+    except Exception as e:
+        st.error(f"Erro ao carregar série de umidade: {e}")
+        return pd.DataFrame()
+
+# Consolidações por hora/dia/mês de cada escopo, compartilhadas entre sessões
+# e atualizadas apenas com as horas novas
+@st.cache_resource
+def obter_consolidacoes(escopo=ESCOPO_TODOS):
+    consolidacoes = Consolidacoes(obter_fonte(escopo), intervalo_minimo=5)
+    assinatura = obter_assinatura()
+    if assinatura is not None:
+        assinatura.consolidacoes.append(consolidacoes)
+    return consolidacoes
+
+# Leituras ao vivo do serviço de ingestão (IRRIGACAO_INGESTAO), repassadas a
+# todos os buffers e consolidações (cada um fica com as do seu escopo) sem
+# ida ao banco; None sem o serviço
+@st.cache_resource
+def obter_assinatura():
+    if not config.INGESTAO:
+        return None
+    from irrigacao.ingestao import assinar_ingestao
+
+    buffers = []
+    consolidacoes = []
+    motores_episodios = []
+    historicos_anomalias = []
+    historicos_regras = []
+
+    def receber_leituras(df):
+        for buffer in list(buffers):
+            buffer.anexar(df)
+        for consolidacao in list(consolidacoes):
+            consolidacao.anexar(df)
+        for motor in list(motores_episodios):
+            motor.anexar(df)
+        for historico in list(historicos_anomalias):
+            historico.anexar(df)
+        for historico in list(historicos_regras):
+            historico.anexar(df)
+
+    assinatura = assinar_ingestao(config.INGESTAO, receber_leituras)
+    assinatura.buffers = buffers
+    assinatura.consolidacoes = consolidacoes
+    assinatura.episodios = motores_episodios
+    assinatura.anomalias = historicos_anomalias
+    assinatura.regras = historicos_regras
+    return assinatura
+
+# Agregados do período lidos das estatísticas contínuas (irrigacao.estatisticas):
+# as do buffer do período para N registros e 24h/3d/7d, as das consolidações
+# para "Todos os dados". Ficam em dia a cada leitura nova sem percorrer as
+# linhas, por isso não passam por cache
+def run_aggregates(filtro, escopo=ESCOPO_TODOS):
+    try:
+        fonte = init_fonte()
+        if fonte:
+            with metricas.cronometrar('run_aggregates', filtro=filtro):
+                if filtro == 0:
+                    return obter_consolidacoes(escopo).agregados(filtro)
+                return atualizar_buffer(filtro, escopo).estatisticas.agregados()
+        return {}
+    except Exception as e:
+        st.error(f"Erro ao calcular agregados: {e}")
+        return {}
+
+# Anomalias dos sensores de todo o histórico de cada escopo (usadas em "Todos
+# os dados"), compartilhadas entre sessões: o histórico é lido uma vez e
+# depois só as leituras novas são avaliadas
+@st.cache_resource
+def obter_anomalias_historico(escopo=ESCOPO_TODOS):
+    historico = anomalias.AnomaliasHistorico(obter_fonte(escopo), intervalo_minimo=5)
+    assinatura = obter_assinatura()
+    if assinatura is not None:
+        assinatura.anomalias.append(historico)
+    return historico
+
+def run_anomalias_historico(escopo=ESCOPO_TODOS):
+    with metricas.cronometrar('run_anomalias', filtro=0):
+        historico = obter_anomalias_historico(escopo)
+        assinatura = obter_assinatura()
+        if assinatura is None or not assinatura.conectado or historico.marca_dagua is None:
+            historico.atualizar()
+        return historico.anomalias()
+
+# Anomalias do período: as do detector contínuo do buffer para N registros e
+# 24h/3d/7d (em dia a cada leitura nova), as do histórico para "Todos os
+# dados"
+def run_anomalias(filtro, filtro_registros, escopo=ESCOPO_TODOS):
+    try:
+        fonte = init_fonte()
+        if fonte:
+            if filtro == 0:
+                return run_anomalias_historico(escopo)
+            return atualizar_buffer(filtro_registros, escopo).anomalias.anomalias()
+    except Exception as e:
+        st.error(f"Erro ao detectar anomalias: {e}")
+    return anomalias.anomalias_vazias()
+
+# Episódios (ciclos de irrigação, umidade baixa e bloqueio) de cada escopo,
+# por dia, compartilhados entre sessões e atualizados só com as leituras novas
+@st.cache_resource
+def obter_episodios(escopo=ESCOPO_TODOS):
+    motor = episodios.Episodios(obter_fonte(escopo), intervalo_minimo=5)
+    assinatura = obter_assinatura()
+    if assinatura is not None:
+        assinatura.episodios.append(motor)
+    return motor
+
+# Resumo e episódios mais recentes iniciados a partir de `desde` (primeira
+# leitura do período; None em "Todos os dados")
+def run_episodios(escopo=ESCOPO_TODOS, desde=None):
+    try:
+        fonte = init_fonte()
+        if fonte:
+            with metricas.cronometrar('run_episodios'):
+                motor = obter_episodios(escopo)
+                assinatura = obter_assinatura()
+                if assinatura is None or not assinatura.conectado or motor.marca_dagua is None:
+                    motor.atualizar()
+                return motor.resumo(desde), motor.episodios(desde, limite=500)
+    except Exception as e:
+        st.error(f"Erro ao calcular os ciclos de irrigação: {e}")
+    return episodios.resumo_vazio(), episodios.episodios_vazios()
+
+# Resumo de todos os dispositivos do campo no período, em uma única passada
+# agrupada na fonte; `marca_dagua` só entra na chave do cache
+@st.cache_data(ttl=300)  # Cache por 5 minutos
+def run_resumo_dispositivos(filtro, campo=None, marca_dagua=None):
+    try:
+        fonte = obter_fonte(Escopo(campo=campo))
+        if fonte:
+            with metricas.cronometrar('run_resumo_dispositivos', filtro=filtro):
+                return fonte.resumo_dispositivos(filtro)
+        return pd.DataFrame()
+    except Exception as e:
+        st.error(f"Erro ao resumir dispositivos: {e}")
+        return pd.DataFrame()
+
+# Regras das sugestões (config.REGRAS), lidas uma vez por processo
+@st.cache_resource
+def obter_regras():
+    return regras.carregar_regras()
+
+# Ocorrências das regras nas janelas de cada dispositivo do período; só as
+# colunas usadas pelas regras são lidas e as linhas não ficam em cache.
+# "Todos os dados" usa run_regras_historico
+@st.cache_data(ttl=300)  # Cache por 5 minutos
+def run_regras(filtro, escopo=ESCOPO_TODOS, marca_dagua=None):
+    try:
+        fonte = obter_fonte(escopo)
+        if fonte:
+            lista = obter_regras()
+            with metricas.cronometrar('run_regras', filtro=filtro):
+                df = fonte.carregar(filtro, colunas=regras.colunas_necessarias(lista))
+                return regras.avaliar(df, lista)
+        return regras.Avaliacao(regras.ocorrencias_vazias(), 0)
+    except Exception as e:
+        st.error(f"Erro ao avaliar as regras: {e}")
+        return regras.Avaliacao(regras.ocorrencias_vazias(), 0)
+
+# Ocorrências das regras em todo o histórico de cada escopo, compartilhadas
+# entre sessões: o histórico é lido uma vez e depois só as leituras novas
+# são avaliadas
+@st.cache_resource
+def obter_regras_historico(escopo=ESCOPO_TODOS):
+    historico = regras.RegrasHistorico(obter_fonte(escopo), obter_regras(), intervalo_minimo=5)
+    assinatura = obter_assinatura()
+    if assinatura is not None:
+        assinatura.regras.append(historico)
+    return historico
+
+def run_regras_historico(escopo=ESCOPO_TODOS):
+    try:
+        fonte = init_fonte()
+        if fonte:
+            with metricas.cronometrar('run_regras', filtro=0):
+                historico = obter_regras_historico(escopo)
+                assinatura = obter_assinatura()
+                if assinatura is None or not assinatura.conectado or historico.marca_dagua is None:
+                    historico.atualizar()
+                return historico.avaliacao()
+    except Exception as e:
+        st.error(f"Erro ao avaliar as regras: {e}")
+    return regras.Avaliacao(regras.ocorrencias_vazias(), 0)
+
+# Modelo de previsão da umidade (config.MODELO_PREVISAO), recarregado quando o
+# arquivo muda e compartilhado entre sessões
+@st.cache_resource
+def obter_previsor():
+    return previsao.Previsor()
+
+# Previsão das próximas leituras de cada dispositivo do escopo, a partir do
+# buffer de 3 dias (o mesmo do período "3d"); refeita só quando a versão do
+# buffer ou o modelo mudam. None sem modelo treinado
+def run_previsao(escopo=ESCOPO_TODOS):
+    try:
+        fonte = init_fonte()
+        if fonte:
+            buffer = atualizar_buffer('3d', escopo)
+            with metricas.cronometrar('run_previsao'):
+                return obter_previsor().prever(buffer.dados(), (escopo, buffer.versao))
+    except Exception as e:
+        st.error(f"Erro ao prever a umidade: {e}")
+    return None
+
 # Função para converter timestamp Unix para datetime
 def convert_timestamp(df):
     if not df.empty and 'TIMESTAMP' in df.columns:
         try:
-            df['DATETIME'] = pd.to_datetime(df['TIMESTAMP'], unit='s')
-            df['DATA'] = df['DATETIME'].dt.date
-            df['HORA'] = df['DATETIME'].dt.time
+            with metricas.cronometrar('convert_timestamp'):
+                adicionar_datetime(df)
         except Exception as e:
             st.error(f"Erro ao converter timestamp: {e}")
     return df
@@ -151,19 +416,76 @@ periodo_selecionado = st.sidebar.selectbox(
     index=1
 )
 
-# Atualização automática
+# Seletores de campo e dispositivo (os dispositivos listados são os do campo)
+TODOS = "Todos"
+lista_dispositivos = listar_dispositivos()
+campo_selecionado = st.sidebar.selectbox(
+    "🌾 Campo:",
+    [TODOS] + sorted(lista_dispositivos['CAMPO'].unique().tolist())
+)
+if campo_selecionado != TODOS:
+    lista_dispositivos = lista_dispositivos[lista_dispositivos['CAMPO'] == campo_selecionado]
+dispositivo_selecionado = st.sidebar.selectbox(
+    "📡 Dispositivo:",
+    [TODOS] + lista_dispositivos['DISPOSITIVO'].tolist()
+)
+escopo = Escopo(
+    campo=None if campo_selecionado == TODOS else int(campo_selecionado),
+    dispositivo=None if dispositivo_selecionado == TODOS else int(dispositivo_selecionado),
+)
+
+# Atualização automática: só o painel ao vivo (cartões, alertas e gráfico de
+# umidade) é reexecutado no intervalo, dentro do seu próprio fragmento
+INTERVALO_ATUALIZACAO = 30
 auto_refresh = st.sidebar.checkbox("🔄 Atualização Automática (30s)", value=False)
-if auto_refresh:
-    st.rerun()
 
-# Botão de atualização manual
-if st.sidebar.button("🔄 Atualizar Dados", type="primary"):
-    st.cache_data.clear()
-    st.rerun()
+# Botão de atualização manual (tratado depois que o período é conhecido)
+atualizar_clicado = st.sidebar.button("🔄 Atualizar Dados", type="primary")
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("### 📊 Informações do Sistema")
-st.sidebar.info("**Banco:** Oracle FIAP\n**Tabela:** historico2024\n**Período:** Janeiro-Dezembro 2024\n**Status:** 🟢 Conectado")
+fonte = init_fonte()
+st.sidebar.info(f"**Banco:** {fonte.descricao if fonte else 'Indisponível'}\n**Tabela:** historico2024\n**Período:** Janeiro-Dezembro 2024\n**Status:** 🟢 Conectado")
+
+# Uso do pool de conexões (apenas para fontes apoiadas em banco)
+stats_pool = fonte.estatisticas_pool() if fonte else None
+if stats_pool:
+    with st.sidebar.expander("🔌 Pool de Conexões"):
+        st.markdown(f"""
+        **Em uso:** {stats_pool['em_uso']} de {stats_pool['maximo']}
+        **Ociosas:** {stats_pool['ociosas']}
+        **Aquisições:** {stats_pool['aquisicoes']} ({stats_pool['esperas']} com espera)
+        **Timeouts:** {stats_pool['timeouts']}
+        **Conexões criadas:** {stats_pool['conexoes_criadas']}
+        """)
+
+# Cache de consultas compartilhado entre processos (irrigacao.cache)
+stats_cache = fonte.estatisticas_cache() if fonte else None
+if stats_cache:
+    with st.sidebar.expander("🗄️ Cache de Consultas"):
+        st.markdown(f"""
+        **Acertos:** {stats_cache['acertos']} ({stats_cache['taxa_acerto']:.0%} dos pedidos)
+        **Faltas:** {stats_cache['faltas']}
+        **Coalescidas:** {stats_cache['coalescidas']}
+        **Entradas:** {stats_cache['entradas']} ({stats_cache['bytes'] / 1024 / 1024:.1f} de {stats_cache['tamanho_maximo'] / 1024 / 1024:.0f} MB)
+        **Expulsas:** {stats_cache['expulsas']}
+        """)
+
+# Diagnóstico de desempenho (irrigacao.metricas), preenchido no fim da
+# execução para incluir as consultas e os gráficos desta
+painel_diagnostico = st.sidebar.expander("📈 Diagnóstico de Desempenho")
+
+def mostrar_diagnostico():
+    operacoes, contadores = metricas.resumo()
+    with painel_diagnostico:
+        if not operacoes and not contadores:
+            st.caption("Nenhuma operação medida ainda")
+            return
+        if operacoes:
+            st.dataframe(pd.DataFrame(operacoes).round(2), width='stretch', hide_index=True)
+        if contadores:
+            st.dataframe(pd.DataFrame(contadores), width='stretch', hide_index=True)
+        st.caption("Tempos em ms desde o início do processo (todas as sessões); p50/p95 estimados pelos baldes do histograma")
 
 # Informação sobre filtros
 st.sidebar.markdown("### ℹ️ Sobre os Filtros")
@@ -176,68 +498,62 @@ st.sidebar.markdown("""
 - Dados de 2024 (não tempo atual)
 """)
 
-# Consulta principal dos dados (relativa aos dados existentes)
+# Filtro principal dos dados (relativo aos dados existentes)
 filtro_selecionado = periodo_opcoes[periodo_selecionado]
 
-if filtro_selecionado == 0:
-    # Todos os dados
-    query = "SELECT * FROM historico2024 ORDER BY timestamp DESC"
-elif isinstance(filtro_selecionado, int):
-    # Filtro por número de registros
-    query = f"""
-    SELECT * FROM (
-        SELECT * FROM historico2024 
-        ORDER BY timestamp DESC
-    ) WHERE ROWNUM <= {filtro_selecionado}
-    ORDER BY timestamp DESC
-    """
-else:
-    # Filtro temporal relativo aos dados (24h, 3d, 7d)
-    if filtro_selecionado == "24h":
-        query = """
-        SELECT * FROM historico2024 
-        WHERE timestamp >= (
-            SELECT MAX(timestamp) - 86400 FROM historico2024
-        )
-        ORDER BY timestamp DESC
-        """
-    elif filtro_selecionado == "3d":
-        query = """
-        SELECT * FROM historico2024 
-        WHERE timestamp >= (
-            SELECT MAX(timestamp) - (3 * 86400) FROM historico2024
-        )
-        ORDER BY timestamp DESC
-        """
-    elif filtro_selecionado == "7d":
-        query = """
-        SELECT * FROM historico2024 
-        WHERE timestamp >= (
-            SELECT MAX(timestamp) - (7 * 86400) FROM historico2024
-        )
-        ORDER BY timestamp DESC
-        """
+# Cartões, pizza, NPK e correlação usam só os agregados do período e as
+# sugestões as ocorrências das regras (run_regras); as linhas individuais
+# servem à tabela e aos gráficos de detalhe, por isso "Todos os dados" traz
+# apenas os registros mais recentes
+LIMITE_REGISTROS_DETALHE = 1000
+filtro_registros = filtro_selecionado if filtro_selecionado != 0 else LIMITE_REGISTROS_DETALHE
+
+# Atualização manual: invalida apenas o período selecionado. Os outros
+# períodos mantêm seus buffers (com as estatísticas contínuas) e caches; as
+# consolidações são compartilhadas e só recebem as horas novas
+if atualizar_clicado:
+    buffer_periodo = obter_buffer(filtro_registros, escopo)
+    run_series.clear(filtro_selecionado, escopo, buffer_periodo.marca_dagua)
+    run_resumo_dispositivos.clear(filtro_selecionado, escopo.campo, buffer_periodo.marca_dagua)
+    run_regras.clear(filtro_selecionado, escopo, buffer_periodo.marca_dagua)
+    buffer_periodo.recarregar()
+    obter_consolidacoes(escopo).atualizar(forcar=True)
+    obter_episodios(escopo).atualizar(forcar=True)
+    # Reavaliação completa das anomalias e regras do histórico só na recarga pedida
+    if filtro_selecionado == 0:
+        obter_anomalias_historico(escopo).recarregar()
+        obter_regras_historico(escopo).recarregar()
 
 # Carregamento dos dados
 with st.spinner("Carregando dados do sistema de irrigação..."):
-    df = run_query(query)
+    agregados = run_aggregates(filtro_selecionado, escopo)
+    df = run_query(filtro_registros, escopo)
 
-if df.empty:
+if df.empty or not agregados.get('TOTAL_MEDICOES'):
     st.error("❌ Nenhum dado encontrado. Verifique a conexão com o banco de dados.")
+    mostrar_diagnostico()
     st.stop()
 
 # Informação sobre dados carregados
 st.sidebar.success(f"✅ {len(df):,} registros carregados")
 
-# Processamento dos dados
-df = convert_timestamp(df)
-df_recente = df.head(1).iloc[0] if not df.empty else None
+# Memória ocupada pelas linhas em memória (tipos compactos de esquema.TIPOS_COMPACTOS)
+memoria = pegada_memoria(df)
+with st.sidebar.expander("🧮 Memória dos Dados"):
+    st.markdown(f"""
+    **Total:** {memoria['bytes'] / 1024:,.1f} KB
+    **Por registro:** {memoria['bytes_por_linha']:.0f} bytes
+    """)
+    st.dataframe(
+        pd.Series(memoria['colunas'], name='bytes').to_frame(),
+        width='stretch'
+    )
 
 # Informações sobre o período dos dados carregados
-if not df.empty and 'DATETIME' in df.columns:
-    data_mais_antiga = df['DATETIME'].min()
-    data_mais_recente = df['DATETIME'].max()
-    total_registros = len(df)
+if agregados:
+    data_mais_antiga = pd.to_datetime(agregados['TS_MIN'], unit='s')
+    data_mais_recente = pd.to_datetime(agregados['TS_MAX'], unit='s')
+    total_registros = agregados['TOTAL_MEDICOES']
     
     st.sidebar.markdown("---")
     st.sidebar.markdown("### 📅 Período dos Dados Carregados")
@@ -248,144 +564,207 @@ if not df.empty and 'DATETIME' in df.columns:
     **⏱️ Intervalo:** {(data_mais_recente - data_mais_antiga).days} dias
     """)
 
-# Métricas principais em tempo real
-st.markdown("## 📊 Status Atual do Sistema")
+# Marcadores de anomalia no gráfico de umidade (os mais recentes) e suas cores
+MAXIMO_MARCADORES_ANOMALIAS = 2000
+CORES_ANOMALIAS = {
+    'fora_da_faixa': '#d62728',
+    'travado': '#7f7f7f',
+    'pico': '#ff7f0e',
+    'oscilacao': '#9467bd',
+}
 
-col1, col2, col3, col4 = st.columns(4)
+# Painel ao vivo: cartões, alertas, gráfico de umidade e anomalias. Com a atualização
+# automática ligada ele roda como fragmento a cada INTERVALO_ATUALIZACAO
+# segundos; os cartões leem as estatísticas contínuas, já em dia com as
+# leituras novas, e gráficos estáticos e tabela não são refeitos
+def painel_ao_vivo(filtro, filtro_registros, escopo):
+    agregados = run_aggregates(filtro, escopo)
+    df = run_query(filtro_registros, escopo)
+    anomalias_periodo = run_anomalias(filtro, filtro_registros, escopo)
+    # Dados já chegam com unidades corrigidas e DATETIME (ver preparar_dados)
+    df_recente = df.head(1).iloc[0] if not df.empty else None
 
-with col1:
-    if df_recente is not None:
-        umidade_atual = df_recente['UMIDADE_DHT']
-        delta_umidade = umidade_atual - df['UMIDADE_DHT'].mean()
-        st.metric(
-            label="💧 Umidade Atual",
-            value=f"{umidade_atual:.1f}%",
-            delta=f"{delta_umidade:.1f}%"
-        )
+    # Métricas principais em tempo real
+    st.markdown("## 📊 Status Atual do Sistema")
 
-with col2:
-    if df_recente is not None:
-        status_irrigacao = "🟢 ATIVO" if df_recente['RELAY_STATUS'] == 1 else "🔴 INATIVO"
-        st.metric(
-            label="🚿 Sistema de Irrigação",
-            value=status_irrigacao
-        )
+    col1, col2, col3, col4 = st.columns(4)
 
-with col3:
-    if df_recente is not None:
-        npk_status = "✅ OK" if df_recente['NPK_OK'] == 1 else "⚠️ ALERTA"
-        st.metric(
-            label="🧪 Nutrientes NPK",
-            value=npk_status
-        )
+    with col1:
+        if df_recente is not None:
+            umidade_atual = df_recente['UMIDADE_DHT']
+            delta_umidade = umidade_atual - agregados['UMIDADE_MEDIA']
+            st.metric(
+                label="💧 Umidade Atual",
+                value=f"{umidade_atual:.1f}%",
+                delta=f"{delta_umidade:.1f}%"
+            )
 
-with col4:
-    if df_recente is not None:
-        ph_status = "✅ OK" if df_recente['PH_OK'] == 1 else "⚠️ ALERTA"
-        st.metric(
-            label="⚖️ Nível de pH",
-            value=ph_status
-        )
+    with col2:
+        if df_recente is not None:
+            status_irrigacao = "🟢 ATIVO" if df_recente['RELAY_STATUS'] == 1 else "🔴 INATIVO"
+            st.metric(
+                label="🚿 Sistema de Irrigação",
+                value=status_irrigacao
+            )
 
-# Sistema de alertas
-st.markdown("## 🚨 Central de Alertas")
+    with col3:
+        if df_recente is not None:
+            npk_status = "✅ OK" if df_recente['NPK_OK'] == 1 else "⚠️ ALERTA"
+            st.metric(
+                label="🧪 Nutrientes NPK",
+                value=npk_status
+            )
 
-col_alert1, col_alert2 = st.columns(2)
+    with col4:
+        if df_recente is not None:
+            ph_status = "✅ OK" if df_recente['PH_OK'] == 1 else "⚠️ ALERTA"
+            st.metric(
+                label="⚖️ Nível de pH",
+                value=ph_status
+            )
 
-with col_alert1:
-    if df_recente is not None:
-        if df_recente['UMIDADE_BAIXA'] == 1:
-            st.markdown("""
-            <div class="irrigation-inactive">
-                <h4>⚠️ ALERTA: Umidade Baixa Detectada</h4>
-                <p>O solo está com baixa umidade. O sistema de irrigação deve ser ativado.</p>
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown("""
-            <div class="irrigation-active">
-                <h4>✅ Umidade do Solo Adequada</h4>
-                <p>Os níveis de umidade estão dentro do esperado.</p>
-            </div>
-            """, unsafe_allow_html=True)
-
-with col_alert2:
-    if df_recente is not None:
-        if df_recente['RELAY_STATUS'] == 1:
-            st.markdown("""
-            <div class="irrigation-active">
-                <h4>🚿 Sistema de Irrigação ATIVO</h4>
-                <p>O sistema está irrigando o solo no momento.</p>
-            </div>
-            """, unsafe_allow_html=True)
+    # Sistema de alertas
+    st.markdown("## 🚨 Central de Alertas")
+
+    col_alert1, col_alert2 = st.columns(2)
+
+    with col_alert1:
+        if df_recente is not None:
+            if df_recente['UMIDADE_BAIXA'] == 1:
+                st.markdown("""
+                <div class="irrigation-inactive">
+                    <h4>⚠️ ALERTA: Umidade Baixa Detectada</h4>
+                    <p>O solo está com baixa umidade. O sistema de irrigação deve ser ativado.</p>
+                </div>
+                """, unsafe_allow_html=True)
+            else:
+                st.markdown("""
+                <div class="irrigation-active">
+                    <h4>✅ Umidade do Solo Adequada</h4>
+                    <p>Os níveis de umidade estão dentro do esperado.</p>
+                </div>
+                """, unsafe_allow_html=True)
+
+    with col_alert2:
+        if df_recente is not None:
+            if df_recente['RELAY_STATUS'] == 1:
+                st.markdown("""
+                <div class="irrigation-active">
+                    <h4>🚿 Sistema de Irrigação ATIVO</h4>
+                    <p>O sistema está irrigando o solo no momento.</p>
+                </div>
+                """, unsafe_allow_html=True)
+            else:
+                st.markdown("""
+                <div class="irrigation-inactive">
+                    <h4>⏸️ Sistema de Irrigação INATIVO</h4>
+                    <p>O sistema não está irrigando no momento.</p>
+                </div>
+                """, unsafe_allow_html=True)
+
+    # Gráficos principais
+    st.markdown("## 📈 Análise Temporal dos Dados")
+
+    # Gráfico de umidade ao longo do tempo, reduzido a poucos milhares de pontos
+    # que preservam o formato da curva
+    if filtro == 0:
+        serie_umidade = run_series(filtro, escopo, obter_buffer(filtro_registros, escopo).marca_dagua)
+    else:
+        serie_umidade = amostragem.reduzir(df[['TIMESTAMP', 'DATETIME', 'UMIDADE_DHT']], 'UMIDADE_DHT')
+    with metricas.cronometrar('streamlit_figura', grafico='umidade'):
+        fig_umidade = px.line(
+            serie_umidade, 
+            x='DATETIME', 
+            y='UMIDADE_DHT',
+            title="💧 Evolução da Umidade do Solo",
+            labels={'UMIDADE_DHT': 'Umidade (%)', 'DATETIME': 'Data e Hora'},
+            color_discrete_sequence=['#1f77b4'],
+            render_mode=amostragem.modo_renderizacao(len(serie_umidade))
+        )
+        fig_umidade.add_hline(
+            y=60, 
+            line_dash="dash", 
+            line_color="green",
+            annotation_text="Nível Ideal (60%)"
+        )
+        fig_umidade.add_hline(
+            y=40, 
+            line_dash="dash", 
+            line_color="red",
+            annotation_text="Nível Crítico (40%)"
+        )
+        # Anomalias dos sensores sobre a curva, na umidade da leitura
+        # (só as mais recentes, para o gráfico continuar leve)
+        marcadores = adicionar_datetime(anomalias_periodo.tail(MAXIMO_MARCADORES_ANOMALIAS).copy())
+        for tipo, grupo in marcadores.groupby('TIPO', sort=False):
+            fig_umidade.add_trace(go.Scatter(
+                x=grupo['DATETIME'],
+                y=grupo['UMIDADE'],
+                mode='markers',
+                name=anomalias.TIPOS[tipo],
+                marker=dict(symbol='x', size=8, color=CORES_ANOMALIAS[tipo])
+            ))
+        fig_umidade.update_layout(height=400)
+    with metricas.cronometrar('streamlit_plotly_chart', grafico='umidade'):
+        st.plotly_chart(fig_umidade, width='stretch')
+
+    with st.expander(f"🚨 Anomalias dos Sensores ({len(anomalias_periodo):,})"):
+        if anomalias_periodo.empty:
+            st.info("Nenhuma anomalia nas leituras do período.")
         else:
-            st.markdown("""
-            <div class="irrigation-inactive">
-                <h4>⏸️ Sistema de Irrigação INATIVO</h4>
-                <p>O sistema não está irrigando no momento.</p>
-            </div>
-            """, unsafe_allow_html=True)
-
-# Gráficos principais
-st.markdown("## 📈 Análise Temporal dos Dados")
-
-# Gráfico de umidade ao longo do tempo
-fig_umidade = px.line(
-    df.head(100), 
-    x='DATETIME', 
-    y='UMIDADE_DHT',
-    title="💧 Evolução da Umidade do Solo",
-    labels={'UMIDADE_DHT': 'Umidade (%)', 'DATETIME': 'Data e Hora'},
-    color_discrete_sequence=['#1f77b4']
-)
-fig_umidade.add_hline(
-    y=60, 
-    line_dash="dash", 
-    line_color="green",
-    annotation_text="Nível Ideal (60%)"
-)
-fig_umidade.add_hline(
-    y=40, 
-    line_dash="dash", 
-    line_color="red",
-    annotation_text="Nível Crítico (40%)"
+            contagens = anomalias_periodo['TIPO'].value_counts()
+            colunas_tipos = st.columns(len(anomalias.TIPOS))
+            for coluna_tipo, (tipo, titulo) in zip(colunas_tipos, anomalias.TIPOS.items()):
+                coluna_tipo.metric(titulo, f"{int(contagens.get(tipo, 0)):,}")
+            tabela = adicionar_datetime(anomalias_periodo.tail(500).iloc[::-1].copy())
+            tabela['TIPO'] = tabela['TIPO'].map(anomalias.TIPOS)
+            st.dataframe(
+                tabela[['DATETIME', 'TIPO', 'COLUNA', 'CAMPO', 'DISPOSITIVO', 'VALOR', 'REFERENCIA']],
+                width='stretch',
+                hide_index=True
+            )
+
+st.fragment(run_every=INTERVALO_ATUALIZACAO if auto_refresh else None)(painel_ao_vivo)(
+    filtro_selecionado, filtro_registros, escopo
 )
-fig_umidade.update_layout(height=400)
-st.plotly_chart(fig_umidade, width='stretch')
 
 # Gráficos combinados
 col_graf1, col_graf2 = st.columns(2)
 
 with col_graf1:
     # Gráfico do status da irrigação
-    irrigacao_dados = df['RELAY_STATUS'].value_counts()
-    fig_irrigacao = px.pie(
-        values=irrigacao_dados.values,
-        names=['Inativo', 'Ativo'],
-        title="🚿 Distribuição do Status de Irrigação",
-        color_discrete_sequence=['#ff7f7f', '#90ee90']
-    )
-    st.plotly_chart(fig_irrigacao, width='stretch')
+    ativacoes = agregados['TOTAL_ATIVACOES']
+    with metricas.cronometrar('streamlit_figura', grafico='irrigacao'):
+        fig_irrigacao = px.pie(
+            values=[agregados['TOTAL_MEDICOES'] - ativacoes, ativacoes],
+            names=['Inativo', 'Ativo'],
+            title="🚿 Distribuição do Status de Irrigação",
+            color_discrete_sequence=['#ff7f7f', '#90ee90']
+        )
+    with metricas.cronometrar('streamlit_plotly_chart', grafico='irrigacao'):
+        st.plotly_chart(fig_irrigacao, width='stretch')
 
 with col_graf2:
     # Gráfico dos nutrientes NPK
     npk_data = {
         'Nutriente': ['Nitrogênio (N)', 'Fósforo (P)', 'Potássio (K)'],
         'Presença (%)': [
-            (df['N_PRESENTE'].sum() / len(df)) * 100,
-            (df['P_PRESENTE'].sum() / len(df)) * 100,
-            (df['K_PRESENTE'].sum() / len(df)) * 100
+            percentual(agregados, 'TOTAL_N_PRESENTE'),
+            percentual(agregados, 'TOTAL_P_PRESENTE'),
+            percentual(agregados, 'TOTAL_K_PRESENTE')
         ]
     }
-    fig_npk = px.bar(
-        npk_data,
-        x='Nutriente',
-        y='Presença (%)',
-        title="🧪 Presença de Nutrientes NPK",
-        color='Presença (%)',
-        color_continuous_scale='Viridis'
-    )
-    st.plotly_chart(fig_npk, width='stretch')
+    with metricas.cronometrar('streamlit_figura', grafico='npk'):
+        fig_npk = px.bar(
+            npk_data,
+            x='Nutriente',
+            y='Presença (%)',
+            title="🧪 Presença de Nutrientes NPK",
+            color='Presença (%)',
+            color_continuous_scale='Viridis'
+        )
+    with metricas.cronometrar('streamlit_plotly_chart', grafico='npk'):
+        st.plotly_chart(fig_npk, width='stretch')
 
 # Análise de correlação
 st.markdown("## 🔍 Análise Avançada")
@@ -394,89 +773,266 @@ col_analise1, col_analise2 = st.columns(2)
 
 with col_analise1:
     # Gráfico de dispersão: Umidade vs LDR
-    fig_scatter = px.scatter(
-        df.head(200),
-        x='UMIDADE_DHT',
-        y='LDR_VALOR',
-        color='RELAY_STATUS',
-        title="💡 Relação: Umidade vs Luminosidade",
-        labels={
-            'UMIDADE_DHT': 'Umidade (%)',
-            'LDR_VALOR': 'Luminosidade',
-            'RELAY_STATUS': 'Irrigação'
-        },
-        color_discrete_map={0: 'red', 1: 'green'}
-    )
-    st.plotly_chart(fig_scatter, width='stretch')
+    with metricas.cronometrar('streamlit_figura', grafico='dispersao'):
+        fig_scatter = px.scatter(
+            df.head(200),
+            x='UMIDADE_DHT',
+            y='LDR_VALOR',
+            color='RELAY_STATUS',
+            title="💡 Relação: Umidade vs Luminosidade",
+            labels={
+                'UMIDADE_DHT': 'Umidade (%)',
+                'LDR_VALOR': 'Luminosidade',
+                'RELAY_STATUS': 'Irrigação'
+            },
+            color_discrete_map={0: 'red', 1: 'green'}
+        )
+    with metricas.cronometrar('streamlit_plotly_chart', grafico='dispersao'):
+        st.plotly_chart(fig_scatter, width='stretch')
 
 with col_analise2:
     # Heatmap de correlação
-    correlacao_cols = ['UMIDADE_DHT', 'LDR_VALOR', 'RELAY_STATUS', 'UMIDADE_BAIXA']
-    corr_matrix = df[correlacao_cols].corr()
+    corr_matrix = matriz_correlacao(agregados)
     
-    fig_heatmap = px.imshow(
-        corr_matrix,
-        title="🔥 Mapa de Correlação entre Variáveis",
-        color_continuous_scale='RdYlBu',
-        aspect='auto'
-    )
-    fig_heatmap.update_layout(height=400)
-    st.plotly_chart(fig_heatmap, width='stretch')
+    with metricas.cronometrar('streamlit_figura', grafico='correlacao'):
+        fig_heatmap = px.imshow(
+            corr_matrix,
+            title="🔥 Mapa de Correlação entre Variáveis",
+            color_continuous_scale='RdYlBu',
+            aspect='auto'
+        )
+        fig_heatmap.update_layout(height=400)
+    with metricas.cronometrar('streamlit_plotly_chart', grafico='correlacao'):
+        st.plotly_chart(fig_heatmap, width='stretch')
 
 # Sugestões inteligentes
 st.markdown("## 🤖 Sugestões Inteligentes de Irrigação")
 
-# Calcular métricas para sugestões
-umidade_media = df['UMIDADE_DHT'].mean()
-taxa_irrigacao = (df['RELAY_STATUS'].sum() / len(df)) * 100
-luz_media = df['LDR_VALOR'].mean()
-
-col_sug1, col_sug2, col_sug3 = st.columns(3)
+# Regras ativas na última leitura de cada dispositivo (irrigacao.regras)
+if filtro_selecionado == 0:
+    avaliacao = run_regras_historico(escopo)
+else:
+    avaliacao = run_regras(filtro_selecionado, escopo, obter_buffer(filtro_registros, escopo).marca_dagua)
+sugestoes = regras.sugestoes(avaliacao, obter_regras())
+exibir_sugestao = {'alerta': st.warning, 'info': st.info, 'ok': st.success}
 
-with col_sug1:
-    st.markdown("""
-    ### 💧 Análise de Umidade
-    """)
-    if umidade_media < 45:
-        st.warning(f"**Atenção:** Umidade média baixa ({umidade_media:.1f}%). Considere aumentar a frequência de irrigação.")
-    elif umidade_media > 75:
-        st.info(f"**OK:** Umidade média adequada ({umidade_media:.1f}%). Sistema funcionando bem.")
+# Previsão das próximas horas (irrigacao.previsao): entra como sugestão de
+# umidade, com os dispositivos que devem ficar com UMIDADE_BAIXA. O modelo é
+# lido uma vez: o arquivo pode mudar (ou sumir) entre a previsão e o texto
+modelo_previsao = obter_previsor().modelo()
+previsoes = run_previsao(escopo) if modelo_previsao is not None else None
+mensagem_previsao = None
+if previsoes is not None and not previsoes.empty:
+    horas_horizonte = modelo_previsao.horizonte * modelo_previsao.intervalo / 3600
+    baixa_prevista = previsoes.dropna(subset=['HORAS_ATE_BAIXA'])
+    if baixa_prevista.empty:
+        mensagem_previsao = (st.success, f"🔮 Nenhuma umidade baixa prevista nas próximas {horas_horizonte:.0f}h.")
     else:
-        st.success(f"**Excelente:** Umidade média ideal ({umidade_media:.1f}%). Continue monitorando.")
+        mensagem_previsao = (st.warning, (
+            f"🔮 Umidade baixa prevista em {len(baixa_prevista):,} dispositivo(s) nas próximas "
+            f"{horas_horizonte:.0f}h (a primeira em {baixa_prevista['HORAS_ATE_BAIXA'].min():.0f}h)."
+        ))
 
-with col_sug2:
-    st.markdown("""
-    ### 🚿 Eficiência da Irrigação
-    """)
-    if taxa_irrigacao < 10:
-        st.success(f"**Ótimo:** Sistema eficiente ({taxa_irrigacao:.1f}% de ativação). Solo bem gerenciado.")
-    elif taxa_irrigacao > 30:
-        st.warning(f"**Atenção:** Alta ativação ({taxa_irrigacao:.1f}%). Verifique vazamentos ou ajuste sensores.")
+for coluna, (categoria, titulo) in zip(st.columns(len(regras.CATEGORIAS)), regras.CATEGORIAS.items()):
+    with coluna:
+        st.markdown(f"""
+        ### {titulo}
+        """)
+        da_categoria = [sugestao for sugestao in sugestoes if sugestao.categoria == categoria]
+        for sugestao in da_categoria:
+            exibir_sugestao[sugestao.severidade](sugestao.mensagem)
+        if not da_categoria:
+            st.caption("Nenhuma regra disparada no período.")
+        if categoria == 'umidade' and mensagem_previsao is not None:
+            exibir, mensagem = mensagem_previsao
+            exibir(mensagem)
+
+# Previsão por dispositivo, dos que têm maior chance de UMIDADE_BAIXA
+if previsoes is None and obter_previsor().erro:
+    st.caption(f"🔮 Previsão indisponível: modelo inválido ({obter_previsor().erro}); "
+               "treine novamente com `python -m irrigacao.previsao`.")
+elif previsoes is None:
+    st.caption("🔮 Previsão indisponível: treine o modelo com `python -m irrigacao.previsao`.")
+else:
+    with st.expander(f"🔮 Previsão da Umidade ({len(previsoes):,} dispositivos)"):
+        tabela_previsao = previsoes.sort_values('PROBABILIDADE_BAIXA', ascending=False).head(500).copy()
+        tabela_previsao['TIMESTAMP'] = pd.to_datetime(tabela_previsao['TIMESTAMP'], unit='s')
+        tabela_previsao['PROBABILIDADE_BAIXA'] *= 100
+        st.dataframe(
+            tabela_previsao[['CAMPO', 'DISPOSITIVO', 'TIMESTAMP', 'UMIDADE_ATUAL', 'UMIDADE_PREVISTA',
+                             'UMIDADE_MINIMA', 'PROBABILIDADE_BAIXA', 'HORAS_ATE_BAIXA']],
+            width='stretch',
+            hide_index=True,
+            column_config={
+                'CAMPO': st.column_config.NumberColumn("Campo"),
+                'DISPOSITIVO': st.column_config.NumberColumn("Dispositivo"),
+                'TIMESTAMP': st.column_config.DatetimeColumn("Última Leitura", format="DD/MM/YYYY HH:mm"),
+                'UMIDADE_ATUAL': st.column_config.NumberColumn("Umidade Atual (%)", format="%.1f"),
+                'UMIDADE_PREVISTA': st.column_config.NumberColumn("Prevista no Horizonte (%)", format="%.1f"),
+                'UMIDADE_MINIMA': st.column_config.NumberColumn("Mínima Prevista (%)", format="%.1f"),
+                'PROBABILIDADE_BAIXA': st.column_config.NumberColumn("Chance de Umidade Baixa (%)", format="%.0f"),
+                'HORAS_ATE_BAIXA': st.column_config.NumberColumn("Umidade Baixa em (h)", format="%.0f"),
+            },
+        )
+
+# Histórico compacto: cada sequência de leituras de um dispositivo em que uma
+# regra valeu, das mais recentes para as mais antigas
+ocorrencias = avaliacao.ocorrencias
+with st.expander(f"📜 Ocorrências das Regras ({len(ocorrencias):,})"):
+    if ocorrencias.empty:
+        st.info("Nenhuma regra disparada no período.")
     else:
-        st.info(f"**Normal:** Ativação moderada ({taxa_irrigacao:.1f}%). Sistema equilibrado.")
+        historico = ocorrencias.sort_values('FIM', ascending=False).head(500).copy()
+        severidades = {regra.id: regra.severidade for regra in obter_regras()}
+        historico.insert(1, 'SEVERIDADE', historico['REGRA'].map(severidades))
+        for coluna in ['INICIO', 'FIM']:
+            historico[coluna] = pd.to_datetime(historico[coluna], unit='s')
+        st.dataframe(
+            historico,
+            width='stretch',
+            hide_index=True,
+            column_config={
+                'REGRA': st.column_config.TextColumn("Regra"),
+                'SEVERIDADE': st.column_config.TextColumn("Severidade"),
+                'CAMPO': st.column_config.NumberColumn("Campo"),
+                'DISPOSITIVO': st.column_config.NumberColumn("Dispositivo"),
+                'INICIO': st.column_config.DatetimeColumn("Início", format="DD/MM/YYYY HH:mm"),
+                'FIM': st.column_config.DatetimeColumn("Fim", format="DD/MM/YYYY HH:mm"),
+                'LEITURAS': st.column_config.NumberColumn("Leituras"),
+                'VALOR_MIN': st.column_config.NumberColumn("Mínimo", format="%.1f"),
+                'VALOR_MAX': st.column_config.NumberColumn("Máximo", format="%.1f"),
+                'VALOR_FINAL': st.column_config.NumberColumn("Valor Final", format="%.1f"),
+                'ATIVA': st.column_config.CheckboxColumn("Ativa"),
+            },
+        )
 
-with col_sug3:
-    st.markdown("""
-    ### ☀️ Condições Ambientais
-    """)
-    if luz_media > 2000:
-        st.info(f"**Dia ensolarado:** Alta luminosidade ({luz_media:.0f}). Monitore evaporação.")
-    elif luz_media < 1500:
-        st.info(f"**Condições nubladas:** Baixa luminosidade ({luz_media:.0f}). Menos evaporação esperada.")
+# Ciclos de irrigação: episódios com a bomba ligada (irrigacao.episodios)
+# iniciados no período, em vez da contagem de leituras com o relé ligado
+st.markdown("## ⏱️ Ciclos de Irrigação")
+
+resumo_episodios, lista_episodios = run_episodios(
+    escopo, None if filtro_selecionado == 0 else agregados['TS_MIN']
+)
+resumo_episodios = resumo_episodios.set_index('EVENTO')
+ciclos = resumo_episodios.loc['irrigacao']
+
+col_ciclo1, col_ciclo2, col_ciclo3, col_ciclo4 = st.columns(4)
+with col_ciclo1:
+    st.metric("🚿 Ciclos", int(ciclos['EPISODIOS']),
+              help=f"{int(ciclos['EM_ANDAMENTO'])} em andamento")
+with col_ciclo2:
+    st.metric("⏱️ Bomba Ligada", f"{ciclos['DURACAO_TOTAL'] / 3600:,.1f} h")
+with col_ciclo3:
+    duracao_media = ciclos['DURACAO_MEDIA'] / 60 if ciclos['EPISODIOS'] else 0.0
+    st.metric("⌛ Duração Média", f"{duracao_media:,.0f} min")
+with col_ciclo4:
+    st.metric("💦 Água Estimada", f"{ciclos['VOLUME']:,.0f} L",
+              help=f"Vazão da bomba: {config.VAZAO_IRRIGACAO:g} L/min (IRRIGACAO_VAZAO)")
+
+with st.expander(f"📜 Episódios ({int(resumo_episodios['EPISODIOS'].sum()):,})"):
+    totais_episodios = resumo_episodios.reset_index()
+    totais_episodios['EVENTO'] = totais_episodios['EVENTO'].map(episodios.TITULOS_EVENTOS)
+    totais_episodios['DURACAO_TOTAL'] = totais_episodios['DURACAO_TOTAL'] / 3600
+    totais_episodios['DURACAO_MEDIA'] = totais_episodios['DURACAO_MEDIA'] / 60
+    st.dataframe(
+        totais_episodios,
+        width='stretch',
+        hide_index=True,
+        column_config={
+            'EVENTO': st.column_config.TextColumn("Evento"),
+            'EPISODIOS': st.column_config.NumberColumn("Episódios"),
+            'EM_ANDAMENTO': st.column_config.NumberColumn("Em Andamento"),
+            'DURACAO_TOTAL': st.column_config.NumberColumn("Duração Total (h)", format="%.1f"),
+            'DURACAO_MEDIA': st.column_config.NumberColumn("Duração Média (min)", format="%.0f"),
+            'LEITURAS': st.column_config.NumberColumn("Leituras"),
+            'VOLUME': st.column_config.NumberColumn("Água (L)", format="%.0f"),
+            'VARIACAO_UMIDADE_MEDIA': st.column_config.NumberColumn(
+                "Variação Média de Umidade (%)", format="%+.1f"
+            ),
+        },
+    )
+    if lista_episodios.empty:
+        st.info("Nenhum episódio no período.")
     else:
-        st.success(f"**Condições ideais:** Luminosidade equilibrada ({luz_media:.0f}).")
+        historico_episodios = lista_episodios.copy()
+        historico_episodios['EVENTO'] = historico_episodios['EVENTO'].map(episodios.TITULOS_EVENTOS)
+        for coluna in ['INICIO', 'FIM']:
+            historico_episodios[coluna] = pd.to_datetime(historico_episodios[coluna], unit='s')
+        historico_episodios['DURACAO'] = historico_episodios['DURACAO'] / 60
+        st.dataframe(
+            historico_episodios,
+            width='stretch',
+            hide_index=True,
+            column_config={
+                'EVENTO': st.column_config.TextColumn("Evento"),
+                'CAMPO': st.column_config.NumberColumn("Campo"),
+                'DISPOSITIVO': st.column_config.NumberColumn("Dispositivo"),
+                'INICIO': st.column_config.DatetimeColumn("Início", format="DD/MM/YYYY HH:mm"),
+                'FIM': st.column_config.DatetimeColumn("Fim", format="DD/MM/YYYY HH:mm"),
+                'DURACAO': st.column_config.NumberColumn("Duração (min)", format="%.0f"),
+                'LEITURAS': st.column_config.NumberColumn("Leituras"),
+                'UMIDADE_ANTES': st.column_config.NumberColumn("Umidade Antes (%)", format="%.1f"),
+                'UMIDADE_DEPOIS': st.column_config.NumberColumn("Umidade Depois (%)", format="%.1f"),
+                'VOLUME': st.column_config.NumberColumn("Água (L)", format="%.0f"),
+                'EM_ANDAMENTO': st.column_config.CheckboxColumn("Em Andamento"),
+            },
+        )
+
+# Visão geral: estado atual e totais do período de cada dispositivo do campo
+st.markdown("## 🗺️ Visão Geral dos Dispositivos")
+
+resumo_dispositivos = run_resumo_dispositivos(
+    filtro_selecionado, escopo.campo, obter_buffer(filtro_registros, escopo).marca_dagua
+)
+if resumo_dispositivos.empty:
+    st.info("Nenhum dispositivo com leituras no período.")
+else:
+    col_disp1, col_disp2, col_disp3, col_disp4 = st.columns(4)
+    with col_disp1:
+        st.metric("📡 Dispositivos", len(resumo_dispositivos))
+    with col_disp2:
+        st.metric("🚿 Irrigando Agora", int(resumo_dispositivos['RELAY_STATUS'].sum()))
+    with col_disp3:
+        st.metric("🧪 Alertas de NPK", int((resumo_dispositivos['NPK_OK'] == 0).sum()))
+    with col_disp4:
+        st.metric("⚖️ Alertas de pH", int((resumo_dispositivos['PH_OK'] == 0).sum()))
+
+    visao_geral = resumo_dispositivos.copy()
+    visao_geral['TS_ULTIMA'] = pd.to_datetime(visao_geral['TS_ULTIMA'], unit='s')
+    for coluna in ['RELAY_STATUS', 'NPK_OK', 'PH_OK']:
+        visao_geral[coluna] = visao_geral[coluna].astype(bool)
+    st.dataframe(
+        visao_geral,
+        width='stretch',
+        hide_index=True,
+        column_config={
+            'CAMPO': st.column_config.NumberColumn("Campo"),
+            'DISPOSITIVO': st.column_config.NumberColumn("Dispositivo"),
+            'MEDICOES': st.column_config.NumberColumn("Medições"),
+            'TS_ULTIMA': st.column_config.DatetimeColumn("Última Leitura", format="DD/MM/YYYY HH:mm"),
+            'UMIDADE_ATUAL': st.column_config.NumberColumn("Umidade Atual (%)", format="%.1f"),
+            'RELAY_STATUS': st.column_config.CheckboxColumn("Irrigando"),
+            'NPK_OK': st.column_config.CheckboxColumn("NPK OK"),
+            'PH_OK': st.column_config.CheckboxColumn("pH OK"),
+            'UMIDADE_MEDIA': st.column_config.NumberColumn("Umidade Média (%)", format="%.1f"),
+            'TAXA_ATIVACAO': st.column_config.ProgressColumn(
+                "Taxa de Ativação", format="%.1f%%", min_value=0, max_value=100
+            ),
+            'ALERTAS': st.column_config.NumberColumn("Alertas de Umidade"),
+        },
+    )
 
 # Tabela de dados recentes
 st.markdown("## 📋 Registros Mais Recentes")
 
 # Preparar dados para exibição
 df_display = df.head(10).copy()
-df_display = df_display[['DATETIME', 'UMIDADE_DHT', 'LDR_VALOR', 'N_PRESENTE', 
+df_display = df_display[['DATETIME', 'CAMPO', 'DISPOSITIVO', 'UMIDADE_DHT', 'LDR_VALOR', 'N_PRESENTE',
                         'P_PRESENTE', 'K_PRESENTE', 'RELAY_STATUS', 'UMIDADE_BAIXA', 
                         'NPK_OK', 'PH_OK']]
 
 # Renomear colunas para melhor visualização
-df_display.columns = ['Data/Hora', 'Umidade (%)', 'Luminosidade', 'N', 'P', 'K', 
+df_display.columns = ['Data/Hora', 'Campo', 'Dispositivo', 'Umidade (%)', 'Luminosidade', 'N', 'P', 'K',
                      'Irrigação', 'Umidade Baixa', 'NPK OK', 'pH OK']
 
 st.dataframe(df_display, width='stretch')
@@ -487,16 +1043,19 @@ st.markdown("## 📊 Estatísticas do Sistema")
 col_stats1, col_stats2, col_stats3, col_stats4 = st.columns(4)
 
 with col_stats1:
-    st.metric("📈 Total de Registros", len(df))
+    st.metric("📈 Total de Registros", agregados['TOTAL_MEDICOES'])
 
 with col_stats2:
-    st.metric("💧 Umidade Média", f"{df['UMIDADE_DHT'].mean():.1f}%")
+    st.metric("💧 Umidade Média", f"{agregados['UMIDADE_MEDIA']:.1f}%")
 
 with col_stats3:
-    st.metric("🚿 Ativações Totais", df['RELAY_STATUS'].sum())
+    st.metric("🚿 Ciclos de Irrigação", int(ciclos['EPISODIOS']),
+              help=f"{agregados['TOTAL_ATIVACOES']:,} leituras com a bomba ligada")
 
 with col_stats4:
-    st.metric("⚠️ Alertas de Umidade", df['UMIDADE_BAIXA'].sum())
+    st.metric("⚠️ Alertas de Umidade", agregados['ALERTAS_UMIDADE_BAIXA'])
+
+mostrar_diagnostico()
 
 # Footer
 st.markdown("---")
@@ -506,9 +1065,3 @@ st.markdown("""
     <p>Dashboard desenvolvido com Streamlit | Dados atualizados em tempo real</p>
 </div>
 """, unsafe_allow_html=True)
-
-# Auto-refresh
-if auto_refresh:
-    import time
-    time.sleep(30)
-    st.rerun()
\ No newline at end of file
@@ -7,120 +7,536 @@ Para usar este dashboard, execute: python src/dashboard_dash.py
 """
 
 import dash
-from dash import html, dcc, Input, Output, dash_table
+import flask
+from dash import html, dcc, Input, Output, State, dash_table
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
-import cx_Oracle
 from datetime import datetime, timedelta
 from sqlalchemy import create_engine
 import urllib.parse
+import threading
+import time
 
-# Configurações de conexão Oracle
-DB_CONFIG = {
-    'username': 'RM567686',
-    'password': '291278',
-    'host': 'oracle.fiap.com.br',
-    'port': '1521',
-    'service_name': 'ORCL'
+from irrigacao import criar_fonte, corrigir_unidades
+from irrigacao import amostragem
+from irrigacao import anomalias
+from irrigacao import config
+from irrigacao import episodios
+from irrigacao import metricas
+from irrigacao import previsao
+from irrigacao import regras
+from irrigacao.agregados import percentual
+from irrigacao.armazem import ArmazemDados
+from irrigacao.buffer import BufferJanela
+from irrigacao.consolidacao import Consolidacoes
+from irrigacao.esquema import ESCOPO_TODOS, Escopo, adicionar_datetime
+from irrigacao.eventos import CanalEventos, AtualizadorPeriodico
+from irrigacao.tarefas import ESTADOS, FilaTarefas
+
+# Valores do dropdown de período -> filtros aceitos pela fonte de dados
+FILTROS_PERIODO = {
+    '100_registros': 100,
+    '500_registros': 500,
+    '24h_dados': '24h',
+    '3d_dados': '3d',
+    '7d_dados': '7d',
+    'todos': 0
 }
 
-# Função para conectar ao banco (cx_Oracle tradicional)
-def get_oracle_connection():
+# Em "todos", os gráficos de detalhe e a tabela usam só os registros mais
+# recentes; os totais do histórico inteiro vêm das consolidações
+LIMITE_REGISTROS_DETALHE = 1000
+
+# Colunas lidas para os cartões, gráficos de detalhe, tabela e estatísticas
+# contínuas do período (TIMESTAMP é sempre incluído)
+COLUNAS_DETALHE = [
+    'UMIDADE_DHT', 'LDR_VALOR', 'N_PRESENTE', 'P_PRESENTE', 'K_PRESENTE',
+    'RELAY_STATUS', 'UMIDADE_BAIXA', 'NPK_OK', 'PH_OK', 'BLOQUEIO_EXTERNO',
+    'CAMPO', 'DISPOSITIVO',
+]
+
+# Fonte de dados (Oracle ou arquivo local, conforme IRRIGACAO_FONTE)
+fonte = criar_fonte()
+
+# Chave dos dados no servidor: período e escopo, "periodo|campo|dispositivo"
+# (vazio = todos). Uma chave só com o período vale para todos os dispositivos
+def montar_chave(filtro_tipo, campo=None, dispositivo=None):
+    if campo is None and dispositivo is None:
+        return filtro_tipo
+    return "|".join([filtro_tipo, '' if campo is None else str(campo),
+                     '' if dispositivo is None else str(dispositivo)])
+
+def interpretar_chave(chave):
+    filtro_tipo, _, resto = chave.partition('|')
+    campo, _, dispositivo = resto.partition('|')
+    return filtro_tipo, Escopo(
+        campo=int(campo) if campo else None,
+        dispositivo=int(dispositivo) if dispositivo else None,
+    )
+
+# Fontes restritas a um campo/dispositivo, criadas na primeira vez que o
+# escopo é pedido (mesmo pool e cache da fonte principal)
+fontes_escopo = {}
+
+def obter_fonte(escopo):
+    if escopo == ESCOPO_TODOS:
+        return fonte
+    if escopo not in fontes_escopo:
+        fontes_escopo[escopo] = fonte.com_escopo(escopo)
+    return fontes_escopo[escopo]
+
+# Campos e dispositivos dos seletores, relidos no máximo a cada 5 minutos
+VALIDADE_DISPOSITIVOS = 300
+_dispositivos = {'lidos_em': None, 'tabela': None}
+
+def listar_dispositivos():
+    agora = time.monotonic()
+    if _dispositivos['lidos_em'] is None or agora - _dispositivos['lidos_em'] >= VALIDADE_DISPOSITIVOS:
+        try:
+            _dispositivos['tabela'] = fonte.dispositivos()
+            _dispositivos['lidos_em'] = agora
+        except Exception as e:
+            print(f"Erro ao listar dispositivos: {e}")
+            if _dispositivos['tabela'] is None:
+                return pd.DataFrame(columns=['CAMPO', 'DISPOSITIVO'])
+    return _dispositivos['tabela']
+
+# Corrigir valores de umidade e converter timestamp (uma vez por leitura nova)
+def preparar_dados(df):
+    with metricas.cronometrar('corrigir_unidades'):
+        corrigir_unidades(df)
+    with metricas.cronometrar('convert_timestamp'):
+        return adicionar_datetime(df)
+
+# Buffer incremental de um período e escopo dos dropdowns
+def criar_buffer(chave):
+    filtro_tipo, escopo = interpretar_chave(chave)
+    filtro = FILTROS_PERIODO.get(filtro_tipo, 0)
+    return BufferJanela(
+        obter_fonte(escopo),
+        filtro if filtro != 0 else LIMITE_REGISTROS_DETALHE,
+        preparar=preparar_dados,
+        colunas=COLUNAS_DETALHE
+    )
+
+# Função para buscar dados (relativa aos dados existentes): a primeira chamada
+# carrega o período e as seguintes trazem apenas leituras com TIMESTAMP novo
+def fetch_data(chave="500_registros", recarregar=False):
     try:
-        dsn = cx_Oracle.makedsn(
-            DB_CONFIG['host'], 
-            DB_CONFIG['port'], 
-            service_name=DB_CONFIG['service_name']
-        )
-        connection = cx_Oracle.connect(
-            DB_CONFIG['username'], 
-            DB_CONFIG['password'], 
-            dsn
-        )
-        return connection
+        filtro_tipo, _ = interpretar_chave(chave)
+        with metricas.cronometrar('fetch_data', periodo=filtro_tipo):
+            buffer = armazem.buffer(chave)
+            if recarregar:
+                buffer.recarregar()
+            elif not ingestao_conectada():
+                buffer.atualizar()
+            return buffer.dados()
+        
     except Exception as e:
-        print(f"Erro ao conectar: {e}")
-        return None
+        print(f"Erro ao buscar dados: {e}")
+        return pd.DataFrame()
 
-# Função para buscar dados (relativa aos dados existentes)
-def fetch_data(filtro_tipo="500_registros"):
+# Consolidações por hora/dia/mês: períodos de tempo leem poucos baldes e cada
+# atualização só consolida as horas novas (no máximo uma ida ao banco a cada
+# 5 segundos, qualquer que seja o número de períodos pedidos). Uma por escopo
+consolidacoes = Consolidacoes(fonte, intervalo_minimo=5)
+consolidacoes_escopo = {}
+
+def obter_consolidacoes(escopo):
+    if escopo == ESCOPO_TODOS:
+        return consolidacoes
+    if escopo not in consolidacoes_escopo:
+        consolidacoes_escopo[escopo] = Consolidacoes(obter_fonte(escopo), intervalo_minimo=5)
+    return consolidacoes_escopo[escopo]
+
+# Agregados do período, lidos das estatísticas contínuas
+# (irrigacao.estatisticas): as do buffer da chave para N registros e
+# 24h/3d/7d, as das consolidações para "todos"
+def calcular_agregados(chave):
+    filtro_tipo, escopo = interpretar_chave(chave)
+    with metricas.cronometrar('fetch_aggregates', periodo=filtro_tipo):
+        filtro = FILTROS_PERIODO.get(filtro_tipo, 0)
+        if filtro == 0:
+            return obter_consolidacoes(escopo).agregados(filtro)
+        buffer = armazem.buffer(chave)
+        if buffer.marca_dagua is None:
+            buffer.atualizar()
+        return buffer.estatisticas.agregados()
+
+def fetch_aggregates(chave="500_registros"):
     try:
-        conn = get_oracle_connection()
-        if not conn:
-            return pd.DataFrame()
-        
-        # Definir query baseada no tipo de filtro
-        if filtro_tipo == "100_registros":
-            query = """
-            SELECT * FROM (
-                SELECT * FROM historico2024 ORDER BY timestamp DESC
-            ) WHERE ROWNUM <= 100
-            ORDER BY timestamp DESC
-            """
-        elif filtro_tipo == "500_registros":
-            query = """
-            SELECT * FROM (
-                SELECT * FROM historico2024 ORDER BY timestamp DESC
-            ) WHERE ROWNUM <= 500
-            ORDER BY timestamp DESC
-            """
-        elif filtro_tipo == "24h_dados":
-            query = """
-            SELECT * FROM historico2024 
-            WHERE timestamp >= (
-                SELECT MAX(timestamp) - 86400 FROM historico2024
-            )
-            ORDER BY timestamp DESC
-            """
-        elif filtro_tipo == "3d_dados":
-            query = """
-            SELECT * FROM historico2024 
-            WHERE timestamp >= (
-                SELECT MAX(timestamp) - (3 * 86400) FROM historico2024
-            )
-            ORDER BY timestamp DESC
-            """
-        elif filtro_tipo == "7d_dados":
-            query = """
-            SELECT * FROM historico2024 
-            WHERE timestamp >= (
-                SELECT MAX(timestamp) - (7 * 86400) FROM historico2024
+        return calcular_agregados(chave)
+    except Exception as e:
+        print(f"Erro ao buscar agregados: {e}")
+        return {}
+
+# Função para buscar a série de umidade já reduzida na fonte; com a versão,
+# refeita só quando os dados mudam: chave -> (versão, série)
+series_umidade = {}
+
+def fetch_series(chave="todos", pontos=amostragem.PONTOS_PADRAO, versao=None):
+    guardado = series_umidade.get(chave)
+    if versao is not None and guardado is not None and guardado[0] == versao:
+        return guardado[1]
+    try:
+        filtro_tipo, escopo = interpretar_chave(chave)
+        with metricas.cronometrar('fetch_series', periodo=filtro_tipo):
+            serie = obter_fonte(escopo).serie(FILTROS_PERIODO.get(filtro_tipo, 0), 'UMIDADE_DHT', pontos)
+            serie = preparar_dados(serie)
+    except Exception as e:
+        print(f"Erro ao buscar série de umidade: {e}")
+        return pd.DataFrame()
+    if versao is not None:
+        series_umidade[chave] = (versao, serie)
+    return serie
+
+# Resumo por dispositivo do campo (uma passada agrupada na fonte), refeito só
+# quando a versão dos dados do período muda: (período, campo) -> (versão, df)
+resumos_dispositivos = {}
+
+def fetch_resumo_dispositivos(chave, versao):
+    filtro_tipo, escopo = interpretar_chave(chave)
+    chave_resumo = (filtro_tipo, escopo.campo)
+    guardado = resumos_dispositivos.get(chave_resumo)
+    if guardado is not None and guardado[0] == versao:
+        return guardado[1]
+    try:
+        with metricas.cronometrar('fetch_resumo_dispositivos', periodo=filtro_tipo):
+            resumo = obter_fonte(Escopo(campo=escopo.campo)).resumo_dispositivos(
+                FILTROS_PERIODO.get(filtro_tipo, 0)
             )
-            ORDER BY timestamp DESC
-            """
-        else:
-            # Todos os dados (limitado a 1000 para performance)
-            query = """
-            SELECT * FROM (
-                SELECT * FROM historico2024 ORDER BY timestamp DESC
-            ) WHERE ROWNUM <= 1000
-            ORDER BY timestamp DESC
-            """
-        
-        # Suprimir warning do pandas
-        import warnings
-        with warnings.catch_warnings():
-            warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy")
-            df = pd.read_sql(query, conn)
-        conn.close()
-        
-        # Corrigir valores de umidade e converter timestamp
-        if not df.empty:
-            if 'UMIDADE_DHT' in df.columns:
-                df['UMIDADE_DHT'] = df['UMIDADE_DHT'] / 100
-            if 'TIMESTAMP' in df.columns:
-                df['DATETIME'] = pd.to_datetime(df['TIMESTAMP'], unit='s')
-        
-        return df
-        
     except Exception as e:
-        print(f"Erro ao buscar dados: {e}")
+        print(f"Erro ao resumir dispositivos: {e}")
         return pd.DataFrame()
+    resumos_dispositivos[chave_resumo] = (versao, resumo)
+    return resumo
+
+# Regras das sugestões (config.REGRAS) e suas ocorrências por período e
+# escopo, reavaliadas só quando a versão dos dados muda:
+# chave -> (versão, avaliação). Em "todos", as do histórico do escopo
+# (irrigacao.regras.RegrasHistorico), lido uma vez e depois avaliado só com
+# as leituras novas
+lista_regras = regras.carregar_regras()
+avaliacoes_regras = {}
+regras_historico = {}
+
+def obter_regras_historico(escopo):
+    if escopo not in regras_historico:
+        regras_historico[escopo] = regras.RegrasHistorico(obter_fonte(escopo), lista_regras, intervalo_minimo=5)
+    return regras_historico[escopo]
+
+def fetch_regras(chave, versao):
+    filtro_tipo, escopo = interpretar_chave(chave)
+    if FILTROS_PERIODO.get(filtro_tipo, 0) == 0:
+        try:
+            with metricas.cronometrar('fetch_regras', periodo=filtro_tipo):
+                historico = obter_regras_historico(escopo)
+                if historico.marca_dagua is None or not ingestao_conectada():
+                    historico.atualizar()
+                return historico.avaliacao()
+        except Exception as e:
+            print(f"Erro ao avaliar as regras: {e}")
+            return regras.Avaliacao(regras.ocorrencias_vazias(), 0)
+    guardado = avaliacoes_regras.get(chave)
+    if guardado is not None and guardado[0] == versao:
+        return guardado[1]
+    try:
+        with metricas.cronometrar('fetch_regras', periodo=filtro_tipo):
+            df = obter_fonte(escopo).carregar(
+                FILTROS_PERIODO.get(filtro_tipo, 0), colunas=regras.colunas_necessarias(lista_regras)
+            )
+            avaliacao = regras.avaliar(df, lista_regras)
+    except Exception as e:
+        print(f"Erro ao avaliar as regras: {e}")
+        return regras.Avaliacao(regras.ocorrencias_vazias(), 0)
+    avaliacoes_regras[chave] = (versao, avaliacao)
+    return avaliacao
+
+# Anomalias dos sensores do período: as do detector contínuo do buffer da
+# chave para N registros e 24h/3d/7d; em "todos", as do histórico do escopo
+# (irrigacao.anomalias.AnomaliasHistorico), lido uma vez e depois avaliado só
+# com as leituras novas. `versao` é aceita para manter a assinatura dos
+# demais resultados por versão
+anomalias_historico = {}
+
+def obter_anomalias_historico(escopo):
+    if escopo not in anomalias_historico:
+        anomalias_historico[escopo] = anomalias.AnomaliasHistorico(obter_fonte(escopo), intervalo_minimo=5)
+    return anomalias_historico[escopo]
+
+def fetch_anomalias(chave, versao):
+    filtro_tipo, escopo = interpretar_chave(chave)
+    if FILTROS_PERIODO.get(filtro_tipo, 0) != 0:
+        return armazem.buffer(chave).anomalias.anomalias()
+    try:
+        with metricas.cronometrar('fetch_anomalias', periodo=filtro_tipo):
+            historico = obter_anomalias_historico(escopo)
+            if historico.marca_dagua is None or not ingestao_conectada():
+                historico.atualizar()
+            return historico.anomalias()
+    except Exception as e:
+        print(f"Erro ao detectar anomalias: {e}")
+        return anomalias.anomalias_vazias()
+
+# Previsão das próximas leituras de cada dispositivo do escopo, a partir do
+# buffer de 3 dias (o mesmo do período "3d_dados"); o modelo
+# (config.MODELO_PREVISAO) é recarregado quando o arquivo muda e a previsão
+# só é refeita quando a versão do buffer muda. None sem modelo treinado ou
+# enquanto o buffer de 3 dias ainda está em carga (agendada por update_data)
+previsor = previsao.Previsor()
+
+def chave_previsao(chave):
+    _, escopo = interpretar_chave(chave)
+    return montar_chave('3d_dados', escopo.campo, escopo.dispositivo)
+
+def fetch_previsao(chave):
+    chave_3d = chave_previsao(chave)
+    if not carga_concluida(chave_3d):
+        return None
+    try:
+        with metricas.cronometrar('fetch_previsao'):
+            buffer = armazem.buffer(chave_3d)
+            return previsor.prever(buffer.dados(), (chave_3d, buffer.versao))
+    except Exception as e:
+        print(f"Erro ao prever a umidade: {e}")
+        return None
+
+# Episódios (ciclos de irrigação, umidade baixa e bloqueio) por escopo,
+# guardados por dia e atualizados só com as leituras novas
+motores_episodios = {}
+
+def obter_episodios(escopo):
+    if escopo not in motores_episodios:
+        motores_episodios[escopo] = episodios.Episodios(obter_fonte(escopo), intervalo_minimo=5)
+    return motores_episodios[escopo]
+
+# Resumo e episódios mais recentes iniciados no período da chave
+def fetch_episodios(chave):
+    filtro_tipo, escopo = interpretar_chave(chave)
+    try:
+        with metricas.cronometrar('fetch_episodios', periodo=filtro_tipo):
+            motor = obter_episodios(escopo)
+            if motor.marca_dagua is None or not ingestao_conectada():
+                motor.atualizar()
+            desde = None
+            if FILTROS_PERIODO.get(filtro_tipo, 0) != 0:
+                desde = armazem.agregados(chave).get('TS_MIN')
+            return motor.resumo(desde), motor.episodios(desde, limite=500)
+    except Exception as e:
+        print(f"Erro ao calcular os episódios: {e}")
+        return episodios.resumo_vazio(), episodios.episodios_vazios()
+
+# Dados mantidos no servidor, por período e escopo: o dcc.Store do navegador
+# guarda só a chave e a versão, e cada callback lê o DataFrame daqui
+armazem = ArmazemDados(criar_buffer, carregar_agregados=fetch_aggregates)
+
+# Atualização única no servidor: a cada INTERVALO_ATUALIZACAO segundos (ou
+# assim que chegam leituras da ingestão) os períodos em uso são atualizados
+# uma vez e as versões novas vão para todas as abas pelo canal de eventos
+# (SSE em /eventos). A carga no banco não cresce com o número de abas abertas
+INTERVALO_ATUALIZACAO = 30
+
+canal = CanalEventos()
+ultimas_versoes = {}
+
+def atualizar_chave(tarefa, chave):
+    # Uma chave já carregada: leituras novas, agregados e, se a versão mudou,
+    # os resultados de detalhe da versão nova
+    filtro_tipo, _ = interpretar_chave(chave)
+    versao = armazem.versao(chave)
+    if not ingestao_conectada():
+        with metricas.cronometrar('fetch_data', periodo=filtro_tipo):
+            armazem.buffer(chave).atualizar()
+    tarefa.informar(0.5, "Calculando os agregados")
+    armazem.publicar_agregados(chave, calcular_agregados(chave))
+    if armazem.versao(chave) != versao:
+        tarefa.informar(0.8, "Avaliando regras, anomalias e episódios")
+        aquecer(chave)
+
+def atualizar_periodos():
+    # Sem nenhuma aba conectada não há por que ir ao banco
+    if canal.assinantes == 0:
+        return
+    # As atualizações rodam na fila própria, com o mesmo tempo limite por
+    # consulta e prazo das cargas: um banco lento não prende o atualizador.
+    # Chaves ainda em carga (irrigacao.tarefas) entram quando ela terminar
+    tarefas = {
+        chave: tarefas_atualizacao.agendar(chave, atualizar_chave, chave)
+        for chave in armazem.chaves() if carga_concluida(chave)
+    }
+    versoes = {}
+    for chave, tarefa in tarefas.items():
+        tarefa.esperar(config.PRAZO_CARGA)
+        versoes[chave] = armazem.versao(chave)
+    if versoes != ultimas_versoes:
+        ultimas_versoes.clear()
+        ultimas_versoes.update(versoes)
+        canal.publicar('versoes', versoes)
+
+# Cargas em segundo plano (irrigacao.tarefas): a primeira carga de um período
+# e escopo e a recarga do botão rodam fora dos workers do Dash, com tempo
+# limite por consulta (config.TEMPO_LIMITE_CONSULTA) e prazo total
+# (config.PRAZO_CARGA). Enquanto a carga não termina, as abas continuam com
+# os últimos dados carregados e acompanham o progresso pelo intervalo de
+# progresso; ao terminar, o atualizador difunde as versões novas
+def terminar_carga(tarefa):
+    metricas.contar('irrigacao_tarefas_total', tipo='carga', estado=tarefa.estado)
+    if tarefa.erro:
+        print(f"Carga de {tarefa.chave}: {tarefa.erro}")
+    atualizador.acordar()
+
+tarefas_carga = FilaTarefas(
+    maximo=max(1, config.POOL_MAXIMO // 2),
+    prazo=config.PRAZO_CARGA,
+    tempo_consulta=config.TEMPO_LIMITE_CONSULTA,
+    ao_terminar=terminar_carga,
+)
+
+# Atualizações do ciclo, uma de cada vez (como quando rodavam na thread do
+# atualizador); ao terminar não acordam o atualizador, que já espera por elas
+def terminar_atualizacao(tarefa):
+    metricas.contar('irrigacao_tarefas_total', tipo='atualizacao', estado=tarefa.estado)
+    if tarefa.erro:
+        print(f"Atualização de {tarefa.chave}: {tarefa.erro}")
+
+tarefas_atualizacao = FilaTarefas(
+    maximo=1,
+    prazo=config.PRAZO_CARGA,
+    tempo_consulta=config.TEMPO_LIMITE_CONSULTA,
+    ao_terminar=terminar_atualizacao,
+)
+
+# Iniciado por iniciar_segundo_plano, na primeira requisição
+atualizador = AtualizadorPeriodico(atualizar_periodos, intervalo=INTERVALO_ATUALIZACAO)
+
+# Resultados por versão dos callbacks de detalhe calculados de antemão, para
+# que a primeira renderização da versão nova não vá ao banco
+def aquecer(chave):
+    versao = armazem.versao(chave)
+    fetch_regras(chave, versao)
+    fetch_anomalias(chave, versao)
+    fetch_resumo_dispositivos(chave, versao)
+    if FILTROS_PERIODO.get(interpretar_chave(chave)[0], 0) == 0:
+        fetch_series(chave, versao=versao)
+    fetch_episodios(chave)
+
+def carregar_chave(tarefa, chave, recarregar=False):
+    filtro_tipo, escopo = interpretar_chave(chave)
+    with metricas.cronometrar('carregar_chave', periodo=filtro_tipo):
+        buffer = armazem.buffer(chave)
+        if recarregar or buffer.marca_dagua is None:
+            tarefa.informar(0.1, "Lendo as leituras do período")
+            # Os dados anteriores continuam servidos até a carga nova terminar
+            buffer.recarregar()
+        if recarregar:
+            tarefa.informar(0.4, "Refazendo as consolidações")
+            obter_consolidacoes(escopo).recarregar()
+            tarefa.informar(0.55, "Refazendo os episódios")
+            obter_episodios(escopo).atualizar(forcar=True)
+            # Reavaliação completa das anomalias e regras só na recarga pedida
+            if escopo in anomalias_historico:
+                anomalias_historico[escopo].recarregar()
+            if escopo in regras_historico:
+                regras_historico[escopo].recarregar()
+        tarefa.informar(0.7, "Calculando os agregados")
+        armazem.publicar_agregados(chave, calcular_agregados(chave))
+        tarefa.informar(0.8, "Avaliando regras, anomalias e episódios")
+        aquecer(chave)
+
+def agendar_carga(chave, recarregar=False):
+    return tarefas_carga.agendar(chave, carregar_chave, chave, recarregar)
+
+def carga_concluida(chave):
+    # Um escopo sem leituras termina a carga sem marca d'água
+    if armazem.carregada(chave):
+        return True
+    tarefa = tarefas_carga.tarefa(chave)
+    return tarefa is not None and tarefa.estado == 'concluida'
+
+# Leituras ao vivo do serviço de ingestão (IRRIGACAO_INGESTAO): cada lote
+# gravado entra direto nos buffers e nas consolidações (cada um fica com as
+# do seu escopo) e antecipa a próxima difusão; o atualizador deixa de
+# consultar o banco enquanto a conexão estiver ativa
+def receber_leituras(df):
+    armazem.anexar(df)
+    consolidacoes.anexar(df)
+    for consolidacao in list(consolidacoes_escopo.values()):
+        consolidacao.anexar(df)
+    for motor in list(motores_episodios.values()):
+        motor.anexar(df)
+    for historico in list(anomalias_historico.values()):
+        historico.anexar(df)
+    for historico in list(regras_historico.values()):
+        historico.anexar(df)
+    atualizador.acordar()
+
+assinatura = None
+
+def ingestao_conectada():
+    return assinatura is not None and assinatura.conectado
 
 # Inicializar app Dash
 app = dash.Dash(__name__)
 app.title = "Sistema de Irrigação Inteligente - FIAP"
+# Aplicação WSGI para servidores como o gunicorn (ver README_DASHBOARD.md)
+server = app.server
+
+# Fluxo de eventos lido por assets/eventos.js, que repassa as versões ao
+# dcc.Store "versoes-store" de cada aba
+@app.server.route('/eventos')
+def eventos():
+    return flask.Response(
+        canal.assinar(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Métricas no formato do Prometheus (irrigacao.metricas): latência das
+# operações e dos callbacks, linhas e bytes lidos, acertos do cache e erros
+@app.server.route('/metrics')
+def metrics():
+    return flask.Response(
+        metricas.texto_prometheus(),
+        mimetype='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+# Atualizador e assinatura da ingestão: threads iniciadas na primeira
+# requisição do processo, não na importação. Com app.run(debug=True) o
+# processo do reloader também importa o módulo, mas só o filho atende; com
+# o gunicorn, cada worker inicia as suas
+_inicio_segundo_plano = threading.Lock()
+_segundo_plano_iniciado = False
+
+@app.server.before_request
+def iniciar_segundo_plano():
+    global assinatura, _segundo_plano_iniciado
+    if _segundo_plano_iniciado:
+        return
+    with _inicio_segundo_plano:
+        if _segundo_plano_iniciado:
+            return
+        if config.INGESTAO:
+            from irrigacao.ingestao import assinar_ingestao
+            assinatura = assinar_ingestao(config.INGESTAO, receber_leituras)
+        atualizador.start()
+        _segundo_plano_iniciado = True
+
+# Duração de cada requisição de callback incluindo a serialização JSON da
+# resposta, que o decorador dos callbacks não enxerga
+@app.server.before_request
+def iniciar_cronometro():
+    flask.g.inicio_requisicao = time.perf_counter()
+
+@app.server.after_request
+def registrar_requisicao(resposta):
+    inicio = flask.g.pop('inicio_requisicao', None)
+    if inicio is not None and flask.request.path.endswith('/_dash-update-component'):
+        corpo = flask.request.get_json(silent=True) or {}
+        saida = str(corpo.get('output', ''))
+        metricas.observar('dash_requisicao_segundos', time.perf_counter() - inicio, saida=saida)
+        metricas.contar('dash_resposta_bytes_total', resposta.calculate_content_length() or 0, saida=saida)
+    return resposta
 
 # Layout do dashboard
 app.layout = html.Div([
@@ -148,10 +564,31 @@ app.layout = html.Div([
             value='500_registros',
             style={'width': '250px', 'display': 'inline-block'}
         ),
+        html.Label("Campo:", style={'margin-left': '20px'}),
+        dcc.Dropdown(
+            id='campo-dropdown',
+            options=[{'label': f'Campo {campo}', 'value': campo}
+                     for campo in sorted(listar_dispositivos()['CAMPO'].unique().tolist())],
+            placeholder='Todos',
+            style={'width': '150px', 'display': 'inline-block'}
+        ),
+        html.Label("Dispositivo:", style={'margin-left': '20px'}),
+        dcc.Dropdown(
+            id='dispositivo-dropdown',
+            placeholder='Todos',
+            style={'width': '180px', 'display': 'inline-block'}
+        ),
         html.Button('🔄 Atualizar', id='refresh-button', 
-                   style={'margin-left': '20px'})
+                   style={'margin-left': '20px'}),
+        html.Button('⏹️ Cancelar', id='cancelar-button',
+                   style={'margin-left': '10px'})
     ], className="controls"),
     
+    # Progresso das cargas em segundo plano, consultado só enquanto há
+    # alguma em andamento
+    html.Div(id='progresso-carga', className="controls"),
+    dcc.Interval(id='progresso-intervalo', interval=500, disabled=True),
+    
     # Métricas principais
     html.Div(id='metricas-principais', className="metrics-row"),
     
@@ -185,38 +622,145 @@ app.layout = html.Div([
     # Sugestões
     html.Div(id='sugestoes', className="suggestions"),
     
-    # Intervalo para atualização automática
-    dcc.Interval(
-        id='interval-component',
-        interval=30*1000,  # 30 segundos
-        n_intervals=0
-    ),
+    # Ciclos de irrigação e demais episódios do período
+    html.Div([
+        html.H3("⏱️ Ciclos de Irrigação"),
+        html.Div(id='ciclos-irrigacao')
+    ], className="table-container"),
+    
+    # Visão geral de todos os dispositivos do campo
+    html.Div([
+        html.H3("🗺️ Visão Geral dos Dispositivos"),
+        html.Div(id='visao-dispositivos')
+    ], className="table-container"),
+    
+    # Versões dos períodos, atualizadas pelos eventos do servidor
+    # (assets/eventos.js) em vez de um intervalo por aba
+    dcc.Store(id='versoes-store'),
     
     # Store para dados
-    dcc.Store(id='data-store')
+    dcc.Store(id='data-store'),
+    
+    # Versão do buffer de 3 dias usado pela previsão
+    dcc.Store(id='previsao-store')
 ])
 
+# Callback para os dispositivos do campo selecionado
+@app.callback(
+    [Output('dispositivo-dropdown', 'options'),
+     Output('dispositivo-dropdown', 'value')],
+    [Input('campo-dropdown', 'value')],
+    [State('dispositivo-dropdown', 'value')]
+)
+@metricas.medido('dash_callback', callback='update_opcoes_dispositivo')
+def update_opcoes_dispositivo(campo, dispositivo_atual):
+    tabela = listar_dispositivos()
+    if campo is not None:
+        tabela = tabela[tabela['CAMPO'] == campo]
+    dispositivos = tabela['DISPOSITIVO'].tolist()
+    opcoes = [{'label': f'Dispositivo {dispositivo}', 'value': dispositivo} for dispositivo in dispositivos]
+    # O dispositivo escolhido só continua se for do campo novo
+    return opcoes, dispositivo_atual if dispositivo_atual in dispositivos else None
+
 # Callback para atualizar dados
 @app.callback(
-    Output('data-store', 'data'),
+    [Output('data-store', 'data'),
+     Output('previsao-store', 'data'),
+     Output('progresso-intervalo', 'disabled')],
     [Input('periodo-dropdown', 'value'),
+     Input('campo-dropdown', 'value'),
+     Input('dispositivo-dropdown', 'value'),
      Input('refresh-button', 'n_clicks'),
-     Input('interval-component', 'n_intervals')]
+     Input('versoes-store', 'data'),
+     Input('progresso-intervalo', 'n_intervals')],
+    [State('data-store', 'data'),
+     State('previsao-store', 'data')]
 )
-def update_data(filtro_periodo, n_clicks, n_intervals):
-    df = fetch_data(filtro_periodo)
-    return df.to_dict('records')
+@metricas.medido('dash_callback', callback='update_data')
+def update_data(filtro_periodo, campo, dispositivo, n_clicks, versoes, n_intervals, data_atual, previsao_atual):
+    chave = montar_chave(filtro_periodo, campo, dispositivo)
+    chave_3d = chave_previsao(chave)
+    gatilho = dash.callback_context.triggered_id
+    # O botão refaz a carga completa em segundo plano; ao terminar, o
+    # atualizador avisa as demais abas. As leituras novas já foram buscadas
+    # pelo atualizador, então aqui só se lê a versão
+    if gatilho == 'refresh-button':
+        agendar_carga(chave, recarregar=True)
+    # Primeira vez que o período e escopo (ou os 3 dias da previsão) são
+    # pedidos: carga inicial em segundo plano. Uma carga que falhou só é
+    # refeita a pedido, não a cada verificação do progresso
+    for chave_pedida in (chave, chave_3d):
+        tarefa = tarefas_carga.tarefa(chave_pedida)
+        if not carga_concluida(chave_pedida) and (tarefa is None or gatilho != 'progresso-intervalo'):
+            agendar_carga(chave_pedida)
+    tarefas = [tarefas_carga.tarefa(chave_pedida) for chave_pedida in (chave, chave_3d)]
+    parado = not any(tarefa is not None and tarefa.ativa for tarefa in tarefas)
+    
+    # Enquanto a chave não termina a carga, as abas ficam com os últimos
+    # dados carregados; sem leituras novas, os gráficos não precisam ser refeitos
+    data = dash.no_update
+    if carga_concluida(chave):
+        data = {'periodo': filtro_periodo, 'chave': chave, 'versao': armazem.versao(chave)}
+        if data == data_atual:
+            data = dash.no_update
+    versao_previsao = None
+    if carga_concluida(chave_3d):
+        versao_previsao = {'chave': chave_3d, 'versao': armazem.versao(chave_3d)}
+    if versao_previsao == previsao_atual:
+        versao_previsao = dash.no_update
+    return data, versao_previsao, parado
+
+# Callback para o progresso das cargas em segundo plano do período e escopo
+# selecionados; o botão de cancelar interrompe a consulta em andamento
+@app.callback(
+    Output('progresso-carga', 'children'),
+    [Input('progresso-intervalo', 'n_intervals'),
+     Input('progresso-intervalo', 'disabled'),
+     Input('cancelar-button', 'n_clicks')],
+    [State('periodo-dropdown', 'value'),
+     State('campo-dropdown', 'value'),
+     State('dispositivo-dropdown', 'value')]
+)
+@metricas.medido('dash_callback', callback='update_progresso')
+def update_progresso(n_intervals, parado, n_clicks, filtro_periodo, campo, dispositivo):
+    chave = montar_chave(filtro_periodo, campo, dispositivo)
+    cargas = {chave: "Dados do período"}
+    cargas.setdefault(chave_previsao(chave), "Últimos 3 dias (previsão)")
+    if dash.callback_context.triggered_id == 'cancelar-button':
+        for chave_carga in cargas:
+            tarefas_carga.cancelar(chave_carga)
+    
+    linhas = []
+    for chave_carga, rotulo in cargas.items():
+        tarefa = tarefas_carga.tarefa(chave_carga)
+        if tarefa is None or tarefa.estado == 'concluida':
+            continue
+        if tarefa.ativa:
+            linhas.append(html.Div([
+                html.Span(f"⏳ {rotulo}: {tarefa.mensagem} ({tarefa.segundos:.0f} s) "),
+                html.Progress(value=f"{tarefa.progresso:.2f}", max="1"),
+            ]))
+        else:
+            motivo = ESTADOS[tarefa.estado].lower()
+            if tarefa.mensagem != ESTADOS[tarefa.estado]:
+                motivo += f" ({tarefa.mensagem})"
+            anteriores = " Mostrando os últimos dados carregados." if carga_concluida(chave_carga) else ""
+            linhas.append(html.Div(
+                f"⚠️ {rotulo}: {motivo}.{anteriores} Use 🔄 Atualizar para tentar de novo."
+            ))
+    return linhas
 
 # Callback para métricas principais
 @app.callback(
     Output('metricas-principais', 'children'),
     [Input('data-store', 'data')]
 )
+@metricas.medido('dash_callback', callback='update_metricas')
 def update_metricas(data):
     if not data:
         return html.Div("Carregando dados...")
     
-    df = pd.DataFrame(data)
+    df = armazem.dados(data['chave'])
     if df.empty:
         return html.Div("Nenhum dado disponível")
     
@@ -247,27 +791,45 @@ def update_metricas(data):
     
     return metricas
 
+# Marcadores de anomalia no gráfico de umidade (os mais recentes) e suas cores
+MAXIMO_MARCADORES_ANOMALIAS = 2000
+CORES_ANOMALIAS = {
+    'fora_da_faixa': '#d62728',
+    'travado': '#7f7f7f',
+    'pico': '#ff7f0e',
+    'oscilacao': '#9467bd',
+}
+
 # Callback para gráfico de umidade
 @app.callback(
     Output('grafico-umidade', 'figure'),
     [Input('data-store', 'data')]
 )
+@metricas.medido('dash_callback', callback='update_grafico_umidade')
 def update_grafico_umidade(data):
     if not data:
         return {}
     
-    df = pd.DataFrame(data)
+    df = armazem.dados(data['chave'])
     if df.empty:
         return {}
     
-    df['DATETIME'] = pd.to_datetime(df['TIMESTAMP'], unit='s')
+    # Série reduzida a poucos milhares de pontos que preservam o formato;
+    # em "todos" a redução é feita na fonte, sobre o histórico completo
+    if FILTROS_PERIODO.get(data['periodo']) == 0:
+        serie = fetch_series(data['chave'], versao=data['versao'])
+    else:
+        serie = amostragem.reduzir(df[['TIMESTAMP', 'DATETIME', 'UMIDADE_DHT']], 'UMIDADE_DHT')
+    if serie.empty:
+        serie = df
     
     fig = px.line(
-        df, 
+        serie, 
         x='DATETIME', 
         y='UMIDADE_DHT',
         title='💧 Evolução da Umidade do Solo',
-        labels={'UMIDADE_DHT': 'Umidade (%)', 'DATETIME': 'Data/Hora'}
+        labels={'UMIDADE_DHT': 'Umidade (%)', 'DATETIME': 'Data/Hora'},
+        render_mode=amostragem.modo_renderizacao(len(serie))
     )
     
     # Linhas de referência
@@ -275,6 +837,20 @@ def update_grafico_umidade(data):
                   annotation_text="Ideal (60%)")
     fig.add_hline(y=40, line_dash="dash", line_color="red", 
                   annotation_text="Crítico (40%)")
+
+    # Anomalias dos sensores sobre a curva, na umidade da leitura (só as
+    # mais recentes, para o gráfico continuar leve)
+    marcadores = adicionar_datetime(
+        fetch_anomalias(data['chave'], data['versao']).tail(MAXIMO_MARCADORES_ANOMALIAS).copy()
+    )
+    for tipo, grupo in marcadores.groupby('TIPO', sort=False):
+        fig.add_trace(go.Scatter(
+            x=grupo['DATETIME'],
+            y=grupo['UMIDADE'],
+            mode='markers',
+            name=anomalias.TIPOS[tipo],
+            marker=dict(symbol='x', size=8, color=CORES_ANOMALIAS[tipo])
+        ))
     
     return fig
 
@@ -283,20 +859,21 @@ def update_grafico_umidade(data):
     Output('grafico-npk', 'figure'),
     [Input('data-store', 'data')]
 )
+@metricas.medido('dash_callback', callback='update_grafico_npk')
 def update_grafico_npk(data):
     if not data:
         return {}
     
-    df = pd.DataFrame(data)
-    if df.empty:
+    agregados = armazem.agregados(data['chave'])
+    if not agregados.get('TOTAL_MEDICOES'):
         return {}
     
     npk_data = {
         'Nutriente': ['Nitrogênio (N)', 'Fósforo (P)', 'Potássio (K)'],
         'Presença (%)': [
-            (df['N_PRESENTE'].sum() / len(df)) * 100,
-            (df['P_PRESENTE'].sum() / len(df)) * 100,
-            (df['K_PRESENTE'].sum() / len(df)) * 100
+            percentual(agregados, 'TOTAL_N_PRESENTE'),
+            percentual(agregados, 'TOTAL_P_PRESENTE'),
+            percentual(agregados, 'TOTAL_K_PRESENTE')
         ]
     }
     
@@ -316,18 +893,19 @@ def update_grafico_npk(data):
     Output('grafico-irrigacao', 'figure'),
     [Input('data-store', 'data')]
 )
+@metricas.medido('dash_callback', callback='update_grafico_irrigacao')
 def update_grafico_irrigacao(data):
     if not data:
         return {}
     
-    df = pd.DataFrame(data)
-    if df.empty:
+    agregados = armazem.agregados(data['chave'])
+    if not agregados.get('TOTAL_MEDICOES'):
         return {}
     
-    irrigacao_counts = df['RELAY_STATUS'].value_counts()
+    ativacoes = agregados['TOTAL_ATIVACOES']
     
     fig = px.pie(
-        values=irrigacao_counts.values,
+        values=[agregados['TOTAL_MEDICOES'] - ativacoes, ativacoes],
         names=['Inativo', 'Ativo'],
         title='🚿 Status da Irrigação',
         color_discrete_sequence=['#ff9999', '#66b3ff']
@@ -340,11 +918,12 @@ def update_grafico_irrigacao(data):
     Output('grafico-correlacao', 'figure'),
     [Input('data-store', 'data')]
 )
+@metricas.medido('dash_callback', callback='update_grafico_correlacao')
 def update_grafico_correlacao(data):
     if not data:
         return {}
     
-    df = pd.DataFrame(data)
+    df = armazem.dados(data['chave'])
     if df.empty:
         return {}
     
@@ -365,19 +944,22 @@ def update_grafico_correlacao(data):
     Output('tabela-dados', 'children'),
     [Input('data-store', 'data')]
 )
+@metricas.medido('dash_callback', callback='update_tabela')
 def update_tabela(data):
     if not data:
         return html.Div("Carregando...")
     
-    df = pd.DataFrame(data)
+    df = armazem.dados(data['chave'])
     if df.empty:
         return html.Div("Nenhum dado disponível")
     
     # Preparar dados para tabela
-    df_table = df.head(10)
+    df_table = df.head(10).copy()
     df_table['DATETIME'] = pd.to_datetime(df_table['TIMESTAMP'], unit='s').dt.strftime('%d/%m/%Y %H:%M')
+    # Umidade fica em float32 na memória; arredondar evita 52.91999816894531
+    df_table['UMIDADE_DHT'] = df_table['UMIDADE_DHT'].astype('float64').round(2)
     
-    columns_to_show = ['DATETIME', 'UMIDADE_DHT', 'LDR_VALOR', 'RELAY_STATUS', 'NPK_OK', 'PH_OK']
+    columns_to_show = ['DATETIME', 'CAMPO', 'DISPOSITIVO', 'UMIDADE_DHT', 'LDR_VALOR', 'RELAY_STATUS', 'NPK_OK', 'PH_OK']
     df_table = df_table[columns_to_show]
     
     return dash_table.DataTable(
@@ -397,35 +979,197 @@ def update_tabela(data):
 # Callback para sugestões
 @app.callback(
     Output('sugestoes', 'children'),
-    [Input('data-store', 'data')]
+    [Input('data-store', 'data'),
+     Input('previsao-store', 'data')]
 )
-def update_sugestoes(data):
+@metricas.medido('dash_callback', callback='update_sugestoes')
+def update_sugestoes(data, versao_previsao=None):
     if not data:
         return html.Div()
     
-    df = pd.DataFrame(data)
-    if df.empty:
-        return html.Div()
+    # Regras ativas na última leitura de cada dispositivo (irrigacao.regras)
+    avaliacao = fetch_regras(data['chave'], data['versao'])
+    icones = {'alerta': '⚠️', 'info': 'ℹ️', 'ok': '✅'}
+    sugestoes = "\n".join(
+        f"- {icones[sugestao.severidade]} {sugestao.mensagem}"
+        for sugestao in regras.sugestoes(avaliacao, lista_regras)
+    )
+
+    # Previsão das próximas horas (irrigacao.previsao), dos dispositivos com
+    # maior chance de UMIDADE_BAIXA. O modelo é lido uma vez: o arquivo pode
+    # mudar (ou sumir) entre a previsão e o texto
+    modelo_previsao = previsor.modelo()
+    previsoes = fetch_previsao(data['chave']) if modelo_previsao is not None else None
+    if previsoes is None:
+        if modelo_previsao is None and previsor.erro:
+            texto_previsao = (f"Previsão indisponível: modelo inválido ({previsor.erro}); "
+                              "treine novamente com `python -m irrigacao.previsao`.")
+        elif modelo_previsao is None:
+            texto_previsao = "Previsão indisponível: treine o modelo com `python -m irrigacao.previsao`."
+        else:
+            texto_previsao = "⏳ Previsão indisponível enquanto os últimos 3 dias não são carregados."
+        tabela_previsao = previsao.previsoes_vazias()
+    else:
+        horas_horizonte = modelo_previsao.horizonte * modelo_previsao.intervalo / 3600
+        baixa_prevista = previsoes.dropna(subset=['HORAS_ATE_BAIXA'])
+        if baixa_prevista.empty:
+            texto_previsao = f"✅ Nenhuma umidade baixa prevista nas próximas {horas_horizonte:.0f}h."
+        else:
+            texto_previsao = (
+                f"⚠️ Umidade baixa prevista em {len(baixa_prevista):,} dispositivo(s) nas próximas "
+                f"{horas_horizonte:.0f}h (a primeira em {baixa_prevista['HORAS_ATE_BAIXA'].min():.0f}h)."
+            )
+        tabela_previsao = previsoes.sort_values('PROBABILIDADE_BAIXA', ascending=False).head(500).copy()
+    tabela_previsao = tabela_previsao[['CAMPO', 'DISPOSITIVO', 'TIMESTAMP', 'UMIDADE_ATUAL', 'UMIDADE_PREVISTA',
+                                       'UMIDADE_MINIMA', 'PROBABILIDADE_BAIXA', 'HORAS_ATE_BAIXA']]
+    tabela_previsao['TIMESTAMP'] = pd.to_datetime(tabela_previsao['TIMESTAMP'], unit='s').dt.strftime('%d/%m/%Y %H:%M')
+    tabela_previsao['PROBABILIDADE_BAIXA'] = tabela_previsao['PROBABILIDADE_BAIXA'] * 100
+    tabela_previsao = tabela_previsao.round(1)
     
-    # Calcular métricas
-    umidade_media = df['UMIDADE_DHT'].mean()
-    taxa_irrigacao = (df['RELAY_STATUS'].sum() / len(df)) * 100
+    # Ocorrências mais recentes, uma linha por sequência de leituras em que
+    # a regra valeu
+    ocorrencias = avaliacao.ocorrencias.sort_values('FIM', ascending=False).head(500).copy()
+    for coluna in ['INICIO', 'FIM']:
+        ocorrencias[coluna] = pd.to_datetime(ocorrencias[coluna], unit='s').dt.strftime('%d/%m/%Y %H:%M')
+    for coluna in ['VALOR_MIN', 'VALOR_MAX', 'VALOR_FINAL']:
+        ocorrencias[coluna] = ocorrencias[coluna].round(1)
+    ocorrencias['ATIVA'] = ocorrencias['ATIVA'].astype(int)
     
-    sugestoes = []
+    return html.Div([
+        html.H3("🤖 Sugestões Inteligentes"),
+        dcc.Markdown(sugestoes or "Nenhuma regra disparada no período."),
+        html.H4("🔮 Previsão da Umidade"),
+        dcc.Markdown(texto_previsao),
+        dash_table.DataTable(
+            data=tabela_previsao.to_dict('records'),
+            columns=[{"name": col, "id": col} for col in tabela_previsao.columns],
+            page_size=10,
+            sort_action='native',
+            style_cell={'textAlign': 'center'},
+            style_header={'backgroundColor': '#1f4e79', 'color': 'white'},
+        ),
+        html.H4(f"📜 Ocorrências das Regras ({len(avaliacao.ocorrencias):,})"),
+        dash_table.DataTable(
+            data=ocorrencias.to_dict('records'),
+            columns=[{"name": col, "id": col} for col in ocorrencias.columns],
+            page_size=10,
+            sort_action='native',
+            style_cell={'textAlign': 'center'},
+            style_header={'backgroundColor': '#1f4e79', 'color': 'white'},
+            style_data_conditional=[
+                {
+                    'if': {'filter_query': '{ATIVA} = 1'},
+                    'fontWeight': 'bold',
+                }
+            ]
+        )
+    ])
+
+# Callback para os ciclos de irrigação
+@app.callback(
+    Output('ciclos-irrigacao', 'children'),
+    [Input('data-store', 'data')]
+)
+@metricas.medido('dash_callback', callback='update_ciclos')
+def update_ciclos(data):
+    if not data:
+        return html.Div("Carregando...")
     
-    if umidade_media < 45:
-        sugestoes.append("⚠️ Umidade média baixa. Considere aumentar irrigação.")
-    elif umidade_media > 75:
-        sugestoes.append("✅ Umidade adequada. Sistema funcionando bem.")
+    # Episódios iniciados no período (irrigacao.episodios): cada sequência de
+    # leituras com a bomba ligada conta uma vez, com duração e água estimada
+    resumo, lista = fetch_episodios(data['chave'])
+    ciclos = resumo.set_index('EVENTO').loc['irrigacao']
+    duracao_media = ciclos['DURACAO_MEDIA'] / 60 if ciclos['EPISODIOS'] else 0.0
+    cartoes = html.Div([
+        html.Div([html.H4(f"{int(ciclos['EPISODIOS'])}"), html.P("🚿 Ciclos")], className="metric-card"),
+        html.Div([html.H4(f"{ciclos['DURACAO_TOTAL'] / 3600:,.1f} h"), html.P("⏱️ Bomba Ligada")],
+                 className="metric-card"),
+        html.Div([html.H4(f"{duracao_media:,.0f} min"), html.P("⌛ Duração Média")], className="metric-card"),
+        html.Div([html.H4(f"{ciclos['VOLUME']:,.0f} L"), html.P("💦 Água Estimada")], className="metric-card"),
+    ], className="metrics-container")
     
-    if taxa_irrigacao > 30:
-        sugestoes.append("🔍 Alta ativação da irrigação. Verifique possíveis vazamentos.")
-    elif taxa_irrigacao < 10:
-        sugestoes.append("👍 Sistema de irrigação eficiente.")
+    tabela = lista.copy()
+    tabela['EVENTO'] = tabela['EVENTO'].map(episodios.TITULOS_EVENTOS)
+    for coluna in ['INICIO', 'FIM']:
+        tabela[coluna] = pd.to_datetime(tabela[coluna], unit='s').dt.strftime('%d/%m/%Y %H:%M')
+    tabela['DURACAO'] = (tabela['DURACAO'] / 60).round(0)
+    for coluna in ['UMIDADE_ANTES', 'UMIDADE_DEPOIS', 'VOLUME']:
+        tabela[coluna] = tabela[coluna].round(1)
+    tabela['EM_ANDAMENTO'] = tabela['EM_ANDAMENTO'].astype(int)
     
     return html.Div([
-        html.H3("🤖 Sugestões Inteligentes"),
-        html.Ul([html.Li(sug) for sug in sugestoes])
+        cartoes,
+        html.H4(f"📜 Episódios ({int(resumo['EPISODIOS'].sum()):,})"),
+        dash_table.DataTable(
+            data=tabela.to_dict('records'),
+            columns=[{"name": col, "id": col} for col in tabela.columns],
+            page_size=10,
+            sort_action='native',
+            style_cell={'textAlign': 'center'},
+            style_header={'backgroundColor': '#1f4e79', 'color': 'white'},
+            style_data_conditional=[
+                {
+                    'if': {'filter_query': '{EM_ANDAMENTO} = 1'},
+                    'fontWeight': 'bold',
+                }
+            ]
+        )
+    ])
+
+# Callback para a visão geral dos dispositivos
+@app.callback(
+    Output('visao-dispositivos', 'children'),
+    [Input('data-store', 'data')]
+)
+@metricas.medido('dash_callback', callback='update_visao_dispositivos')
+def update_visao_dispositivos(data):
+    if not data:
+        return html.Div("Carregando...")
+    
+    resumo = fetch_resumo_dispositivos(data['chave'], data['versao'])
+    if resumo.empty:
+        return html.Div("Nenhum dispositivo com leituras no período")
+    
+    cartoes = html.Div([
+        html.Div([html.H4(f"{len(resumo)}"), html.P("📡 Dispositivos")], className="metric-card"),
+        html.Div([html.H4(f"{int(resumo['RELAY_STATUS'].sum())}"), html.P("🚿 Irrigando Agora")],
+                 className="metric-card"),
+        html.Div([html.H4(f"{int((resumo['NPK_OK'] == 0).sum())}"), html.P("🧪 Alertas de NPK")],
+                 className="metric-card"),
+        html.Div([html.H4(f"{int((resumo['PH_OK'] == 0).sum())}"), html.P("⚖️ Alertas de pH")],
+                 className="metric-card"),
+    ], className="metrics-container")
+    
+    tabela = resumo.copy()
+    tabela['TS_ULTIMA'] = pd.to_datetime(tabela['TS_ULTIMA'], unit='s').dt.strftime('%d/%m/%Y %H:%M')
+    for coluna in ['UMIDADE_ATUAL', 'UMIDADE_MEDIA', 'TAXA_ATIVACAO']:
+        tabela[coluna] = tabela[coluna].round(1)
+    
+    # Paginação, ordenação e filtro no navegador: com milhares de dispositivos
+    # só uma página é desenhada por vez
+    return html.Div([
+        cartoes,
+        dash_table.DataTable(
+            data=tabela.to_dict('records'),
+            columns=[{"name": col, "id": col} for col in tabela.columns],
+            page_size=20,
+            sort_action='native',
+            filter_action='native',
+            style_cell={'textAlign': 'center'},
+            style_header={'backgroundColor': '#1f4e79', 'color': 'white'},
+            style_data_conditional=[
+                {
+                    'if': {'filter_query': '{RELAY_STATUS} = 1'},
+                    'backgroundColor': '#d4edda',
+                    'color': 'black',
+                },
+                {
+                    'if': {'filter_query': '{NPK_OK} = 0 || {PH_OK} = 0'},
+                    'backgroundColor': '#f8d7da',
+                    'color': 'black',
+                }
+            ]
+        )
     ])
 
 # CSS inline
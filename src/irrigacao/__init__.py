@@ -0,0 +1,19 @@
+"""
+Pacote de suporte aos dashboards do Sistema de Irrigação Inteligente
+Sistema desenvolvido para a Fase 3 do curso FIAP - Tecnologia em IA
+
+Os módulos deste pacote são compartilhados por `src/dashboard.py` (Streamlit)
+e `src/dashboard_dash.py` (Dash), que os importam a partir da pasta `src/`.
+"""
+
+from irrigacao.esquema import TABELA, COLUNAS, corrigir_unidades, compactar, pegada_memoria
+from irrigacao.fonte_dados import (
+    FonteDados,
+    FonteOracle,
+    FonteLocal,
+    FonteBancoLocal,
+    Periodo,
+    interpretar_periodo,
+    criar_fonte,
+)
+from irrigacao.pool import PoolConexoes, TempoEsgotado
@@ -0,0 +1,261 @@
+"""
+Agregados do período usados pelos cartões, gráficos e sugestões
+
+Em vez de trazer todas as linhas para calcular médias, contagens e
+correlações no pandas, as fontes de dados devolvem só estes poucos números
+em uma única ida ao banco (mesmas contas das consultas 6, 7, 9, 10, 11 e 12
+de `scripts/consultas_analise.sql`).
+
+Os valores de umidade já saem corrigidos para porcentagem.
+
+`montar_sql_dispositivos`/`resumir_dispositivos` fazem o mesmo por
+dispositivo: uma linha por nó com a leitura mais recente e os totais do
+período, em uma única passada agrupada (e não uma consulta por dispositivo).
+"""
+
+import numpy as np
+import pandas as pd
+
+from irrigacao.esquema import ESCALA_UMIDADE
+
+# Colunas do mapa de correlação dos dashboards
+COLUNAS_CORRELACAO = ['UMIDADE_DHT', 'LDR_VALOR', 'RELAY_STATUS', 'UMIDADE_BAIXA']
+
+# Contagem de linhas com a flag ligada -> nome do agregado
+SOMAS_FLAGS = {
+    'RELAY_STATUS': 'TOTAL_ATIVACOES',
+    'UMIDADE_BAIXA': 'ALERTAS_UMIDADE_BAIXA',
+    'N_PRESENTE': 'TOTAL_N_PRESENTE',
+    'P_PRESENTE': 'TOTAL_P_PRESENTE',
+    'K_PRESENTE': 'TOTAL_K_PRESENTE',
+    'NPK_OK': 'TOTAL_NPK_OK',
+    'PH_OK': 'TOTAL_PH_OK',
+    'BLOQUEIO_EXTERNO': 'TOTAL_BLOQUEIO_EXTERNO',
+}
+
+
+def pares_correlacao():
+    for i, a in enumerate(COLUNAS_CORRELACAO):
+        for b in COLUNAS_CORRELACAO[i + 1:]:
+            yield a, b
+
+
+def nome_correlacao(a, b):
+    return f"CORR_{a}_{b}"
+
+
+# Colunas do resumo por dispositivo, na ordem da visão geral
+COLUNAS_DISPOSITIVOS = [
+    'CAMPO', 'DISPOSITIVO', 'MEDICOES', 'TS_ULTIMA', 'UMIDADE_ATUAL', 'RELAY_STATUS',
+    'NPK_OK', 'PH_OK', 'UMIDADE_MEDIA', 'TAXA_ATIVACAO', 'ALERTAS',
+]
+
+# Estado atual: valores da leitura mais recente de cada dispositivo
+COLUNAS_ESTADO = ['RELAY_STATUS', 'NPK_OK', 'PH_OK']
+
+
+def montar_sql_agregados(subconsulta):
+    """SELECT de uma linha com todos os agregados sobre `subconsulta`."""
+    # Divisor com ponto decimal: no SQLite inteiro / inteiro trunca
+    escala = float(ESCALA_UMIDADE)
+    campos = [
+        "COUNT(*) AS TOTAL_MEDICOES",
+        "MIN(TIMESTAMP) AS TS_MIN",
+        "MAX(TIMESTAMP) AS TS_MAX",
+        f"AVG(UMIDADE_DHT) / {escala} AS UMIDADE_MEDIA",
+        f"MIN(UMIDADE_DHT) / {escala} AS UMIDADE_MIN",
+        f"MAX(UMIDADE_DHT) / {escala} AS UMIDADE_MAX",
+        f"STDDEV(UMIDADE_DHT) / {escala} AS UMIDADE_DESVIO",
+        "AVG(LDR_VALOR) AS LDR_MEDIA",
+    ]
+    campos += [f"SUM({coluna}) AS {nome}" for coluna, nome in SOMAS_FLAGS.items()]
+    campos += [f"CORR({a}, {b}) AS {nome_correlacao(a, b)}" for a, b in pares_correlacao()]
+    return "SELECT\n    " + ",\n    ".join(campos) + f"\nFROM ({subconsulta})"
+
+
+def montar_sql_dispositivos(subconsulta, tabela):
+    """Resumo por dispositivo sobre `subconsulta`: um GROUP BY com os totais
+    e a última leitura de cada um, buscada pela chave (DISPOSITIVO,
+    TIMESTAMP) de `tabela`."""
+    escala = float(ESCALA_UMIDADE)
+    # Sem AS nos apelidos de tabela: o Oracle não aceita
+    return (
+        "SELECT R.CAMPO, R.DISPOSITIVO, R.MEDICOES, R.TS_ULTIMA,\n"
+        f"    U.UMIDADE_DHT / {escala} AS UMIDADE_ATUAL,\n"
+        "    " + ", ".join(f"U.{coluna}" for coluna in COLUNAS_ESTADO) + ",\n"
+        "    R.UMIDADE_MEDIA, 100.0 * R.ATIVACOES / R.MEDICOES AS TAXA_ATIVACAO, R.ALERTAS\n"
+        "FROM (\n"
+        "    SELECT CAMPO, DISPOSITIVO, COUNT(*) AS MEDICOES, MAX(TIMESTAMP) AS TS_ULTIMA,\n"
+        f"        AVG(UMIDADE_DHT) / {escala} AS UMIDADE_MEDIA,\n"
+        "        SUM(RELAY_STATUS) AS ATIVACOES, SUM(UMIDADE_BAIXA) AS ALERTAS\n"
+        f"    FROM ({subconsulta})\n"
+        "    GROUP BY CAMPO, DISPOSITIVO\n"
+        ") R\n"
+        f"JOIN {tabela} U ON U.DISPOSITIVO = R.DISPOSITIVO AND U.TIMESTAMP = R.TS_ULTIMA\n"
+        "ORDER BY R.CAMPO, R.DISPOSITIVO"
+    )
+
+
+def normalizar_dispositivos(df):
+    """Resumo devolvido pelo banco com os nomes e tipos de
+    `resumir_dispositivos`."""
+    df.columns = [c.upper() for c in df.columns]
+    df = df[COLUNAS_DISPOSITIVOS]
+    inteiras = ['CAMPO', 'DISPOSITIVO', 'MEDICOES', 'TS_ULTIMA', 'ALERTAS'] + COLUNAS_ESTADO
+    df = df.astype({coluna: 'int64' for coluna in inteiras})
+    return df.astype({c: 'float64' for c in ['UMIDADE_ATUAL', 'UMIDADE_MEDIA', 'TAXA_ATIVACAO']})
+
+
+def resumir_dispositivos(df):
+    """Mesmo resumo de `montar_sql_dispositivos`, sobre linhas em memória
+    (unidades armazenadas, em ordem crescente de TIMESTAMP)."""
+    if len(df) == 0:
+        return pd.DataFrame(columns=COLUNAS_DISPOSITIVOS)
+    resumo = df.groupby(['CAMPO', 'DISPOSITIVO'], sort=True, observed=True).agg(
+        MEDICOES=('TIMESTAMP', 'size'),
+        TS_ULTIMA=('TIMESTAMP', 'last'),
+        UMIDADE_ATUAL=('UMIDADE_DHT', 'last'),
+        **{coluna: (coluna, 'last') for coluna in COLUNAS_ESTADO},
+        UMIDADE_MEDIA=('UMIDADE_DHT', 'mean'),
+        ATIVACOES=('RELAY_STATUS', 'sum'),
+        ALERTAS=('UMIDADE_BAIXA', 'sum'),
+    ).reset_index()
+    resumo['UMIDADE_ATUAL'] = resumo['UMIDADE_ATUAL'] / ESCALA_UMIDADE
+    resumo['UMIDADE_MEDIA'] = resumo['UMIDADE_MEDIA'] / ESCALA_UMIDADE
+    resumo['TAXA_ATIVACAO'] = 100.0 * resumo['ATIVACOES'] / resumo['MEDICOES']
+    return normalizar_dispositivos(resumo)
+
+
+def normalizar_agregados(linha):
+    """Converte a linha devolvida pelo banco em dict de floats/ints."""
+    agregados = {}
+    for chave, valor in linha.items():
+        chave = chave.upper()
+        if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+            agregados[chave] = float('nan') if chave != 'TOTAL_MEDICOES' else 0
+        elif chave == 'TOTAL_MEDICOES' or chave.startswith(('TOTAL_', 'ALERTAS_', 'TS_')):
+            agregados[chave] = int(valor)
+        else:
+            agregados[chave] = float(valor)
+    return agregados
+
+
+def calcular_agregados(df):
+    """Mesmos agregados de `montar_sql_agregados`, sobre um DataFrame já
+    carregado (UMIDADE_DHT no formato armazenado)."""
+    total = len(df)
+    if total == 0:
+        return normalizar_agregados({'TOTAL_MEDICOES': 0})
+
+    umidade = df['UMIDADE_DHT'].to_numpy(dtype='float64') / ESCALA_UMIDADE
+    ldr = df['LDR_VALOR'].to_numpy(dtype='float64')
+    timestamps = df['TIMESTAMP'].to_numpy()
+    agregados = {
+        'TOTAL_MEDICOES': total,
+        'TS_MIN': timestamps.min(),
+        'TS_MAX': timestamps.max(),
+        'UMIDADE_MEDIA': umidade.mean(),
+        'UMIDADE_MIN': umidade.min(),
+        'UMIDADE_MAX': umidade.max(),
+        # STDDEV do Oracle é o desvio amostral
+        'UMIDADE_DESVIO': umidade.std(ddof=1) if total > 1 else float('nan'),
+        'LDR_MEDIA': ldr.mean(),
+    }
+    for coluna, nome in SOMAS_FLAGS.items():
+        agregados[nome] = df[coluna].to_numpy().sum()
+
+    valores = np.column_stack([df[c].to_numpy(dtype='float64') for c in COLUNAS_CORRELACAO])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.corrcoef(valores, rowvar=False) if total > 1 else np.full((4, 4), np.nan)
+    for i, a in enumerate(COLUNAS_CORRELACAO):
+        for j, b in enumerate(COLUNAS_CORRELACAO):
+            if j > i:
+                agregados[nome_correlacao(a, b)] = corr[i, j]
+    return normalizar_agregados(agregados)
+
+
+def matriz_correlacao(agregados):
+    """Monta a matriz de correlação 4x4 a partir dos agregados."""
+    matriz = pd.DataFrame(
+        np.eye(len(COLUNAS_CORRELACAO)),
+        index=COLUNAS_CORRELACAO,
+        columns=COLUNAS_CORRELACAO,
+    )
+    for a, b in pares_correlacao():
+        valor = agregados.get(nome_correlacao(a, b), float('nan'))
+        matriz.loc[a, b] = valor
+        matriz.loc[b, a] = valor
+    return matriz
+
+
+def percentual(agregados, nome):
+    """Percentual de medições do período com a flag ligada."""
+    total = agregados.get('TOTAL_MEDICOES', 0)
+    return (agregados.get(nome, 0) / total) * 100 if total else 0.0
+
+
+# Somas por balde de tempo (base de irrigacao.consolidacao)
+# Colunas numéricas com soma, soma dos quadrados, mínimo e máximo
+COLUNAS_MEDIDAS = ['UMIDADE_DHT', 'LDR_VALOR']
+
+
+def _regras_combinacao():
+    regras = {'CONTAGEM': 'sum', 'TS_MIN': 'min', 'TS_MAX': 'max'}
+    for coluna in COLUNAS_MEDIDAS:
+        regras[f'SOMA_{coluna}'] = 'sum'
+        regras[f'SOMA_QUAD_{coluna}'] = 'sum'
+        regras[f'MIN_{coluna}'] = 'min'
+        regras[f'MAX_{coluna}'] = 'max'
+    for coluna in SOMAS_FLAGS:
+        regras[f'SOMA_{coluna}'] = 'sum'
+    for a, b in pares_correlacao():
+        regras[f'PROD_{a}_{b}'] = 'sum'
+    return regras
+
+
+# Como combinar dois baldes (ou um balde e um lote novo) coluna a coluna
+REGRAS = _regras_combinacao()
+
+
+def montar_sql_somas_hora(subconsulta):
+    """GROUP BY por hora com as colunas de `REGRAS` (unidades armazenadas)."""
+    campos = [
+        "FLOOR(TIMESTAMP / 3600) * 3600 AS INICIO",
+        "COUNT(*) AS CONTAGEM",
+        "MIN(TIMESTAMP) AS TS_MIN",
+        "MAX(TIMESTAMP) AS TS_MAX",
+    ]
+    for coluna in COLUNAS_MEDIDAS:
+        campos += [
+            f"SUM({coluna}) AS SOMA_{coluna}",
+            f"SUM({coluna} * {coluna}) AS SOMA_QUAD_{coluna}",
+            f"MIN({coluna}) AS MIN_{coluna}",
+            f"MAX({coluna}) AS MAX_{coluna}",
+        ]
+    campos += [f"SUM({coluna}) AS SOMA_{coluna}" for coluna in SOMAS_FLAGS]
+    campos += [f"SUM({a} * {b}) AS PROD_{a}_{b}" for a, b in pares_correlacao()]
+    return (
+        "SELECT\n    " + ",\n    ".join(campos)
+        + f"\nFROM ({subconsulta})\nGROUP BY FLOOR(TIMESTAMP / 3600)"
+    )
+
+
+def somar_por_hora(df):
+    """Mesmo resultado de `montar_sql_somas_hora`, sobre linhas em memória."""
+    if len(df) == 0:
+        return pd.DataFrame(columns=['INICIO'] + list(REGRAS)).set_index('INICIO')
+    timestamps = df['TIMESTAMP'].to_numpy().astype('int64')
+    base = {'CONTAGEM': np.ones(len(df), dtype='int64'), 'TS_MIN': timestamps, 'TS_MAX': timestamps}
+    for coluna in COLUNAS_MEDIDAS:
+        valores = df[coluna].to_numpy(dtype='float64')
+        base[f'SOMA_{coluna}'] = valores
+        base[f'SOMA_QUAD_{coluna}'] = valores * valores
+        base[f'MIN_{coluna}'] = valores
+        base[f'MAX_{coluna}'] = valores
+    for coluna in SOMAS_FLAGS:
+        base[f'SOMA_{coluna}'] = df[coluna].to_numpy(dtype='int64')
+    for a, b in pares_correlacao():
+        base[f'PROD_{a}_{b}'] = df[a].to_numpy(dtype='float64') * df[b].to_numpy(dtype='float64')
+    linhas = pd.DataFrame(base)
+    linhas['INICIO'] = timestamps // 3600 * 3600
+    return linhas.groupby('INICIO', sort=True).agg(REGRAS)
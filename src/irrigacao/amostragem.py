@@ -0,0 +1,94 @@
+"""
+Redução de séries temporais para os gráficos de linha
+
+Um gráfico com centenas de pixels de largura não precisa de dezenas de
+milhares de pontos. As funções daqui escolhem um subconjunto que preserva o
+formato visual da série:
+
+- `lttb`: Largest-Triangle-Three-Buckets, mantém picos e vales relevantes
+- `minmax`: mínimo e máximo de cada balde, garante que nenhum extremo some
+
+Os índices devolvidos são sempre crescentes, prontos para plotar.
+"""
+
+import numpy as np
+
+# Pontos por gráfico depois da redução (~2 por pixel de um gráfico largo)
+PONTOS_PADRAO = 2000
+
+# A partir deste número de pontos o gráfico usa renderização WebGL
+LIMITE_WEBGL = 1000
+
+
+def lttb(x, y, pontos=PONTOS_PADRAO):
+    """Índices escolhidos pelo algoritmo LTTB (x crescente)."""
+    n = len(x)
+    if pontos >= n or pontos < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    # Primeiro e último ponto fixos; o resto dividido em pontos-2 baldes
+    bordas = np.linspace(1, n - 1, pontos - 1).astype(np.int64)
+    escolhidos = np.empty(pontos, dtype=np.int64)
+    escolhidos[0] = 0
+    escolhidos[-1] = n - 1
+
+    anterior = 0
+    for i in range(pontos - 2):
+        inicio, fim = bordas[i], bordas[i + 1]
+        # Média do balde seguinte (ou o último ponto, no último balde)
+        prox_inicio, prox_fim = fim, bordas[i + 2] if i + 2 < len(bordas) else n
+        media_x = x[prox_inicio:prox_fim].mean()
+        media_y = y[prox_inicio:prox_fim].mean()
+
+        ax, ay = x[anterior], y[anterior]
+        areas = np.abs(
+            (ax - media_x) * (y[inicio:fim] - ay)
+            - (ax - x[inicio:fim]) * (media_y - ay)
+        )
+        anterior = inicio + int(np.argmax(areas))
+        escolhidos[i + 1] = anterior
+    return escolhidos
+
+
+def minmax(y, pontos=PONTOS_PADRAO):
+    """Índices do mínimo e do máximo de cada balde (pontos/2 baldes)."""
+    n = len(y)
+    if pontos >= n or pontos < 2:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype='float64')
+    baldes = pontos // 2
+    bordas = np.linspace(0, n, baldes + 1).astype(np.int64)[:-1]
+    tamanhos = np.diff(np.append(bordas, n))
+    # Posição de cada linha dentro do seu balde, para achar argmin/argmax
+    balde_da_linha = np.repeat(np.arange(baldes), tamanhos)
+    minimos = np.minimum.reduceat(y, bordas)
+    maximos = np.maximum.reduceat(y, bordas)
+    indices = np.arange(n)
+    idx_min = np.full(baldes, n, dtype=np.int64)
+    idx_max = np.full(baldes, n, dtype=np.int64)
+    e_min = y == minimos[balde_da_linha]
+    e_max = y == maximos[balde_da_linha]
+    np.minimum.at(idx_min, balde_da_linha[e_min], indices[e_min])
+    np.minimum.at(idx_max, balde_da_linha[e_max], indices[e_max])
+    return np.unique(np.concatenate([idx_min, idx_max]))
+
+
+def reduzir(df, coluna, pontos=PONTOS_PADRAO, metodo='lttb', coluna_x='TIMESTAMP'):
+    """Subconjunto de `df` em ordem crescente de `coluna_x` com no máximo
+    `pontos` linhas."""
+    df = df.sort_values(coluna_x, kind='stable')
+    if len(df) <= pontos:
+        return df
+    if metodo == 'minmax':
+        indices = minmax(df[coluna].to_numpy(), pontos)
+    else:
+        indices = lttb(df[coluna_x].to_numpy(), df[coluna].to_numpy(), pontos)
+    return df.iloc[indices]
+
+
+def modo_renderizacao(n_pontos):
+    """Valor de `render_mode` do plotly express para a série."""
+    return 'webgl' if n_pontos > LIMITE_WEBGL else 'svg'
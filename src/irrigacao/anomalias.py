@@ -0,0 +1,360 @@
+"""
+Detecção contínua de anomalias dos sensores
+
+Leituras ruins do DHT/LDR e um relé que liga e desliga a cada amostra
+entram direto nos gráficos e médias. Aqui cada leitura é classificada, por
+dispositivo e só com as leituras anteriores a ela (o resultado não muda
+quando as próximas chegam):
+
+- fora_da_faixa: UMIDADE_DHT ou LDR_VALOR fora de `FAIXAS`
+- travado: o mesmo valor repetido em `LEITURAS_TRAVADO` leituras seguidas
+- pico: valor a mais de `LIMITE_PICO` desvios da média das `JANELA`
+  leituras anteriores (e a mais de `VARIACAO_MINIMA` dela)
+- oscilacao: `TROCAS_OSCILACAO` ou mais trocas de RELAY_STATUS nas últimas
+  `JANELA_OSCILACAO` leituras
+
+`detectar(df)` reavalia um histórico inteiro de uma vez: as janelas saem de
+somas acumuladas e diferenças deslocadas, sem laço por linha.
+`DetectorAnomalias` faz o mesmo em lotes: guarda só as últimas
+`LEITURAS_GUARDADAS` leituras de cada dispositivo (memória limitada) e as
+coloca na frente do lote seguinte, de modo que o resultado em lotes é igual
+ao da reavaliação completa. `AnomaliasHistorico` usa um detector sem limite
+de anomalias para o histórico inteiro de uma fonte: lê o histórico uma vez e
+depois só as leituras novas, como `irrigacao.episodios`.
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from irrigacao import config
+from irrigacao.esquema import (
+    CAMPO_PADRAO,
+    DISPOSITIVO_PADRAO,
+    ESCALA_UMIDADE,
+    filtrar_escopo,
+    marcas_por_dispositivo,
+    posteriores_as_marcas,
+)
+from irrigacao.regras import ordem_por_dispositivo
+
+# Faixa física de cada sensor, no formato armazenado (umidade x100; LDR no
+# ADC de 12 bits do ESP32)
+FAIXAS = {
+    'UMIDADE_DHT': (0, 100 * ESCALA_UMIDADE),
+    'LDR_VALOR': (0, 4095),
+}
+
+# Diferença mínima da média da janela para um pico (formato armazenado)
+VARIACAO_MINIMA = {
+    'UMIDADE_DHT': 15 * ESCALA_UMIDADE,
+    'LDR_VALOR': 800,
+}
+
+JANELA = 24
+LIMITE_PICO = 4.0
+LEITURAS_TRAVADO = 6
+JANELA_OSCILACAO = 8
+TROCAS_OSCILACAO = 6
+
+# Leituras de cada dispositivo guardadas entre lotes
+LEITURAS_GUARDADAS = max(JANELA, LEITURAS_TRAVADO, JANELA_OSCILACAO)
+
+TIPOS = {
+    'fora_da_faixa': "Fora da faixa",
+    'travado': "Valor travado",
+    'pico': "Pico",
+    'oscilacao': "Relé oscilando",
+}
+
+# Colunas lidas das fontes (TIMESTAMP é sempre incluído)
+COLUNAS_LEITURA = ['CAMPO', 'DISPOSITIVO', 'UMIDADE_DHT', 'LDR_VALOR', 'RELAY_STATUS']
+
+# REFERENCIA depende do tipo: média da janela (pico), leituras repetidas
+# (travado), trocas na janela (oscilacao) ou NaN (fora_da_faixa). VALOR e
+# REFERENCIA de umidade e a UMIDADE da leitura saem em porcentagem
+_TIPOS_ANOMALIAS = {
+    'TIPO': 'object',
+    'COLUNA': 'object',
+    'CAMPO': 'int64',
+    'DISPOSITIVO': 'int64',
+    'TIMESTAMP': 'int64',
+    'VALOR': 'float64',
+    'REFERENCIA': 'float64',
+    'UMIDADE': 'float64',
+}
+
+COLUNAS_ANOMALIAS = list(_TIPOS_ANOMALIAS)
+
+# Anomalias guardadas por um DetectorAnomalias (as mais recentes)
+MAXIMO_ANOMALIAS = 10000
+
+
+def anomalias_vazias():
+    return pd.DataFrame({coluna: pd.Series(dtype=tipo) for coluna, tipo in _TIPOS_ANOMALIAS.items()})
+
+
+def _leituras_ordenadas(df):
+    """Colunas de `COLUNAS_LEITURA` e TIMESTAMP em arrays, na ordem
+    (DISPOSITIVO, TIMESTAMP)."""
+    timestamps = df['TIMESTAMP'].to_numpy()
+    dispositivos = (df['DISPOSITIVO'].to_numpy() if 'DISPOSITIVO' in df
+                    else np.full(len(df), DISPOSITIVO_PADRAO))
+    ordem = ordem_por_dispositivo(timestamps, dispositivos)
+    return {
+        'TIMESTAMP': timestamps[ordem].astype('int64'),
+        'DISPOSITIVO': dispositivos[ordem].astype('int64'),
+        'CAMPO': (df['CAMPO'].to_numpy()[ordem].astype('int64') if 'CAMPO' in df
+                  else np.full(len(df), CAMPO_PADRAO, dtype='int64')),
+        'UMIDADE_DHT': df['UMIDADE_DHT'].to_numpy(dtype='float64')[ordem],
+        'LDR_VALOR': df['LDR_VALOR'].to_numpy(dtype='float64')[ordem],
+        'RELAY_STATUS': df['RELAY_STATUS'].to_numpy()[ordem].astype('int8'),
+        # Repetições do valor até cada leitura; guardadas com as últimas
+        # leituras para a contagem continuar no lote seguinte
+        **{f'REPETICOES_{coluna}': np.ones(len(df), dtype='int64') for coluna in FAIXAS},
+    }
+
+
+def _janela(acumulado, fim, inicio_grupo, tamanho):
+    """Soma dos `tamanho` valores antes de cada posição (sem ela), sem
+    atravessar o início do dispositivo; `acumulado` começa em 0."""
+    inicio = np.maximum(fim - tamanho, inicio_grupo)
+    return acumulado[fim] - acumulado[inicio]
+
+
+def _pontuar(leituras, avaliar):
+    """Anomalias das posições marcadas em `avaliar` (as demais só servem de
+    histórico), com as leituras em ordem (DISPOSITIVO, TIMESTAMP)."""
+    n = len(leituras['TIMESTAMP'])
+    dispositivos = leituras['DISPOSITIVO']
+    posicoes = np.arange(n)
+    novo = np.empty(n, dtype=bool)
+    novo[0] = True
+    np.not_equal(dispositivos[1:], dispositivos[:-1], out=novo[1:])
+    inicio_grupo = np.maximum.accumulate(np.where(novo, posicoes, 0))
+    umidade = leituras['UMIDADE_DHT'] / ESCALA_UMIDADE
+
+    partes = []
+
+    def anotar(tipo, coluna, mascara, valores, referencia, escala=1.0):
+        indices = np.flatnonzero(mascara & avaliar)
+        if len(indices):
+            partes.append({
+                'TIPO': np.full(len(indices), tipo, dtype=object),
+                'COLUNA': np.full(len(indices), coluna, dtype=object),
+                'CAMPO': leituras['CAMPO'][indices],
+                'DISPOSITIVO': dispositivos[indices],
+                'TIMESTAMP': leituras['TIMESTAMP'][indices],
+                'VALOR': valores[indices] * escala,
+                'REFERENCIA': referencia[indices],
+                'UMIDADE': umidade[indices],
+            })
+
+    for coluna, (minimo, maximo) in FAIXAS.items():
+        valores = leituras[coluna]
+        escala = 1 / ESCALA_UMIDADE if coluna == 'UMIDADE_DHT' else 1.0
+        valido = (valores >= minimo) & (valores <= maximo)
+        anotar('fora_da_faixa', coluna, ~valido & ~np.isnan(valores), valores, np.full(n, np.nan), escala)
+
+        # Posição de cada leitura na sequência de valores iguais (a que
+        # começa no início do dispositivo continua a contagem guardada)
+        mudou = novo.copy()
+        np.not_equal(valores[1:], valores[:-1], out=mudou[1:])
+        mudou[1:] |= novo[1:]
+        inicio_sequencia = np.maximum.accumulate(np.where(mudou, posicoes, 0))
+        anteriores = leituras[f'REPETICOES_{coluna}']
+        repeticoes = posicoes - inicio_sequencia + np.where(
+            inicio_sequencia == inicio_grupo, anteriores[inicio_grupo], 1)
+        leituras[f'REPETICOES_{coluna}'] = repeticoes
+        anotar('travado', coluna, valido & (repeticoes >= LEITURAS_TRAVADO),
+               valores, repeticoes.astype('float64'), escala)
+
+        # Média e desvio das leituras válidas da janela anterior, centradas
+        # para as somas dos quadrados não perderem precisão
+        centro = (minimo + maximo) / 2
+        centrados = np.where(valido, valores - centro, 0.0)
+        contagem = np.concatenate(([0], np.cumsum(valido)))
+        soma = np.concatenate(([0.0], np.cumsum(centrados)))
+        quadrados = np.concatenate(([0.0], np.cumsum(centrados * centrados)))
+        quantidade = _janela(contagem, posicoes, inicio_grupo, JANELA)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media = _janela(soma, posicoes, inicio_grupo, JANELA) / quantidade
+            variancia = _janela(quadrados, posicoes, inicio_grupo, JANELA) / quantidade - media * media
+            desvio = np.sqrt(np.maximum(variancia, 0.0))
+            distancia = np.abs(valores - centro - media)
+            pico = (valido & (quantidade >= JANELA // 2)
+                    & (distancia > np.maximum(LIMITE_PICO * desvio, VARIACAO_MINIMA[coluna])))
+        anotar('pico', coluna, pico, valores, (media + centro) * escala, escala)
+
+    # Trocas do relé entre leituras seguidas do mesmo dispositivo
+    rele = leituras['RELAY_STATUS']
+    troca = np.zeros(n, dtype='int64')
+    troca[1:] = (rele[1:] != rele[:-1]) & ~novo[1:]
+    trocas = _janela(np.concatenate(([0], np.cumsum(troca))), posicoes + 1,
+                     inicio_grupo + 1, JANELA_OSCILACAO - 1)
+    anotar('oscilacao', 'RELAY_STATUS', trocas >= TROCAS_OSCILACAO,
+           rele.astype('float64'), trocas.astype('float64'))
+
+    if not partes:
+        return anomalias_vazias()
+    anomalias = pd.DataFrame({
+        coluna: np.concatenate([parte[coluna] for parte in partes]) for coluna in COLUNAS_ANOMALIAS
+    })
+    return anomalias.sort_values(['TIMESTAMP', 'DISPOSITIVO'], kind='stable').reset_index(drop=True)
+
+
+def detectar(df):
+    """Anomalias de todas as leituras de `df` (colunas de `COLUNAS_LEITURA`,
+    formato armazenado, qualquer ordem), em ordem de TIMESTAMP."""
+    if len(df) == 0:
+        return anomalias_vazias()
+    leituras = _leituras_ordenadas(df)
+    return _pontuar(leituras, np.ones(len(df), dtype=bool))
+
+
+class DetectorAnomalias:
+    """Detecção em lotes com memória limitada.
+
+    `processar(df)` recebe leituras posteriores às já vistas (formato
+    armazenado) e devolve as anomalias delas; as últimas
+    `LEITURAS_GUARDADAS` leituras de cada dispositivo ficam para o próximo
+    lote e as `maximo` anomalias mais recentes (todas, com None) para
+    `anomalias()`.
+    """
+
+    def __init__(self, maximo=MAXIMO_ANOMALIAS):
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self.limpar()
+
+    def limpar(self):
+        with self._lock:
+            self._ultimas = None
+            self._anomalias = anomalias_vazias()
+
+    def processar(self, df):
+        if len(df) == 0:
+            return anomalias_vazias()
+        leituras = _leituras_ordenadas(df)
+        with self._lock:
+            avaliar = np.ones(len(df), dtype=bool)
+            if self._ultimas is not None:
+                juntas = {
+                    coluna: np.concatenate((self._ultimas[coluna], valores))
+                    for coluna, valores in leituras.items()
+                }
+                ordem = np.lexsort((juntas['TIMESTAMP'], juntas['DISPOSITIVO']))
+                leituras = {coluna: valores[ordem] for coluna, valores in juntas.items()}
+                avaliar = ordem >= len(self._ultimas['TIMESTAMP'])
+            novas = _pontuar(leituras, avaliar)
+
+            # Últimas leituras de cada dispositivo (inclusive os que não
+            # vieram neste lote, que continuam com as guardadas)
+            dispositivos = leituras['DISPOSITIVO']
+            n = len(dispositivos)
+            ultimo = np.empty(n, dtype=bool)
+            ultimo[-1] = True
+            np.not_equal(dispositivos[1:], dispositivos[:-1], out=ultimo[:-1])
+            posicoes = np.arange(n)
+            fim_grupo = np.minimum.accumulate(np.where(ultimo, posicoes, n)[::-1])[::-1]
+            manter = posicoes > fim_grupo - LEITURAS_GUARDADAS
+            self._ultimas = {coluna: valores[manter] for coluna, valores in leituras.items()}
+
+            if len(novas):
+                anteriores = self._anomalias
+                juntas = pd.concat([anteriores, novas], ignore_index=True)
+                # Leituras atrasadas de um dispositivo: mantém a ordem de TIMESTAMP
+                if len(anteriores) and novas['TIMESTAMP'].iloc[0] < anteriores['TIMESTAMP'].iloc[-1]:
+                    juntas = juntas.sort_values('TIMESTAMP', kind='stable', ignore_index=True)
+                self._anomalias = juntas if self.maximo is None else juntas.tail(self.maximo)
+        return novas
+
+    def descartar_antes(self, timestamp):
+        """Esquece as anomalias com TIMESTAMP anterior a `timestamp` (as que
+        saíram da janela do buffer)."""
+        with self._lock:
+            anomalias = self._anomalias
+            if len(anomalias) and anomalias['TIMESTAMP'].iloc[0] < timestamp:
+                self._anomalias = anomalias[anomalias['TIMESTAMP'].to_numpy() >= timestamp]
+
+    def anomalias(self):
+        """Anomalias guardadas, em ordem de TIMESTAMP."""
+        with self._lock:
+            return self._anomalias.reset_index(drop=True)
+
+
+class AnomaliasHistorico:
+    """Anomalias de todo o histórico de uma fonte, mantidas em memória.
+
+    A primeira atualização lê o histórico inteiro uma vez; as seguintes só as
+    leituras recentes, com a mesma sobreposição e marca d'água por
+    dispositivo de `irrigacao.buffer`. `recarregar()` refaz do zero.
+    """
+
+    def __init__(self, fonte, intervalo_minimo=0.0):
+        self.fonte = fonte
+        self.intervalo_minimo = intervalo_minimo
+        self.detector = DetectorAnomalias(maximo=None)
+        self._lock = threading.Lock()
+        self._ultima_busca = None
+        self.marcas = None  # maior TIMESTAMP já avaliado de cada DISPOSITIVO
+        self.marca_dagua = None
+        self.versao = 0
+
+    def recarregar(self):
+        """Descarta as anomalias e reavalia o histórico inteiro."""
+        df = self.fonte.carregar(0, colunas=COLUNAS_LEITURA)
+        with self._lock:
+            self.detector.limpar()
+            self.marcas = self.marca_dagua = None
+            self._incorporar(df)
+            self._ultima_busca = time.monotonic()
+        return len(df)
+
+    def atualizar(self, forcar=False):
+        """Avalia as leituras novas da fonte; devolve quantas chegaram."""
+        if self.marca_dagua is None:
+            return self.recarregar()
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima_busca < self.intervalo_minimo:
+            return 0
+        novos = self.fonte.carregar_desde(
+            self.marca_dagua - config.SOBREPOSICAO_INCREMENTAL, colunas=COLUNAS_LEITURA
+        )
+        with self._lock:
+            self._ultima_busca = agora
+            novos = posteriores_as_marcas(novos, self.marcas)
+            if len(novos) == 0:
+                return 0
+            self._incorporar(novos)
+        return len(novos)
+
+    def anexar(self, df):
+        """Avalia leituras que não vieram da fonte (formato armazenado); as
+        que não passam da marca d'água do seu dispositivo ou estão fora do
+        escopo da fonte são ignoradas."""
+        df = filtrar_escopo(df, self.fonte.escopo)
+        with self._lock:
+            # Sem carga inicial, a primeira atualização já as trará
+            if self.marca_dagua is None:
+                return 0
+            df = posteriores_as_marcas(df, self.marcas)
+            if len(df) == 0:
+                return 0
+            self._incorporar(df)
+        return len(df)
+
+    def _incorporar(self, df):
+        # Chamado com o lock adquirido
+        if len(df) == 0:
+            return
+        self.detector.processar(df)
+        self.marcas = marcas_por_dispositivo(df, self.marcas)
+        self.marca_dagua = int(self.marcas.max())
+        self.versao += 1
+
+    def anomalias(self):
+        """Anomalias do histórico, em ordem de TIMESTAMP."""
+        return self.detector.anomalias()
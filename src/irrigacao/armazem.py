@@ -0,0 +1,95 @@
+"""
+Armazém de dados do lado do servidor
+
+Guarda, por chave de período, o buffer incremental de linhas e os agregados
+calculados na fonte. Os componentes do navegador recebem apenas a chave e um
+identificador de versão; cada callback busca o DataFrame já montado aqui, sem
+serializar registros para JSON e reconstruí-los a cada atualização.
+"""
+
+import math
+import threading
+
+
+class ArmazemDados:
+    """Buffers e agregados por chave, compartilhados entre callbacks e abas.
+
+    `criar_buffer(chave)` cria o `BufferJanela` da chave na primeira vez em
+    que ela é pedida; `carregar_agregados(chave)`, se informado, preenche os
+    agregados de uma chave que ainda não foi publicada.
+    """
+
+    def __init__(self, criar_buffer, carregar_agregados=None):
+        self.criar_buffer = criar_buffer
+        self.carregar_agregados = carregar_agregados
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._agregados = {}  # chave -> (versão, dict)
+
+    def buffer(self, chave):
+        with self._lock:
+            if chave not in self._buffers:
+                self._buffers[chave] = self.criar_buffer(chave)
+            return self._buffers[chave]
+
+    def chaves(self):
+        """Chaves com buffer criado (os períodos em uso)."""
+        with self._lock:
+            return list(self._buffers)
+
+    def anexar(self, df):
+        """Repassa linhas recebidas ao vivo a todos os buffers já criados."""
+        with self._lock:
+            buffers = list(self._buffers.values())
+        return sum(buffer.anexar(df) for buffer in buffers)
+
+    def publicar_agregados(self, chave, agregados):
+        """Substitui os agregados da chave, mudando a versão só se mudaram."""
+        with self._lock:
+            versao, atuais = self._agregados.get(chave, (0, None))
+            if not _mesmos_valores(agregados, atuais):
+                self._agregados[chave] = (versao + 1, agregados)
+
+    def dados(self, chave):
+        """DataFrame atual da chave (carregado na primeira chamada)."""
+        buffer = self.buffer(chave)
+        if buffer.marca_dagua is None:
+            buffer.atualizar()
+        return buffer.dados()
+
+    def carregada(self, chave):
+        """Se a chave já tem linhas e agregados, isto é, se `dados` e
+        `agregados` respondem sem ir à fonte."""
+        with self._lock:
+            buffer = self._buffers.get(chave)
+            publicado = chave in self._agregados
+        return publicado and buffer is not None and buffer.marca_dagua is not None
+
+    def agregados(self, chave):
+        with self._lock:
+            publicado = chave in self._agregados
+        if not publicado and self.carregar_agregados is not None:
+            self.publicar_agregados(chave, self.carregar_agregados(chave))
+        with self._lock:
+            return self._agregados.get(chave, (0, {}))[1]
+
+    def versao(self, chave):
+        """Identificador que muda sempre que linhas ou agregados mudam."""
+        buffer = self.buffer(chave)
+        with self._lock:
+            versao_agregados = self._agregados.get(chave, (0, None))[0]
+        return f"{buffer.versao}.{versao_agregados}"
+
+
+def _mesmos_valores(a, b):
+    # Comparação de dicts que trata NaN == NaN (correlações indefinidas)
+    if a is None or b is None or a.keys() != b.keys():
+        return a is b
+    for chave, valor in a.items():
+        outro = b[chave]
+        if valor != outro and not (
+            isinstance(valor, float) and isinstance(outro, float)
+            and math.isnan(valor) and math.isnan(outro)
+        ):
+            return False
+    return True
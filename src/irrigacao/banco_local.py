@@ -0,0 +1,113 @@
+"""
+Banco local (SQLite) que substitui o Oracle em desenvolvimento e testes
+
+Cria a tabela HISTORICO2024 com as mesmas colunas e unidades do Oracle e uma
+tabela DUAL, para que o pool de conexões e as ferramentas de linha de comando
+possam ser exercitados sem acesso ao servidor da FIAP. As funções de agregação
+STDDEV e CORR do Oracle são registradas em cada conexão, de forma que as
+consultas de `irrigacao.consultas` rodam sem alteração.
+"""
+
+import math
+import sqlite3
+
+import pandas as pd
+
+from irrigacao import config
+from irrigacao.esquema import TABELA, COLUNAS, armazenar_unidades, completar_dispositivo
+
+
+def conectar_local(caminho=None):
+    """Abre uma conexão SQLite compartilhável entre threads."""
+    caminho = caminho or config.BANCO_LOCAL
+    conn = sqlite3.connect(caminho, check_same_thread=False)
+    conn.create_aggregate('STDDEV', 1, _Desvio)
+    conn.create_aggregate('CORR', 2, _Correlacao)
+    conn.execute("CREATE TABLE IF NOT EXISTS DUAL (DUMMY TEXT)")
+    if conn.execute("SELECT COUNT(*) FROM DUAL").fetchone()[0] == 0:
+        conn.execute("INSERT INTO DUAL VALUES ('X')")
+        conn.commit()
+    return conn
+
+
+def criar_banco_local(caminho=None, arquivo=None, tabela=TABELA):
+    """Cria (ou recria) a tabela local a partir do CSV histórico."""
+    arquivo = arquivo or config.ARQUIVO_LOCAL
+    # Mesmo formato gravado pela importação do SQL Developer
+    df = pd.read_csv(arquivo, usecols=lambda coluna: coluna in COLUNAS)
+    df = armazenar_unidades(completar_dispositivo(df))[COLUNAS]
+
+    from irrigacao import migracoes
+
+    conn = conectar_local(caminho)
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {tabela}")
+        # A tabela recriada perdeu os índices: as migrações valem de novo
+        if migracoes.tabela_existe(conn, 'sqlite', migracoes.TABELA_VERSOES):
+            conn.execute(f"DELETE FROM {migracoes.TABELA_VERSOES} WHERE TABELA = ?", (tabela,))
+        conn.commit()
+        migracoes.migrar(conn, 'sqlite', tabela)
+        df.to_sql(tabela, conn, index=False, if_exists='append')
+        conn.commit()
+    finally:
+        conn.close()
+    return len(df)
+
+
+def tabela_existe(caminho=None, tabela=TABELA):
+    caminho = caminho or config.BANCO_LOCAL
+    conn = sqlite3.connect(caminho)
+    try:
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,)
+        ).fetchone() is not None
+    finally:
+        conn.close()
+
+
+class _Desvio:
+    # STDDEV do Oracle: desvio amostral, 0 para uma única linha
+    def __init__(self):
+        self.n = 0
+        self.soma = 0.0
+        self.soma_quad = 0.0
+
+    def step(self, valor):
+        if valor is not None:
+            self.n += 1
+            self.soma += valor
+            self.soma_quad += valor * valor
+
+    def finalize(self):
+        if self.n == 0:
+            return None
+        if self.n == 1:
+            return 0.0
+        variancia = (self.soma_quad - self.soma * self.soma / self.n) / (self.n - 1)
+        return math.sqrt(max(variancia, 0.0))
+
+
+class _Correlacao:
+    # CORR do Oracle: NULL quando uma das colunas não varia
+    def __init__(self):
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.syy = self.sxy = 0.0
+
+    def step(self, x, y):
+        if x is not None and y is not None:
+            self.n += 1
+            self.sx += x
+            self.sy += y
+            self.sxx += x * x
+            self.syy += y * y
+            self.sxy += x * y
+
+    def finalize(self):
+        if self.n < 2:
+            return None
+        cov = self.n * self.sxy - self.sx * self.sy
+        var_x = self.n * self.sxx - self.sx * self.sx
+        var_y = self.n * self.syy - self.sy * self.sy
+        if var_x <= 0 or var_y <= 0:
+            return None
+        return cov / math.sqrt(var_x * var_y)
@@ -0,0 +1,457 @@
+"""
+Suíte de benchmarks dos dashboards
+
+Gera históricos sintéticos (`irrigacao.sintetico`, com as distribuições e
+correlações do CSV de 2024) em escalas de 1x a 10.000x e mede, em cada uma:
+
+- fonte.<tipo>.*: consulta + fetch de cada período (`carregar`), agregados,
+  série reduzida, somas por hora e resumo por dispositivo, nas fontes local
+  (Parquet, que exige o pyarrow de `requirements.txt`) e sqlite (mesmas consultas do Oracle, tabela com as migrações
+  aplicadas)
+- preparo.*: correção de unidades e conversão de TIMESTAMP dos períodos,
+  avaliação das regras das sugestões (`irrigacao.regras`) sobre 7 dias e
+  sobre o histórico inteiro de todos os dispositivos, e uma leitura nova
+  (e a leitura dos agregados) nas estatísticas contínuas de 7 dias
+  (`irrigacao.estatisticas`), que não deve crescer com a escala; episódios
+  (`irrigacao.episodios`) do histórico inteiro, montados do zero e lidos do
+  cache por dia (resumo de 7 dias e de todos); anomalias dos sensores
+  (`irrigacao.anomalias`) do histórico inteiro reavaliadas de uma vez e uma
+  leitura nova no detector contínuo, que também não deve crescer com a escala;
+  treino do modelo de previsão da umidade (`irrigacao.previsao`) no histórico
+  inteiro e previsão de todos os dispositivos a partir dos últimos 3 dias
+- dash.*: cada callback do `dashboard_dash` de ponta a ponta, incluindo a
+  montagem de cada figura (update_data frio, até o fim da carga em segundo
+  plano, e com buffer já carregado)
+- streamlit.*: execução completa do `dashboard.py` pelo AppTest (opcional)
+
+Os resultados saem em JSON (mediana, p95, mínimo e máximo em ms por escala e
+cenário), com metadados do ambiente, para serem guardados e comparados entre
+versões: `--comparar` aponta as medianas que pioraram além do limite e
+encerra com código 1.
+
+Uso, a partir da pasta `src/`:
+
+    python -m irrigacao.benchmark --escalas 1,10 --saida bench.json
+    python -m irrigacao.benchmark --escalas 100,1000 --fontes sqlite --cenarios fonte.
+    python -m irrigacao.benchmark --escalas 1,10 --comparar bench.json --limite-regressao 0.2
+    python -m irrigacao.benchmark --escalas 100 --dispositivos 1000 --cenarios fonte.,dash.update_visao
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from irrigacao import anomalias
+from irrigacao import episodios
+from irrigacao import previsao
+from irrigacao import regras
+from irrigacao import sintetico
+from irrigacao.carga import CargaEmLote, conectar_destino
+from irrigacao.esquema import adicionar_datetime, armazenar_unidades, corrigir_unidades
+from irrigacao.estatisticas import EstatisticasJanela
+from irrigacao.fonte_dados import criar_fonte
+
+ESCALAS_PADRAO = [1, 10, 100]
+
+# Períodos do dropdown do Dash, na ordem da tela
+PERIODOS = ['100_registros', '500_registros', '24h_dados', '3d_dados', '7d_dados', 'todos']
+
+DIRETORIO_PADRAO = os.path.join(tempfile.gettempdir(), 'irrigacao', 'benchmark')
+
+
+def medir(funcao, repeticoes, aquecer=True):
+    """Tempos (ms) de `repeticoes` chamadas de `funcao()`."""
+    if aquecer:
+        funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return tempos
+
+
+def resumir(tempos):
+    """Mediana, p95, mínimo e máximo de uma lista de tempos (ms)."""
+    ordenados = sorted(tempos)
+    return {
+        'repeticoes': len(tempos),
+        'mediana_ms': statistics.median(ordenados),
+        'p95_ms': float(np.percentile(ordenados, 95)),
+        'minimo_ms': ordenados[0],
+        'maximo_ms': ordenados[-1],
+    }
+
+
+def preparar_dados(diretorio, escala, fontes, semente=0, dispositivos=1):
+    """Caminhos do Parquet e do SQLite sintéticos da escala, gerados só se
+    ainda não existirem (a mesma semente gera sempre os mesmos dados). As
+    linhas da escala são divididas entre os `dispositivos`."""
+    os.makedirs(diretorio, exist_ok=True)
+    linhas = sintetico.LINHAS_HISTORICO * escala
+    gerar = dict(semente=semente, dispositivos=dispositivos, campos=max(1, dispositivos // 100))
+    base = os.path.join(diretorio, f'sintetico_{linhas}_s{semente}')
+    if dispositivos > 1:
+        base += f'_d{dispositivos}'
+    caminhos = {}
+    if 'local' in fontes:
+        caminhos['local'] = base + '.parquet'
+        if not os.path.exists(caminhos['local']):
+            df = pd.concat(sintetico.gerar_lotes(linhas, **gerar), ignore_index=True)
+            df.to_parquet(caminhos['local'] + '.tmp', index=False)
+            os.replace(caminhos['local'] + '.tmp', caminhos['local'])
+    if 'sqlite' in fontes:
+        caminhos['sqlite'] = base + '.sqlite'
+        # A carga é idempotente: uma execução interrompida continua de onde parou
+        conn, dialeto = conectar_destino('sqlite', caminhos['sqlite'])
+        try:
+            carga = CargaEmLote(conn, dialeto)
+            carga.criar_tabela()
+            carga.carregar(sintetico.gerar_lotes(linhas, **gerar))
+        finally:
+            conn.close()
+    return caminhos
+
+
+def criar_fontes(caminhos):
+    """Fontes de dados de cada caminho, sem o cache compartilhado (o
+    benchmark mede a consulta, não o acerto de cache)."""
+    fontes = {}
+    for tipo, caminho in caminhos.items():
+        if tipo == 'sqlite':
+            fontes[tipo] = criar_fonte('sqlite', caminho=caminho, cache=None)
+        else:
+            fontes[tipo] = criar_fonte(tipo, caminho=caminho)
+    return fontes
+
+
+def cenarios_fonte(tipo, fonte):
+    filtros = {'100': 100, '500': 500, '24h': '24h', '7d': '7d', 'todos': 0}
+    cenarios = {}
+    for nome, filtro in filtros.items():
+        if filtro == 0:
+            # "todos" só é carregado linha a linha com limite (como nas telas)
+            cenarios[f'fonte.{tipo}.carregar.1000'] = lambda: fonte.carregar(1000)
+        else:
+            cenarios[f'fonte.{tipo}.carregar.{nome}'] = lambda f=filtro: fonte.carregar(f)
+        cenarios[f'fonte.{tipo}.agregados.{nome}'] = lambda f=filtro: fonte.agregados(f)
+    cenarios[f'fonte.{tipo}.serie.todos'] = lambda: fonte.serie(0, 'UMIDADE_DHT')
+    cenarios[f'fonte.{tipo}.somas_por_hora'] = lambda: fonte.somas_por_hora()
+    for nome, filtro in {'24h': '24h', 'todos': 0}.items():
+        cenarios[f'fonte.{tipo}.resumo_dispositivos.{nome}'] = lambda f=filtro: fonte.resumo_dispositivos(f)
+    return cenarios
+
+
+def cenarios_preparo(fonte):
+    # Cópias feitas fora da medição: as duas funções alteram o DataFrame
+    dados = {nome: armazenar_unidades(fonte.carregar(filtro))
+             for nome, filtro in (('500', 500), ('7d', '7d'))}
+    cenarios = {}
+    for nome, df in dados.items():
+        cenarios[f'preparo.corrigir_unidades.{nome}'] = lambda df=df: corrigir_unidades(df.copy())
+        cenarios[f'preparo.convert_timestamp.{nome}'] = lambda df=df: adicionar_datetime(df.copy())
+    lista = regras.carregar_regras()
+    for nome, filtro in (('7d', '7d'), ('todos', 0)):
+        df = fonte.carregar(filtro, colunas=regras.colunas_necessarias(lista))
+        cenarios[f'preparo.regras.{nome}'] = lambda df=df: regras.avaliar(df, lista)
+
+    # Janela de 7 dias cheia; cada chamada anexa uma leitura um minuto depois
+    # da anterior, retirando as que saem da janela
+    estatisticas = EstatisticasJanela('7d')
+    estatisticas.adicionar(dados['7d'])
+    leitura = dados['7d'].head(1).reset_index(drop=True)
+
+    def nova_leitura():
+        leitura['TIMESTAMP'] += 60
+        estatisticas.adicionar(leitura)
+
+    cenarios['preparo.estatisticas.leitura.7d'] = nova_leitura
+    cenarios['preparo.estatisticas.agregados.7d'] = estatisticas.agregados
+
+    historico = fonte.carregar(0, colunas=episodios.COLUNAS_LEITURA)
+
+    def montar_episodios():
+        motor = episodios.Episodios(fonte)
+        motor.incorporar(historico)
+        return motor
+
+    motor = montar_episodios()
+    semana = motor.marca_dagua - 7 * 86400
+    cenarios['preparo.episodios.montar.todos'] = montar_episodios
+    cenarios['preparo.episodios.resumo.7d'] = lambda: motor.resumo(semana)
+    cenarios['preparo.episodios.resumo.todos'] = motor.resumo
+
+    leituras = fonte.carregar(0, colunas=anomalias.COLUNAS_LEITURA)
+    detector = anomalias.DetectorAnomalias()
+    detector.processar(leituras)
+    ultima = leituras.head(1).reset_index(drop=True)
+
+    def nova_leitura_anomalias():
+        ultima['TIMESTAMP'] += 60
+        detector.processar(ultima)
+
+    cenarios['preparo.anomalias.detectar.todos'] = lambda: anomalias.detectar(leituras)
+    cenarios['preparo.anomalias.leitura'] = nova_leitura_anomalias
+
+    historico_previsao = corrigir_unidades(fonte.carregar(0, colunas=previsao.COLUNAS_LEITURA))
+    recentes = corrigir_unidades(fonte.carregar('3d', colunas=previsao.COLUNAS_LEITURA))
+    modelo = previsao.treinar(historico_previsao)
+    cenarios['preparo.previsao.treinar.todos'] = lambda: previsao.treinar(historico_previsao)
+    cenarios['preparo.previsao.prever.3d'] = lambda: previsao.prever(modelo, recentes)
+    return cenarios
+
+
+def _importar_dash():
+    """Módulo `dashboard_dash`, importado com a fonte local do CSV (a fonte
+    de cada escala é trocada depois em `cenarios_dash`)."""
+    os.environ.setdefault('IRRIGACAO_FONTE', 'local')
+    from irrigacao import config
+
+    config.FONTE = 'local'
+    config.INGESTAO = ''
+    import dashboard_dash
+
+    dashboard_dash.atualizador.parar()
+    return dashboard_dash
+
+
+def _contexto_dash(gatilho):
+    # callback_context fora de uma requisição: só o que update_data lê
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    context_value.set(AttributeDict(triggered_inputs=[{'prop_id': gatilho, 'value': None}]))
+
+
+def cenarios_dash(fonte):
+    from irrigacao.armazem import ArmazemDados
+    from irrigacao.consolidacao import Consolidacoes
+
+    d = _importar_dash()
+
+    def reiniciar():
+        # Estado do servidor como logo após a subida, sobre a fonte da escala
+        d.fonte = fonte
+        d.consolidacoes = Consolidacoes(fonte, intervalo_minimo=5)
+        d.armazem = ArmazemDados(d.criar_buffer, carregar_agregados=d.fetch_aggregates)
+        d.fontes_escopo.clear()
+        d.consolidacoes_escopo.clear()
+        d.resumos_dispositivos.clear()
+        d.avaliacoes_regras.clear()
+        d.anomalias_historico.clear()
+        d.regras_historico.clear()
+        d.series_umidade.clear()
+        d.tarefas_carga.limpar()
+
+    def esperar_carga(periodo):
+        # update_data só agenda a carga (irrigacao.tarefas); o cenário mede
+        # até ela terminar e os dados serem publicados
+        for chave in (periodo, d.chave_previsao(periodo)):
+            tarefa = d.tarefas_carga.tarefa(chave)
+            if tarefa is not None:
+                tarefa.esperar()
+        _contexto_dash('progresso-intervalo.n_intervals')
+        return d.update_data(periodo, None, None, None, None, 1, None, None)[0]
+
+    def frio(periodo):
+        reiniciar()
+        _contexto_dash('periodo-dropdown.value')
+        d.update_data(periodo, None, None, None, None, None, None, None)
+        return esperar_carga(periodo)
+
+    callbacks = ['update_metricas', 'update_grafico_umidade', 'update_grafico_npk',
+                 'update_grafico_irrigacao', 'update_grafico_correlacao', 'update_tabela',
+                 'update_sugestoes', 'update_visao_dispositivos']
+    cenarios = {}
+    for periodo in PERIODOS:
+        cenarios[f'dash.update_data.frio.{periodo}'] = lambda p=periodo: frio(p)
+        dados = frio(periodo)
+
+        def quente(p=periodo):
+            _contexto_dash('versoes-store.data')
+            return d.update_data(p, None, None, None, {}, None, None, None)
+
+        def atualizar(p=periodo):
+            _contexto_dash('refresh-button.n_clicks')
+            d.update_data(p, None, None, 1, None, None, None, None)
+            return esperar_carga(p)
+
+        cenarios[f'dash.update_data.quente.{periodo}'] = quente
+        cenarios[f'dash.update_data.atualizar.{periodo}'] = atualizar
+        for nome in callbacks:
+            callback = getattr(d, nome)
+            cenarios[f'dash.{nome}.{periodo}'] = lambda c=callback, dados=dados: c(dados)
+    # O estado fica carregado com todos os períodos para os cenários acima
+    reiniciar()
+    for periodo in PERIODOS:
+        frio(periodo)
+    return cenarios
+
+
+def cenarios_streamlit(caminho_sqlite):
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    from irrigacao import config
+
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dashboard.py')
+
+    def executar(periodo=None):
+        # O script lê a configuração já importada neste processo
+        config.FONTE = 'sqlite'
+        config.BANCO_LOCAL = caminho_sqlite
+        config.CACHE_CONSULTAS = ''
+        config.INGESTAO = ''
+        # Cada execução é uma sessão nova com os caches de st.cache_* vazios
+        # (eles são do processo, não da instância do AppTest)
+        st.cache_data.clear()
+        st.cache_resource.clear()
+        app = AppTest.from_file(script, default_timeout=600)
+        app.run()
+        if periodo:
+            app.sidebar.selectbox[0].select(periodo).run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].value)
+
+    return {
+        'streamlit.execucao.padrao': executar,
+        'streamlit.execucao.todos': lambda: executar('Todos os dados'),
+    }
+
+
+def executar(escalas, repeticoes=5, fontes=('local', 'sqlite'), filtro_cenarios=None,
+             diretorio=DIRETORIO_PADRAO, semente=0, streamlit=False, relatar=None, dispositivos=1):
+    """Lista de resultados (um dict por escala e cenário)."""
+    resultados = []
+    for escala in escalas:
+        linhas = sintetico.LINHAS_HISTORICO * escala
+        caminhos = preparar_dados(
+            diretorio, escala, fontes if not streamlit else set(fontes) | {'sqlite'}, semente, dispositivos
+        )
+        por_tipo = criar_fontes({tipo: caminhos[tipo] for tipo in fontes})
+        principal = por_tipo.get('local') or next(iter(por_tipo.values()))
+
+        grupos = [lambda t=tipo, f=fonte: cenarios_fonte(t, f) for tipo, fonte in por_tipo.items()]
+        grupos += [lambda: cenarios_preparo(principal), lambda: cenarios_dash(principal)]
+        if streamlit:
+            grupos.append(lambda: cenarios_streamlit(caminhos['sqlite']))
+
+        for grupo in grupos:
+            for nome, funcao in grupo().items():
+                if filtro_cenarios and not any(nome.startswith(f) for f in filtro_cenarios):
+                    continue
+                vezes = repeticoes if not nome.startswith('streamlit.') else max(1, repeticoes // 5)
+                resultado = {'escala': escala, 'linhas': linhas, 'cenario': nome}
+                resultado.update(resumir(medir(funcao, vezes)))
+                resultados.append(resultado)
+                if relatar:
+                    relatar(resultado)
+    return resultados
+
+
+def metadados(semente, dispositivos=1):
+    """Ambiente da execução, gravado junto com os resultados."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'plataforma': platform.platform(),
+        'processador': platform.processor() or platform.machine(),
+        'commit': commit,
+        'semente': semente,
+        'dispositivos': dispositivos,
+    }
+
+
+def comparar(resultados, anteriores, limite):
+    """Cenários cuja mediana cresceu mais que `limite` (fração) em relação
+    a `anteriores`, como (escala, cenario, mediana anterior, atual)."""
+    referencia = {(r['escala'], r['cenario']): r['mediana_ms'] for r in anteriores}
+    regressoes = []
+    for resultado in resultados:
+        anterior = referencia.get((resultado['escala'], resultado['cenario']))
+        if anterior and resultado['mediana_ms'] > anterior * (1 + limite):
+            regressoes.append((resultado['escala'], resultado['cenario'], anterior, resultado['mediana_ms']))
+    return regressoes
+
+
+def _relatar(resultado):
+    print(
+        f"{resultado['linhas']:>12,} linhas | {resultado['cenario']:<44} | "
+        f"{resultado['mediana_ms']:>10.2f} ms (p95 {resultado['p95_ms']:.2f})"
+    )
+
+
+def _lista(texto, tipo=str):
+    return [tipo(item) for item in texto.split(',') if item]
+
+
+def _argumentos(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m irrigacao.benchmark',
+        description="Benchmarks das consultas, do preparo e dos callbacks dos dashboards.",
+    )
+    parser.add_argument('--escalas', default=",".join(str(e) for e in ESCALAS_PADRAO),
+                        help=f"múltiplos do histórico de {sintetico.LINHAS_HISTORICO} linhas, "
+                             "separados por vírgula (até 10000)")
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--fontes', default='local,sqlite', help="fontes medidas: local, sqlite")
+    parser.add_argument('--cenarios', default=None,
+                        help="prefixos dos cenários a medir, separados por vírgula (ex.: fonte.,dash.)")
+    parser.add_argument('--streamlit', action='store_true',
+                        help="inclui execuções completas do dashboard Streamlit (AppTest)")
+    parser.add_argument('--diretorio', default=DIRETORIO_PADRAO,
+                        help="onde ficam os dados sintéticos gerados (reaproveitados entre execuções)")
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--dispositivos', type=int, default=1,
+                        help="dispositivos entre os quais as linhas de cada escala são divididas")
+    parser.add_argument('--saida', default=None, help="grava os resultados em JSON")
+    parser.add_argument('--comparar', default=None, help="JSON de uma execução anterior")
+    parser.add_argument('--limite-regressao', type=float, default=0.2,
+                        help="piora relativa da mediana tolerada em --comparar (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _argumentos(argv)
+    resultados = executar(
+        _lista(args.escalas, int), args.repeticoes, _lista(args.fontes),
+        _lista(args.cenarios) if args.cenarios else None,
+        args.diretorio, args.semente, args.streamlit, relatar=_relatar, dispositivos=args.dispositivos,
+    )
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump({'metadados': metadados(args.semente, args.dispositivos), 'resultados': resultados},
+                      arquivo, indent=2)
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            anteriores = json.load(arquivo)['resultados']
+        regressoes = comparar(resultados, anteriores, args.limite_regressao)
+        for escala, cenario, anterior, atual in regressoes:
+            print(f"REGRESSÃO escala {escala} | {cenario}: {anterior:.2f} ms -> {atual:.2f} ms")
+        if regressoes:
+            return 1
+        print("Nenhuma regressão acima do limite")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Latência das consultas de janela conforme a tabela cresce
+
+Carrega leituras sintéticas (`irrigacao.sintetico`) em duas tabelas de
+teste, uma sem índice (como a importada pelo assistente do SQL Developer) e
+outra com as migrações de `irrigacao.migracoes`, e mede as consultas que os
+dashboards fazem a cada atualização em cada tamanho pedido: MAX(TIMESTAMP),
+os 500 registros mais recentes, as janelas de 24h e 7 dias e os agregados de
+24h. As tabelas crescem de um tamanho para o seguinte sem recarregar o que
+já foi gravado.
+
+Uso, a partir da pasta `src/`:
+
+    python -m irrigacao.benchmark_janelas --destino sqlite --banco /tmp/bench.sqlite
+    python -m irrigacao.benchmark_janelas --destino sqlite --banco /tmp/bench.sqlite \\
+        --tamanhos 8760,876000,8760000,100000000 --saida janelas.json
+    python -m irrigacao.benchmark_janelas --particionar     # Oracle, com a migração 3
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from irrigacao import migracoes
+from irrigacao import sintetico
+from irrigacao.carga import CargaEmLote, conectar_destino
+from irrigacao.consultas import ConstrutorConsultas, buscar
+from irrigacao.fonte_dados import interpretar_periodo
+
+TAMANHOS_PADRAO = [8_760, 87_600, 876_000, 8_760_000]
+
+VARIANTES = {
+    'sem_indice': '_SEM',
+    'com_indice': '_COM',
+}
+
+
+def consultas_medidas(consultas):
+    """Consultas feitas pelos dashboards a cada atualização, por nome."""
+    return {
+        'max_timestamp': consultas.versao(),
+        'ultimos_500': consultas.ordenada(consultas.periodo(interpretar_periodo(500))),
+        'janela_24h': consultas.ordenada(consultas.periodo(interpretar_periodo('24h'))),
+        'janela_7d': consultas.ordenada(consultas.periodo(interpretar_periodo('7d'))),
+        'agregados_24h': consultas.agregados(interpretar_periodo('24h')),
+    }
+
+
+def medir(conn, consulta, repeticoes):
+    """Tempos (ms) de `repeticoes` execuções completas (com o fetch) e o
+    número de linhas do resultado."""
+    buscar(conn, consulta)  # aquece o cache de páginas/cursores
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        _, linhas = buscar(conn, consulta)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return tempos, len(linhas)
+
+
+def preparar_tabela(conn, dialeto, tabela, indexada, particionar=False):
+    """Recria a tabela de teste vazia, com ou sem as migrações."""
+    cursor = conn.cursor()
+    try:
+        if migracoes.tabela_existe(conn, dialeto, tabela):
+            cursor.execute(f"DROP TABLE {tabela}")
+        if migracoes.tabela_existe(conn, dialeto, migracoes.TABELA_VERSOES):
+            marcador = ":1" if dialeto == 'oracle' else "?"
+            cursor.execute(f"DELETE FROM {migracoes.TABELA_VERSOES} WHERE TABELA = {marcador}", (tabela,))
+        if not indexada:
+            cursor.execute(ConstrutorConsultas(tabela, dialeto).criar_tabela())
+    finally:
+        cursor.close()
+    conn.commit()
+    if indexada:
+        migracoes.migrar(conn, dialeto, tabela, particionar=particionar)
+
+
+def executar(conn, dialeto, tabela_base, tamanhos, repeticoes=5, particionar=False,
+             semente=0, relatar=None):
+    """Lista de resultados (um dict por variante, tamanho e consulta)."""
+    resultados = []
+    tabelas = {variante: tabela_base + sufixo for variante, sufixo in VARIANTES.items()}
+    for variante, tabela in tabelas.items():
+        preparar_tabela(conn, dialeto, tabela, variante == 'com_indice', particionar)
+
+    carregadas = 0
+    for tamanho in sorted(tamanhos):
+        for variante, tabela in tabelas.items():
+            inicio = time.perf_counter()
+            apos = None
+            if carregadas:
+                apos = sintetico.INICIO_PADRAO + carregadas * sintetico.INTERVALO_PADRAO
+            carga = CargaEmLote(conn, dialeto, tabela)
+            carga.carregar(sintetico.gerar_lotes(tamanho, semente=semente, apos=apos))
+            segundos_carga = time.perf_counter() - inicio
+
+            consultas = ConstrutorConsultas(tabela, dialeto)
+            for nome, consulta in consultas_medidas(consultas).items():
+                tempos, linhas = medir(conn, consulta, repeticoes)
+                resultado = {
+                    'variante': variante,
+                    'linhas_tabela': tamanho,
+                    'consulta': nome,
+                    'mediana_ms': statistics.median(tempos),
+                    'minimo_ms': min(tempos),
+                    'maximo_ms': max(tempos),
+                    'linhas_resultado': linhas,
+                    'segundos_carga': segundos_carga,
+                }
+                resultados.append(resultado)
+                if relatar:
+                    relatar(resultado)
+        carregadas = tamanho
+    return resultados
+
+
+def _relatar(resultado):
+    print(
+        f"{resultado['linhas_tabela']:>12,} linhas | {resultado['variante']:<10} | "
+        f"{resultado['consulta']:<14} | {resultado['mediana_ms']:>10.2f} ms "
+        f"({resultado['linhas_resultado']:,} linhas)"
+    )
+
+
+def _argumentos(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m irrigacao.benchmark_janelas',
+        description="Latência das consultas de janela com e sem as migrações de esquema.",
+    )
+    parser.add_argument('--destino', choices=['oracle', 'sqlite'], default='oracle')
+    parser.add_argument('--banco', default=None, help="arquivo SQLite do destino sqlite")
+    parser.add_argument('--tabela', default='HIST_BENCH',
+                        help="prefixo das tabelas de teste (recriadas a cada execução)")
+    parser.add_argument('--tamanhos', default=",".join(str(t) for t in TAMANHOS_PADRAO),
+                        help="tamanhos da tabela, separados por vírgula (até 100000000)")
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--particionar', action='store_true',
+                        help="aplica também o particionamento mensal (Oracle)")
+    parser.add_argument('--saida', default=None, help="grava os resultados em JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _argumentos(argv)
+    tamanhos = [int(t) for t in args.tamanhos.split(',') if t]
+    conn, dialeto = conectar_destino(args.destino, args.banco)
+    try:
+        resultados = executar(
+            conn, dialeto, args.tabela, tamanhos, args.repeticoes, args.particionar, relatar=_relatar
+        )
+    finally:
+        conn.close()
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump({'destino': args.destino, 'resultados': resultados}, arquivo, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
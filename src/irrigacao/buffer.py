@@ -0,0 +1,241 @@
+"""
+Buffer em memória com busca incremental (marca d'água por dispositivo)
+
+Cada atualização automática consulta apenas as linhas recentes, anexa-as ao
+buffer em ordem cronológica e descarta as que saíram do período selecionado.
+O custo de uma atualização em regime passa a depender do número de leituras
+novas, não do tamanho da janela.
+
+Com vários dispositivos, as leituras de um deles podem chegar ao banco depois
+das de outro com TIMESTAMP maior. Por isso a busca relê
+`config.SOBREPOSICAO_INCREMENTAL` segundos antes da leitura mais recente e
+descarta as repetidas pela marca d'água de cada DISPOSITIVO (a chave
+primária é (DISPOSITIVO, TIMESTAMP)); as atrasadas entram no buffer na sua
+posição cronológica. Leituras que atrasarem mais que a sobreposição só
+entram com `recarregar()`. Linhas recebidas por outro caminho (o serviço de
+`irrigacao.ingestao`) entram por `anexar()`, sem ida ao banco.
+
+Quando as colunas lidas incluem as de `irrigacao.estatisticas`, cada lote
+também atualiza as estatísticas contínuas do período (`estatisticas`), que
+saem da janela junto com as linhas. Com as de `irrigacao.anomalias`, as
+leituras novas passam pelo detector de anomalias (`anomalias`), que esquece
+as que saíram da janela.
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from irrigacao import config
+from irrigacao.anomalias import COLUNAS_LEITURA as COLUNAS_ANOMALIAS, DetectorAnomalias
+from irrigacao.esquema import compactar, filtrar_escopo, marcas_por_dispositivo, posteriores_as_marcas, projetar
+from irrigacao.estatisticas import COLUNAS_ESTATISTICAS, EstatisticasJanela
+from irrigacao.fonte_dados import interpretar_periodo
+
+
+class BufferJanela:
+    """Linhas de um período mantidas em colunas NumPy com capacidade extra.
+
+    - `atualizar()` faz a carga completa na primeira chamada e depois só a
+      busca incremental (`FonteDados.carregar_desde`)
+    - `dados()` devolve um DataFrame em ordem decrescente de TIMESTAMP, como
+      o resto do dashboard espera; o frame é reaproveitado enquanto a versão
+      do buffer não muda
+    - `preparar`, se informado, é aplicado uma única vez a cada lote novo
+      (por exemplo correção de unidades e coluna DATETIME)
+    - `intervalo_minimo` evita idas ao banco mais frequentes que esse número
+      de segundos, mesmo com vários chamadores
+    - `colunas`, se informado, limita as leituras a essas colunas (mais
+      TIMESTAMP); os tipos compactos da fonte são preservados no buffer
+    - `estatisticas` (`EstatisticasJanela` do mesmo período) acompanha as
+      linhas do buffer; é None se `colunas` não inclui todas as colunas de
+      `COLUNAS_ESTATISTICAS`
+    - `anomalias` (`DetectorAnomalias`) classifica cada leitura nova e
+      guarda as anomalias das linhas do buffer; é None se `colunas` não
+      inclui as colunas de `irrigacao.anomalias.COLUNAS_LEITURA`
+    """
+
+    def __init__(self, fonte, filtro, preparar=None, intervalo_minimo=0.0, colunas=None):
+        self.fonte = fonte
+        self.filtro = filtro
+        self.colunas = colunas
+        self.periodo = interpretar_periodo(filtro)
+        self.preparar = preparar
+        self.intervalo_minimo = intervalo_minimo
+        self.estatisticas = (
+            EstatisticasJanela(self.periodo)
+            if colunas is None or set(COLUNAS_ESTATISTICAS) <= set(colunas) else None
+        )
+        self.anomalias = (
+            DetectorAnomalias()
+            if colunas is None or set(COLUNAS_ANOMALIAS) <= set(colunas) else None
+        )
+
+        self._lock = threading.Lock()
+        self._colunas = None  # dict coluna -> array com capacidade extra
+        self._inicio = 0
+        self._fim = 0
+        self._ultima_busca = None
+        self._frame = None
+        self.versao = 0
+        self.marca_dagua = None  # maior TIMESTAMP já carregado
+        self.marcas = None  # maior TIMESTAMP já carregado de cada DISPOSITIVO
+
+    def __len__(self):
+        return self._fim - self._inicio
+
+    def recarregar(self):
+        """Descarta o conteúdo e refaz a carga completa do período."""
+        df = self.fonte.carregar(self.filtro, colunas=self.colunas)
+        with self._lock:
+            self._colunas = None
+            self._inicio = self._fim = 0
+            self.marca_dagua = None
+            self.marcas = None
+            if self.estatisticas is not None:
+                self.estatisticas.limpar()
+            if self.anomalias is not None:
+                self.anomalias.limpar()
+            self._anexar(df)
+            self._ultima_busca = time.monotonic()
+        return len(df)
+
+    def atualizar(self, forcar=False):
+        """Busca as leituras novas e devolve quantas foram anexadas."""
+        if self.marca_dagua is None:
+            return self.recarregar()
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima_busca < self.intervalo_minimo:
+            return 0
+        limite = self.periodo.valor if self.periodo.tipo == 'registros' else None
+        novos = self.fonte.carregar_desde(
+            self.marca_dagua - config.SOBREPOSICAO_INCREMENTAL, limite=limite, colunas=self.colunas
+        )
+        with self._lock:
+            self._ultima_busca = agora
+            # Descarta as já vistas, inclusive as que outra thread anexou
+            # enquanto esta buscava
+            if len(novos) and self.marca_dagua is not None:
+                novos = posteriores_as_marcas(novos, self.marcas).reset_index(drop=True)
+            if len(novos) == 0:
+                return 0
+            self._anexar(novos)
+        return len(novos)
+
+    def anexar(self, df):
+        """Anexa linhas que não vieram da fonte (formato armazenado, em
+        qualquer ordem); as que não passam da marca d'água do seu
+        dispositivo são ignoradas.
+
+        Antes da primeira carga não faz nada: a carga completa já as trará.
+        Linhas fora do escopo da fonte também são ignoradas.
+        """
+        df = filtrar_escopo(df, self.fonte.escopo)
+        if self.colunas is not None:
+            df = df[projetar(self.colunas)]
+        df = compactar(df.sort_values('TIMESTAMP', ascending=False, kind='stable'))
+        with self._lock:
+            if self.marca_dagua is None:
+                return 0
+            df = posteriores_as_marcas(df, self.marcas)
+            if len(df) == 0:
+                return 0
+            self._anexar(df.reset_index(drop=True))
+        return len(df)
+
+    def _anexar(self, df):
+        # Chamado com o lock adquirido; `df` vem da fonte em ordem decrescente
+        # e cada dispositivo só traz leituras posteriores às suas já guardadas
+        if len(df) == 0:
+            return
+        df = df.iloc[::-1].reset_index(drop=True)
+        self.marcas = marcas_por_dispositivo(df, self.marcas)
+        # Estatísticas e anomalias no formato armazenado, antes de `preparar`
+        if self.estatisticas is not None:
+            self.estatisticas.adicionar(df)
+        if self.anomalias is not None:
+            self.anomalias.processar(df)
+        if self.preparar is not None and len(df):
+            df = self.preparar(df)
+
+        if self._colunas is None:
+            capacidade = max(len(df) * 2, 1024)
+            self._colunas = {
+                nome: np.empty(capacidade, dtype=df[nome].to_numpy().dtype)
+                for nome in df.columns
+            }
+            self._inicio = self._fim = 0
+
+        n = len(df)
+        capacidade = len(next(iter(self._colunas.values())))
+        if self._fim + n > capacidade:
+            self._compactar(n)
+        timestamps = self._colunas['TIMESTAMP']
+        novos_timestamps = df['TIMESTAMP'].to_numpy()
+        if self._fim > self._inicio and novos_timestamps[0] < timestamps[self._fim - 1]:
+            self._intercalar(df)
+        else:
+            for nome, destino in self._colunas.items():
+                destino[self._fim:self._fim + n] = df[nome].to_numpy()
+            self._fim += n
+        self._descartar_expirados()
+
+        timestamps = self._colunas['TIMESTAMP']
+        if self._fim > self._inicio:
+            self.marca_dagua = int(timestamps[self._fim - 1])
+            if self.anomalias is not None:
+                self.anomalias.descartar_antes(int(timestamps[self._inicio]))
+        self.versao += 1
+        self._frame = None
+
+    def _intercalar(self, df):
+        # Leituras atrasadas de algum dispositivo: só as linhas guardadas a
+        # partir da mais antiga delas são reordenadas junto com o lote
+        timestamps = self._colunas['TIMESTAMP']
+        posicao = self._inicio + int(np.searchsorted(
+            timestamps[self._inicio:self._fim], df['TIMESTAMP'].to_numpy()[0], side='right'
+        ))
+        ordem = np.argsort(
+            np.concatenate((timestamps[posicao:self._fim], df['TIMESTAMP'].to_numpy())), kind='stable'
+        )
+        fim = self._fim + len(df)
+        for nome, destino in self._colunas.items():
+            juntos = np.concatenate((destino[posicao:self._fim], df[nome].to_numpy().astype(destino.dtype)))
+            destino[posicao:fim] = juntos[ordem]
+        self._fim = fim
+
+    def _compactar(self, extra):
+        # Move as linhas válidas para o início e dobra a capacidade se preciso
+        tamanho = self._fim - self._inicio
+        capacidade = len(next(iter(self._colunas.values())))
+        nova_capacidade = capacidade
+        while tamanho + extra > nova_capacidade // 2:
+            nova_capacidade *= 2
+        for nome, origem in self._colunas.items():
+            destino = origem if nova_capacidade == capacidade else np.empty(nova_capacidade, dtype=origem.dtype)
+            destino[:tamanho] = origem[self._inicio:self._fim]
+            self._colunas[nome] = destino
+        self._inicio, self._fim = 0, tamanho
+
+    def _descartar_expirados(self):
+        if self.periodo.tipo == 'registros':
+            self._inicio = max(self._inicio, self._fim - self.periodo.valor)
+        elif self.periodo.tipo == 'janela' and self._fim > self._inicio:
+            timestamps = self._colunas['TIMESTAMP'][self._inicio:self._fim]
+            corte = timestamps[-1] - self.periodo.valor
+            self._inicio += int(np.searchsorted(timestamps, corte, side='left'))
+
+    def dados(self):
+        """Linhas do período, da mais recente para a mais antiga."""
+        with self._lock:
+            if self._frame is None:
+                if self._colunas is None:
+                    self._frame = pd.DataFrame()
+                else:
+                    self._frame = pd.DataFrame({
+                        nome: coluna[self._inicio:self._fim][::-1]
+                        for nome, coluna in self._colunas.items()
+                    })
+            return self._frame
@@ -0,0 +1,277 @@
+"""
+Cache de consultas compartilhado entre processos
+
+Os resultados das consultas ficam em um arquivo SQLite local, visível para
+todos os processos da máquina (vários workers do Dash, sessões do Streamlit
+e as ferramentas de linha de comando). A chave é o texto SQL normalizado, os
+valores das variáveis de ligação e a versão dos dados (MAX(TIMESTAMP) da
+tabela): quando chega uma leitura nova a versão muda e as entradas antigas
+simplesmente deixam de ser pedidas, saindo do cache pela ordem de uso
+quando o tamanho passa de `tamanho_maximo`.
+
+Pedidos simultâneos da mesma chave viram uma única ida ao banco
+(single-flight): dentro do processo os demais esperam um `threading.Event`;
+entre processos, quem consegue gravar a reserva da chave consulta e os
+outros aguardam o resultado aparecer no arquivo. Os contadores de acertos,
+faltas e pedidos coalescidos também ficam no arquivo, somando todos os
+processos.
+
+Os valores são gravados com pickle, então quem pode escrever no arquivo pode
+executar código no processo que o lê: a pasta do cache é criada só para o
+usuário (0o700) e recusada se pertencer a outro usuário ou se outros puderem
+gravar nela ou no arquivo.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from irrigacao import metricas
+
+# Sinal de "não está no cache" (None é um valor válido)
+_AUSENTE = object()
+
+CONTADORES = ('acertos', 'faltas', 'coalescidas', 'expulsas', 'grandes_demais')
+
+# Segundos entre duas gravações do horário de acesso de uma entrada: um
+# acerto só escreve no arquivo quando o último acesso registrado é mais
+# antigo que isso (a ordem de expulsão não precisa de mais precisão)
+INTERVALO_ACESSO = 5.0
+
+_ESQUEMA = [
+    """CREATE TABLE IF NOT EXISTS entradas (
+        chave TEXT PRIMARY KEY,
+        valor BLOB NOT NULL,
+        tamanho INTEGER NOT NULL,
+        acesso REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS entradas_acesso ON entradas (acesso)",
+    """CREATE TABLE IF NOT EXISTS reservas (
+        chave TEXT PRIMARY KEY,
+        pid INTEGER NOT NULL,
+        inicio REAL NOT NULL
+    )""",
+    "CREATE TABLE IF NOT EXISTS contadores (nome TEXT PRIMARY KEY, valor INTEGER NOT NULL)",
+]
+
+
+def normalizar_sql(sql):
+    """Texto SQL com espaços e quebras de linha colapsados."""
+    return " ".join(sql.split())
+
+
+def verificar_permissoes(caminho):
+    """Levanta `PermissionError` se `caminho` (pasta ou arquivo) pertence a
+    outro usuário ou pode ser gravado pelo grupo ou por outros. Sem
+    `os.getuid` (Windows), não confere nada."""
+    if not hasattr(os, 'getuid') or not os.path.exists(caminho):
+        return
+    estado = os.stat(caminho)
+    if estado.st_uid != os.getuid() or estado.st_mode & 0o022:
+        raise PermissionError(
+            f"{caminho} pertence a outro usuário ou pode ser gravado por outros; "
+            f"o cache de consultas não vai lê-lo (use IRRIGACAO_CACHE para outro caminho)"
+        )
+
+
+def chave_consulta(consulta, versao, origem=''):
+    """Chave de cache de uma `Consulta` em uma versão dos dados; `origem`
+    separa bancos diferentes que usam o mesmo arquivo de cache."""
+    texto = json.dumps(
+        [origem, normalizar_sql(consulta.sql), sorted(consulta.parametros.items()), versao],
+        default=str,
+    )
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+class CacheCompartilhado:
+    """Cache em arquivo SQLite com expulsão por tamanho e single-flight.
+
+    - `tamanho_maximo`: bytes somados dos valores serializados; as entradas
+      usadas há mais tempo saem primeiro
+    - `espera_maxima`: segundos que um pedido aguarda a consulta de outro
+      processo antes de desistir e consultar por conta própria (também é o
+      prazo após o qual a reserva de um processo que morreu é ignorada)
+    """
+
+    def __init__(self, caminho, tamanho_maximo=256 * 1024 * 1024, espera_maxima=30.0):
+        self.caminho = caminho
+        self.tamanho_maximo = tamanho_maximo
+        self.espera_maxima = espera_maxima
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._em_andamento = {}  # chave -> threading.Event
+        diretorio = os.path.dirname(os.path.abspath(caminho))
+        os.makedirs(diretorio, mode=0o700, exist_ok=True)
+        verificar_permissoes(diretorio)
+        verificar_permissoes(caminho)
+        conn = self._conexao()
+        for instrucao in _ESQUEMA:
+            conn.execute(instrucao)
+        conn.executemany(
+            "INSERT OR IGNORE INTO contadores (nome, valor) VALUES (?, 0)",
+            [(nome,) for nome in CONTADORES],
+        )
+
+    def _conexao(self):
+        # Uma conexão por thread, em modo autocommit e com WAL para que
+        # leituras de um processo não bloqueiem as gravações de outro
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=self.espera_maxima, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _contar(self, nome, quantidade=1):
+        # Os contadores do arquivo somam todos os processos; os de
+        # `irrigacao.metricas` são só deste, como o restante do /metrics
+        self._conexao().execute(
+            "UPDATE contadores SET valor = valor + ? WHERE nome = ?", (quantidade, nome)
+        )
+        metricas.contar('irrigacao_cache_consultas_total', quantidade, resultado=nome)
+
+    def obter(self, chave, calcular):
+        """Valor da chave; `calcular()` só roda se nenhum outro pedido
+        (deste ou de outro processo) já estiver calculando o mesmo valor."""
+        valor = self._ler(chave)
+        if valor is not _AUSENTE:
+            self._contar('acertos')
+            return valor
+
+        with self._lock:
+            evento = self._em_andamento.get(chave)
+            dono = evento is None
+            if dono:
+                evento = self._em_andamento[chave] = threading.Event()
+        # Só conta como coalescido o pedido que recebeu o valor de outro; se
+        # a espera desiste, é uma falta como qualquer outra
+        if not dono:
+            evento.wait(self.espera_maxima)
+            valor = self._ler(chave)
+            if valor is not _AUSENTE:
+                self._contar('coalescidas')
+                return valor
+            # O dono falhou ou o valor não coube no cache
+            self._contar('faltas')
+            return calcular()
+
+        try:
+            if not self._reservar(chave):
+                valor = self._aguardar(chave)
+                if valor is not _AUSENTE:
+                    self._contar('coalescidas')
+                    return valor
+            self._contar('faltas')
+            valor = calcular()
+            self._gravar(chave, valor)
+            return valor
+        finally:
+            self._liberar(chave)
+            with self._lock:
+                del self._em_andamento[chave]
+            evento.set()
+
+    def _ler(self, chave):
+        conn = self._conexao()
+        linha = conn.execute("SELECT valor, acesso FROM entradas WHERE chave = ?", (chave,)).fetchone()
+        if linha is None:
+            return _AUSENTE
+        agora = time.time()
+        if agora - linha[1] >= INTERVALO_ACESSO:
+            conn.execute("UPDATE entradas SET acesso = ? WHERE chave = ?", (agora, chave))
+        return pickle.loads(linha[0])
+
+    def _reservar(self, chave):
+        conn = self._conexao()
+        agora = time.time()
+        # Reserva de um processo que morreu no meio da consulta
+        conn.execute(
+            "DELETE FROM reservas WHERE chave = ? AND inicio < ?", (chave, agora - self.espera_maxima)
+        )
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO reservas (chave, pid, inicio) VALUES (?, ?, ?)",
+            (chave, os.getpid(), agora),
+        )
+        return cursor.rowcount == 1
+
+    def _aguardar(self, chave):
+        conn = self._conexao()
+        limite = time.monotonic() + self.espera_maxima
+        pausa = 0.01
+        while time.monotonic() < limite:
+            valor = self._ler(chave)
+            if valor is not _AUSENTE:
+                return valor
+            if conn.execute("SELECT 1 FROM reservas WHERE chave = ?", (chave,)).fetchone() is None:
+                # Reserva liberada sem valor: consulta falhou ou grande demais
+                return self._ler(chave)
+            time.sleep(pausa)
+            pausa = min(pausa * 2, 0.2)
+        return _AUSENTE
+
+    def _liberar(self, chave):
+        self._conexao().execute(
+            "DELETE FROM reservas WHERE chave = ? AND pid = ?", (chave, os.getpid())
+        )
+
+    def _gravar(self, chave, valor):
+        dados = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(dados) > self.tamanho_maximo:
+            self._contar('grandes_demais')
+            return
+        conn = self._conexao()
+        conn.execute(
+            "INSERT OR REPLACE INTO entradas (chave, valor, tamanho, acesso) VALUES (?, ?, ?, ?)",
+            (chave, sqlite3.Binary(dados), len(dados), time.time()),
+        )
+        self._expulsar()
+
+    def _expulsar(self):
+        conn = self._conexao()
+        total = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM entradas").fetchone()[0]
+        excesso = total - self.tamanho_maximo
+        if excesso <= 0:
+            return
+        removidas = []
+        for chave, tamanho in conn.execute("SELECT chave, tamanho FROM entradas ORDER BY acesso"):
+            removidas.append((chave,))
+            excesso -= tamanho
+            if excesso <= 0:
+                break
+        conn.executemany("DELETE FROM entradas WHERE chave = ?", removidas)
+        self._contar('expulsas', len(removidas))
+
+    def limpar(self):
+        """Remove todas as entradas (os contadores são mantidos)."""
+        self._conexao().execute("DELETE FROM entradas")
+
+    def estatisticas(self):
+        """Contadores de todos os processos, entradas e bytes ocupados."""
+        conn = self._conexao()
+        estatisticas = dict(conn.execute("SELECT nome, valor FROM contadores").fetchall())
+        entradas, tamanho = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM entradas"
+        ).fetchone()
+        estatisticas.update(entradas=entradas, bytes=tamanho, tamanho_maximo=self.tamanho_maximo)
+        pedidos = estatisticas['acertos'] + estatisticas['faltas'] + estatisticas['coalescidas']
+        estatisticas['taxa_acerto'] = (
+            (estatisticas['acertos'] + estatisticas['coalescidas']) / pedidos if pedidos else 0.0
+        )
+        return estatisticas
+
+
+def criar_cache(caminho=None, tamanho_mb=None):
+    """Cache de `config.CACHE_CONSULTAS`, ou None se estiver desligado."""
+    from irrigacao import config
+
+    caminho = config.CACHE_CONSULTAS if caminho is None else caminho
+    if not caminho:
+        return None
+    tamanho_mb = config.CACHE_TAMANHO_MB if tamanho_mb is None else tamanho_mb
+    return CacheCompartilhado(caminho, tamanho_maximo=tamanho_mb * 1024 * 1024)
@@ -0,0 +1,274 @@
+"""
+Carregador em lote da tabela HISTORICO2024 (substitui o assistente de
+importação do SQL Developer descrito em `scripts/oracle_import.md`)
+
+Lê o CSV em blocos (`pd.read_csv(chunksize=...)`), converte UMIDADE_DHT para
+o formato armazenado (x100) e grava com `executemany` (array DML) em lotes
+configuráveis. Depois de cada bloco confirmado o maior TIMESTAMP gravado vai
+para um arquivo de checkpoint; uma carga interrompida retoma a partir dele.
+Linhas cuja chave (DISPOSITIVO, TIMESTAMP) já está na tabela (ou repetida no
+próprio arquivo) são ignoradas; arquivos sem CAMPO/DISPOSITIVO são de um
+único nó (campo 1, dispositivo 1).
+
+Uso, a partir da pasta `src/`:
+
+    python -m irrigacao.carga                              # CSV histórico -> Oracle
+    python -m irrigacao.carga --destino sqlite --criar-tabela
+    python -m irrigacao.carga --destino sqlite --sintetico 20000000
+    python -m irrigacao.carga --destino sqlite --sintetico 8760000 --dispositivos 1000
+
+O arquivo de entrada precisa estar em ordem crescente de TIMESTAMP entre
+blocos (como o CSV histórico e o gerador de `irrigacao.sintetico`).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from irrigacao import config
+from irrigacao import migracoes
+from irrigacao import sintetico
+from irrigacao.consultas import ConstrutorConsultas, buscar
+from irrigacao.esquema import TABELA, COLUNAS, armazenar_unidades, completar_dispositivo
+
+LOTE_LEITURA_PADRAO = 100_000
+LOTE_INSERCAO_PADRAO = 10_000
+
+# Chave numérica (DISPOSITIVO, TIMESTAMP): TIMESTAMP tem até 10 dígitos
+_PESO_DISPOSITIVO = 10**10
+
+
+class EntradaForaDeOrdem(Exception):
+    """Um bloco trouxe TIMESTAMPs anteriores aos já gravados pela carga."""
+
+
+def ler_checkpoint(caminho):
+    """Maior TIMESTAMP já confirmado, ou None sem checkpoint."""
+    if not caminho or not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo).get('timestamp')
+
+
+def gravar_checkpoint(caminho, timestamp, linhas):
+    # Grava em arquivo temporário e troca, para nunca deixar um JSON pela metade
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump({'timestamp': int(timestamp), 'linhas': int(linhas)}, arquivo)
+    os.replace(temporario, caminho)
+
+
+def ler_blocos_csv(caminho, tamanho_bloco=LOTE_LEITURA_PADRAO):
+    """Blocos do CSV com as colunas de HISTORICO2024 (umidade em %)."""
+    for bloco in pd.read_csv(caminho, usecols=lambda coluna: coluna in COLUNAS, chunksize=tamanho_bloco):
+        yield completar_dispositivo(bloco)
+
+
+class CargaEmLote:
+    """Grava blocos de leituras em uma conexão DB-API.
+
+    - `lote_insercao`: linhas por chamada de `executemany`
+    - `checkpoint`: arquivo JSON com o maior TIMESTAMP confirmado (None
+      desliga a retomada)
+    - `relatar`: função chamada com uma linha de progresso a cada bloco
+    """
+
+    def __init__(self, conn, dialeto='oracle', tabela=TABELA,
+                 lote_insercao=LOTE_INSERCAO_PADRAO, checkpoint=None, relatar=None):
+        self.conn = conn
+        self.consultas = ConstrutorConsultas(tabela, dialeto)
+        self.lote_insercao = lote_insercao
+        self.checkpoint = checkpoint
+        self.relatar = relatar
+        # Linhas até o checkpoint de uma carga anterior são puladas; depois
+        # delas, cada bloco precisa vir após o último gravado nesta carga
+        self.retomar_apos = ler_checkpoint(checkpoint)
+        self.ultimo_timestamp = self.retomar_apos
+        self._gravou = False
+        self.estatisticas = {
+            'lidas': 0,
+            'inseridas': 0,
+            'duplicadas': 0,
+            'ja_carregadas': 0,
+            'segundos': 0.0,
+        }
+        self._faixa_existente = None
+
+    def criar_tabela(self):
+        """Cria a tabela (se preciso) e aplica as migrações de esquema."""
+        return migracoes.migrar(self.conn, self.consultas.dialeto, self.consultas.tabela)
+
+    def carregar(self, blocos):
+        """Grava todos os blocos; devolve `estatisticas`."""
+        inicio = time.perf_counter()
+        _, linhas = buscar(self.conn, self.consultas.extremos())
+        self._faixa_existente = linhas[0] if linhas and linhas[0][0] is not None else None
+        for bloco in blocos:
+            self._carregar_bloco(bloco)
+            self.estatisticas['segundos'] = time.perf_counter() - inicio
+            if self.relatar:
+                self.relatar(self.progresso())
+        self.estatisticas['segundos'] = time.perf_counter() - inicio
+        return self.estatisticas
+
+    def _carregar_bloco(self, bloco):
+        self.estatisticas['lidas'] += len(bloco)
+        if self.retomar_apos is not None:
+            # O TIMESTAMP do checkpoint pode ter ficado com parte dos
+            # dispositivos; as linhas dele já gravadas saem em `_sem_existentes`
+            novas = bloco['TIMESTAMP'] >= self.retomar_apos
+            self.estatisticas['ja_carregadas'] += int((~novas).sum())
+            bloco = bloco[novas]
+        if len(bloco) == 0:
+            return
+        tamanho = len(bloco)
+        bloco = completar_dispositivo(bloco)
+        bloco = bloco.drop_duplicates(['DISPOSITIVO', 'TIMESTAMP'])
+        bloco = bloco.sort_values(['TIMESTAMP', 'DISPOSITIVO'], kind='stable')
+        bloco = self._sem_existentes(bloco)
+        self.estatisticas['duplicadas'] += tamanho - len(bloco)
+        if len(bloco) == 0:
+            return
+
+        bloco = armazenar_unidades(bloco[COLUNAS].copy())
+        # Tuplas de inteiros Python (o driver não aceita escalares NumPy)
+        linhas = list(zip(*(bloco[coluna].tolist() for coluna in COLUNAS)))
+        sql = self.consultas.inserir()
+        cursor = self.conn.cursor()
+        try:
+            for i in range(0, len(linhas), self.lote_insercao):
+                cursor.executemany(sql, linhas[i:i + self.lote_insercao])
+        finally:
+            cursor.close()
+        self.conn.commit()
+
+        self.ultimo_timestamp = int(bloco['TIMESTAMP'].iloc[-1])
+        self._gravou = True
+        self.estatisticas['inseridas'] += len(bloco)
+        if self.checkpoint:
+            gravar_checkpoint(self.checkpoint, self.ultimo_timestamp, self.estatisticas['inseridas'])
+
+    def _sem_existentes(self, bloco):
+        # Só blocos que caem na faixa que a tabela já tinha no início da carga,
+        # ou que continuam o último TIMESTAMP gravado (outros dispositivos no
+        # mesmo instante), podem repetir linhas; os demais vêm depois de tudo
+        timestamps = bloco['TIMESTAMP'].to_numpy()
+        if self._gravou and timestamps[0] < self.ultimo_timestamp:
+            raise EntradaForaDeOrdem(
+                f"TIMESTAMP {timestamps[0]} é anterior ao último gravado ({self.ultimo_timestamp})"
+            )
+        continua = self._gravou and timestamps[0] == self.ultimo_timestamp
+        na_faixa = self._faixa_existente is not None and not (
+            timestamps[-1] < self._faixa_existente[0] or timestamps[0] > self._faixa_existente[1]
+        )
+        if not (continua or na_faixa):
+            return bloco
+        _, linhas = buscar(self.conn, self.consultas.chaves_entre(timestamps[0], timestamps[-1]))
+        existentes = np.fromiter(
+            (linha[0] * _PESO_DISPOSITIVO + linha[1] for linha in linhas), dtype='int64', count=len(linhas)
+        )
+        chaves = bloco['DISPOSITIVO'].to_numpy().astype('int64') * _PESO_DISPOSITIVO + timestamps
+        return bloco[~np.isin(chaves, existentes)]
+
+    def progresso(self):
+        e = self.estatisticas
+        taxa = e['inseridas'] / e['segundos'] if e['segundos'] else 0.0
+        return (
+            f"{e['lidas']:,} lidas | {e['inseridas']:,} inseridas | "
+            f"{e['duplicadas']:,} duplicadas | {e['ja_carregadas']:,} já carregadas | "
+            f"{taxa:,.0f} linhas/s"
+        )
+
+
+def conectar_destino(destino, banco=None):
+    """Conexão e dialeto do destino ("oracle" ou "sqlite")."""
+    if destino == 'oracle':
+        from irrigacao.fonte_dados import conectar_oracle
+
+        return conectar_oracle(), 'oracle'
+    if destino == 'sqlite':
+        from irrigacao.banco_local import conectar_local
+
+        return conectar_local(banco), 'sqlite'
+    raise ValueError(f"Destino desconhecido: {destino!r}")
+
+
+def _argumentos(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m irrigacao.carga',
+        description="Carga em lote de leituras na tabela HISTORICO2024.",
+    )
+    parser.add_argument('arquivo', nargs='?', default=config.ARQUIVO_LOCAL,
+                        help="CSV com as colunas de HISTORICO2024 (padrão: CSV histórico)")
+    parser.add_argument('--destino', choices=['oracle', 'sqlite'], default='oracle')
+    parser.add_argument('--banco', default=None,
+                        help="arquivo SQLite do destino sqlite (padrão: IRRIGACAO_BANCO_LOCAL)")
+    parser.add_argument('--tabela', default=TABELA)
+    parser.add_argument('--lote-leitura', type=int, default=LOTE_LEITURA_PADRAO,
+                        help="linhas lidas (e confirmadas) por bloco")
+    parser.add_argument('--lote-insercao', type=int, default=LOTE_INSERCAO_PADRAO,
+                        help="linhas por executemany")
+    parser.add_argument('--checkpoint', default=None,
+                        help="arquivo de checkpoint (padrão: <origem>.<tabela>.checkpoint.json)")
+    parser.add_argument('--sem-checkpoint', action='store_true',
+                        help="não retomar nem gravar checkpoint")
+    parser.add_argument('--criar-tabela', action='store_true',
+                        help="cria a tabela e aplica as migrações (irrigacao.migracoes) antes da carga")
+    parser.add_argument('--sintetico', type=int, default=None, metavar='LINHAS',
+                        help="grava LINHAS leituras sintéticas em vez de ler o arquivo")
+    parser.add_argument('--semente', type=int, default=0,
+                        help="semente do gerador sintético")
+    parser.add_argument('--intervalo', type=int, default=sintetico.INTERVALO_PADRAO,
+                        help="segundos entre leituras sintéticas (padrão: 3600)")
+    parser.add_argument('--dispositivos', type=int, default=1,
+                        help="dispositivos das leituras sintéticas (as LINHAS são divididas entre eles)")
+    parser.add_argument('--campos', type=int, default=1,
+                        help="campos entre os quais os dispositivos sintéticos são distribuídos")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _argumentos(argv)
+    origem = f"sintetico-{args.semente}" if args.sintetico else args.arquivo
+    checkpoint = None
+    if not args.sem_checkpoint:
+        checkpoint = args.checkpoint or f"{origem}.{args.tabela}.checkpoint.json"
+
+    conn, dialeto = conectar_destino(args.destino, args.banco)
+    try:
+        carga = CargaEmLote(
+            conn,
+            dialeto=dialeto,
+            tabela=args.tabela,
+            lote_insercao=args.lote_insercao,
+            checkpoint=checkpoint,
+            relatar=print,
+        )
+        if args.criar_tabela:
+            carga.criar_tabela()
+        if args.sintetico:
+            blocos = sintetico.gerar_lotes(
+                args.sintetico, args.lote_leitura, intervalo=args.intervalo,
+                semente=args.semente, apos=carga.retomar_apos,
+                dispositivos=args.dispositivos, campos=args.campos,
+            )
+        else:
+            blocos = ler_blocos_csv(args.arquivo, args.lote_leitura)
+        estatisticas = carga.carregar(blocos)
+    finally:
+        conn.close()
+
+    print(
+        f"Carga concluída: {estatisticas['inseridas']:,} linhas em "
+        f"{estatisticas['segundos']:.1f}s ({carga.progresso()})"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Configurações compartilhadas pelos dashboards
+
+Os valores padrão reproduzem o ambiente da FIAP; cada um pode ser sobrescrito
+por variável de ambiente sem alterar o código.
+"""
+
+import os
+import tempfile
+
+# Raiz do repositório (src/irrigacao/config.py -> ../../)
+RAIZ_PROJETO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# Configurações de conexão Oracle
+DB_CONFIG = {
+    'username': os.environ.get('IRRIGACAO_ORACLE_USUARIO', 'RM567686'),
+    'password': os.environ.get('IRRIGACAO_ORACLE_SENHA', '291278'),
+    'host': os.environ.get('IRRIGACAO_ORACLE_HOST', 'oracle.fiap.com.br'),
+    'port': os.environ.get('IRRIGACAO_ORACLE_PORTA', '1521'),
+    'service_name': os.environ.get('IRRIGACAO_ORACLE_SERVICO', 'ORCL'),
+}
+
+# Fonte de dados: "oracle" (padrão), "local" (CSV/Parquet em disco) ou
+# "sqlite" (mesmas consultas do Oracle no banco local)
+FONTE = os.environ.get('IRRIGACAO_FONTE', 'oracle')
+
+# Arquivo usado pela fonte local
+ARQUIVO_LOCAL = os.environ.get(
+    'IRRIGACAO_ARQUIVO',
+    os.path.join(RAIZ_PROJETO, 'assets', 'import', 'dados_historicos_2024.csv'),
+)
+
+# Banco SQLite usado como substituto local do Oracle (irrigacao.banco_local)
+BANCO_LOCAL = os.environ.get(
+    'IRRIGACAO_BANCO_LOCAL',
+    os.path.join(RAIZ_PROJETO, 'assets', 'import', 'historico2024.sqlite'),
+)
+
+# Pool de conexões: conexões abertas na criação, limite e espera máxima (s)
+POOL_MINIMO = int(os.environ.get('IRRIGACAO_POOL_MINIMO', '1'))
+POOL_MAXIMO = int(os.environ.get('IRRIGACAO_POOL_MAXIMO', '4'))
+POOL_TIMEOUT = float(os.environ.get('IRRIGACAO_POOL_TIMEOUT', '10'))
+
+# Cargas em segundo plano do Dash (irrigacao.tarefas): tempo limite de cada
+# consulta ao banco e prazo total de uma carga (s)
+TEMPO_LIMITE_CONSULTA = float(os.environ.get('IRRIGACAO_TEMPO_LIMITE_CONSULTA', '30'))
+PRAZO_CARGA = float(os.environ.get('IRRIGACAO_PRAZO_CARGA', '120'))
+
+# Cache de instruções por conexão Oracle (cursores reaproveitados para o
+# mesmo texto SQL, ver irrigacao.consultas)
+CACHE_INSTRUCOES = int(os.environ.get('IRRIGACAO_CACHE_INSTRUCOES', '40'))
+
+# Linhas trazidas por ida ao banco nas consultas grandes (arraysize máximo)
+ARRAYSIZE_MAXIMO = int(os.environ.get('IRRIGACAO_ARRAYSIZE_MAXIMO', '5000'))
+
+# Intervalo entre leituras do sensor (s), usado para estimar as linhas de uma
+# janela de tempo antes de consultá-la
+INTERVALO_LEITURAS = int(os.environ.get('IRRIGACAO_INTERVALO_LEITURAS', '3600'))
+
+# Busca incremental (buffers, consolidações e episódios): cada atualização
+# relê as leituras desta quantidade de segundos antes da mais recente já vista
+# e descarta as repetidas pela marca d'água de cada dispositivo. Assim as
+# leituras de um dispositivo que chegam ao banco depois das de outro, mais
+# novas, não se perdem; as que atrasarem mais que isso só entram com a
+# recarga completa
+SOBREPOSICAO_INCREMENTAL = int(os.environ.get(
+    'IRRIGACAO_SOBREPOSICAO_INCREMENTAL', str(2 * INTERVALO_LEITURAS)
+))
+
+# Porta de saída do serviço de ingestão (irrigacao.ingestao), no formato
+# host:porta. Quando definida, os dashboards recebem as leituras novas por ela
+# em vez de consultar o banco a cada atualização
+INGESTAO = os.environ.get('IRRIGACAO_INGESTAO', '')
+
+# Cache de consultas compartilhado entre processos (irrigacao.cache): arquivo
+# SQLite, tamanho máximo em MB e validade (s) da versão dos dados
+# (MAX(TIMESTAMP)) lida do banco. IRRIGACAO_CACHE vazio desliga o cache. O
+# padrão fica em uma pasta do usuário dentro do temporário: o cache guarda os
+# resultados com pickle e não pode ser gravável por outros usuários
+CACHE_CONSULTAS = os.environ.get(
+    'IRRIGACAO_CACHE',
+    os.path.join(
+        tempfile.gettempdir(),
+        f"irrigacao-{os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'usuario')}",
+        'cache_consultas.sqlite',
+    ),
+)
+CACHE_TAMANHO_MB = int(os.environ.get('IRRIGACAO_CACHE_MB', '256'))
+CACHE_VALIDADE_VERSAO = float(os.environ.get('IRRIGACAO_CACHE_VALIDADE_VERSAO', '1'))
+
+# Regras das sugestões de irrigação (irrigacao.regras), em JSON
+REGRAS = os.environ.get(
+    'IRRIGACAO_REGRAS',
+    os.path.join(RAIZ_PROJETO, 'config', 'regras_irrigacao.json'),
+)
+
+# Vazão da bomba de irrigação (litros por minuto), usada para estimar a água
+# de cada ciclo de irrigação (irrigacao.episodios)
+VAZAO_IRRIGACAO = float(os.environ.get('IRRIGACAO_VAZAO', '10'))
+
+# Modelo de previsão da umidade (irrigacao.previsao), gravado pelo treino
+# (python -m irrigacao.previsao) e recarregado pelos dashboards quando muda
+MODELO_PREVISAO = os.environ.get(
+    'IRRIGACAO_MODELO_PREVISAO',
+    os.path.join(RAIZ_PROJETO, 'config', 'modelo_umidade.npz'),
+)
+
+# Pacote de consultas de análise (irrigacao.relatorio) e diretório dos
+# resultados em Parquet, um arquivo por consulta e versão dos dados
+SCRIPT_ANALISE = os.environ.get(
+    'IRRIGACAO_SCRIPT_ANALISE',
+    os.path.join(RAIZ_PROJETO, 'scripts', 'consultas_analise.sql'),
+)
+RESULTADOS_ANALISE = os.environ.get(
+    'IRRIGACAO_RESULTADOS_ANALISE',
+    os.path.join(tempfile.gettempdir(), 'irrigacao', 'consultas_analise'),
+)
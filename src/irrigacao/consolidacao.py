@@ -0,0 +1,292 @@
+"""
+Consolidações por hora, dia e mês com atualização incremental
+
+Guarda, para cada balde de tempo, contagem, soma, soma dos quadrados, mínimo
+e máximo de UMIDADE_DHT e LDR_VALOR, as somas das flags e as somas dos
+produtos usados nas correlações. Com isso os agregados de um período (ver
+`irrigacao.agregados`) saem de algumas dezenas de baldes em vez de dezenas de
+milhares de linhas: uma janela é coberta pelos meses inteiros que cabem nela,
+depois pelos dias inteiros das bordas e por fim pelas horas. Uma hora cortada
+pela janela com leituras dos dois lados do corte (leituras fora da hora
+cheia, vários dispositivos) é somada pela fonte, só com as linhas dentro da
+janela.
+
+Os baldes horários vêm da fonte (`FonteDados.somas_por_hora`, com GROUP BY no
+Oracle); dias e meses são montados a partir deles. Cada atualização pede
+apenas as horas inteiras a partir de `config.SOBREPOSICAO_INCREMENTAL`
+segundos antes da última leitura consolidada e soma a diferença entre elas e
+as já consolidadas: leituras de um dispositivo que chegam ao banco depois das
+de outro, mais novas, entram na hora certa, e nenhuma é contada duas vezes.
+Leituras recebidas ao vivo (`irrigacao.ingestao`) são somadas por `anexar()`,
+sem consultar a fonte; se alguma já tinha vindo da fonte, a diferença da
+atualização seguinte a desconta.
+
+"Todos" não precisa somar baldes: as horas novas de cada atualização também
+entram nas estatísticas contínuas sem janela (`irrigacao.estatisticas`).
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from irrigacao import config
+from irrigacao.agregados import (
+    REGRAS,
+    SOMAS_FLAGS,
+    somar_por_hora,
+    pares_correlacao,
+    nome_correlacao,
+    normalizar_agregados,
+)
+from irrigacao.esquema import ESCALA_UMIDADE, filtrar_escopo
+from irrigacao.estatisticas import EstatisticasJanela
+from irrigacao.fonte_dados import interpretar_periodo
+
+# Níveis da mais grossa para a mais fina
+NIVEIS = ['mes', 'dia', 'hora']
+
+
+def inicio_do_balde(inicios_hora, nivel):
+    """Início (epoch, UTC) do balde de `nivel` que contém cada hora."""
+    inicios_hora = np.asarray(inicios_hora, dtype='int64')
+    if nivel == 'hora':
+        return inicios_hora
+    if nivel == 'dia':
+        return inicios_hora // 86400 * 86400
+    meses = inicios_hora.astype('datetime64[s]').astype('datetime64[M]')
+    return meses.astype('datetime64[s]').astype('int64')
+
+
+def fim_do_balde(inicios, nivel):
+    """Início do balde seguinte (fim exclusivo)."""
+    inicios = np.asarray(inicios, dtype='int64')
+    if nivel == 'hora':
+        return inicios + 3600
+    if nivel == 'dia':
+        return inicios + 86400
+    meses = inicios.astype('datetime64[s]').astype('datetime64[M]') + 1
+    return meses.astype('datetime64[s]').astype('int64')
+
+
+def combinar(tabela, parcial):
+    """Soma `parcial` a `tabela` (as duas indexadas pelo início do balde)."""
+    if tabela is None or len(tabela) == 0:
+        return parcial.sort_index()
+    if len(parcial) == 0:
+        return tabela
+    tocados = parcial.index.intersection(tabela.index)
+    if len(tocados):
+        juntos = pd.concat([tabela.loc[tocados], parcial.loc[tocados]])
+        tabela = tabela.copy()
+        tabela.loc[tocados] = juntos.groupby(level=0).agg(REGRAS).loc[tocados].to_numpy()
+    novos = parcial.drop(index=tocados)
+    if len(novos):
+        tabela = pd.concat([tabela, novos]).sort_index()
+    return tabela
+
+
+def finalizar(somas):
+    """Converte a soma de baldes nos agregados de `irrigacao.agregados`."""
+    n = somas.get('CONTAGEM', 0)
+    if not n:
+        return normalizar_agregados({'TOTAL_MEDICOES': 0})
+    # Somas vindas do banco chegam como inteiros; produtos delas estouram int64
+    somas = {chave: float(valor) for chave, valor in somas.items()}
+    soma_u = somas['SOMA_UMIDADE_DHT']
+    variancia_u = (somas['SOMA_QUAD_UMIDADE_DHT'] - soma_u * soma_u / n) / (n - 1) if n > 1 else float('nan')
+    agregados = {
+        'TOTAL_MEDICOES': n,
+        'TS_MIN': somas['TS_MIN'],
+        'TS_MAX': somas['TS_MAX'],
+        'UMIDADE_MEDIA': soma_u / n / ESCALA_UMIDADE,
+        'UMIDADE_MIN': somas['MIN_UMIDADE_DHT'] / ESCALA_UMIDADE,
+        'UMIDADE_MAX': somas['MAX_UMIDADE_DHT'] / ESCALA_UMIDADE,
+        'UMIDADE_DESVIO': np.sqrt(max(variancia_u, 0.0)) / ESCALA_UMIDADE if n > 1 else float('nan'),
+        'LDR_MEDIA': somas['SOMA_LDR_VALOR'] / n,
+    }
+    for coluna, nome in SOMAS_FLAGS.items():
+        agregados[nome] = somas[f'SOMA_{coluna}']
+
+    def soma_quadrados(coluna):
+        # Flags 0/1: x*x == x
+        chave = f'SOMA_QUAD_{coluna}'
+        return somas[chave] if chave in somas else somas[f'SOMA_{coluna}']
+
+    for a, b in pares_correlacao():
+        sa, sb = somas[f'SOMA_{a}'], somas[f'SOMA_{b}']
+        cov = n * somas[f'PROD_{a}_{b}'] - sa * sb
+        var_a = n * soma_quadrados(a) - sa * sa
+        var_b = n * soma_quadrados(b) - sb * sb
+        agregados[nome_correlacao(a, b)] = (
+            cov / np.sqrt(var_a * var_b) if var_a > 0 and var_b > 0 else float('nan')
+        )
+    return normalizar_agregados(agregados)
+
+
+def _somar_baldes(tabela):
+    if len(tabela) == 0:
+        return {}
+    return {coluna: getattr(tabela[coluna], regra)() for coluna, regra in REGRAS.items()}
+
+
+def _juntar(partes):
+    partes = [p for p in partes if p]
+    if not partes:
+        return {}
+    return _somar_baldes(pd.DataFrame(partes))
+
+
+class Consolidacoes:
+    """Tabelas por hora, dia e mês mantidas em memória e atualizadas de
+    forma incremental a partir de uma fonte de dados.
+
+    `agregados(filtro)` responde aos períodos relativos (24h/3d/7d) e a
+    "todos" pelas consolidações; períodos de N registros são delegados à
+    fonte, já que dependem das linhas individuais.
+    """
+
+    def __init__(self, fonte, intervalo_minimo=0.0):
+        self.fonte = fonte
+        self.intervalo_minimo = intervalo_minimo
+        self.tabelas = {nivel: None for nivel in NIVEIS}
+        self.marca_dagua = None
+        self.versao = 0
+        # Estatísticas de todo o histórico consolidado
+        self.estatisticas = EstatisticasJanela(0)
+        self._lock = threading.Lock()
+        self._ultima_busca = None
+
+    def recarregar(self):
+        """Descarta as consolidações e refaz a partir da fonte inteira."""
+        with self._lock:
+            self.tabelas = {nivel: None for nivel in NIVEIS}
+            self.marca_dagua = None
+            self.estatisticas.limpar()
+        return self.atualizar(forcar=True)
+
+    def atualizar(self, forcar=False):
+        """Consolida as horas novas (ou com leituras novas) da fonte;
+        devolve quantas mudaram."""
+        agora = time.monotonic()
+        if (not forcar and self._ultima_busca is not None
+                and agora - self._ultima_busca < self.intervalo_minimo):
+            return 0
+        versao = self.versao
+        desde = None
+        if self.marca_dagua is not None:
+            # Horas inteiras: as somas relidas substituem as consolidadas
+            desde = (self.marca_dagua - config.SOBREPOSICAO_INCREMENTAL) // 3600 * 3600 - 1
+        relidas = self.fonte.somas_por_hora(desde=desde)
+        with self._lock:
+            self._ultima_busca = agora
+            # `anexar` pode ter somado leituras enquanto a fonte respondia;
+            # a diferença as descontaria até a próxima atualização
+            if len(relidas) == 0 or self.versao != versao:
+                return 0
+            diferenca = self._diferenca(relidas)
+            if len(diferenca) == 0:
+                return 0
+            self.incorporar(diferenca)
+        return len(diferenca)
+
+    def _diferenca(self, relidas):
+        # Somas das horas relidas menos as já consolidadas (as horas só
+        # ganham leituras, então mínimos e máximos vêm das relidas)
+        tabela = self.tabelas['hora']
+        if tabela is None or len(tabela) == 0:
+            return relidas
+        somas = [coluna for coluna, regra in REGRAS.items() if regra == 'sum']
+        diferenca = relidas.copy()
+        diferenca[somas] = (
+            relidas[somas].astype('float64')
+            - tabela.reindex(relidas.index)[somas].astype('float64').fillna(0)
+        )
+        return diferenca[(diferenca[somas] != 0).any(axis=1)]
+
+    def anexar(self, df):
+        """Consolida linhas que não vieram da fonte (formato armazenado);
+        as que estão fora do escopo da fonte são ignoradas."""
+        df = filtrar_escopo(df, self.fonte.escopo)
+        with self._lock:
+            # Sem consolidação inicial, a primeira atualização já as trará
+            if self.marca_dagua is None or len(df) == 0:
+                return 0
+            self.incorporar(somar_por_hora(df))
+        return len(df)
+
+    def incorporar(self, parcial_hora):
+        """Soma baldes horários (novos ou diferenças de horas já
+        consolidadas) a todos os níveis."""
+        for nivel in NIVEIS:
+            if nivel == 'hora':
+                parcial = parcial_hora
+            else:
+                chave = inicio_do_balde(parcial_hora.index.to_numpy(), nivel)
+                parcial = parcial_hora.groupby(chave).agg(REGRAS)
+            self.tabelas[nivel] = combinar(self.tabelas[nivel], parcial)
+        if (parcial_hora['CONTAGEM'] > 0).all():
+            self.estatisticas.adicionar_somas(_somar_baldes(parcial_hora))
+        else:
+            # Correção de leituras contadas duas vezes: as estatísticas do
+            # histórico são refeitas a partir das horas
+            self.estatisticas.limpar()
+            self.estatisticas.adicionar_somas(_somar_baldes(self.tabelas['hora']))
+        self.marca_dagua = int(self.tabelas['hora']['TS_MAX'].max())
+        self.versao += 1
+
+    def somas(self, inicio, fim):
+        """Somas das linhas com inicio <= TIMESTAMP < fim, lendo o menor
+        número possível de baldes. Uma hora cortada pelo intervalo com
+        leituras dos dois lados do corte é somada pela fonte, só com as
+        linhas dentro dele."""
+        cortadas = []
+        with self._lock:
+            cobertas = self._cobrir(0, inicio, fim, cortadas)
+        partes = [cobertas]
+        for hora in cortadas:
+            partes.append(_somar_baldes(
+                self.fonte.somas_por_hora(desde=max(hora, inicio) - 1, ate=min(hora + 3600, fim))
+            ))
+        return _juntar(partes)
+
+    def _cobrir(self, indice_nivel, inicio, fim, cortadas):
+        if inicio >= fim or indice_nivel >= len(NIVEIS):
+            return {}
+        nivel = NIVEIS[indice_nivel]
+        tabela = self.tabelas[nivel]
+        if tabela is None or len(tabela) == 0:
+            return {}
+        inicios = tabela.index.to_numpy()
+        fins = fim_do_balde(inicios, nivel)
+        a = int(np.searchsorted(inicios, inicio, side='left'))
+        b = int(np.searchsorted(fins, fim, side='right'))
+        if nivel == 'hora':
+            # Nível mais fino: uma hora cortada pelo intervalo entra inteira
+            # se todas as suas leituras estão dentro dele; com leituras dos
+            # dois lados do corte, fica para a fonte
+            primeiras = tabela['TS_MIN'].to_numpy()
+            ultimas = tabela['TS_MAX'].to_numpy()
+            dentro = (primeiras >= inicio) & (ultimas < fim)
+            fora = (ultimas < inicio) | (primeiras >= fim)
+            cortadas.extend(int(hora) for hora in inicios[~dentro & ~fora])
+            return _somar_baldes(tabela[dentro])
+        if a >= b:
+            return self._cobrir(indice_nivel + 1, inicio, fim, cortadas)
+        meio = _somar_baldes(tabela.iloc[a:b])
+        esquerda = self._cobrir(indice_nivel + 1, inicio, int(inicios[a]), cortadas)
+        direita = self._cobrir(indice_nivel + 1, int(fins[b - 1]), fim, cortadas)
+        return _juntar([esquerda, meio, direita])
+
+    def agregados(self, filtro):
+        periodo = interpretar_periodo(filtro)
+        if periodo.tipo == 'registros':
+            return self.fonte.agregados(filtro)
+        self.atualizar()
+        if self.marca_dagua is None:
+            return normalizar_agregados({'TOTAL_MEDICOES': 0})
+        if periodo.tipo == 'todos':
+            return self.estatisticas.agregados()
+        fim = self.marca_dagua + 1
+        return finalizar(self.somas(fim - 1 - periodo.valor, fim))
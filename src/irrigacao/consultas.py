@@ -0,0 +1,257 @@
+"""
+Construtor de consultas com variáveis de ligação (bind variables)
+
+Todas as consultas das fontes apoiadas em banco saem daqui com o mesmo texto
+SQL para qualquer valor de filtro (`:n`, `:segundos`, `:desde`, `:baldes`).
+O Oracle reconhece a instrução já analisada e reaproveita o cursor do cache
+de instruções da conexão (`config.CACHE_INSTRUCOES`), em vez de fazer um
+hard parse para cada literal.
+
+Cada `Consulta` leva também a estimativa de linhas do resultado, usada por
+`buscar` para ajustar `arraysize`/`prefetchrows` do cursor: blocos grandes
+nas janelas longas e uma única ida ao banco nas consultas de poucas linhas.
+
+O dialeto "sqlite" muda apenas a limitação de linhas (`LIMIT :n` no lugar
+de `FETCH FIRST :n ROWS ONLY`), para rodar as mesmas consultas no banco
+local (`irrigacao.banco_local`).
+
+Com um `Escopo` (campo e/ou dispositivo) as consultas de leitura passam a
+ler uma visão da tabela filtrada por `:campo`/`:dispositivo`; o texto SQL
+continua o mesmo para qualquer dispositivo.
+"""
+
+from collections import namedtuple
+from contextlib import nullcontext
+
+import pandas as pd
+
+from irrigacao import config
+from irrigacao import metricas
+from irrigacao.agregados import montar_sql_agregados, montar_sql_dispositivos, montar_sql_somas_hora
+from irrigacao.esquema import TABELA, COLUNAS, ESCOPO_TODOS, TIPOS_ORACLE, projetar
+from irrigacao.tarefas import tarefa_atual
+
+# SQL com marcadores nomeados, valores dos marcadores e linhas esperadas
+# (None quando não há como estimar)
+Consulta = namedtuple('Consulta', ['sql', 'parametros', 'linhas'])
+
+DIALETOS = ('oracle', 'sqlite')
+
+
+class ConstrutorConsultas:
+    """Monta as consultas de uma tabela com o esquema de HISTORICO2024.
+
+    `escopo` restringe as consultas de leitura a um campo e/ou dispositivo;
+    as de carga (`extremos`, `chaves_entre`, `inserir`) valem para a tabela
+    inteira.
+    """
+
+    def __init__(self, tabela=TABELA, dialeto='oracle', escopo=ESCOPO_TODOS):
+        if dialeto not in DIALETOS:
+            raise ValueError(f"Dialeto SQL desconhecido: {dialeto!r}")
+        self.tabela = tabela
+        self.dialeto = dialeto
+        self.escopo = escopo
+        condicoes = []
+        self._parametros_escopo = {}
+        if escopo.campo is not None:
+            condicoes.append("CAMPO = :campo")
+            self._parametros_escopo['campo'] = int(escopo.campo)
+        if escopo.dispositivo is not None:
+            condicoes.append("DISPOSITIVO = :dispositivo")
+            self._parametros_escopo['dispositivo'] = int(escopo.dispositivo)
+        # Tabela ou visão filtrada lida pelas consultas de leitura
+        self.origem = tabela
+        if condicoes:
+            self.origem = f"(SELECT * FROM {tabela} WHERE {' AND '.join(condicoes)})"
+
+    def _parametros(self, **parametros):
+        return dict(self._parametros_escopo, **parametros)
+
+    def _primeiras(self):
+        # Limite de linhas depois de um ORDER BY
+        return "FETCH FIRST :n ROWS ONLY" if self.dialeto == 'oracle' else "LIMIT :n"
+
+    def periodo(self, periodo, colunas=None):
+        """Linhas do período, sem ordenação final (serve de subconsulta)."""
+        lista = _lista(colunas)
+        if periodo.tipo == 'todos':
+            return Consulta(f"SELECT {lista} FROM {self.origem}", self._parametros(), None)
+        if periodo.tipo == 'registros':
+            sql = (
+                f"SELECT {lista} FROM {self.origem} "
+                f"ORDER BY TIMESTAMP DESC {self._primeiras()}"
+            )
+            return Consulta(sql, self._parametros(n=periodo.valor), periodo.valor)
+        sql = (
+            f"SELECT {lista} FROM {self.origem} "
+            f"WHERE TIMESTAMP >= (SELECT MAX(TIMESTAMP) - :segundos FROM {self.origem})"
+        )
+        return Consulta(
+            sql, self._parametros(segundos=periodo.valor), periodo.valor // config.INTERVALO_LEITURAS + 1
+        )
+
+    def ordenada(self, consulta):
+        """A mesma consulta em ordem decrescente de TIMESTAMP."""
+        return consulta._replace(sql=f"SELECT * FROM ({consulta.sql}) ORDER BY TIMESTAMP DESC")
+
+    def desde(self, timestamp, limite=None, colunas=None):
+        """Linhas com TIMESTAMP maior que `timestamp` (as `limite` mais
+        recentes, se informado), em ordem decrescente."""
+        sql = f"SELECT {_lista(colunas)} FROM {self.origem} WHERE TIMESTAMP > :desde"
+        parametros = self._parametros(desde=int(timestamp))
+        if limite:
+            sql += f" ORDER BY TIMESTAMP DESC {self._primeiras()}"
+            parametros['n'] = int(limite)
+        return self.ordenada(Consulta(sql, parametros, int(limite) if limite else None))
+
+    def agregados(self, periodo):
+        """Linha única com os agregados de `irrigacao.agregados`."""
+        base = self.periodo(periodo)
+        return Consulta(montar_sql_agregados(base.sql), base.parametros, 1)
+
+    def resumo_dispositivos(self, periodo):
+        """Uma linha por dispositivo do período (ver
+        `agregados.montar_sql_dispositivos`), em uma única consulta."""
+        base = self.periodo(periodo)
+        return Consulta(montar_sql_dispositivos(base.sql, self.tabela), base.parametros, None)
+
+    def dispositivos(self):
+        """Pares (CAMPO, DISPOSITIVO) com leituras, em ordem."""
+        return Consulta(
+            f"SELECT DISTINCT CAMPO, DISPOSITIVO FROM {self.origem} ORDER BY CAMPO, DISPOSITIVO",
+            self._parametros(), None,
+        )
+
+    def somas_hora(self, desde=None, ate=None):
+        """Somas por hora (ver `irrigacao.consolidacao`) após `desde` e antes
+        de `ate`."""
+        sql = f"SELECT * FROM {self.origem}"
+        parametros = self._parametros()
+        condicoes = []
+        if desde is not None:
+            condicoes.append("TIMESTAMP > :desde")
+            parametros['desde'] = int(desde)
+        if ate is not None:
+            condicoes.append("TIMESTAMP < :ate")
+            parametros['ate'] = int(ate)
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        return Consulta(montar_sql_somas_hora(sql), parametros, None)
+
+    def serie(self, periodo, coluna, pontos):
+        """Mínimo e máximo de `coluna` em `pontos`/2 baldes de tempo (Oracle)."""
+        if self.dialeto != 'oracle':
+            raise NotImplementedError("KEEP (DENSE_RANK ...) só existe no Oracle")
+        if coluna not in COLUNAS:
+            raise ValueError(f"Coluna desconhecida: {coluna!r}")
+        baldes = max(pontos // 2, 1)
+        base = self.periodo(periodo, [coluna])
+        sql = f"""
+        SELECT
+            MIN(d.TIMESTAMP) KEEP (DENSE_RANK FIRST ORDER BY d.{coluna}) AS TS_MIN,
+            MIN(d.{coluna}) AS VALOR_MIN,
+            MIN(d.TIMESTAMP) KEEP (DENSE_RANK LAST ORDER BY d.{coluna}) AS TS_MAX,
+            MAX(d.{coluna}) AS VALOR_MAX
+        FROM ({base.sql}) d,
+             (SELECT MIN(TIMESTAMP) AS T0, MAX(TIMESTAMP) AS T1 FROM ({base.sql})) l
+        GROUP BY FLOOR((d.TIMESTAMP - l.T0) * :baldes / (l.T1 - l.T0 + 1))
+        """
+        return Consulta(sql, dict(base.parametros, baldes=baldes), 2 * baldes)
+
+    def versao(self):
+        """Maior TIMESTAMP da tabela, usado como versão dos dados."""
+        return Consulta(f"SELECT MAX(TIMESTAMP) FROM {self.origem}", self._parametros(), 1)
+
+    def versao_contagem(self):
+        """MAX(TIMESTAMP) e COUNT(*) da tabela: ao contrário de `versao`,
+        muda também com leituras gravadas com TIMESTAMP antigo (cargas em
+        lote, leituras atrasadas)."""
+        return Consulta(f"SELECT MAX(TIMESTAMP), COUNT(*) FROM {self.tabela}", {}, 1)
+
+    def extremos(self):
+        """Menor e maior TIMESTAMP da tabela (NULL se vazia)."""
+        return Consulta(f"SELECT MIN(TIMESTAMP), MAX(TIMESTAMP) FROM {self.tabela}", {}, 1)
+
+    def chaves_entre(self, inicio, fim):
+        """Pares (DISPOSITIVO, TIMESTAMP) já gravados com TIMESTAMP entre
+        `inicio` e `fim` (inclusive)."""
+        sql = f"SELECT DISPOSITIVO, TIMESTAMP FROM {self.tabela} WHERE TIMESTAMP BETWEEN :inicio AND :fim"
+        return Consulta(sql, {'inicio': int(inicio), 'fim': int(fim)}, None)
+
+    def inserir(self, colunas=COLUNAS, ignorar_duplicadas=False):
+        """INSERT com marcadores posicionais, para `executemany` (array DML).
+
+        `ignorar_duplicadas` descarta em silêncio as linhas que violam a chave
+        primária em (DISPOSITIVO, TIMESTAMP) (ver `irrigacao.migracoes`) em
+        vez de abortar o lote inteiro.
+        """
+        if self.dialeto == 'oracle':
+            marcadores = ", ".join(f":{i}" for i in range(1, len(colunas) + 1))
+            inicio = "INSERT INTO"
+            if ignorar_duplicadas:
+                inicio = f"INSERT /*+ IGNORE_ROW_ON_DUPKEY_INDEX({self.tabela}, {self.tabela}_PK) */ INTO"
+        else:
+            marcadores = ", ".join("?" for _ in colunas)
+            inicio = "INSERT OR IGNORE INTO" if ignorar_duplicadas else "INSERT INTO"
+        return f"{inicio} {self.tabela} ({', '.join(colunas)}) VALUES ({marcadores})"
+
+    def criar_tabela(self, colunas=COLUNAS):
+        """DDL da tabela com as colunas de HISTORICO2024."""
+        if self.dialeto == 'oracle':
+            tipos = [f"{c} {TIPOS_ORACLE[c]}" for c in colunas]
+        else:
+            tipos = [f"{c} INTEGER" for c in colunas]
+        return f"CREATE TABLE {self.tabela} (\n    " + ",\n    ".join(tipos) + "\n)"
+
+
+def _lista(colunas):
+    return "*" if colunas is None else ", ".join(projetar(colunas))
+
+
+def ajustar_cursor(cursor, linhas_esperadas):
+    """Define `arraysize` (linhas por ida ao banco) e, no cx_Oracle,
+    `prefetchrows` conforme o tamanho esperado do resultado.
+
+    Resultados pequenos e conhecidos cabem em uma única ida ao banco
+    (prefetchrows = linhas + 1, para o driver já ver o fim do cursor); os
+    grandes ou sem estimativa usam blocos de `config.ARRAYSIZE_MAXIMO`.
+    """
+    maximo = config.ARRAYSIZE_MAXIMO
+    if linhas_esperadas is None or linhas_esperadas >= maximo:
+        cursor.arraysize = maximo
+        prefetch = maximo
+    else:
+        cursor.arraysize = max(int(linhas_esperadas), 1)
+        prefetch = cursor.arraysize + 1
+    if hasattr(cursor, 'prefetchrows'):
+        cursor.prefetchrows = prefetch
+
+
+def buscar(conn, consulta):
+    """Executa `consulta` e devolve (nomes das colunas, linhas).
+
+    Dentro de uma tarefa em segundo plano (`irrigacao.tarefas`), a consulta
+    respeita o tempo limite e o cancelamento da tarefa.
+    """
+    tarefa = tarefa_atual()
+    cursor = conn.cursor()
+    try:
+        with metricas.cronometrar('consulta_banco'), (tarefa.consulta(conn) if tarefa else nullcontext()):
+            ajustar_cursor(cursor, consulta.linhas)
+            cursor.execute(consulta.sql, consulta.parametros)
+            nomes = [d[0].upper() for d in cursor.description]
+            linhas = cursor.fetchall()
+    finally:
+        cursor.close()
+    metricas.contar('irrigacao_linhas_lidas_total', len(linhas), origem='banco')
+    return nomes, linhas
+
+
+def executar(conn, consulta):
+    """Executa `consulta` e devolve um DataFrame."""
+    nomes, linhas = buscar(conn, consulta)
+    with metricas.cronometrar('montar_dataframe'):
+        df = pd.DataFrame.from_records(linhas, columns=nomes)
+    metricas.contar('irrigacao_bytes_lidos_total', int(df.memory_usage(index=False).sum()), origem='banco')
+    return df
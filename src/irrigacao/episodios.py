@@ -0,0 +1,384 @@
+"""
+Episódios das flags liga/desliga: ciclos de irrigação, umidade baixa e bloqueio
+
+Somar RELAY_STATUS (como "Ativações Totais" e a consulta 9) conta quantas
+leituras encontraram a bomba ligada, não quantas vezes ela ligou nem por
+quanto tempo. Aqui cada coluna de `EVENTOS` é codificada em sequências
+(run-length) por dispositivo, com NumPy e sem laço por linha: cada sequência
+de leituras seguidas com a flag ligada vira um episódio com
+
+- início (primeira leitura ligada) e fim (primeira leitura desligada depois
+  dela, ou a última leitura se o episódio continua em andamento)
+- duração, número de leituras e umidade antes (leitura anterior ao início)
+  e depois (leitura do fim), em porcentagem
+- para a irrigação, a água estimada pela vazão da bomba
+  (`config.VAZAO_IRRIGACAO`, litros por minuto)
+
+`Episodios` mantém os episódios de uma fonte em memória, ordenados pelo
+início, e os totais de cada dia (um resumo de período soma os dias inteiros
+e só filtra episódios no primeiro dia). A primeira atualização lê o
+histórico inteiro uma vez; as seguintes só as leituras recentes, com a mesma
+sobreposição e marca d'água por dispositivo de `irrigacao.buffer` (a da
+última leitura guardada de cada um). A última leitura de cada dispositivo e
+os episódios ainda abertos ficam guardados, e um lote novo só continua essas
+sequências: os dias anteriores não são recalculados.
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from irrigacao import config
+from irrigacao.esquema import (
+    CAMPO_PADRAO,
+    DISPOSITIVO_PADRAO,
+    ESCALA_UMIDADE,
+    filtrar_escopo,
+    posteriores_as_marcas,
+)
+from irrigacao.regras import ordem_por_dispositivo, segmentos
+
+# Evento -> coluna da flag
+EVENTOS = {
+    'irrigacao': 'RELAY_STATUS',
+    'umidade_baixa': 'UMIDADE_BAIXA',
+    'bloqueio': 'BLOQUEIO_EXTERNO',
+}
+
+TITULOS_EVENTOS = {
+    'irrigacao': "🚿 Irrigação",
+    'umidade_baixa': "💧 Umidade Baixa",
+    'bloqueio': "⛔ Bloqueio Externo",
+}
+
+# Colunas lidas da fonte (TIMESTAMP é sempre incluído)
+COLUNAS_LEITURA = ['CAMPO', 'DISPOSITIVO', 'UMIDADE_DHT'] + list(EVENTOS.values())
+
+_TIPOS_EPISODIOS = {
+    'EVENTO': 'object',
+    'CAMPO': 'int64',
+    'DISPOSITIVO': 'int64',
+    'INICIO': 'int64',
+    'FIM': 'int64',
+    'DURACAO': 'int64',
+    'LEITURAS': 'int64',
+    'UMIDADE_ANTES': 'float64',
+    'UMIDADE_DEPOIS': 'float64',
+    'VOLUME': 'float64',
+    'EM_ANDAMENTO': 'bool',
+}
+
+COLUNAS_EPISODIOS = list(_TIPOS_EPISODIOS)
+
+# Totais somados por dia e evento
+_SOMAS = ['EPISODIOS', 'DURACAO', 'LEITURAS', 'VOLUME', 'VARIACAO_UMIDADE']
+
+# Blocos de episódios encerrados guardados antes de juntá-los em um só
+MAXIMO_BLOCOS = 32
+
+COLUNAS_RESUMO = [
+    'EVENTO', 'EPISODIOS', 'EM_ANDAMENTO', 'DURACAO_TOTAL', 'DURACAO_MEDIA',
+    'LEITURAS', 'VOLUME', 'VARIACAO_UMIDADE_MEDIA',
+]
+
+
+def episodios_vazios():
+    return pd.DataFrame({coluna: pd.Series(dtype=tipo) for coluna, tipo in _TIPOS_EPISODIOS.items()})
+
+
+def _leituras_ordenadas(df):
+    """Colunas de `COLUNAS_LEITURA` e TIMESTAMP em arrays, na ordem
+    (DISPOSITIVO, TIMESTAMP)."""
+    timestamps = df['TIMESTAMP'].to_numpy()
+    dispositivos = (df['DISPOSITIVO'].to_numpy() if 'DISPOSITIVO' in df
+                    else np.full(len(df), DISPOSITIVO_PADRAO))
+    ordem = ordem_por_dispositivo(timestamps, dispositivos)
+    leituras = {
+        'TIMESTAMP': timestamps[ordem].astype('int64'),
+        'DISPOSITIVO': dispositivos[ordem].astype('int64'),
+        'CAMPO': (df['CAMPO'].to_numpy()[ordem].astype('int64') if 'CAMPO' in df
+                  else np.full(len(df), CAMPO_PADRAO, dtype='int64')),
+        'UMIDADE_DHT': df['UMIDADE_DHT'].to_numpy(dtype='float64')[ordem] / ESCALA_UMIDADE,
+    }
+    for coluna in EVENTOS.values():
+        leituras[coluna] = df[coluna].to_numpy()[ordem]
+    return leituras
+
+
+def detectar(leituras, vazao, herdada=None, abertos=None):
+    """Episódios de todas as flags de `EVENTOS` nas `leituras` (saída de
+    `_leituras_ordenadas`, umidade já em porcentagem).
+
+    `herdada` marca as leituras que são a última de um lote anterior: uma
+    sequência que começa nelas continua o episódio aberto correspondente de
+    `abertos` (indexado por EVENTO e DISPOSITIVO), de quem herda início,
+    leituras e umidade antes. Episódios que chegam à última leitura de um
+    dispositivo saem com EM_ANDAMENTO.
+    """
+    timestamps = leituras['TIMESTAMP']
+    dispositivos = leituras['DISPOSITIVO']
+    umidade = leituras['UMIDADE_DHT']
+    troca = dispositivos[1:] != dispositivos[:-1]
+    novo = np.concatenate(([True], troca))
+    ultimo = np.concatenate((troca, [True]))
+
+    partes = []
+    for evento, coluna in EVENTOS.items():
+        inicios, fins = segmentos(leituras[coluna] == 1, novo, ultimo)
+        if not len(inicios):
+            continue
+        em_andamento = ultimo[fins]
+        # Fim na primeira leitura desligada; sem ela, na última leitura
+        posicao_fim = np.where(em_andamento, fins, fins + 1)
+        posicao_antes = np.where(novo[inicios], inicios, inicios - 1)
+        inicio = timestamps[inicios]
+        quantidade = fins - inicios + 1
+        antes = umidade[posicao_antes]
+
+        if herdada is not None and abertos is not None and len(abertos):
+            continua = np.flatnonzero(herdada[inicios])
+            if len(continua):
+                chaves = pd.MultiIndex.from_arrays(
+                    [np.full(len(continua), evento, dtype=object), dispositivos[inicios[continua]]]
+                )
+                anteriores = abertos.reindex(chaves)
+                encontrados = anteriores['INICIO'].notna().to_numpy()
+                continua = continua[encontrados]
+                anteriores = anteriores[encontrados]
+                inicio[continua] = anteriores['INICIO'].to_numpy()
+                # A leitura herdada já foi contada no lote anterior
+                quantidade[continua] += anteriores['LEITURAS'].to_numpy().astype('int64') - 1
+                antes[continua] = anteriores['UMIDADE_ANTES'].to_numpy()
+
+        fim = timestamps[posicao_fim]
+        duracao = fim - inicio
+        partes.append(pd.DataFrame({
+            'EVENTO': evento,
+            'CAMPO': leituras['CAMPO'][inicios],
+            'DISPOSITIVO': dispositivos[inicios],
+            'INICIO': inicio,
+            'FIM': fim,
+            'DURACAO': duracao,
+            'LEITURAS': quantidade,
+            'UMIDADE_ANTES': antes,
+            'UMIDADE_DEPOIS': umidade[posicao_fim],
+            'VOLUME': duracao / 60 * vazao if coluna == 'RELAY_STATUS' else np.nan,
+            'EM_ANDAMENTO': em_andamento,
+        }))
+
+    if not partes:
+        return episodios_vazios()
+    return pd.concat(partes, ignore_index=True)
+
+
+def _somar(episodios, chaves):
+    """Totais de `_SOMAS` agrupados por `chaves`."""
+    return episodios.assign(
+        EPISODIOS=1,
+        VARIACAO_UMIDADE=episodios['UMIDADE_DEPOIS'] - episodios['UMIDADE_ANTES'],
+    ).groupby(chaves, sort=True)[_SOMAS].sum()
+
+
+def resumir(totais, em_andamento):
+    """Tabela de `COLUNAS_RESUMO` (uma linha por evento de `EVENTOS`) a
+    partir dos totais por evento e do número de episódios em andamento."""
+    totais = totais.reindex(list(EVENTOS), fill_value=0)
+    episodios = totais['EPISODIOS'].to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        resumo = pd.DataFrame({
+            'EVENTO': list(EVENTOS),
+            'EPISODIOS': episodios.astype('int64'),
+            'EM_ANDAMENTO': em_andamento.reindex(list(EVENTOS), fill_value=0).to_numpy().astype('int64'),
+            'DURACAO_TOTAL': totais['DURACAO'].to_numpy().astype('int64'),
+            'DURACAO_MEDIA': totais['DURACAO'].to_numpy() / episodios,
+            'LEITURAS': totais['LEITURAS'].to_numpy().astype('int64'),
+            'VOLUME': totais['VOLUME'].to_numpy(dtype='float64'),
+            'VARIACAO_UMIDADE_MEDIA': totais['VARIACAO_UMIDADE'].to_numpy() / episodios,
+        })
+    resumo.loc[resumo['EVENTO'] != 'irrigacao', 'VOLUME'] = np.nan
+    return resumo
+
+
+def resumo_vazio():
+    return resumir(pd.DataFrame(0, index=[], columns=_SOMAS), pd.Series(dtype='int64'))
+
+
+class Episodios:
+    """Episódios de uma fonte de dados, por dia de início, atualizados de
+    forma incremental.
+
+    - `atualizar()` lê o histórico inteiro na primeira chamada e depois só
+      as leituras novas (`FonteDados.carregar_desde`)
+    - `anexar(df)` incorpora leituras recebidas ao vivo, sem ida à fonte
+    - `episodios(desde)` e `resumo(desde)` respondem pelos episódios com
+      início a partir de `desde` (epoch; None = todos); o resumo lê os
+      totais diários
+    """
+
+    def __init__(self, fonte, vazao=None, intervalo_minimo=0.0):
+        self.fonte = fonte
+        self.vazao = config.VAZAO_IRRIGACAO if vazao is None else vazao
+        self.intervalo_minimo = intervalo_minimo
+        self._lock = threading.Lock()
+        self._ultima_busca = None
+        self._limpar()
+
+    def _limpar(self):
+        self.totais = None  # somas por (DIA, EVENTO) dos episódios encerrados
+        # Episódios encerrados em blocos ordenados por INICIO: a carga inicial
+        # e cada lote seguinte acrescentam um bloco
+        self._blocos = []
+        self._abertos = episodios_vazios().set_index(['EVENTO', 'DISPOSITIVO'], drop=False)
+        self._ultimas = None  # última leitura de cada dispositivo, por DISPOSITIVO
+        self.marca_dagua = None
+        self.versao = 0
+
+    def recarregar(self):
+        """Descarta os episódios e refaz a partir do histórico inteiro."""
+        df = self.fonte.carregar(0, colunas=COLUNAS_LEITURA)
+        with self._lock:
+            self._limpar()
+            self.incorporar(df)
+            self._ultima_busca = time.monotonic()
+        return len(df)
+
+    def atualizar(self, forcar=False):
+        """Incorpora as leituras novas da fonte; devolve quantas chegaram."""
+        if self.marca_dagua is None:
+            return self.recarregar()
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima_busca < self.intervalo_minimo:
+            return 0
+        novos = self.fonte.carregar_desde(
+            self.marca_dagua - config.SOBREPOSICAO_INCREMENTAL, colunas=COLUNAS_LEITURA
+        )
+        with self._lock:
+            self._ultima_busca = agora
+            # Descarta as já incorporadas, inclusive por `anexar` enquanto a
+            # fonte respondia
+            if len(novos) and self.marca_dagua is not None:
+                novos = posteriores_as_marcas(novos, self._marcas())
+            if len(novos) == 0:
+                return 0
+            self.incorporar(novos)
+        return len(novos)
+
+    def anexar(self, df):
+        """Incorpora leituras que não vieram da fonte (formato armazenado);
+        as que não passam da marca d'água do seu dispositivo ou estão fora do
+        escopo da fonte são ignoradas."""
+        df = filtrar_escopo(df, self.fonte.escopo)
+        with self._lock:
+            # Sem carga inicial, a primeira atualização já as trará
+            if self.marca_dagua is None:
+                return 0
+            df = posteriores_as_marcas(df, self._marcas())
+            if len(df) == 0:
+                return 0
+            self.incorporar(df)
+        return len(df)
+
+    def _marcas(self):
+        # Marca d'água de cada dispositivo: a sua última leitura guardada
+        return None if self._ultimas is None else self._ultimas['TIMESTAMP']
+
+    def incorporar(self, df):
+        """Continua os episódios com as leituras de `df` (todas posteriores
+        às já incorporadas); chamado com o lock adquirido."""
+        if len(df) == 0:
+            return
+        leituras = _leituras_ordenadas(df)
+        presentes = np.unique(leituras['DISPOSITIVO'])
+        herdada = None
+        if self._ultimas is not None:
+            # A última leitura guardada de cada dispositivo do lote entra na
+            # frente das novas: continua os episódios abertos e dá a umidade
+            # de antes dos que começam na primeira leitura nova
+            anteriores = self._ultimas.loc[self._ultimas.index.intersection(presentes)]
+            if len(anteriores):
+                juntas = {
+                    coluna: np.concatenate((anteriores[coluna].to_numpy().astype(valores.dtype), valores))
+                    for coluna, valores in leituras.items()
+                }
+                ordem = np.lexsort((juntas['TIMESTAMP'], juntas['DISPOSITIVO']))
+                leituras = {coluna: valores[ordem] for coluna, valores in juntas.items()}
+                herdada = ordem < len(anteriores)
+
+        episodios = detectar(leituras, self.vazao, herdada, self._abertos)
+        andamento = episodios['EM_ANDAMENTO'].to_numpy()
+        self._guardar(episodios[~andamento])
+
+        # Episódios abertos dos dispositivos do lote são substituídos
+        abertos = episodios[andamento].set_index(['EVENTO', 'DISPOSITIVO'], drop=False)
+        mantidos = self._abertos[~self._abertos['DISPOSITIVO'].isin(presentes)]
+        self._abertos = pd.concat([mantidos, abertos]) if len(mantidos) else abertos
+
+        ultimo = np.concatenate((leituras['DISPOSITIVO'][1:] != leituras['DISPOSITIVO'][:-1], [True]))
+        ultimas = pd.DataFrame({coluna: valores[ultimo] for coluna, valores in leituras.items()})
+        ultimas.index = ultimas['DISPOSITIVO'].to_numpy()
+        if self._ultimas is not None:
+            ultimas = pd.concat([self._ultimas.drop(index=presentes, errors='ignore'), ultimas])
+        self._ultimas = ultimas
+        self.marca_dagua = int(ultimas['TIMESTAMP'].max())
+        self.versao += 1
+
+    def _guardar(self, encerrados):
+        if len(encerrados) == 0:
+            return
+        dias = encerrados['INICIO'].to_numpy() // 86400 * 86400
+        somas = _somar(encerrados.assign(DIA=dias), ['DIA', 'EVENTO'])
+        self.totais = somas if self.totais is None else self.totais.add(somas, fill_value=0)
+        self._blocos.append(encerrados.sort_values('INICIO', kind='stable').reset_index(drop=True))
+        if len(self._blocos) > MAXIMO_BLOCOS:
+            juntos = pd.concat(self._blocos, ignore_index=True)
+            self._blocos = [juntos.sort_values('INICIO', kind='stable').reset_index(drop=True)]
+
+    def _desde(self, desde, ate=None, limite=None):
+        # Fatias dos blocos com desde <= INICIO < ate (no máximo as `limite`
+        # mais recentes de cada bloco); chamado com o lock adquirido
+        partes = []
+        for bloco in self._blocos:
+            inicios = bloco['INICIO'].to_numpy()
+            a = 0 if desde is None else int(np.searchsorted(inicios, desde, side='left'))
+            b = len(bloco) if ate is None else int(np.searchsorted(inicios, ate, side='left'))
+            if limite is not None:
+                a = max(a, b - limite)
+            if b > a:
+                partes.append(bloco.iloc[a:b])
+        return partes
+
+    def episodios(self, desde=None, limite=None):
+        """Episódios com INICIO >= `desde`, dos mais recentes para os mais
+        antigos (no máximo `limite`), incluindo os em andamento."""
+        with self._lock:
+            abertos = self._abertos.reset_index(drop=True)
+            partes = [abertos if desde is None else abertos[abertos['INICIO'] >= desde]]
+            partes += self._desde(desde, limite=limite)
+        partes = [parte for parte in partes if len(parte)]
+        if not partes:
+            return episodios_vazios()
+        episodios = pd.concat(partes, ignore_index=True).sort_values(
+            ['INICIO', 'DISPOSITIVO'], ascending=False, kind='stable'
+        )
+        return (episodios if limite is None else episodios.head(limite)).reset_index(drop=True)
+
+    def resumo(self, desde=None):
+        """`resumir` dos episódios com INICIO >= `desde`: os dias inteiros
+        saem dos totais diários e só o primeiro dia é filtrado."""
+        with self._lock:
+            abertos = self._abertos.reset_index(drop=True)
+            if desde is not None:
+                abertos = abertos[abertos['INICIO'] >= desde]
+            partes = []
+            totais = self.totais
+            if totais is not None and desde is not None:
+                primeiro_dia = desde // 86400 * 86400
+                totais = totais[totais.index.get_level_values('DIA') > primeiro_dia]
+                partes += [_somar(parte, 'EVENTO') for parte in self._desde(desde, primeiro_dia + 86400)]
+            if totais is not None:
+                partes.append(totais.groupby(level='EVENTO').sum())
+        partes.append(_somar(abertos, 'EVENTO'))
+        somas = pd.concat(partes).groupby(level=0).sum()
+        return resumir(somas, abertos.groupby('EVENTO').size())
@@ -0,0 +1,226 @@
+"""
+Esquema da tabela HISTORICO2024
+
+Centraliza os nomes de colunas, os tipos compactos usados em memória e a
+correção de unidades aplicada depois de cada leitura, para que todas as fontes
+de dados devolvam o mesmo formato.
+
+Cada leitura pertence a um dispositivo (nó de sensores) de um campo. O CSV de
+2024 e as tabelas anteriores à migração 4 (`irrigacao.migracoes`) têm um
+único nó, que fica como campo 1, dispositivo 1 (`completar_dispositivo`).
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+TABELA = "HISTORICO2024"
+
+# Colunas do CSV histórico e da tabela importada pelo assistente
+COLUNAS_HISTORICO = [
+    'TIMESTAMP',
+    'UMIDADE_DHT',
+    'LDR_VALOR',
+    'N_PRESENTE',
+    'P_PRESENTE',
+    'K_PRESENTE',
+    'BLOQUEIO_EXTERNO',
+    'RELAY_STATUS',
+    'UMIDADE_BAIXA',
+    'NPK_OK',
+    'PH_OK',
+]
+
+# Identificação do nó de sensores: o dispositivo é único na instalação e o
+# campo agrupa dispositivos (a chave primária é DISPOSITIVO, TIMESTAMP)
+COLUNAS_DISPOSITIVO = ['CAMPO', 'DISPOSITIVO']
+
+COLUNAS = COLUNAS_HISTORICO + COLUNAS_DISPOSITIVO
+
+# Campo e dispositivo das leituras que não os informam
+CAMPO_PADRAO = 1
+DISPOSITIVO_PADRAO = 1
+
+# Recorte de campo/dispositivo de uma fonte de dados; None em um dos dois
+# significa todos
+Escopo = namedtuple('Escopo', ['campo', 'dispositivo'], defaults=(None, None))
+
+ESCOPO_TODOS = Escopo()
+
+# Colunas 0/1 definidas como NUMBER(1,0) na importação (scripts/oracle_import.md)
+FLAGS = [
+    'N_PRESENTE',
+    'P_PRESENTE',
+    'K_PRESENTE',
+    'BLOQUEIO_EXTERNO',
+    'RELAY_STATUS',
+    'UMIDADE_BAIXA',
+    'NPK_OK',
+    'PH_OK',
+]
+
+# A importação no SQL Developer gravou UMIDADE_DHT sem o separador decimal
+# (52.92 -> 5292), por isso os valores lidos da tabela são divididos por 100
+ESCALA_UMIDADE = 100
+
+# Tipos das colunas no Oracle (DDL do carregador em lote, irrigacao.carga)
+TIPOS_ORACLE = {
+    'TIMESTAMP': 'NUMBER(10,0)',
+    'UMIDADE_DHT': 'NUMBER(6,0)',
+    'LDR_VALOR': 'NUMBER(5,0)',
+    **{flag: 'NUMBER(1,0)' for flag in FLAGS},
+    'CAMPO': 'NUMBER(6,0)',
+    'DISPOSITIVO': 'NUMBER(6,0)',
+}
+
+# Faixa aceita em cada coluna, no formato armazenado: a precisão de
+# TIPOS_ORACLE e 0/1 nas flags (validação da ingestão ao vivo)
+FAIXAS_ARMAZENADAS = {
+    'TIMESTAMP': (0, 10**10 - 1),
+    'UMIDADE_DHT': (0, 10**6 - 1),
+    'LDR_VALOR': (0, 10**5 - 1),
+    **{flag: (0, 1) for flag in FLAGS},
+    'CAMPO': (0, 10**6 - 1),
+    'DISPOSITIVO': (0, 10**6 - 1),
+}
+
+# Tipos em memória de cada coluna. O pandas infere int64/float64 para tudo o
+# que vem do banco ou do CSV; com estes tipos uma linha cai de 88 para 18
+# bytes. TIMESTAMP em int32 vale até 2038 (`compactar` mantém int64 se não
+# couber) e UMIDADE_DHT x100 cabe sem perda em float32.
+TIPOS_COMPACTOS = {
+    'TIMESTAMP': 'int32',
+    'UMIDADE_DHT': 'float32',
+    'LDR_VALOR': 'uint16',
+    **{flag: 'uint8' for flag in FLAGS},
+    'CAMPO': 'uint16',
+    'DISPOSITIVO': 'uint16',
+}
+
+
+def completar_dispositivo(df):
+    """Acrescenta CAMPO e DISPOSITIVO padrão às leituras que não os têm
+    (CSV histórico, arquivos de um único nó)."""
+    if 'CAMPO' not in df.columns:
+        df['CAMPO'] = CAMPO_PADRAO
+    if 'DISPOSITIVO' not in df.columns:
+        df['DISPOSITIVO'] = DISPOSITIVO_PADRAO
+    return df
+
+
+def filtrar_escopo(df, escopo):
+    """Linhas de `df` dentro do `Escopo` (todas se ele for ESCOPO_TODOS)."""
+    if escopo.campo is None and escopo.dispositivo is None:
+        return df
+    mascara = np.ones(len(df), dtype=bool)
+    if escopo.campo is not None:
+        mascara &= df['CAMPO'].to_numpy() == escopo.campo
+    if escopo.dispositivo is not None:
+        mascara &= df['DISPOSITIVO'].to_numpy() == escopo.dispositivo
+    return df[mascara]
+
+
+def _dispositivos(df):
+    if 'DISPOSITIVO' in df.columns:
+        return df['DISPOSITIVO'].to_numpy()
+    return np.full(len(df), DISPOSITIVO_PADRAO)
+
+
+def marcas_por_dispositivo(df, marcas=None):
+    """Maior TIMESTAMP de cada DISPOSITIVO de `df`, junto das `marcas`
+    anteriores (Series indexada por DISPOSITIVO). Sem a coluna DISPOSITIVO
+    as linhas são do dispositivo padrão."""
+    if len(df) == 0:
+        return marcas
+    novas = pd.Series(df['TIMESTAMP'].to_numpy()).groupby(_dispositivos(df)).max()
+    if marcas is None or len(marcas) == 0:
+        return novas
+    return pd.concat([marcas, novas]).groupby(level=0).max()
+
+
+def posteriores_as_marcas(df, marcas):
+    """Linhas de `df` com TIMESTAMP maior que a marca d'água do seu
+    dispositivo (`marcas_por_dispositivo`); as de dispositivos sem marca
+    entram todas."""
+    if len(df) == 0 or marcas is None or len(marcas) == 0:
+        return df
+    limites = marcas.reindex(_dispositivos(df)).to_numpy(dtype='float64')
+    # NaN (dispositivo sem marca) nunca é >= TIMESTAMP
+    return df[~(limites >= df['TIMESTAMP'].to_numpy())]
+
+
+def corrigir_unidades(df):
+    """Converte UMIDADE_DHT do formato armazenado para porcentagem."""
+    if 'UMIDADE_DHT' in df.columns:
+        df['UMIDADE_DHT'] = df['UMIDADE_DHT'] / ESCALA_UMIDADE
+    return df
+
+
+def adicionar_datetime(df):
+    """Acrescenta DATETIME (datetime64, UTC ingênuo) a partir de TIMESTAMP.
+
+    É a única coluna derivada usada pelas telas; colunas de date/time do
+    Python custariam ~50 bytes por linha cada.
+    """
+    if 'TIMESTAMP' in df.columns:
+        df['DATETIME'] = pd.to_datetime(df['TIMESTAMP'], unit='s')
+    return df
+
+
+def armazenar_unidades(df):
+    """Inverso de `corrigir_unidades`: UMIDADE_DHT em porcentagem (CSV) para
+    o inteiro x100 gravado na tabela."""
+    if 'UMIDADE_DHT' in df.columns:
+        df['UMIDADE_DHT'] = np.rint(df['UMIDADE_DHT'] * ESCALA_UMIDADE).astype('int64')
+    return df
+
+
+def projetar(colunas=None):
+    """Lista de colunas a consultar, na ordem de COLUNAS e sempre com
+    TIMESTAMP (usado na ordenação e na busca incremental)."""
+    if colunas is None:
+        return list(COLUNAS)
+    desconhecidas = set(colunas) - set(COLUNAS)
+    if desconhecidas:
+        raise ValueError(f"Colunas desconhecidas: {sorted(desconhecidas)}")
+    return [c for c in COLUNAS if c == 'TIMESTAMP' or c in colunas]
+
+
+def _cabe(valores, tipo):
+    # Inteiros só são convertidos se não houver nulos nem valores fora da faixa
+    if not np.issubdtype(tipo, np.integer):
+        return True
+    if valores.isna().any():
+        return False
+    if len(valores) == 0:
+        return True
+    limites = np.iinfo(tipo)
+    minimo, maximo = valores.min(), valores.max()
+    return limites.min <= minimo and maximo <= limites.max and (valores % 1 == 0).all()
+
+
+def compactar(df):
+    """Converte as colunas conhecidas para `TIPOS_COMPACTOS`, mantendo o tipo
+    original das que tiverem nulos ou valores que não caibam."""
+    for coluna, tipo in TIPOS_COMPACTOS.items():
+        if coluna not in df.columns or df[coluna].dtype == tipo:
+            continue
+        tipo = np.dtype(tipo)
+        if not np.issubdtype(df[coluna].dtype, np.number):
+            continue
+        if _cabe(df[coluna], tipo):
+            df[coluna] = df[coluna].astype(tipo)
+    return df
+
+
+def pegada_memoria(df):
+    """Memória ocupada pelo DataFrame, no total e por coluna (bytes)."""
+    por_coluna = df.memory_usage(deep=True, index=False)
+    total = int(por_coluna.sum())
+    return {
+        'linhas': len(df),
+        'bytes': total,
+        'bytes_por_linha': total / len(df) if len(df) else 0.0,
+        'colunas': {nome: int(valor) for nome, valor in por_coluna.items()},
+    }
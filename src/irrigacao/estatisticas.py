@@ -0,0 +1,391 @@
+"""
+Estatísticas contínuas das leituras, com janela deslizante
+
+`EstatisticasJanela` mantém, para as colunas de sensores, contagem, média,
+variância, mínimo, máximo e a matriz de covariância das leituras de um
+período ("registros", "janela" ou "todos", como em `BufferJanela`), sem
+voltar às linhas a cada atualização:
+
+- média e co-momentos (soma dos produtos dos desvios) são atualizados pela
+  fórmula de Welford/Chan, que junta (ou retira) um lote inteiro em custo
+  proporcional ao número de colunas, não ao tamanho da janela; uma leitura
+  nova é um lote de uma linha
+- ao passar do limite do período, as leituras mais antigas são retiradas da
+  janela pela mesma fórmula, ao contrário
+- mínimo e máximo de umidade e luminosidade vêm de filas monotônicas: cada
+  leitura entra e sai da fila no máximo uma vez
+
+As flags 0/1 só precisam da soma (média, variância, mínimo e máximo saem
+dela). As linhas chegam no formato armazenado (UMIDADE_DHT x100) e
+`agregados()` devolve o mesmo dict de `irrigacao.agregados`, já em
+porcentagem, para os cartões, sugestões e o mapa de correlação.
+
+Sem janela ("todos") as linhas não são guardadas, e o estado pode começar
+das somas por hora das consolidações (`adicionar_somas`).
+"""
+
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from irrigacao.agregados import (
+    COLUNAS_CORRELACAO,
+    COLUNAS_MEDIDAS,
+    SOMAS_FLAGS,
+    nome_correlacao,
+    normalizar_agregados,
+    pares_correlacao,
+)
+from irrigacao.esquema import ESCALA_UMIDADE
+from irrigacao.fonte_dados import interpretar_periodo
+
+# Colunas acompanhadas: as da covariância primeiro, depois as demais flags
+COLUNAS_ESTATISTICAS = COLUNAS_CORRELACAO + [c for c in SOMAS_FLAGS if c not in COLUNAS_CORRELACAO]
+
+_COVARIANCIA = len(COLUNAS_CORRELACAO)
+_MEDIDAS = [COLUNAS_ESTATISTICAS.index(coluna) for coluna in COLUNAS_MEDIDAS]
+
+# Fotografia das estatísticas (unidades de exibição, umidade em %)
+Estatisticas = namedtuple('Estatisticas', [
+    'contagem', 'ts_min', 'ts_max', 'media', 'variancia', 'minimo', 'maximo', 'covariancia',
+])
+
+# Lote resumido: contagem, médias, co-momentos das colunas da covariância,
+# mínimos e máximos das colunas medidas e TIMESTAMPs extremos
+_Lote = namedtuple('_Lote', ['n', 'media', 'comomento', 'minimo', 'maximo', 'ts_min', 'ts_max'])
+
+
+def _lote_de_valores(valores, timestamps):
+    centrados = valores[:, :_COVARIANCIA] - valores[:, :_COVARIANCIA].mean(axis=0)
+    return _Lote(
+        n=len(valores),
+        media=valores.mean(axis=0),
+        comomento=centrados.T @ centrados,
+        minimo=valores[:, _MEDIDAS].min(axis=0),
+        maximo=valores[:, _MEDIDAS].max(axis=0),
+        ts_min=int(timestamps.min()),
+        ts_max=int(timestamps.max()),
+    )
+
+
+def _lote_de_somas(somas):
+    """`_Lote` a partir das somas de `irrigacao.consolidacao` (uma linha de
+    `Consolidacoes.somas` ou de `FonteDados.somas_por_hora` já somada)."""
+    n = int(somas.get('CONTAGEM', 0))
+    if n == 0:
+        return None
+    soma = np.array([float(somas[f'SOMA_{coluna}']) for coluna in COLUNAS_ESTATISTICAS])
+    media = soma / n
+    produtos = np.empty((_COVARIANCIA, _COVARIANCIA))
+    for i, coluna in enumerate(COLUNAS_CORRELACAO):
+        # Flags 0/1: x*x == x
+        produtos[i, i] = float(somas.get(f'SOMA_QUAD_{coluna}', somas[f'SOMA_{coluna}']))
+    for a, b in pares_correlacao():
+        i, j = COLUNAS_CORRELACAO.index(a), COLUNAS_CORRELACAO.index(b)
+        produtos[i, j] = produtos[j, i] = float(somas[f'PROD_{a}_{b}'])
+    medias = media[:_COVARIANCIA]
+    return _Lote(
+        n=n,
+        media=media,
+        comomento=produtos - n * np.outer(medias, medias),
+        minimo=np.array([float(somas[f'MIN_{coluna}']) for coluna in COLUNAS_MEDIDAS]),
+        maximo=np.array([float(somas[f'MAX_{coluna}']) for coluna in COLUNAS_MEDIDAS]),
+        ts_min=int(somas['TS_MIN']),
+        ts_max=int(somas['TS_MAX']),
+    )
+
+
+class _FilaMinimos:
+    """Fila monotônica (valores crescentes da frente para o fim) com o
+    mínimo de uma janela deslizante; para máximos, os valores entram
+    negados. Guarda o número de sequência de cada leitura candidata."""
+
+    def __init__(self, capacidade=1024):
+        self.sequencias = np.empty(capacidade, dtype='int64')
+        self.valores = np.empty(capacidade)
+        self.inicio = self.fim = 0
+
+    def adicionar(self, sequencias, valores):
+        # Do lote só ficam as leituras menores que todas as seguintes ...
+        seguintes = np.empty(len(valores))
+        seguintes[-1] = np.inf
+        seguintes[:-1] = np.minimum.accumulate(valores[::-1])[::-1][1:]
+        candidatos = valores < seguintes
+        sequencias, valores = sequencias[candidatos], valores[candidatos]
+        # ... e da fila só as menores que o mínimo do lote
+        self.fim = self.inicio + int(np.searchsorted(
+            self.valores[self.inicio:self.fim], valores[0], side='left'
+        ))
+        n = len(valores)
+        if self.fim + n > len(self.valores):
+            tamanho = self.fim - self.inicio
+            capacidade = len(self.valores)
+            while tamanho + n > capacidade // 2:
+                capacidade *= 2
+            for nome in ('sequencias', 'valores'):
+                origem = getattr(self, nome)
+                destino = origem if capacidade == len(origem) else np.empty(capacidade, dtype=origem.dtype)
+                destino[:tamanho] = origem[self.inicio:self.fim]
+                setattr(self, nome, destino)
+            self.inicio, self.fim = 0, tamanho
+        self.sequencias[self.fim:self.fim + n] = sequencias
+        self.valores[self.fim:self.fim + n] = valores
+        self.fim += n
+
+    def descartar_antes(self, sequencia):
+        """Retira da frente as leituras com sequência menor que `sequencia`."""
+        self.inicio += int(np.searchsorted(self.sequencias[self.inicio:self.fim], sequencia, side='left'))
+
+    def minimo(self):
+        return self.valores[self.inicio] if self.fim > self.inicio else float('nan')
+
+
+class EstatisticasJanela:
+    """Estatísticas das leituras do período `filtro` (como em
+    `fonte_dados.interpretar_periodo`), atualizadas a cada lote.
+
+    `adicionar(df)` recebe leituras no formato armazenado, em geral
+    posteriores às já vistas; leituras atrasadas de algum dispositivo
+    (TIMESTAMP menor que o da última guardada) são intercaladas na janela na
+    sua posição, refazendo as filas de mínimos e máximos. `estatisticas()` e
+    `agregados()` leem o estado atual sem percorrer as linhas.
+    """
+
+    def __init__(self, filtro=0):
+        self.periodo = interpretar_periodo(filtro)
+        self._lock = threading.Lock()
+        self.limpar()
+
+    @property
+    def com_janela(self):
+        return self.periodo.tipo != 'todos'
+
+    def limpar(self):
+        """Volta ao estado vazio."""
+        with self._lock:
+            k = len(COLUNAS_ESTATISTICAS)
+            self.n = 0
+            self.media = np.zeros(k)
+            self.comomento = np.zeros((_COVARIANCIA, _COVARIANCIA))
+            self.ts_min = self.ts_max = None
+            self._minimo = np.full(len(_MEDIDAS), np.inf)
+            self._maximo = np.full(len(_MEDIDAS), -np.inf)
+            self.versao = 0
+            if self.com_janela:
+                # Leituras da janela em colunas com capacidade extra (como em
+                # BufferJanela), numeradas pela sequência de chegada
+                self._valores = np.empty((1024, k))
+                self._timestamps = np.empty(1024, dtype='int64')
+                self._inicio = self._fim = 0
+                self._sequencia_base = 0
+                self._filas = [(_FilaMinimos(), _FilaMinimos()) for _ in _MEDIDAS]
+
+    def __len__(self):
+        return self.n
+
+    def adicionar(self, df):
+        """Junta as leituras de `df` (colunas de `COLUNAS_ESTATISTICAS` e
+        TIMESTAMP) e retira as que saíram do período; devolve quantas
+        entraram."""
+        if len(df) == 0:
+            return 0
+        timestamps = df['TIMESTAMP'].to_numpy().astype('int64')
+        valores = np.column_stack([df[coluna].to_numpy(dtype='float64') for coluna in COLUNAS_ESTATISTICAS])
+        if np.any(timestamps[1:] < timestamps[:-1]):
+            ordem = np.argsort(timestamps, kind='stable')
+            timestamps, valores = timestamps[ordem], valores[ordem]
+        with self._lock:
+            if self.com_janela and self._fim > self._inicio and timestamps[0] < self._timestamps[self._fim - 1]:
+                self._intercalar(valores, timestamps)
+            elif self.com_janela:
+                self._guardar(valores, timestamps)
+            self._somar(_lote_de_valores(valores, timestamps))
+            if self.com_janela:
+                self._descartar_expirados()
+            self.versao += 1
+        return len(df)
+
+    def adicionar_somas(self, somas):
+        """Junta um lote já resumido em somas (ver `_lote_de_somas`); só faz
+        sentido sem janela, já que as linhas não ficam guardadas."""
+        if self.com_janela:
+            raise ValueError("Somas só podem ser adicionadas a estatísticas sem janela")
+        lote = _lote_de_somas(somas)
+        if lote is None:
+            return 0
+        with self._lock:
+            self._somar(lote)
+            self.versao += 1
+        return lote.n
+
+    def _somar(self, lote):
+        # Chamado com o lock adquirido
+        n = self.n + lote.n
+        delta = lote.media - self.media
+        self.media = self.media + delta * (lote.n / n)
+        d = delta[:_COVARIANCIA]
+        self.comomento = self.comomento + lote.comomento + np.outer(d, d) * (self.n * lote.n / n)
+        self.n = n
+        self.ts_max = lote.ts_max if self.ts_max is None else max(self.ts_max, lote.ts_max)
+        if not self.com_janela:
+            self.ts_min = lote.ts_min if self.ts_min is None else min(self.ts_min, lote.ts_min)
+            self._minimo = np.minimum(self._minimo, lote.minimo)
+            self._maximo = np.maximum(self._maximo, lote.maximo)
+
+    def _subtrair(self, lote):
+        # Inverso de `_somar`: retira da janela um lote que já estava nela
+        n = self.n - lote.n
+        if n <= 0:
+            self.n = 0
+            self.media = np.zeros_like(self.media)
+            self.comomento = np.zeros_like(self.comomento)
+            return
+        media = (self.media * self.n - lote.media * lote.n) / n
+        d = (lote.media - media)[:_COVARIANCIA]
+        self.comomento = self.comomento - lote.comomento - np.outer(d, d) * (n * lote.n / self.n)
+        self.media = media
+        self.n = n
+
+    def _guardar(self, valores, timestamps):
+        n = len(valores)
+        if self._fim + n > len(self._timestamps):
+            tamanho = self._fim - self._inicio
+            capacidade = len(self._timestamps)
+            while tamanho + n > capacidade // 2:
+                capacidade *= 2
+            novos_valores = np.empty((capacidade, valores.shape[1]))
+            novos_timestamps = np.empty(capacidade, dtype='int64')
+            novos_valores[:tamanho] = self._valores[self._inicio:self._fim]
+            novos_timestamps[:tamanho] = self._timestamps[self._inicio:self._fim]
+            self._valores, self._timestamps = novos_valores, novos_timestamps
+            self._sequencia_base += self._inicio
+            self._inicio, self._fim = 0, tamanho
+        sequencias = self._sequencia_base + self._fim + np.arange(n)
+        self._valores[self._fim:self._fim + n] = valores
+        self._timestamps[self._fim:self._fim + n] = timestamps
+        self._fim += n
+        for indice, (minimos, maximos) in zip(_MEDIDAS, self._filas):
+            minimos.adicionar(sequencias, valores[:, indice])
+            maximos.adicionar(sequencias, -valores[:, indice])
+
+    def _intercalar(self, valores, timestamps):
+        # Reordena a janela com as leituras atrasadas; as somas não dependem
+        # da ordem, mas o descarte pelo período e as filas monotônicas sim
+        todos_valores = np.concatenate((self._valores[self._inicio:self._fim], valores))
+        todos_timestamps = np.concatenate((self._timestamps[self._inicio:self._fim], timestamps))
+        ordem = np.argsort(todos_timestamps, kind='stable')
+        n = len(ordem)
+        capacidade = len(self._timestamps)
+        while n > capacidade // 2:
+            capacidade *= 2
+        self._valores = np.empty((capacidade, valores.shape[1]))
+        self._timestamps = np.empty(capacidade, dtype='int64')
+        self._valores[:n] = todos_valores[ordem]
+        self._timestamps[:n] = todos_timestamps[ordem]
+        self._inicio, self._fim = 0, n
+        self._sequencia_base = 0
+        self._filas = [(_FilaMinimos(), _FilaMinimos()) for _ in _MEDIDAS]
+        sequencias = np.arange(n)
+        for indice, (minimos, maximos) in zip(_MEDIDAS, self._filas):
+            minimos.adicionar(sequencias, self._valores[:n, indice])
+            maximos.adicionar(sequencias, -self._valores[:n, indice])
+
+    def _descartar_expirados(self):
+        # Mesmo critério de BufferJanela._descartar_expirados
+        inicio = self._inicio
+        if self.periodo.tipo == 'registros':
+            inicio = max(inicio, self._fim - self.periodo.valor)
+        else:
+            corte = self._timestamps[self._fim - 1] - self.periodo.valor
+            inicio += int(np.searchsorted(self._timestamps[inicio:self._fim], corte, side='left'))
+        if inicio > self._inicio:
+            self._subtrair(_lote_de_valores(self._valores[self._inicio:inicio], self._timestamps[self._inicio:inicio]))
+            self._inicio = inicio
+            for minimos, maximos in self._filas:
+                minimos.descartar_antes(self._sequencia_base + inicio)
+                maximos.descartar_antes(self._sequencia_base + inicio)
+        self.ts_min = int(self._timestamps[self._inicio])
+
+    def _extremos(self):
+        # Mínimos e máximos de todas as colunas; os das flags saem da soma
+        minimo = np.where(np.round(self.media * self.n) >= self.n, 1.0, 0.0)
+        maximo = np.where(np.round(self.media * self.n) > 0, 1.0, 0.0)
+        if self.com_janela:
+            minimo[_MEDIDAS] = [minimos.minimo() for minimos, _ in self._filas]
+            maximo[_MEDIDAS] = [-maximos.minimo() for _, maximos in self._filas]
+        else:
+            minimo[_MEDIDAS] = self._minimo
+            maximo[_MEDIDAS] = self._maximo
+        return minimo, maximo
+
+    def estatisticas(self):
+        """`Estatisticas` atuais, com umidade em porcentagem (Series
+        indexadas por `COLUNAS_ESTATISTICAS`, covariância em DataFrame)."""
+        with self._lock:
+            n = self.n
+            escala = np.ones(len(COLUNAS_ESTATISTICAS))
+            escala[COLUNAS_ESTATISTICAS.index('UMIDADE_DHT')] = 1 / ESCALA_UMIDADE
+            if n == 0:
+                vazio = pd.Series(np.nan, index=COLUNAS_ESTATISTICAS)
+                covariancia = pd.DataFrame(np.nan, index=COLUNAS_CORRELACAO, columns=COLUNAS_CORRELACAO)
+                return Estatisticas(0, None, None, vazio, vazio, vazio, vazio, covariancia)
+            media = self.media
+            # Variância amostral (como o STDDEV do Oracle); flags pela soma
+            variancia = media * (1 - media) * n
+            variancia[:_COVARIANCIA] = np.diag(self.comomento)
+            variancia = variancia / (n - 1) if n > 1 else np.full_like(variancia, np.nan)
+            covariancia = self.comomento / (n - 1) if n > 1 else np.full_like(self.comomento, np.nan)
+            minimo, maximo = self._extremos()
+            escala_cov = escala[:_COVARIANCIA]
+            return Estatisticas(
+                contagem=n,
+                ts_min=self.ts_min,
+                ts_max=self.ts_max,
+                media=pd.Series(media * escala, index=COLUNAS_ESTATISTICAS),
+                variancia=pd.Series(np.maximum(variancia, 0) * escala ** 2, index=COLUNAS_ESTATISTICAS),
+                minimo=pd.Series(minimo * escala, index=COLUNAS_ESTATISTICAS),
+                maximo=pd.Series(maximo * escala, index=COLUNAS_ESTATISTICAS),
+                covariancia=pd.DataFrame(
+                    covariancia * np.outer(escala_cov, escala_cov),
+                    index=COLUNAS_CORRELACAO, columns=COLUNAS_CORRELACAO,
+                ),
+            )
+
+    def correlacao(self, estatisticas=None):
+        """Matriz de correlação das colunas de `COLUNAS_CORRELACAO` (das
+        `estatisticas` informadas ou das atuais)."""
+        if estatisticas is None:
+            estatisticas = self.estatisticas()
+        covariancia = estatisticas.covariancia.to_numpy()
+        desvios = np.sqrt(np.diag(covariancia))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            matriz = covariancia / np.outer(desvios, desvios)
+        matriz[~np.isfinite(matriz)] = np.nan
+        np.fill_diagonal(matriz, 1.0)
+        return pd.DataFrame(matriz, index=COLUNAS_CORRELACAO, columns=COLUNAS_CORRELACAO)
+
+    def agregados(self):
+        """Mesmo dict de `agregados.calcular_agregados` para as leituras da
+        janela."""
+        estatisticas = self.estatisticas()
+        n = estatisticas.contagem
+        if n == 0:
+            return normalizar_agregados({'TOTAL_MEDICOES': 0})
+        agregados = {
+            'TOTAL_MEDICOES': n,
+            'TS_MIN': estatisticas.ts_min,
+            'TS_MAX': estatisticas.ts_max,
+            'UMIDADE_MEDIA': estatisticas.media['UMIDADE_DHT'],
+            'UMIDADE_MIN': estatisticas.minimo['UMIDADE_DHT'],
+            'UMIDADE_MAX': estatisticas.maximo['UMIDADE_DHT'],
+            'UMIDADE_DESVIO': np.sqrt(estatisticas.variancia['UMIDADE_DHT']) if n > 1 else float('nan'),
+            'LDR_MEDIA': estatisticas.media['LDR_VALOR'],
+        }
+        for coluna, nome in SOMAS_FLAGS.items():
+            agregados[nome] = int(round(estatisticas.media[coluna] * n))
+        correlacao = self.correlacao(estatisticas)
+        for a, b in pares_correlacao():
+            agregados[nome_correlacao(a, b)] = correlacao.loc[a, b]
+        return normalizar_agregados(agregados)
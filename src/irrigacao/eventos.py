@@ -0,0 +1,118 @@
+"""
+Canal de eventos do servidor para os navegadores (Server-Sent Events)
+
+Em vez de cada aba consultar o servidor (e o banco) no seu próprio intervalo,
+uma única thread (`AtualizadorPeriodico`) atualiza os dados a cada período ou
+quando chegam leituras novas, e o `CanalEventos` entrega o resultado a todas
+as conexões abertas. A carga no banco depende do número de períodos em uso,
+não do número de pessoas olhando.
+
+Cada conexão tem uma fila limitada: um navegador que não consome os eventos é
+desconectado (o EventSource reconecta sozinho e recebe o último evento).
+"""
+
+import json
+import queue
+import threading
+import time
+
+
+class CanalEventos:
+    """Difusão de eventos SSE para todas as conexões abertas."""
+
+    def __init__(self, capacidade_cliente=20, keepalive=15.0, reconexao=5.0):
+        self.capacidade_cliente = capacidade_cliente
+        self.keepalive = keepalive
+        self.reconexao = reconexao
+        self._lock = threading.Lock()
+        self._filas = set()
+        self._ultimos = {}  # evento -> última mensagem, enviada a quem conecta
+        self.estatisticas = {'eventos': 0, 'conexoes': 0, 'desconectados': 0}
+
+    @property
+    def assinantes(self):
+        with self._lock:
+            return len(self._filas)
+
+    def publicar(self, evento, dados):
+        """Envia `dados` (serializável em JSON) a todas as conexões."""
+        mensagem = f"event: {evento}\ndata: {json.dumps(dados)}\n\n"
+        with self._lock:
+            self._ultimos[evento] = mensagem
+            self.estatisticas['eventos'] += 1
+            for fila in list(self._filas):
+                try:
+                    fila.put_nowait(mensagem)
+                except queue.Full:
+                    self._desconectar(fila)
+
+    def _desconectar(self, fila):
+        # Chamado com o lock adquirido
+        self._filas.discard(fila)
+        while not fila.empty():
+            fila.get_nowait()
+        fila.put_nowait(None)
+        self.estatisticas['desconectados'] += 1
+
+    def assinar(self):
+        """Gerador com o fluxo `text/event-stream` de uma conexão."""
+        fila = queue.Queue(maxsize=self.capacidade_cliente)
+        with self._lock:
+            self._filas.add(fila)
+            self.estatisticas['conexoes'] += 1
+            iniciais = list(self._ultimos.values())
+        try:
+            yield f"retry: {int(self.reconexao * 1000)}\n\n"
+            yield from iniciais
+            while True:
+                try:
+                    mensagem = fila.get(timeout=self.keepalive)
+                except queue.Empty:
+                    # Comentário SSE: mantém a conexão viva em proxies e
+                    # detecta navegadores que já fecharam a aba
+                    yield ": keepalive\n\n"
+                    continue
+                if mensagem is None:
+                    break
+                yield mensagem
+        finally:
+            with self._lock:
+                self._filas.discard(fila)
+
+
+class AtualizadorPeriodico(threading.Thread):
+    """Thread daemon que chama `atualizar()` a cada `intervalo` segundos.
+
+    `acordar()` antecipa a próxima atualização (leituras novas, botão de
+    recarga), respeitando `intervalo_minimo` entre duas execuções para que
+    uma rajada de lotes não vire uma rajada de atualizações.
+    """
+
+    def __init__(self, atualizar, intervalo=30.0, intervalo_minimo=1.0):
+        super().__init__(name='atualizador-periodico', daemon=True)
+        self.atualizar = atualizar
+        self.intervalo = intervalo
+        self.intervalo_minimo = intervalo_minimo
+        self.execucoes = 0
+        self.ultimo_erro = None
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.is_set():
+            inicio = time.monotonic()
+            try:
+                self.atualizar()
+            except Exception as e:
+                self.ultimo_erro = str(e)
+            self.execucoes += 1
+            self._parar.wait(max(self.intervalo_minimo - (time.monotonic() - inicio), 0.0))
+            self._acordar.wait(max(self.intervalo - (time.monotonic() - inicio), 0.0))
+            self._acordar.clear()
+
+    def acordar(self):
+        self._acordar.set()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
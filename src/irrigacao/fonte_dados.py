@@ -0,0 +1,457 @@
+"""
+Camada de acesso aos dados do sistema de irrigação
+
+Define uma interface única (`FonteDados`) usada pelos dois dashboards, com
+as implementações:
+
+- `FonteOracle`: consulta a tabela HISTORICO2024 no Oracle da FIAP
+- `FonteBancoLocal`: as mesmas consultas sobre o banco SQLite local
+- `FonteLocal`: lê `dados_historicos_2024.csv` (ou um Parquet convertido dele)
+  para memória e responde aos filtros de período sem ida ao banco
+
+As duas devolvem o mesmo formato de tabela que o Oracle (colunas de
+`esquema.COLUNAS`, UMIDADE_DHT no formato armazenado e ordem decrescente de
+TIMESTAMP), de forma que a correção de unidades continua sendo feita em um
+único lugar. As linhas saem com os tipos de `esquema.TIPOS_COMPACTOS` e
+`colunas` restringe a leitura às colunas que a tela usa.
+
+`com_escopo` devolve a mesma fonte restrita a um campo e/ou dispositivo
+(`esquema.Escopo`); `resumo_dispositivos` dá a visão geral de todos eles.
+"""
+
+import copy
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from irrigacao import config
+from irrigacao import amostragem
+from irrigacao import banco_local
+from irrigacao import metricas
+from irrigacao.agregados import (
+    normalizar_agregados,
+    normalizar_dispositivos,
+    calcular_agregados,
+    resumir_dispositivos,
+    somar_por_hora,
+)
+from irrigacao.cache import chave_consulta, criar_cache
+from irrigacao.consultas import ConstrutorConsultas, buscar, executar
+from irrigacao.esquema import (
+    TABELA, COLUNAS, COLUNAS_DISPOSITIVO, ESCOPO_TODOS,
+    armazenar_unidades, compactar, completar_dispositivo, filtrar_escopo, projetar,
+)
+from irrigacao.pool import PoolConexoes
+
+# Período normalizado: tipo "registros" (N mais recentes), "janela" (segundos
+# antes do MAX(TIMESTAMP)) ou "todos"
+Periodo = namedtuple('Periodo', ['tipo', 'valor'])
+
+JANELAS = {
+    '24h': 86400,
+    '3d': 3 * 86400,
+    '7d': 7 * 86400,
+}
+
+
+def interpretar_periodo(filtro):
+    """Converte o valor de filtro dos dashboards em um `Periodo`.
+
+    Aceita um inteiro (N registros mais recentes, 0 = todos), as chaves
+    "24h"/"3d"/"7d" ou um `Periodo` já normalizado.
+    """
+    if isinstance(filtro, Periodo):
+        return filtro
+    if isinstance(filtro, (int, np.integer)) and not isinstance(filtro, bool):
+        if filtro <= 0:
+            return Periodo('todos', None)
+        return Periodo('registros', int(filtro))
+    if filtro in JANELAS:
+        return Periodo('janela', JANELAS[filtro])
+    raise ValueError(f"Filtro de período desconhecido: {filtro!r}")
+
+
+class FonteDados:
+    """Interface comum das fontes de dados.
+
+    `carregar` devolve as linhas do período em ordem decrescente de
+    TIMESTAMP, com as mesmas colunas e unidades da tabela HISTORICO2024 (ou
+    só as de `colunas`, mais TIMESTAMP).
+    `agregados` devolve apenas os totais do período (ver
+    `irrigacao.agregados`), sem trafegar as linhas.
+    Todas as leituras se restringem ao `escopo` da fonte.
+    """
+
+    descricao = "Fonte de dados"
+    escopo = ESCOPO_TODOS
+
+    def com_escopo(self, escopo):
+        """Cópia da fonte restrita ao `Escopo` (campo e/ou dispositivo),
+        compartilhando pool e cache com esta."""
+        raise NotImplementedError
+
+    def dispositivos(self):
+        """DataFrame CAMPO, DISPOSITIVO com os nós que têm leituras."""
+        df = self.carregar(0, colunas=COLUNAS_DISPOSITIVO)[COLUNAS_DISPOSITIVO]
+        return df.drop_duplicates().sort_values(COLUNAS_DISPOSITIVO).reset_index(drop=True)
+
+    def resumo_dispositivos(self, filtro):
+        """Uma linha por dispositivo do período (ver
+        `agregados.resumir_dispositivos`)."""
+        return resumir_dispositivos(self.carregar(filtro).iloc[::-1])
+
+    def carregar(self, filtro, colunas=None):
+        raise NotImplementedError
+
+    def agregados(self, filtro):
+        raise NotImplementedError
+
+    def carregar_desde(self, timestamp, limite=None, colunas=None):
+        """Linhas com TIMESTAMP maior que `timestamp` (as `limite` mais
+        recentes, se informado), em ordem decrescente."""
+        raise NotImplementedError
+
+    def somas_por_hora(self, desde=None, ate=None):
+        """Somas por hora (ver `irrigacao.consolidacao`) das linhas com
+        TIMESTAMP maior que `desde` e menor que `ate`, indexadas pelo início
+        da hora."""
+        df = self.carregar(0)
+        if desde is not None:
+            df = df[df['TIMESTAMP'] > desde]
+        if ate is not None:
+            df = df[df['TIMESTAMP'] < ate]
+        return somar_por_hora(df)
+
+    def serie(self, filtro, coluna, pontos=amostragem.PONTOS_PADRAO):
+        """TIMESTAMP e `coluna` do período reduzidos a no máximo `pontos`
+        linhas, em ordem crescente, para gráficos de linha."""
+        df = self.carregar(filtro, colunas=[coluna])
+        return amostragem.reduzir(df, coluna, pontos).reset_index(drop=True)
+
+    def estatisticas_pool(self):
+        """Uso do pool de conexões, ou None se a fonte não usa banco."""
+        return None
+
+    def estatisticas_cache(self):
+        """Contadores do cache compartilhado, ou None se a fonte não usa."""
+        return None
+
+
+class FonteOracle(FonteDados):
+    """Fonte de dados apoiada na tabela HISTORICO2024 do Oracle.
+
+    As consultas usam conexões emprestadas de um `PoolConexoes`, que pode ser
+    compartilhado entre fontes (e sessões) do mesmo processo, e saem do
+    `ConstrutorConsultas` com variáveis de ligação: o texto SQL é o mesmo
+    para qualquer período e os cursores são reaproveitados pelo driver.
+
+    Com um `cache` (`irrigacao.cache.CacheCompartilhado`), os resultados são
+    compartilhados entre processos e valem enquanto o MAX(TIMESTAMP) da
+    tabela não mudar.
+    """
+
+    descricao = "Oracle FIAP"
+    dialeto = 'oracle'
+
+    def __init__(self, pool=None, tabela=TABELA, cache=None, verificar_esquema=True):
+        self.pool = pool or criar_pool_oracle()
+        self.tabela = tabela
+        self.consultas = ConstrutorConsultas(tabela, self.dialeto)
+        self.cache = cache
+        self._versao = None
+        self._versao_lida = None
+        self._lock_versao = threading.Lock()
+        if verificar_esquema:
+            self.verificar_esquema()
+
+    def verificar_esquema(self):
+        """Confere na partida se as migrações de `irrigacao.migracoes` foram
+        aplicadas, com uma mensagem clara em vez do erro do banco na primeira
+        consulta."""
+        from irrigacao import migracoes
+
+        with self.pool.conexao() as conn:
+            migracoes.verificar(conn, self.dialeto, self.tabela)
+
+    def com_escopo(self, escopo):
+        fonte = copy.copy(self)
+        fonte.escopo = escopo
+        fonte.consultas = ConstrutorConsultas(self.tabela, self.dialeto, escopo)
+        # A versão (MAX(TIMESTAMP)) passa a ser a do escopo
+        fonte._versao = fonte._versao_lida = None
+        fonte._lock_versao = threading.Lock()
+        return fonte
+
+    @property
+    def origem(self):
+        """Identifica o banco nas chaves do cache compartilhado."""
+        banco = config.DB_CONFIG
+        return f"oracle://{banco['username']}@{banco['host']}:{banco['port']}/{banco['service_name']}"
+
+    def versao_dados(self):
+        """MAX(TIMESTAMP) da tabela, relido no máximo a cada
+        `config.CACHE_VALIDADE_VERSAO` segundos."""
+        with self._lock_versao:
+            agora = time.monotonic()
+            if self._versao_lida is None or agora - self._versao_lida >= config.CACHE_VALIDADE_VERSAO:
+                with self.pool.conexao() as conn:
+                    _, linhas = buscar(conn, self.consultas.versao())
+                self._versao, self._versao_lida = linhas[0][0], agora
+            return self._versao
+
+    def _em_cache(self, consulta, calcular):
+        if self.cache is None:
+            return calcular()
+        chave = chave_consulta(consulta, self.versao_dados(), self.origem)
+        return self.cache.obter(chave, calcular)
+
+    def _executar(self, consulta, em_cache=True):
+        def calcular():
+            with self.pool.conexao() as conn:
+                return executar(conn, consulta)
+
+        return self._em_cache(consulta, calcular) if em_cache else calcular()
+
+    def carregar(self, filtro, colunas=None):
+        consulta = self.consultas.periodo(interpretar_periodo(filtro), colunas)
+        return compactar(self._executar(self.consultas.ordenada(consulta)))
+
+    def carregar_desde(self, timestamp, limite=None, colunas=None):
+        # As buscas incrementais não passam pelo cache: uma leitura atrasada
+        # de outro dispositivo não muda o MAX(TIMESTAMP) da chave e nunca
+        # chegaria
+        consulta = self.consultas.desde(timestamp, limite, colunas)
+        return compactar(self._executar(consulta, em_cache=False))
+
+    def serie(self, filtro, coluna, pontos=amostragem.PONTOS_PADRAO):
+        # Mínimo e máximo de cada balde de tempo calculados no próprio banco:
+        # trafegam no máximo `pontos` linhas, qualquer que seja o período
+        baldes_df = self._executar(self.consultas.serie(interpretar_periodo(filtro), coluna, pontos))
+        pontos_df = pd.concat([
+            baldes_df[['TS_MIN', 'VALOR_MIN']].set_axis(['TIMESTAMP', coluna], axis=1),
+            baldes_df[['TS_MAX', 'VALOR_MAX']].set_axis(['TIMESTAMP', coluna], axis=1),
+        ])
+        return compactar(
+            pontos_df.drop_duplicates('TIMESTAMP')
+            .sort_values('TIMESTAMP')
+            .reset_index(drop=True)
+        )
+
+    def somas_por_hora(self, desde=None, ate=None):
+        # Só a leitura inicial (sem `desde`) usa o cache, como em `carregar_desde`
+        somas = self._executar(self.consultas.somas_hora(desde, ate), em_cache=desde is None and ate is None)
+        return somas.set_index('INICIO').sort_index()
+
+    def agregados(self, filtro):
+        consulta = self.consultas.agregados(interpretar_periodo(filtro))
+
+        def calcular():
+            with self.pool.conexao() as conn:
+                nomes, linhas = buscar(conn, consulta)
+            return normalizar_agregados(dict(zip(nomes, linhas[0])))
+
+        return self._em_cache(consulta, calcular)
+
+    def dispositivos(self):
+        return self._executar(self.consultas.dispositivos()).astype('int64')
+
+    def resumo_dispositivos(self, filtro):
+        consulta = self.consultas.resumo_dispositivos(interpretar_periodo(filtro))
+        return normalizar_dispositivos(self._executar(consulta))
+
+    def estatisticas_pool(self):
+        return self.pool.estatisticas()
+
+    def estatisticas_cache(self):
+        return self.cache.estatisticas() if self.cache is not None else None
+
+
+class FonteBancoLocal(FonteOracle):
+    """As mesmas consultas da `FonteOracle` sobre o banco SQLite local
+    (`irrigacao.banco_local`), criado a partir do CSV se ainda não existir.
+
+    A série reduzida usa o caminho genérico (`FonteDados.serie`), já que o
+    SQLite não tem KEEP (DENSE_RANK ...).
+    """
+
+    descricao = "Banco local (SQLite)"
+    dialeto = 'sqlite'
+
+    def __init__(self, caminho=None, pool=None, tabela=TABELA, cache=None):
+        self.caminho = caminho or config.BANCO_LOCAL
+        if pool is None:
+            if not banco_local.tabela_existe(self.caminho, tabela):
+                banco_local.criar_banco_local(self.caminho, tabela=tabela)
+            else:
+                # Bancos criados antes das migrações ganham o índice em TIMESTAMP
+                from irrigacao import migracoes
+
+                conn = banco_local.conectar_local(self.caminho)
+                try:
+                    migracoes.migrar(conn, 'sqlite', tabela)
+                finally:
+                    conn.close()
+            pool = PoolConexoes(
+                lambda: banco_local.conectar_local(self.caminho),
+                minimo=config.POOL_MINIMO,
+                maximo=config.POOL_MAXIMO,
+                timeout=config.POOL_TIMEOUT,
+            )
+        # As migrações já rodaram acima
+        super().__init__(pool=pool, tabela=tabela, cache=cache, verificar_esquema=False)
+
+    @property
+    def origem(self):
+        return f"sqlite://{os.path.abspath(self.caminho)}"
+
+    def serie(self, filtro, coluna, pontos=amostragem.PONTOS_PADRAO):
+        return FonteDados.serie(self, filtro, coluna, pontos)
+
+
+class FonteLocal(FonteDados):
+    """Fonte de dados em memória lida de um CSV ou Parquet.
+
+    O arquivo é lido uma única vez e mantido em ordem crescente de
+    TIMESTAMP (e DISPOSITIVO); os filtros de período viram fatias por
+    `searchsorted`. `com_escopo` guarda só as linhas do escopo.
+    """
+
+    descricao = "Arquivo local"
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or config.ARQUIVO_LOCAL
+        df = completar_dispositivo(ler_arquivo(self.caminho))
+        df = df[COLUNAS].sort_values(['TIMESTAMP', 'DISPOSITIVO'], kind='stable').reset_index(drop=True)
+        # O CSV guarda a umidade em porcentagem; a tabela Oracle guarda x100
+        self._df = compactar(armazenar_unidades(df))
+        self._timestamps = df['TIMESTAMP'].to_numpy()
+        self._dispositivos = None
+
+    def com_escopo(self, escopo):
+        fonte = copy.copy(self)
+        fonte.escopo = escopo
+        fonte._df = filtrar_escopo(self._df, escopo).reset_index(drop=True)
+        fonte._timestamps = fonte._df['TIMESTAMP'].to_numpy()
+        fonte._dispositivos = None
+        return fonte
+
+    def __len__(self):
+        return len(self._df)
+
+    def _fatia(self, periodo):
+        total = len(self._df)
+        if total == 0 or periodo.tipo == 'todos':
+            return 0, total
+        if periodo.tipo == 'registros':
+            return max(total - periodo.valor, 0), total
+        inicio = np.searchsorted(self._timestamps, self._timestamps[-1] - periodo.valor, side='left')
+        return int(inicio), total
+
+    def _linhas(self, inicio, fim, colunas):
+        df = self._df if colunas is None else self._df[projetar(colunas)]
+        df = df.iloc[inicio:fim].iloc[::-1].reset_index(drop=True)
+        metricas.contar('irrigacao_linhas_lidas_total', len(df), origem='arquivo')
+        metricas.contar('irrigacao_bytes_lidos_total', int(df.memory_usage(index=False).sum()), origem='arquivo')
+        return df
+
+    def carregar(self, filtro, colunas=None):
+        inicio, fim = self._fatia(interpretar_periodo(filtro))
+        return self._linhas(inicio, fim, colunas)
+
+    def carregar_desde(self, timestamp, limite=None, colunas=None):
+        inicio = int(np.searchsorted(self._timestamps, timestamp, side='right'))
+        fim = len(self._df)
+        if limite:
+            inicio = max(inicio, fim - limite)
+        return self._linhas(inicio, fim, colunas)
+
+    def serie(self, filtro, coluna, pontos=amostragem.PONTOS_PADRAO):
+        inicio, fim = self._fatia(interpretar_periodo(filtro))
+        timestamps = self._timestamps[inicio:fim]
+        valores = self._df[coluna].to_numpy()[inicio:fim]
+        indices = amostragem.lttb(timestamps, valores, pontos)
+        return pd.DataFrame({'TIMESTAMP': timestamps[indices], coluna: valores[indices]})
+
+    def somas_por_hora(self, desde=None, ate=None):
+        inicio = 0 if desde is None else int(np.searchsorted(self._timestamps, desde, side='right'))
+        fim = len(self._timestamps) if ate is None else int(np.searchsorted(self._timestamps, ate, side='left'))
+        return somar_por_hora(self._df.iloc[inicio:fim])
+
+    def agregados(self, filtro):
+        inicio, fim = self._fatia(interpretar_periodo(filtro))
+        return calcular_agregados(self._df.iloc[inicio:fim])
+
+    def dispositivos(self):
+        # O arquivo não muda depois de lido
+        if self._dispositivos is None:
+            self._dispositivos = super().dispositivos()
+        return self._dispositivos
+
+    def resumo_dispositivos(self, filtro):
+        inicio, fim = self._fatia(interpretar_periodo(filtro))
+        return resumir_dispositivos(self._df.iloc[inicio:fim])
+
+
+def ler_arquivo(caminho):
+    """Lê um CSV ou Parquet com as colunas de HISTORICO2024."""
+    if caminho.endswith('.parquet'):
+        return pd.read_parquet(caminho)
+    return pd.read_csv(caminho)
+
+
+def converter_para_parquet(origem=None, destino=None):
+    """Gera uma cópia Parquet do CSV histórico (pyarrow, de `requirements.txt`)."""
+    origem = origem or config.ARQUIVO_LOCAL
+    destino = destino or origem.rsplit('.', 1)[0] + '.parquet'
+    pd.read_csv(origem).to_parquet(destino, index=False)
+    return destino
+
+
+def conectar_oracle():
+    """Abre uma conexão cx_Oracle com as credenciais de `config.DB_CONFIG`."""
+    import cx_Oracle
+
+    dsn = cx_Oracle.makedsn(
+        config.DB_CONFIG['host'],
+        config.DB_CONFIG['port'],
+        service_name=config.DB_CONFIG['service_name']
+    )
+    conn = cx_Oracle.connect(
+        config.DB_CONFIG['username'],
+        config.DB_CONFIG['password'],
+        dsn
+    )
+    # Cursores das consultas com variáveis de ligação ficam em cache por
+    # conexão (ver irrigacao.consultas)
+    conn.stmtcachesize = config.CACHE_INSTRUCOES
+    return conn
+
+
+def criar_pool_oracle(minimo=None, maximo=None, timeout=None):
+    """Pool de conexões Oracle com os limites de `config`."""
+    return PoolConexoes(
+        conectar_oracle,
+        minimo=config.POOL_MINIMO if minimo is None else minimo,
+        maximo=config.POOL_MAXIMO if maximo is None else maximo,
+        timeout=config.POOL_TIMEOUT if timeout is None else timeout,
+    )
+
+
+def criar_fonte(tipo=None, **kwargs):
+    """Cria a fonte configurada em IRRIGACAO_FONTE ("oracle", "local" ou
+    "sqlite"); as fontes apoiadas em banco usam o cache compartilhado de
+    `config.CACHE_CONSULTAS`, salvo se `cache` for informado."""
+    tipo = (tipo or config.FONTE).lower()
+    if tipo in ('oracle', 'sqlite') and 'cache' not in kwargs:
+        kwargs['cache'] = criar_cache()
+    if tipo == 'oracle':
+        return FonteOracle(**kwargs)
+    if tipo == 'local':
+        return FonteLocal(**kwargs)
+    if tipo == 'sqlite':
+        return FonteBancoLocal(**kwargs)
+    raise ValueError(f"Fonte de dados desconhecida: {tipo!r}")
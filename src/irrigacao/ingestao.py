@@ -0,0 +1,582 @@
+"""
+Serviço de ingestão de leituras ao vivo (asyncio)
+
+Recebe leituras dos sensores (DHT, LDR, NPK, pH e relé dos dispositivos
+ESP32) por TCP, porta serial ou por um substituto local de broker MQTT, no
+formato de uma linha JSON por leitura (ou uma lista de leituras):
+
+    {"TIMESTAMP": 1735700000, "UMIDADE_DHT": 52.92, "LDR_VALOR": 2043, ...}
+
+UMIDADE_DHT chega em porcentagem, como no CSV; TIMESTAMP ausente recebe o
+horário do servidor e CAMPO/DISPOSITIVO ausentes ficam com os padrões (no
+broker, DISPOSITIVO vem do tópico `irrigacao/<dispositivo>/leituras`). Cada leitura é validada contra o esquema da tabela
+(`esquema.FAIXAS_ARMAZENADAS`) e entra em uma fila limitada:
+
+- as inserções são agrupadas em lotes por tamanho (`tamanho_lote`) ou por
+  tempo (`intervalo_lote` segundos desde a primeira leitura do lote) e
+  gravadas com `executemany` em uma thread separada
+- com o banco lento a fila enche e quem entrega leituras passa a esperar
+  (`await put`): a conexão TCP deixa de ser lida, a thread da serial para e
+  o broker local segura a publicação, propagando a contrapressão até a origem
+- cada lote confirmado é repassado a um `Difusor`, que o entrega aos
+  dashboards (callbacks no mesmo processo ou clientes TCP da porta de
+  saída) sem que eles precisem consultar o banco
+
+Uso, a partir da pasta `src/`:
+
+    python -m irrigacao.ingestao --tcp 0.0.0.0:7000 --saida 0.0.0.0:7001
+    python -m irrigacao.ingestao --destino sqlite --simular 2000 --intervalo-simulacao 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from irrigacao import sintetico
+from irrigacao.consultas import ConstrutorConsultas
+from irrigacao.esquema import (
+    TABELA, COLUNAS, CAMPO_PADRAO, DISPOSITIVO_PADRAO, ESCALA_UMIDADE, FAIXAS_ARMAZENADAS,
+)
+
+TAMANHO_LOTE_PADRAO = 1000
+INTERVALO_LOTE_PADRAO = 0.5
+CAPACIDADE_PADRAO = 20_000
+
+# Tópico MQTT das leituras de cada dispositivo
+TOPICO_LEITURAS = 'irrigacao/+/leituras'
+
+
+class LeituraInvalida(ValueError):
+    """Leitura fora do esquema de HISTORICO2024."""
+
+
+def validar_leitura(leitura, agora=None):
+    """Tupla no formato armazenado (ordem de COLUNAS) a partir de um dict."""
+    if not isinstance(leitura, dict):
+        raise LeituraInvalida(f"Leitura deve ser um objeto JSON, não {type(leitura).__name__}")
+    valores = {str(chave).upper(): valor for chave, valor in leitura.items()}
+    desconhecidas = set(valores) - set(COLUNAS)
+    if desconhecidas:
+        raise LeituraInvalida(f"Colunas desconhecidas: {sorted(desconhecidas)}")
+    if valores.get('TIMESTAMP') is None:
+        valores['TIMESTAMP'] = int(time.time() if agora is None else agora)
+    valores.setdefault('CAMPO', CAMPO_PADRAO)
+    valores.setdefault('DISPOSITIVO', DISPOSITIVO_PADRAO)
+
+    linha = []
+    for coluna in COLUNAS:
+        valor = valores.get(coluna)
+        if isinstance(valor, bool):
+            valor = int(valor)
+        if not isinstance(valor, (int, float)) or valor != valor:
+            raise LeituraInvalida(f"{coluna}: valor numérico obrigatório, recebido {valor!r}")
+        if coluna == 'UMIDADE_DHT':
+            valor = round(valor * ESCALA_UMIDADE)
+        elif valor != int(valor):
+            raise LeituraInvalida(f"{coluna}: valor inteiro obrigatório, recebido {valor!r}")
+        valor = int(valor)
+        minimo, maximo = FAIXAS_ARMAZENADAS[coluna]
+        if not minimo <= valor <= maximo:
+            raise LeituraInvalida(f"{coluna}: {valor} fora da faixa [{minimo}, {maximo}]")
+        linha.append(valor)
+    return tuple(linha)
+
+
+def decodificar(mensagem):
+    """Lista de leituras (dicts) de uma linha JSON."""
+    if isinstance(mensagem, bytes):
+        mensagem = mensagem.decode('utf-8')
+    try:
+        dados = json.loads(mensagem)
+    except ValueError as e:
+        raise LeituraInvalida(f"JSON inválido: {e}") from e
+    return dados if isinstance(dados, list) else [dados]
+
+
+def lote_para_frame(linhas):
+    """DataFrame (formato armazenado, ordem de chegada) de tuplas validadas."""
+    return pd.DataFrame.from_records(linhas, columns=COLUNAS)
+
+
+class BrokerLocal:
+    """Substituto local de um broker MQTT, dentro do mesmo processo.
+
+    Tópicos separados por "/", com os curingas "+" (um nível) e "#" (o resto)
+    nas assinaturas. Cada assinatura é uma fila limitada: `publicar` espera
+    enquanto a fila de algum assinante estiver cheia, como um broker com
+    controle de fluxo.
+    """
+
+    def __init__(self, capacidade=CAPACIDADE_PADRAO):
+        self.capacidade = capacidade
+        self._assinaturas = []  # (filtro, fila)
+
+    def assinar(self, filtro):
+        fila = asyncio.Queue(maxsize=self.capacidade)
+        self._assinaturas.append((filtro.split('/'), fila))
+        return fila
+
+    async def publicar(self, topico, carga):
+        niveis = topico.split('/')
+        for filtro, fila in self._assinaturas:
+            if _casa_topico(filtro, niveis):
+                await fila.put((topico, carga))
+
+
+def _casa_topico(filtro, niveis):
+    for i, parte in enumerate(filtro):
+        if parte == '#':
+            return True
+        if i >= len(niveis) or (parte != '+' and parte != niveis[i]):
+            return False
+    return len(filtro) == len(niveis)
+
+
+class Difusor:
+    """Entrega cada lote gravado a quem estiver assinando.
+
+    Callbacks no mesmo processo são chamados em sequência; clientes TCP da
+    porta de saída recebem uma linha JSON por lote
+    (`{"colunas": [...], "linhas": [[...], ...]}`). Um cliente lento não
+    atrasa a ingestão: quando a fila dele enche, ele é desconectado.
+    """
+
+    def __init__(self, capacidade_cliente=100):
+        self.capacidade_cliente = capacidade_cliente
+        self._callbacks = []
+        self._clientes = set()
+        self.desconectados = 0
+
+    def assinar(self, callback):
+        self._callbacks.append(callback)
+        return callback
+
+    def cancelar(self, callback):
+        self._callbacks.remove(callback)
+
+    @property
+    def assinantes(self):
+        return len(self._callbacks) + len(self._clientes)
+
+    def publicar(self, linhas):
+        if not linhas:
+            return
+        if self._callbacks:
+            df = lote_para_frame(linhas)
+            for callback in list(self._callbacks):
+                callback(df)
+        if self._clientes:
+            mensagem = (json.dumps({'colunas': COLUNAS, 'linhas': linhas}) + '\n').encode()
+            for fila in list(self._clientes):
+                try:
+                    fila.put_nowait(mensagem)
+                except asyncio.QueueFull:
+                    self._desconectar(fila)
+
+    def _desconectar(self, fila):
+        # Descarta o que o cliente ainda não leu e sinaliza o fim da conexão
+        self._clientes.discard(fila)
+        while not fila.empty():
+            fila.get_nowait()
+        fila.put_nowait(None)
+        self.desconectados += 1
+
+    async def servir(self, host, porta):
+        """Servidor TCP de saída para os dashboards."""
+        return await asyncio.start_server(self._atender, host, porta)
+
+    async def _atender(self, _leitor, escritor):
+        fila = asyncio.Queue(maxsize=self.capacidade_cliente)
+        self._clientes.add(fila)
+        try:
+            while True:
+                mensagem = await fila.get()
+                if mensagem is None:
+                    break
+                escritor.write(mensagem)
+                await escritor.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._clientes.discard(fila)
+            escritor.close()
+
+
+class ServicoIngestao:
+    """Fila limitada de leituras validadas e gravação em micro-lotes.
+
+    `conectar()` devolve a conexão DB-API usada pela thread de gravação
+    (Oracle ou o banco local, ver `irrigacao.carga.conectar_destino`).
+    """
+
+    def __init__(self, conectar, dialeto='oracle', tabela=TABELA,
+                 tamanho_lote=TAMANHO_LOTE_PADRAO, intervalo_lote=INTERVALO_LOTE_PADRAO,
+                 capacidade=CAPACIDADE_PADRAO, difusor=None, tentativas=3):
+        self.conectar = conectar
+        self.consultas = ConstrutorConsultas(tabela, dialeto)
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_lote = intervalo_lote
+        self.capacidade = capacidade
+        self.difusor = difusor or Difusor()
+        self.tentativas = tentativas
+
+        self._fila = None
+        self._tarefa = None
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingestao')
+        self._estatisticas = {
+            'recebidas': 0,
+            'invalidas': 0,
+            'gravadas': 0,
+            'lotes': 0,
+            'esperas_fila': 0,
+            'falhas_gravacao': 0,
+            'lotes_descartados': 0,
+            'tempo_gravacao_total': 0.0,
+        }
+        self.ultimo_erro = None
+
+    async def iniciar(self):
+        self._fila = asyncio.Queue(maxsize=self.capacidade)
+        self._tarefa = asyncio.create_task(self._gravar_continuamente())
+
+    async def parar(self):
+        """Grava o que restou na fila e libera a conexão."""
+        if self._fila is not None:
+            await self._fila.join()
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._fechar_conexao)
+        self._executor.shutdown(wait=True)
+
+    async def receber(self, leitura):
+        """Valida uma leitura e a coloca na fila (espera se estiver cheia)."""
+        self._estatisticas['recebidas'] += 1
+        try:
+            linha = validar_leitura(leitura)
+        except LeituraInvalida as e:
+            self._estatisticas['invalidas'] += 1
+            self.ultimo_erro = str(e)
+            return False
+        if self._fila.full():
+            self._estatisticas['esperas_fila'] += 1
+        await self._fila.put(linha)
+        return True
+
+    async def receber_mensagem(self, mensagem, dispositivo=None):
+        """Uma linha JSON com uma leitura ou uma lista delas; `dispositivo`
+        vale para as leituras que não informarem o seu."""
+        try:
+            leituras = decodificar(mensagem)
+        except LeituraInvalida as e:
+            self._estatisticas['recebidas'] += 1
+            self._estatisticas['invalidas'] += 1
+            self.ultimo_erro = str(e)
+            return
+        for leitura in leituras:
+            if dispositivo is not None and isinstance(leitura, dict) and not any(
+                str(chave).upper() == 'DISPOSITIVO' for chave in leitura
+            ):
+                leitura['DISPOSITIVO'] = dispositivo
+            await self.receber(leitura)
+
+    # Entradas
+
+    async def servir_tcp(self, host, porta):
+        """Servidor TCP de entrada: uma linha JSON por mensagem."""
+        return await asyncio.start_server(self._atender_tcp, host, porta, limit=1 << 20)
+
+    async def _atender_tcp(self, leitor, escritor):
+        try:
+            async for linha in leitor:
+                if linha.strip():
+                    await self.receber_mensagem(linha)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    async def ler_serial(self, porta, baud=115200):
+        """Lê linhas JSON de uma porta serial (requer pyserial)."""
+        import serial
+
+        loop = asyncio.get_running_loop()
+        parar = threading.Event()
+
+        def ler():
+            with serial.Serial(porta, baud, timeout=1) as conexao:
+                while not parar.is_set():
+                    linha = conexao.readline()
+                    if linha.strip():
+                        # Bloqueia a thread enquanto a fila estiver cheia
+                        asyncio.run_coroutine_threadsafe(self.receber_mensagem(linha), loop).result()
+
+        try:
+            await asyncio.to_thread(ler)
+        finally:
+            parar.set()
+
+    async def consumir_broker(self, broker, topico=TOPICO_LEITURAS):
+        """Assina `topico` no broker local e ingere as publicações."""
+        fila = broker.assinar(topico)
+        while True:
+            topico, carga = await fila.get()
+            await self.receber_mensagem(carga, _dispositivo_do_topico(topico))
+
+    # Gravação
+
+    async def _gravar_continuamente(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = [await self._fila.get()]
+            limite = loop.time() + self.intervalo_lote
+            while len(lote) < self.tamanho_lote:
+                try:
+                    lote.append(self._fila.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(await asyncio.wait_for(self._fila.get(), restante))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                if await self._gravar(lote):
+                    self.difusor.publicar(lote)
+            finally:
+                for _ in lote:
+                    self._fila.task_done()
+
+    async def _gravar(self, lote):
+        loop = asyncio.get_running_loop()
+        for tentativa in range(self.tentativas):
+            inicio = time.perf_counter()
+            try:
+                await loop.run_in_executor(self._executor, self._gravar_sincrono, lote)
+            except Exception as e:
+                self._estatisticas['falhas_gravacao'] += 1
+                self.ultimo_erro = str(e)
+                await asyncio.sleep(0.5 * 2 ** tentativa)
+                continue
+            self._estatisticas['tempo_gravacao_total'] += time.perf_counter() - inicio
+            self._estatisticas['gravadas'] += len(lote)
+            self._estatisticas['lotes'] += 1
+            return True
+        self._estatisticas['lotes_descartados'] += 1
+        return False
+
+    def _gravar_sincrono(self, lote):
+        # Roda na thread de gravação, a única que usa a conexão
+        if self._conn is None:
+            self._conn = self.conectar()
+        cursor = self._conn.cursor()
+        try:
+            cursor.executemany(self.consultas.inserir(ignorar_duplicadas=True), lote)
+            self._conn.commit()
+        except Exception:
+            self._fechar_conexao()
+            raise
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+    def _fechar_conexao(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def estatisticas(self):
+        estatisticas = dict(self._estatisticas)
+        estatisticas['fila'] = self._fila.qsize() if self._fila is not None else 0
+        estatisticas['capacidade'] = self.capacidade
+        estatisticas['assinantes'] = self.difusor.assinantes
+        return estatisticas
+
+
+def _dispositivo_do_topico(topico):
+    # irrigacao/<dispositivo>/leituras, com o dispositivo numérico
+    niveis = topico.split('/')
+    if len(niveis) == 3 and niveis[1].isdigit():
+        return int(niveis[1])
+    return None
+
+
+async def simular_dispositivos(broker, dispositivos, intervalo, duracao, semente=0):
+    """Publica no broker local leituras sintéticas de `dispositivos`
+    sensores, cada um a cada `intervalo` segundos, por `duracao` segundos."""
+    loop = asyncio.get_running_loop()
+    fim = loop.time() + duracao
+    rodada = 0
+    while loop.time() < fim:
+        inicio_rodada = loop.time()
+        agora = int(time.time())
+        lote = sintetico.gerar_lote(agora, 1, dispositivos=dispositivos, semente=[semente, rodada])
+        leituras = lote.to_json(orient='records', lines=True).splitlines()
+        for dispositivo, leitura in zip(lote['DISPOSITIVO'], leituras):
+            await broker.publicar(f'irrigacao/{dispositivo}/leituras', leitura)
+        rodada += 1
+        await asyncio.sleep(max(0.0, intervalo - (loop.time() - inicio_rodada)))
+
+
+class AssinaturaIngestao(threading.Thread):
+    """Cliente da porta de saída do serviço, para os dashboards.
+
+    Roda em uma thread daemon, chama `ao_receber(df)` com cada lote gravado
+    (formato armazenado) e reconecta após `reconectar` segundos se a conexão
+    cair. `conectado` indica se há uma conexão ativa.
+    """
+
+    def __init__(self, endereco, ao_receber, reconectar=5.0):
+        super().__init__(name='assinatura-ingestao', daemon=True)
+        self.host, self.porta = _endereco(endereco)
+        self.ao_receber = ao_receber
+        self.reconectar = reconectar
+        self.conectado = False
+        self.lotes = 0
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.is_set():
+            try:
+                with socket.create_connection((self.host, self.porta), timeout=self.reconectar) as conexao:
+                    conexao.settimeout(None)
+                    self.conectado = True
+                    for linha in conexao.makefile('rb'):
+                        if self._parar.is_set():
+                            break
+                        mensagem = json.loads(linha)
+                        self.ao_receber(pd.DataFrame.from_records(mensagem['linhas'], columns=mensagem['colunas']))
+                        self.lotes += 1
+            except (OSError, ValueError):
+                pass
+            finally:
+                self.conectado = False
+            self._parar.wait(self.reconectar)
+
+    def parar(self):
+        self._parar.set()
+
+
+def assinar_ingestao(endereco, ao_receber, reconectar=5.0):
+    """Inicia e devolve uma `AssinaturaIngestao`."""
+    assinatura = AssinaturaIngestao(endereco, ao_receber, reconectar)
+    assinatura.start()
+    return assinatura
+
+
+def _endereco(texto):
+    host, _, porta = texto.rpartition(':')
+    return host or '127.0.0.1', int(porta)
+
+
+def _argumentos(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m irrigacao.ingestao',
+        description="Serviço de ingestão de leituras ao vivo para HISTORICO2024.",
+    )
+    parser.add_argument('--tcp', default=None, metavar='HOST:PORTA',
+                        help="endereço TCP de entrada (linhas JSON)")
+    parser.add_argument('--serial', default=None, metavar='PORTA',
+                        help="porta serial de entrada (requer pyserial)")
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--saida', default=None, metavar='HOST:PORTA',
+                        help="endereço TCP de onde os dashboards recebem os lotes gravados")
+    parser.add_argument('--destino', choices=['oracle', 'sqlite'], default='oracle')
+    parser.add_argument('--banco', default=None, help="arquivo SQLite do destino sqlite")
+    parser.add_argument('--tabela', default=TABELA)
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_PADRAO,
+                        help="leituras por inserção")
+    parser.add_argument('--intervalo-lote', type=float, default=INTERVALO_LOTE_PADRAO,
+                        help="espera máxima (s) para completar um lote")
+    parser.add_argument('--capacidade', type=int, default=CAPACIDADE_PADRAO,
+                        help="leituras na fila antes de aplicar contrapressão")
+    parser.add_argument('--simular', type=int, default=None, metavar='DISPOSITIVOS',
+                        help="publica leituras sintéticas desses dispositivos no broker local")
+    parser.add_argument('--intervalo-simulacao', type=float, default=1.0,
+                        help="segundos entre leituras de cada dispositivo simulado")
+    parser.add_argument('--duracao', type=float, default=60.0,
+                        help="duração da simulação (s)")
+    return parser.parse_args(argv)
+
+
+async def _executar(args):
+    from irrigacao.carga import conectar_destino
+
+    servico = ServicoIngestao(
+        lambda: conectar_destino(args.destino, args.banco)[0],
+        dialeto=args.destino,
+        tabela=args.tabela,
+        tamanho_lote=args.lote,
+        intervalo_lote=args.intervalo_lote,
+        capacidade=args.capacidade,
+    )
+    await servico.iniciar()
+    tarefas = []
+    if args.tcp:
+        await servico.servir_tcp(*_endereco(args.tcp))
+    if args.saida:
+        await servico.difusor.servir(*_endereco(args.saida))
+    if args.serial:
+        tarefas.append(asyncio.create_task(servico.ler_serial(args.serial, args.baud)))
+    if args.simular:
+        broker = BrokerLocal(capacidade=args.capacidade)
+        tarefas.append(asyncio.create_task(servico.consumir_broker(broker)))
+        simulacao = asyncio.create_task(
+            simular_dispositivos(broker, args.simular, args.intervalo_simulacao, args.duracao)
+        )
+
+    inicio = time.perf_counter()
+    try:
+        while True:
+            await asyncio.sleep(5)
+            e = servico.estatisticas()
+            taxa = e['gravadas'] / (time.perf_counter() - inicio)
+            print(
+                f"{e['recebidas']:,} recebidas | {e['gravadas']:,} gravadas em {e['lotes']:,} lotes | "
+                f"{e['invalidas']:,} inválidas | fila {e['fila']:,}/{e['capacidade']:,} | "
+                f"{taxa:,.0f} linhas/s"
+            )
+            if args.simular and simulacao.done():
+                break
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await servico.parar()
+    return servico.estatisticas()
+
+
+def main(argv=None):
+    args = _argumentos(argv)
+    if not (args.tcp or args.serial or args.simular):
+        print("Informe ao menos uma entrada: --tcp, --serial ou --simular", file=sys.stderr)
+        return 2
+    try:
+        estatisticas = asyncio.run(_executar(args))
+    except KeyboardInterrupt:
+        return 0
+    print(f"Ingestão encerrada: {estatisticas['gravadas']:,} leituras gravadas")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
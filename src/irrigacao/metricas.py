@@ -0,0 +1,199 @@
+"""
+Métricas de desempenho dos dashboards
+
+Registro em memória, por processo, de histogramas de latência e contadores
+(linhas e bytes lidos, acertos do cache, erros), sem dependências externas:
+
+- `cronometrar(operacao, **rotulos)`: bloco `with` que observa a duração em
+  `irrigacao_operacao_segundos` e, se uma exceção escapar, conta o erro em
+  `irrigacao_operacao_erros_total` com o nome da classe da exceção
+- `medido(operacao, **rotulos)`: o mesmo como decorador
+- `contar(nome, quantidade, **rotulos)`: soma a um contador
+
+`texto_prometheus()` devolve tudo no formato de exposição do Prometheus
+(servido pelo Dash em `/metrics`) e `resumo()` as mesmas séries em dicts
+para o painel de diagnóstico da sidebar do Streamlit.
+"""
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+OPERACOES = 'irrigacao_operacao_segundos'
+ERROS = 'irrigacao_operacao_erros_total'
+
+# Limites dos baldes (s), de 1 ms a 30 s
+LIMITES_PADRAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Texto de ajuda de cada métrica conhecida, exibido no /metrics
+DESCRICOES = {
+    OPERACOES: "Duração das operações instrumentadas",
+    ERROS: "Exceções nas operações instrumentadas",
+    'irrigacao_linhas_lidas_total': "Linhas lidas das fontes de dados",
+    'irrigacao_bytes_lidos_total': "Bytes dos DataFrames montados a partir das fontes",
+    'irrigacao_cache_consultas_total': "Pedidos ao cache compartilhado de consultas, por resultado",
+    'irrigacao_tarefas_total': "Cargas e atualizações em segundo plano terminadas, por tipo e estado",
+    'dash_requisicao_segundos': "Duração das requisições de callback do Dash, com a serialização",
+    'dash_resposta_bytes_total': "Bytes das respostas de callback do Dash",
+}
+
+
+class Histograma:
+    """Contagens cumulativas por limite, soma e total de observações."""
+
+    def __init__(self, limites=LIMITES_PADRAO):
+        self.limites = tuple(limites)
+        self.baldes = [0] * (len(self.limites) + 1)  # o último é +Inf
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.baldes[bisect.bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def cumulativos(self):
+        acumulado, resultado = 0, []
+        for contagem in self.baldes:
+            acumulado += contagem
+            resultado.append(acumulado)
+        return resultado
+
+    def quantil(self, q):
+        """Estimativa do quantil `q` por interpolação linear dentro do balde
+        (como o `histogram_quantile` do Prometheus)."""
+        if self.total == 0:
+            return None
+        alvo = q * self.total
+        anterior_limite, anterior_contagem = 0.0, 0
+        for limite, acumulado in zip(self.limites, self.cumulativos()):
+            if acumulado >= alvo:
+                no_balde = acumulado - anterior_contagem
+                fracao = (alvo - anterior_contagem) / no_balde if no_balde else 0.0
+                return anterior_limite + (limite - anterior_limite) * fracao
+            anterior_limite, anterior_contagem = limite, acumulado
+        return self.limites[-1]
+
+
+def _rotulos(rotulos):
+    return tuple(sorted((chave, str(valor)) for chave, valor in rotulos.items()))
+
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatar_rotulos(rotulos, extra=()):
+    pares = list(rotulos) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{chave}="{_escapar(valor)}"' for chave, valor in pares) + '}'
+
+
+class RegistroMetricas:
+    """Histogramas e contadores indexados por nome e rótulos."""
+
+    def __init__(self, limites=LIMITES_PADRAO):
+        self.limites = limites
+        self._lock = threading.Lock()
+        self._histogramas = {}  # nome -> {rotulos: Histograma}
+        self._contadores = {}   # nome -> {rotulos: valor}
+
+    def observar(self, nome, valor, **rotulos):
+        chave = _rotulos(rotulos)
+        with self._lock:
+            series = self._histogramas.setdefault(nome, {})
+            histograma = series.get(chave)
+            if histograma is None:
+                histograma = series[chave] = Histograma(self.limites)
+            histograma.observar(valor)
+
+    def contar(self, nome, quantidade=1, **rotulos):
+        chave = _rotulos(rotulos)
+        with self._lock:
+            series = self._contadores.setdefault(nome, {})
+            series[chave] = series.get(chave, 0) + quantidade
+
+    @contextmanager
+    def cronometrar(self, operacao, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.contar(ERROS, operacao=operacao, erro=type(e).__name__, **rotulos)
+            raise
+        finally:
+            self.observar(OPERACOES, time.perf_counter() - inicio, operacao=operacao, **rotulos)
+
+    def medido(self, operacao, **rotulos):
+        def decorador(funcao):
+            @functools.wraps(funcao)
+            def envolvida(*args, **kwargs):
+                with self.cronometrar(operacao, **rotulos):
+                    return funcao(*args, **kwargs)
+            return envolvida
+        return decorador
+
+    def limpar(self):
+        with self._lock:
+            self._histogramas.clear()
+            self._contadores.clear()
+
+    def texto_prometheus(self):
+        """Todas as séries no formato de exposição em texto 0.0.4."""
+        linhas = []
+        with self._lock:
+            for nome in sorted(self._histogramas):
+                linhas.append(f"# HELP {nome} {DESCRICOES.get(nome, nome)}")
+                linhas.append(f"# TYPE {nome} histogram")
+                for rotulos, h in sorted(self._histogramas[nome].items()):
+                    limites = [repr(float(l)) for l in h.limites] + ['+Inf']
+                    for limite, acumulado in zip(limites, h.cumulativos()):
+                        linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos, [('le', limite)])} {acumulado}")
+                    linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {h.soma!r}")
+                    linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {h.total}")
+            for nome in sorted(self._contadores):
+                linhas.append(f"# HELP {nome} {DESCRICOES.get(nome, nome)}")
+                linhas.append(f"# TYPE {nome} counter")
+                for rotulos, valor in sorted(self._contadores[nome].items()):
+                    linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {valor}")
+        return "\n".join(linhas) + "\n"
+
+    def resumo(self):
+        """(operações, contadores): um dict por série, com os rótulos em
+        texto e, nos histogramas, chamadas, média e quantis 50/95 em ms."""
+        def texto(rotulos):
+            return ", ".join(f"{chave}={valor}" for chave, valor in rotulos)
+
+        with self._lock:
+            operacoes = [
+                {
+                    'metrica': nome,
+                    'rotulos': texto(rotulos),
+                    'chamadas': h.total,
+                    'media_ms': h.soma / h.total * 1000,
+                    'p50_ms': h.quantil(0.5) * 1000,
+                    'p95_ms': h.quantil(0.95) * 1000,
+                }
+                for nome, series in sorted(self._histogramas.items())
+                for rotulos, h in sorted(series.items())
+            ]
+            contadores = [
+                {'metrica': nome, 'rotulos': texto(rotulos), 'valor': valor}
+                for nome, series in sorted(self._contadores.items())
+                for rotulos, valor in sorted(series.items())
+            ]
+        return operacoes, contadores
+
+
+# Registro do processo, usado pelos módulos do pacote e pelos dashboards
+registro = RegistroMetricas()
+
+observar = registro.observar
+contar = registro.contar
+cronometrar = registro.cronometrar
+medido = registro.medido
+texto_prometheus = registro.texto_prometheus
+resumo = registro.resumo
@@ -0,0 +1,291 @@
+"""
+Migrações versionadas do esquema de HISTORICO2024
+
+A tabela criada pelo assistente do SQL Developer (`scripts/oracle_import.md`)
+não tem chave nem índice: as consultas de "N registros mais recentes"
+ordenam a tabela inteira e as janelas relativas (24h/3d/7d) leem todas as
+linhas para achar o MAX(TIMESTAMP). As migrações abaixo levam qualquer
+instalação (nova ou importada pelo assistente) ao mesmo esquema:
+
+1. cria a tabela, se ainda não existir
+2. chave primária em TIMESTAMP (no SQLite, índice único equivalente): o
+   MAX(TIMESTAMP), as janelas e o ORDER BY TIMESTAMP DESC passam a ser
+   percorridos pelo índice
+3. opcional, só Oracle: particionamento por intervalo de ~1 mês (30 dias de
+   TIMESTAMP, que é epoch numérico), para que as janelas leiam apenas as
+   partições recentes
+4. colunas CAMPO e DISPOSITIVO (as linhas existentes ficam no campo 1,
+   dispositivo 1) e chave primária em (DISPOSITIVO, TIMESTAMP), com um
+   índice em TIMESTAMP para as janelas de todos os dispositivos
+
+As versões aplicadas ficam na tabela ESQUEMA_VERSAO, por tabela; rodar as
+migrações de novo só aplica as que faltam.
+
+Uso, a partir da pasta `src/`:
+
+    python -m irrigacao.migracoes                      # Oracle
+    python -m irrigacao.migracoes --particionar        # inclui a migração 3
+    python -m irrigacao.migracoes --destino sqlite --banco /tmp/teste.sqlite
+    python -m irrigacao.migracoes --ddl --destino sqlite   # só mostra o DDL
+"""
+
+import argparse
+import sys
+import time
+from collections import namedtuple
+
+from irrigacao.consultas import ConstrutorConsultas, Consulta, buscar
+from irrigacao.esquema import CAMPO_PADRAO, COLUNAS_HISTORICO, DISPOSITIVO_PADRAO, TABELA, TIPOS_ORACLE
+
+TABELA_VERSOES = "ESQUEMA_VERSAO"
+
+# Primeiro limite das partições (2024-01-01 00:00 UTC) e largura de cada
+# intervalo (30 dias); leituras anteriores ficam na partição inicial
+INICIO_PARTICOES = 1704067200
+INTERVALO_PARTICAO = 30 * 86400
+
+# `instrucoes(consultas, tabela_existe)` devolve a lista de instruções SQL;
+# `dialetos` limita a migração a alguns dialetos e `opcional` exige pedido
+# explícito (`particionar=True`)
+Migracao = namedtuple('Migracao', ['versao', 'descricao', 'instrucoes', 'dialetos', 'opcional'])
+
+
+def _criar_tabela(consultas, tabela_existe):
+    # As colunas de dispositivo chegam na migração 4
+    return [] if tabela_existe else [consultas.criar_tabela(COLUNAS_HISTORICO)]
+
+
+def _chave_primaria(consultas, tabela_existe):
+    t = consultas.tabela
+    instrucoes = []
+    if tabela_existe:
+        # Tabelas importadas pelo assistente podem ter TIMESTAMPs nulos ou
+        # repetidos; fica a primeira linha de cada TIMESTAMP
+        identificador = "ROWID" if consultas.dialeto == 'oracle' else "rowid"
+        instrucoes += [
+            f"DELETE FROM {t} WHERE TIMESTAMP IS NULL",
+            f"DELETE FROM {t} WHERE {identificador} NOT IN "
+            f"(SELECT MIN({identificador}) FROM {t} GROUP BY TIMESTAMP)",
+        ]
+    if consultas.dialeto == 'oracle':
+        instrucoes.append(f"ALTER TABLE {t} ADD CONSTRAINT {t}_PK PRIMARY KEY (TIMESTAMP)")
+    else:
+        # O SQLite não acrescenta chave primária a uma tabela existente; o
+        # índice único tem o mesmo efeito nas consultas
+        instrucoes.append(f"CREATE UNIQUE INDEX IF NOT EXISTS {t}_PK ON {t} (TIMESTAMP)")
+    return instrucoes
+
+
+def _particionar(consultas, tabela_existe):
+    # Requer Oracle 12.2+ com a opção de particionamento
+    t = consultas.tabela
+    return [
+        f"ALTER TABLE {t} MODIFY PARTITION BY RANGE (TIMESTAMP) "
+        f"INTERVAL ({INTERVALO_PARTICAO}) "
+        f"(PARTITION {t}_P0 VALUES LESS THAN ({INICIO_PARTICOES})) "
+        f"ONLINE UPDATE INDEXES"
+    ]
+
+
+def _dispositivos(consultas, tabela_existe):
+    t = consultas.tabela
+    padroes = {'CAMPO': CAMPO_PADRAO, 'DISPOSITIVO': DISPOSITIVO_PADRAO}
+    if consultas.dialeto == 'oracle':
+        colunas = ", ".join(
+            f"{coluna} {TIPOS_ORACLE[coluna]} DEFAULT {padrao} NOT NULL" for coluna, padrao in padroes.items()
+        )
+        return [
+            f"ALTER TABLE {t} ADD ({colunas})",
+            f"ALTER TABLE {t} DROP CONSTRAINT {t}_PK DROP INDEX",
+            f"ALTER TABLE {t} ADD CONSTRAINT {t}_PK PRIMARY KEY (DISPOSITIVO, TIMESTAMP)",
+            f"CREATE INDEX {t}_TS ON {t} (TIMESTAMP)",
+        ]
+    return [
+        *(f"ALTER TABLE {t} ADD COLUMN {coluna} INTEGER NOT NULL DEFAULT {padrao}"
+          for coluna, padrao in padroes.items()),
+        f"DROP INDEX IF EXISTS {t}_PK",
+        f"CREATE UNIQUE INDEX {t}_PK ON {t} (DISPOSITIVO, TIMESTAMP)",
+        f"CREATE INDEX IF NOT EXISTS {t}_TS ON {t} (TIMESTAMP)",
+    ]
+
+
+MIGRACOES = [
+    Migracao(1, "Cria a tabela de leituras", _criar_tabela, ('oracle', 'sqlite'), False),
+    Migracao(2, "Chave primária em TIMESTAMP", _chave_primaria, ('oracle', 'sqlite'), False),
+    Migracao(3, "Particionamento mensal por intervalo", _particionar, ('oracle',), True),
+    Migracao(4, "Campo e dispositivo", _dispositivos, ('oracle', 'sqlite'), False),
+]
+
+
+def _ddl_versoes(dialeto):
+    if dialeto == 'oracle':
+        tipos = ("VARCHAR2(128)", "NUMBER(6,0)", "VARCHAR2(200)", "NUMBER(10,0)")
+    else:
+        tipos = ("TEXT", "INTEGER", "TEXT", "INTEGER")
+    return (
+        f"CREATE TABLE {TABELA_VERSOES} (\n"
+        f"    TABELA {tipos[0]} NOT NULL,\n"
+        f"    VERSAO {tipos[1]} NOT NULL,\n"
+        f"    DESCRICAO {tipos[2]},\n"
+        f"    APLICADA_EM {tipos[3]},\n"
+        f"    CONSTRAINT {TABELA_VERSOES}_PK PRIMARY KEY (TABELA, VERSAO)\n"
+        f")"
+    )
+
+
+def tabela_existe(conn, dialeto, nome):
+    """Se a tabela `nome` existe no esquema da conexão."""
+    if dialeto == 'oracle':
+        sql = "SELECT COUNT(*) FROM USER_TABLES WHERE TABLE_NAME = :nome"
+    else:
+        sql = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = :nome"
+    _, linhas = buscar(conn, Consulta(sql, {'nome': nome.upper() if dialeto == 'oracle' else nome}, 1))
+    return linhas[0][0] > 0
+
+
+def versoes_aplicadas(conn, dialeto, tabela=TABELA):
+    """Versões já registradas em ESQUEMA_VERSAO para `tabela`."""
+    if not tabela_existe(conn, dialeto, TABELA_VERSOES):
+        return set()
+    consulta = Consulta(
+        f"SELECT VERSAO FROM {TABELA_VERSOES} WHERE TABELA = :tabela", {'tabela': tabela}, None
+    )
+    _, linhas = buscar(conn, consulta)
+    return {int(linha[0]) for linha in linhas}
+
+
+def pendentes(conn, dialeto, tabela=TABELA, particionar=False):
+    """Migrações que ainda faltam para `tabela`, em ordem."""
+    aplicadas = versoes_aplicadas(conn, dialeto, tabela)
+    return [
+        m for m in MIGRACOES
+        if m.versao not in aplicadas and dialeto in m.dialetos and (particionar or not m.opcional)
+    ]
+
+
+def verificar(conn, dialeto, tabela=TABELA):
+    """Levanta `RuntimeError` se faltam migrações obrigatórias em `tabela`:
+    sem a migração 4 as consultas falhariam no banco com coluna inexistente
+    (ORA-00904 em CAMPO/DISPOSITIVO)."""
+    faltando = pendentes(conn, dialeto, tabela)
+    if faltando:
+        lista = "; ".join(f"{m.versao} ({m.descricao})" for m in faltando)
+        comando = "python -m irrigacao.migracoes"
+        if tabela != TABELA:
+            comando += f" --tabela {tabela}"
+        raise RuntimeError(
+            f"O esquema de {tabela} está desatualizado, faltam as migrações {lista}. "
+            f"Rode `{comando}` (a partir da pasta src/) e abra o dashboard de novo."
+        )
+
+
+def _executar(conn, instrucoes):
+    cursor = conn.cursor()
+    try:
+        for sql in instrucoes:
+            cursor.execute(sql)
+    finally:
+        cursor.close()
+
+
+def _travar(conn, dialeto):
+    # No SQLite a migração inteira (DDL e registro da versão) fica em uma
+    # transação de escrita: processos que abrem o mesmo banco ao mesmo tempo
+    # aplicam cada versão uma única vez. No Oracle o DDL confirma sozinho
+    if dialeto == 'sqlite':
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+
+
+def migrar(conn, dialeto, tabela=TABELA, particionar=False, relatar=None):
+    """Aplica as migrações pendentes; devolve as versões aplicadas."""
+    consultas = ConstrutorConsultas(tabela, dialeto)
+    if not tabela_existe(conn, dialeto, TABELA_VERSOES):
+        _executar(conn, [_ddl_versoes(dialeto)])
+        conn.commit()
+
+    aplicadas = []
+    for migracao in pendentes(conn, dialeto, tabela, particionar):
+        inicio = time.perf_counter()
+        _travar(conn, dialeto)
+        try:
+            # Outro processo pode ter aplicado a migração enquanto esperávamos
+            if migracao.versao in versoes_aplicadas(conn, dialeto, tabela):
+                conn.commit()
+                continue
+            _executar(conn, migracao.instrucoes(consultas, tabela_existe(conn, dialeto, tabela)))
+            cursor = conn.cursor()
+            try:
+                marcadores = "(:1, :2, :3, :4)" if dialeto == 'oracle' else "(?, ?, ?, ?)"
+                cursor.execute(
+                    f"INSERT INTO {TABELA_VERSOES} (TABELA, VERSAO, DESCRICAO, APLICADA_EM) VALUES {marcadores}",
+                    (tabela, migracao.versao, migracao.descricao, int(time.time())),
+                )
+            finally:
+                cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        aplicadas.append(migracao.versao)
+        if relatar:
+            relatar(
+                f"{tabela}: versão {migracao.versao} ({migracao.descricao}) "
+                f"aplicada em {time.perf_counter() - inicio:.2f}s"
+            )
+    return aplicadas
+
+
+def ddl(dialeto, tabela=TABELA, particionar=False):
+    """Script com todas as instruções de uma instalação nova."""
+    consultas = ConstrutorConsultas(tabela, dialeto)
+    instrucoes = [_ddl_versoes(dialeto)]
+    for migracao in MIGRACOES:
+        if dialeto in migracao.dialetos and (particionar or not migracao.opcional):
+            instrucoes += migracao.instrucoes(consultas, False)
+            # Registra a versão, para que `migrar` não a aplique de novo
+            instrucoes.append(
+                f"INSERT INTO {TABELA_VERSOES} (TABELA, VERSAO, DESCRICAO, APLICADA_EM) "
+                f"VALUES ('{tabela}', {migracao.versao}, '{migracao.descricao}', {int(time.time())})"
+            )
+    return ";\n\n".join(instrucoes) + ";\n"
+
+
+def _argumentos(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m irrigacao.migracoes',
+        description="Aplica as migrações de esquema de HISTORICO2024.",
+    )
+    parser.add_argument('--destino', choices=['oracle', 'sqlite'], default='oracle')
+    parser.add_argument('--banco', default=None,
+                        help="arquivo SQLite do destino sqlite (padrão: IRRIGACAO_BANCO_LOCAL)")
+    parser.add_argument('--tabela', default=TABELA)
+    parser.add_argument('--particionar', action='store_true',
+                        help="inclui o particionamento mensal (Oracle 12.2+)")
+    parser.add_argument('--ddl', action='store_true',
+                        help="só mostra o DDL de uma instalação nova, sem conectar")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _argumentos(argv)
+    if args.ddl:
+        print(ddl(args.destino, args.tabela, args.particionar))
+        return 0
+
+    from irrigacao.carga import conectar_destino
+
+    conn, dialeto = conectar_destino(args.destino, args.banco)
+    try:
+        aplicadas = migrar(conn, dialeto, args.tabela, args.particionar, relatar=print)
+        atuais = sorted(versoes_aplicadas(conn, dialeto, args.tabela))
+    finally:
+        conn.close()
+    if not aplicadas:
+        print(f"{args.tabela} já está atualizada")
+    print(f"Versões aplicadas: {atuais}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Pool de conexões compartilhado pelos dashboards
+
+Mantém um conjunto limitado de conexões abertas e reaproveitadas entre
+consultas, em vez de abrir (e pagar o login Oracle) a cada atualização.
+O pool não depende do cx_Oracle: recebe uma função `conectar` que devolve
+qualquer conexão DB-API, o que permite exercitá-lo com o banco local
+(`irrigacao.banco_local`) no lugar do Oracle.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Consulta usada na verificação de saúde quando a conexão não tem ping()
+CONSULTA_VERIFICACAO = "SELECT 1 FROM DUAL"
+
+
+class TempoEsgotado(Exception):
+    """Nenhuma conexão ficou disponível dentro do tempo de espera."""
+
+
+def verificar_conexao(conn):
+    """Confirma que a conexão ainda responde (ping ou SELECT 1 FROM DUAL)."""
+    if hasattr(conn, 'ping'):
+        conn.ping()
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute(CONSULTA_VERIFICACAO)
+        cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+class PoolConexoes:
+    """Pool de conexões limitado, seguro para uso entre threads.
+
+    - `minimo` conexões são abertas na criação (falhas não impedem a criação;
+      a conexão é tentada de novo na próxima aquisição)
+    - no máximo `maximo` conexões existem ao mesmo tempo; quem pede além disso
+      espera até `timeout` segundos e recebe `TempoEsgotado`
+    - conexões ociosas há mais de `intervalo_verificacao` segundos passam por
+      `verificar` antes de serem entregues e são descartadas se falharem
+    """
+
+    def __init__(self, conectar, minimo=1, maximo=4, timeout=10.0,
+                 verificar=verificar_conexao, intervalo_verificacao=30.0):
+        if maximo < 1 or minimo > maximo:
+            raise ValueError("Pool precisa de 0 <= minimo <= maximo e maximo >= 1")
+        self.conectar = conectar
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.verificar = verificar
+        self.intervalo_verificacao = intervalo_verificacao
+
+        self._condicao = threading.Condition()
+        self._ociosas = []  # pilha de (conexão, instante em que foi devolvida)
+        self._abertas = 0
+        self._fechado = False
+        self._contadores = {
+            'aquisicoes': 0,
+            'esperas': 0,
+            'tempo_espera_total': 0.0,
+            'timeouts': 0,
+            'conexoes_criadas': 0,
+            'falhas_conexao': 0,
+            'falhas_verificacao': 0,
+            'descartadas': 0,
+        }
+
+        for _ in range(minimo):
+            with self._condicao:
+                self._abertas += 1
+            try:
+                conn = self._abrir()
+            except Exception:
+                break
+            with self._condicao:
+                self._ociosas.append((conn, time.monotonic()))
+
+    def _abrir(self):
+        # A vaga em _abertas já foi reservada por quem chama, sob o lock
+        try:
+            conn = self.conectar()
+        except Exception:
+            with self._condicao:
+                self._abertas -= 1
+                self._contadores['falhas_conexao'] += 1
+                self._condicao.notify()
+            raise
+        with self._condicao:
+            self._contadores['conexoes_criadas'] += 1
+        return conn
+
+    def _saudavel(self, conn, devolvida_em):
+        if self.verificar is None:
+            return True
+        if time.monotonic() - devolvida_em < self.intervalo_verificacao:
+            return True
+        try:
+            self.verificar(conn)
+            return True
+        except Exception:
+            with self._condicao:
+                self._contadores['falhas_verificacao'] += 1
+            return False
+
+    def adquirir(self, timeout=None):
+        """Retira uma conexão do pool, abrindo uma nova se houver vaga."""
+        timeout = self.timeout if timeout is None else timeout
+        limite = time.monotonic() + timeout
+        esperou = False
+        inicio = time.monotonic()
+
+        while True:
+            with self._condicao:
+                while True:
+                    if self._fechado:
+                        raise RuntimeError("Pool de conexões fechado")
+                    if self._ociosas:
+                        conn, devolvida_em = self._ociosas.pop()
+                        abrir = False
+                        break
+                    if self._abertas < self.maximo:
+                        self._abertas += 1
+                        conn, devolvida_em = None, None
+                        abrir = True
+                        break
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._contadores['timeouts'] += 1
+                        raise TempoEsgotado(
+                            f"Nenhuma conexão disponível em {timeout:.1f}s "
+                            f"({self.maximo} em uso)"
+                        )
+                    esperou = True
+                    self._condicao.wait(restante)
+
+            if abrir:
+                conn = self._abrir()
+            elif not self._saudavel(conn, devolvida_em):
+                self._descartar(conn)
+                continue
+
+            with self._condicao:
+                self._contadores['aquisicoes'] += 1
+                if esperou:
+                    self._contadores['esperas'] += 1
+                    self._contadores['tempo_espera_total'] += time.monotonic() - inicio
+            return conn
+
+    def devolver(self, conn, descartar=False):
+        """Devolve a conexão ao pool (ou a fecha, se `descartar`)."""
+        if descartar or self._fechado:
+            self._descartar(conn)
+            return
+        with self._condicao:
+            self._ociosas.append((conn, time.monotonic()))
+            self._condicao.notify()
+
+    def _descartar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._condicao:
+            self._abertas -= 1
+            self._contadores['descartadas'] += 1
+            self._condicao.notify()
+
+    @contextmanager
+    def conexao(self, timeout=None):
+        """Empresta uma conexão; se o bloco falhar ela é descartada."""
+        conn = self.adquirir(timeout)
+        try:
+            yield conn
+        except Exception:
+            self.devolver(conn, descartar=True)
+            raise
+        else:
+            self.devolver(conn)
+
+    def estatisticas(self):
+        """Uso atual e contadores acumulados do pool."""
+        with self._condicao:
+            stats = dict(self._contadores)
+            stats.update({
+                'abertas': self._abertas,
+                'ociosas': len(self._ociosas),
+                'em_uso': self._abertas - len(self._ociosas),
+                'minimo': self.minimo,
+                'maximo': self.maximo,
+            })
+        return stats
+
+    def fechar(self):
+        """Fecha as conexões ociosas e recusa novas aquisições."""
+        with self._condicao:
+            self._fechado = True
+            ociosas, self._ociosas = self._ociosas, []
+            self._condicao.notify_all()
+        for conn, _ in ociosas:
+            self._descartar(conn)
@@ -0,0 +1,430 @@
+"""
+Previsão da umidade do solo por dispositivo
+
+As sugestões olham só para trás (médias das janelas). Este módulo prevê, para
+cada dispositivo, a umidade das próximas `HORIZONTE` leituras e a chance de
+cada uma vir com UMIDADE_BAIXA, a partir da última leitura.
+
+- Atributos (`construir_atributos`): umidade atual e defasada
+  (`DEFASAGENS`), médias e desvios das últimas 6 e 24 leituras, variação da
+  última leitura, LDR, relé, UMIDADE_BAIXA atual e hora do dia (seno e
+  cosseno). Tudo vetorizado sobre as leituras em ordem (DISPOSITIVO,
+  TIMESTAMP), com somas acumuladas que não atravessam a troca de
+  dispositivo.
+- Modelo: regressão ridge com uma coluna de saída por horizonte (umidade e
+  UMIDADE_BAIXA), resolvida em forma fechada com NumPy. A previsão de todos
+  os dispositivos é uma única multiplicação de matrizes.
+- Treino fora dos dashboards, sobre o histórico da HISTORICO2024:
+
+      python -m irrigacao.previsao
+      python -m irrigacao.previsao --saida /tmp/modelo.npz --ridge 10
+
+  grava o modelo em `config.MODELO_PREVISAO` (NumPy .npz, sem pickle) e
+  mostra o erro nas últimas 20% das leituras contra a persistência (repetir
+  a umidade atual).
+- `Previsor` recarrega o arquivo quando ele muda (sem reiniciar os
+  dashboards) e guarda a previsão de cada versão dos dados. Um arquivo que
+  não pode ser lido (truncado, de outra versão) conta como modelo ausente,
+  com o motivo em `Previsor.erro`.
+
+O horizonte é contado em leituras; as horas previstas usam o intervalo
+mediano entre leituras do treino.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import zipfile
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from irrigacao import config
+from irrigacao.esquema import CAMPO_PADRAO, DISPOSITIVO_PADRAO, corrigir_unidades
+from irrigacao.regras import ordem_por_dispositivo
+
+HORIZONTE = 6
+DEFASAGENS = (1, 2, 3, 6, 12, 24)
+JANELAS = (6, 24)
+RIDGE_PADRAO = 1.0
+
+# Probabilidade prevista a partir da qual uma leitura conta como UMIDADE_BAIXA
+LIMIAR_UMIDADE_BAIXA = 0.5
+
+# Parte final (por TIMESTAMP) do histórico usada para medir o erro
+FRACAO_VALIDACAO = 0.2
+
+# Colunas lidas das fontes (TIMESTAMP é sempre incluído); UMIDADE_DHT em %
+COLUNAS_LEITURA = ['CAMPO', 'DISPOSITIVO', 'UMIDADE_DHT', 'LDR_VALOR', 'RELAY_STATUS', 'UMIDADE_BAIXA']
+
+# Previsões guardadas por um Previsor (versões de dados diferentes)
+MAXIMO_PREVISOES = 32
+
+Modelo = namedtuple('Modelo', [
+    'pesos',        # atributos x (2 * horizonte): umidade, depois UMIDADE_BAIXA
+    'media',        # média de cada atributo no treino
+    'escala',       # desvio de cada atributo no treino
+    'media_alvo',   # média de cada saída no treino
+    'atributos',    # nomes dos atributos, na ordem de `construir_atributos`
+    'horizonte',
+    'intervalo',    # segundos entre leituras (mediana do treino)
+    'info',         # dict: data do treino, linhas, erros da validação
+])
+
+
+def nomes_atributos():
+    nomes = ['UMIDADE']
+    nomes += [f'UMIDADE_ANTES_{k}' for k in DEFASAGENS]
+    nomes += ['VARIACAO']
+    for janela in JANELAS:
+        nomes += [f'UMIDADE_MEDIA_{janela}', f'UMIDADE_DESVIO_{janela}']
+    nomes += ['LDR', f'LDR_MEDIA_{JANELAS[0]}', 'RELAY', f'RELAY_MEDIA_{JANELAS[0]}',
+              'UMIDADE_BAIXA', 'HORA_SEN', 'HORA_COS']
+    return nomes
+
+
+def _leituras_ordenadas(df):
+    """Colunas de `COLUNAS_LEITURA` e TIMESTAMP em arrays, na ordem
+    (DISPOSITIVO, TIMESTAMP)."""
+    timestamps = df['TIMESTAMP'].to_numpy()
+    dispositivos = (df['DISPOSITIVO'].to_numpy() if 'DISPOSITIVO' in df
+                    else np.full(len(df), DISPOSITIVO_PADRAO))
+    ordem = ordem_por_dispositivo(timestamps, dispositivos)
+    leituras = {
+        'TIMESTAMP': timestamps[ordem].astype('int64'),
+        'DISPOSITIVO': dispositivos[ordem].astype('int64'),
+        'CAMPO': (df['CAMPO'].to_numpy()[ordem].astype('int64') if 'CAMPO' in df
+                  else np.full(len(df), CAMPO_PADRAO, dtype='int64')),
+    }
+    for coluna in ['UMIDADE_DHT', 'LDR_VALOR', 'RELAY_STATUS', 'UMIDADE_BAIXA']:
+        leituras[coluna] = df[coluna].to_numpy(dtype='float64')[ordem]
+    return leituras
+
+
+def _grupos(dispositivos):
+    """Início e fim (inclusive) do dispositivo de cada posição."""
+    n = len(dispositivos)
+    posicoes = np.arange(n)
+    novo = np.empty(n, dtype=bool)
+    novo[0] = True
+    np.not_equal(dispositivos[1:], dispositivos[:-1], out=novo[1:])
+    ultimo = np.empty(n, dtype=bool)
+    ultimo[-1] = True
+    ultimo[:-1] = novo[1:]
+    inicio = np.maximum.accumulate(np.where(novo, posicoes, 0))
+    fim = np.minimum.accumulate(np.where(ultimo, posicoes, n)[::-1])[::-1]
+    return posicoes, inicio, fim
+
+
+def _media_movel(valores, posicoes, inicio, janela):
+    """Média e desvio das `janela` leituras até cada posição (inclusive),
+    sem atravessar o início do dispositivo."""
+    centro = valores.mean() if len(valores) else 0.0
+    centrados = valores - centro
+    soma = np.concatenate(([0.0], np.cumsum(centrados)))
+    quadrados = np.concatenate(([0.0], np.cumsum(centrados * centrados)))
+    fim = posicoes + 1
+    comeco = np.maximum(fim - janela, inicio)
+    quantidade = fim - comeco
+    media = (soma[fim] - soma[comeco]) / quantidade
+    variancia = (quadrados[fim] - quadrados[comeco]) / quantidade - media * media
+    return media + centro, np.sqrt(np.maximum(variancia, 0.0))
+
+
+def construir_atributos(leituras, posicoes=None, inicio=None):
+    """Matriz de atributos (linhas x `nomes_atributos()`) de cada leitura de
+    `leituras` (arrays em ordem (DISPOSITIVO, TIMESTAMP)), só com ela e as
+    anteriores do mesmo dispositivo."""
+    if posicoes is None:
+        posicoes, inicio, _ = _grupos(leituras['DISPOSITIVO'])
+    umidade = leituras['UMIDADE_DHT']
+    colunas = [umidade]
+    colunas += [umidade[np.maximum(posicoes - k, inicio)] for k in DEFASAGENS]
+    colunas.append(umidade - colunas[1])
+    for janela in JANELAS:
+        colunas.extend(_media_movel(umidade, posicoes, inicio, janela))
+    luz = leituras['LDR_VALOR']
+    rele = leituras['RELAY_STATUS']
+    colunas += [luz, _media_movel(luz, posicoes, inicio, JANELAS[0])[0],
+                rele, _media_movel(rele, posicoes, inicio, JANELAS[0])[0],
+                leituras['UMIDADE_BAIXA']]
+    angulo = (leituras['TIMESTAMP'] % 86400) * (2 * np.pi / 86400)
+    colunas += [np.sin(angulo), np.cos(angulo)]
+    return np.column_stack(colunas)
+
+
+def _alvos(leituras, posicoes, fim, horizonte):
+    """Umidade e UMIDADE_BAIXA das `horizonte` leituras seguintes e as
+    posições que têm todas elas no mesmo dispositivo."""
+    validas = posicoes + horizonte <= fim
+    seguintes = np.minimum(posicoes[:, None] + np.arange(1, horizonte + 1), len(posicoes) - 1)
+    alvos = np.hstack((leituras['UMIDADE_DHT'][seguintes], leituras['UMIDADE_BAIXA'][seguintes]))
+    return alvos, validas
+
+
+def _ajustar(atributos, alvos, ridge):
+    media = atributos.mean(axis=0)
+    escala = atributos.std(axis=0)
+    escala[escala == 0] = 1.0
+    media_alvo = alvos.mean(axis=0)
+    x = (atributos - media) / escala
+    gram = x.T @ x + ridge * np.eye(x.shape[1])
+    pesos = np.linalg.solve(gram, x.T @ (alvos - media_alvo))
+    return pesos, media, escala, media_alvo
+
+
+def _aplicar(modelo, atributos):
+    saida = ((atributos - modelo.media) / modelo.escala) @ modelo.pesos + modelo.media_alvo
+    umidade = saida[:, :modelo.horizonte]
+    probabilidade = np.clip(saida[:, modelo.horizonte:], 0.0, 1.0)
+    return umidade, probabilidade
+
+
+def _erros(modelo, atributos, alvos):
+    """Erro absoluto médio da umidade e acerto de UMIDADE_BAIXA por
+    horizonte, do modelo e da persistência."""
+    umidade, probabilidade = _aplicar(modelo, atributos)
+    real_umidade = alvos[:, :modelo.horizonte]
+    real_baixa = alvos[:, modelo.horizonte:] >= 0.5
+    atual = atributos[:, [0]]
+    baixa_atual = atributos[:, [nomes_atributos().index('UMIDADE_BAIXA')]] >= 0.5
+    return {
+        'mae_umidade': np.abs(umidade - real_umidade).mean(axis=0).round(3).tolist(),
+        'mae_persistencia': np.abs(atual - real_umidade).mean(axis=0).round(3).tolist(),
+        'acerto_umidade_baixa': ((probabilidade >= LIMIAR_UMIDADE_BAIXA) == real_baixa).mean(axis=0).round(4).tolist(),
+        'acerto_persistencia': (baixa_atual == real_baixa).mean(axis=0).round(4).tolist(),
+    }
+
+
+def treinar(df, horizonte=HORIZONTE, ridge=RIDGE_PADRAO, fracao_validacao=FRACAO_VALIDACAO):
+    """`Modelo` ajustado às leituras de `df` (UMIDADE_DHT em %, qualquer
+    ordem). Os erros de `info['validacao']` vêm de um ajuste só com as
+    leituras antes do corte de validação; o modelo devolvido usa todas."""
+    leituras = _leituras_ordenadas(df)
+    posicoes, inicio, fim = _grupos(leituras['DISPOSITIVO'])
+    atributos = construir_atributos(leituras, posicoes, inicio)
+    alvos, validas = _alvos(leituras, posicoes, fim, horizonte)
+    if validas.sum() <= len(nomes_atributos()):
+        raise ValueError(f"Leituras insuficientes para treinar ({int(validas.sum())} com {horizonte} seguintes)")
+    seguidas = np.diff(leituras['TIMESTAMP'])[posicoes[:-1] < fim[:-1]]
+    intervalo = float(np.median(seguidas)) if len(seguidas) else float(config.INTERVALO_LEITURAS)
+
+    def ajustar(mascara):
+        return Modelo(*_ajustar(atributos[mascara], alvos[mascara], ridge),
+                      nomes_atributos(), horizonte, intervalo, {})
+
+    info = {
+        'treinado_em': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'linhas': int(validas.sum()),
+        'dispositivos': int(len(np.unique(leituras['DISPOSITIVO']))),
+        'ridge': ridge,
+    }
+    corte = np.quantile(leituras['TIMESTAMP'], 1 - fracao_validacao)
+    # O alvo da última leitura de treino não pode passar do corte
+    treino = validas & (leituras['TIMESTAMP'][np.minimum(posicoes + horizonte, fim)] < corte)
+    teste = validas & (leituras['TIMESTAMP'] >= corte)
+    if treino.sum() > len(nomes_atributos()) and teste.any():
+        info['validacao'] = _erros(ajustar(treino), atributos[teste], alvos[teste])
+        info['linhas_validacao'] = int(teste.sum())
+    return ajustar(validas)._replace(info=info)
+
+
+def salvar(modelo, caminho=None):
+    caminho = caminho or config.MODELO_PREVISAO
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    os.makedirs(diretorio, exist_ok=True)
+    # Grava ao lado e renomeia: um dashboard nunca lê o arquivo pela metade
+    temporario = f"{caminho}.tmp.npz"
+    np.savez(
+        temporario,
+        pesos=modelo.pesos,
+        media=modelo.media,
+        escala=modelo.escala,
+        media_alvo=modelo.media_alvo,
+        atributos=np.array(modelo.atributos),
+        horizonte=modelo.horizonte,
+        intervalo=modelo.intervalo,
+        info=json.dumps(modelo.info),
+    )
+    os.replace(temporario, caminho)
+    return caminho
+
+
+def carregar(caminho=None):
+    """`Modelo` gravado por `salvar`. Os atributos precisam ser os desta
+    versão do módulo."""
+    with np.load(caminho or config.MODELO_PREVISAO, allow_pickle=False) as arquivo:
+        modelo = Modelo(
+            pesos=arquivo['pesos'],
+            media=arquivo['media'],
+            escala=arquivo['escala'],
+            media_alvo=arquivo['media_alvo'],
+            atributos=[str(nome) for nome in arquivo['atributos']],
+            horizonte=int(arquivo['horizonte']),
+            intervalo=float(arquivo['intervalo']),
+            info=json.loads(str(arquivo['info'])),
+        )
+    if modelo.atributos != nomes_atributos():
+        raise ValueError("Modelo de previsão com atributos diferentes dos atuais; treine novamente")
+    return modelo
+
+
+def previsoes_vazias(horizonte=HORIZONTE):
+    colunas = {
+        'CAMPO': 'int64',
+        'DISPOSITIVO': 'int64',
+        'TIMESTAMP': 'int64',
+        'UMIDADE_ATUAL': 'float64',
+        'UMIDADE_PREVISTA': 'float64',
+        'UMIDADE_MINIMA': 'float64',
+        'PROBABILIDADE_BAIXA': 'float64',
+        'HORAS_ATE_BAIXA': 'float64',
+    }
+    colunas.update({f'UMIDADE_{h}': 'float64' for h in range(1, horizonte + 1)})
+    return pd.DataFrame({coluna: pd.Series(dtype=tipo) for coluna, tipo in colunas.items()})
+
+
+def prever(modelo, df):
+    """Previsão a partir da última leitura de cada dispositivo de `df`
+    (UMIDADE_DHT em %; as `max(DEFASAGENS)` leituras anteriores bastam), uma
+    linha por dispositivo:
+
+    - UMIDADE_1..UMIDADE_<horizonte>: umidade prevista em cada leitura seguinte
+    - UMIDADE_PREVISTA / UMIDADE_MINIMA: na última e a menor do horizonte
+    - PROBABILIDADE_BAIXA: maior probabilidade de UMIDADE_BAIXA no horizonte
+    - HORAS_ATE_BAIXA: horas até a primeira leitura prevista com
+      UMIDADE_BAIXA (NaN se nenhuma)
+    """
+    if len(df) == 0:
+        return previsoes_vazias(modelo.horizonte)
+    leituras = _leituras_ordenadas(df)
+    posicoes, inicio, fim = _grupos(leituras['DISPOSITIVO'])
+    # Só as leituras que entram nos atributos das últimas de cada dispositivo
+    recentes = posicoes >= fim - max(max(DEFASAGENS), max(JANELAS))
+    if not recentes.all():
+        leituras = {coluna: valores[recentes] for coluna, valores in leituras.items()}
+        posicoes, inicio, fim = _grupos(leituras['DISPOSITIVO'])
+    ultimas = np.flatnonzero(posicoes == fim)
+    atributos = construir_atributos(leituras, posicoes, inicio)[ultimas]
+    umidade, probabilidade = _aplicar(modelo, atributos)
+
+    baixa = probabilidade >= LIMIAR_UMIDADE_BAIXA
+    primeira = np.where(baixa.any(axis=1), baixa.argmax(axis=1) + 1, np.nan)
+    previsoes = pd.DataFrame({
+        'CAMPO': leituras['CAMPO'][ultimas],
+        'DISPOSITIVO': leituras['DISPOSITIVO'][ultimas],
+        'TIMESTAMP': leituras['TIMESTAMP'][ultimas],
+        'UMIDADE_ATUAL': atributos[:, 0],
+        'UMIDADE_PREVISTA': umidade[:, -1],
+        'UMIDADE_MINIMA': umidade.min(axis=1),
+        'PROBABILIDADE_BAIXA': probabilidade.max(axis=1),
+        'HORAS_ATE_BAIXA': primeira * modelo.intervalo / 3600,
+    })
+    for h in range(modelo.horizonte):
+        previsoes[f'UMIDADE_{h + 1}'] = umidade[:, h]
+    return previsoes
+
+
+class Previsor:
+    """Modelo do arquivo `caminho` (padrão `config.MODELO_PREVISAO`),
+    recarregado quando o arquivo muda, e as previsões das últimas
+    `MAXIMO_PREVISOES` versões de dados.
+
+    `modelo()` e `prever(df, versao)` devolvem None sem modelo gravado ou
+    com um arquivo que não pode ser lido (o motivo fica em `erro` até o
+    arquivo mudar); com a mesma `versao` (e o mesmo arquivo) `prever`
+    devolve a previsão guardada sem olhar `df`.
+    """
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or config.MODELO_PREVISAO
+        self._lock = threading.Lock()
+        self._modelo = None
+        self._assinatura = None
+        self._previsoes = OrderedDict()
+        self.erro = None
+
+    def modelo(self):
+        try:
+            estado = os.stat(self.caminho)
+        except FileNotFoundError:
+            with self._lock:
+                self._modelo = self._assinatura = self.erro = None
+                self._previsoes.clear()
+            return None
+        assinatura = (estado.st_mtime_ns, estado.st_size)
+        with self._lock:
+            if assinatura != self._assinatura:
+                self._previsoes.clear()
+                self._assinatura = assinatura
+                try:
+                    self._modelo = carregar(self.caminho)
+                    self.erro = None
+                except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile) as e:
+                    # Arquivo apagado ou trocado durante a leitura, truncado
+                    # ou de outra versão do módulo: só tenta de novo quando
+                    # ele mudar
+                    self._modelo = None
+                    self.erro = str(e)
+            return self._modelo
+
+    def prever(self, df, versao=None):
+        modelo = self.modelo()
+        if modelo is None:
+            return None
+        with self._lock:
+            if versao is not None and versao in self._previsoes:
+                self._previsoes.move_to_end(versao)
+                return self._previsoes[versao]
+        previsoes = prever(modelo, df)
+        if versao is not None:
+            with self._lock:
+                self._previsoes[versao] = previsoes
+                while len(self._previsoes) > MAXIMO_PREVISOES:
+                    self._previsoes.popitem(last=False)
+        return previsoes
+
+
+def _argumentos(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m irrigacao.previsao',
+        description="Treina o modelo de previsão da umidade com o histórico da HISTORICO2024.",
+    )
+    parser.add_argument('--saida', default=None,
+                        help="arquivo do modelo (padrão: IRRIGACAO_MODELO_PREVISAO)")
+    parser.add_argument('--horizonte', type=int, default=HORIZONTE,
+                        help="leituras previstas à frente (padrão: 6)")
+    parser.add_argument('--ridge', type=float, default=RIDGE_PADRAO,
+                        help="regularização da regressão")
+    parser.add_argument('--validacao', type=float, default=FRACAO_VALIDACAO,
+                        help="fração final do histórico usada para medir o erro")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from irrigacao.fonte_dados import criar_fonte
+
+    args = _argumentos(argv)
+    fonte = criar_fonte()
+    print(f"Lendo o histórico: {fonte.descricao}")
+    df = corrigir_unidades(fonte.carregar(0, colunas=COLUNAS_LEITURA))
+    modelo = treinar(df, args.horizonte, args.ridge, args.validacao)
+    caminho = salvar(modelo, args.saida)
+    print(f"{modelo.info['linhas']:,} leituras de {modelo.info['dispositivos']} dispositivo(s) -> {caminho}")
+    validacao = modelo.info.get('validacao')
+    if validacao:
+        print(f"Validação ({modelo.info['linhas_validacao']:,} leituras): erro médio da umidade "
+              f"(pontos %) e acerto de UMIDADE_BAIXA por leitura à frente")
+        print("  h   modelo  persistência   acerto  persistência")
+        for h in range(modelo.horizonte):
+            print(f"{h + 1:3d}  {validacao['mae_umidade'][h]:7.2f}  {validacao['mae_persistencia'][h]:12.2f}"
+                  f"   {validacao['acerto_umidade_baixa'][h]:6.1%}  {validacao['acerto_persistencia'][h]:12.1%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,536 @@
+"""
+Motor de regras de irrigação
+
+As regras das sugestões saem do código e vão para um arquivo JSON
+(`config.REGRAS`, por padrão `config/regras_irrigacao.json`), compartilhado
+pelos dois dashboards. Cada regra compara uma métrica (média de uma coluna
+em uma janela de tempo) com um limite:
+
+    {"id": "umidade_baixa", "categoria": "umidade", "metrica": "umidade_media",
+     "operador": "<", "limite": 45, "janela": "24h", "severidade": "alerta",
+     "mensagem": "Umidade média baixa ({valor:.1f}%)."}
+
+- `metrica`: uma das chaves de `METRICAS`
+- `operador`: "<", "<=", ">", ">=" ou "entre" (limite [mínimo, máximo],
+  inclusive)
+- `janela`: janela deslizante ("6h", "3d", segundos) terminando em cada
+  leitura, ou null para o período inteiro até a leitura (média acumulada)
+- `severidade`: "alerta", "info" ou "ok"
+
+`avaliar` calcula as métricas de todas as janelas de todas as leituras de
+cada dispositivo de uma vez, com somas acumuladas e `searchsorted` (sem laço
+por linha), e devolve as ocorrências em forma compacta: cada sequência de
+leituras seguidas de um dispositivo em que a regra vale vira uma linha
+(início, fim, leituras, valores mínimo/máximo/final e se continua ativa na
+última leitura). `sugestoes` resume as ocorrências ativas para os painéis.
+
+Para o histórico inteiro, `RegrasHistorico` avalia só as leituras novas a
+cada atualização: guarda de cada dispositivo as leituras ainda dentro da
+maior janela e as somas das anteriores (para as médias acumuladas), e
+estende as ocorrências que continuavam ativas.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from irrigacao import config
+from irrigacao.esquema import (
+    CAMPO_PADRAO, DISPOSITIVO_PADRAO, ESCALA_UMIDADE,
+    filtrar_escopo, marcas_por_dispositivo, posteriores_as_marcas,
+)
+
+Regra = namedtuple('Regra', [
+    'id', 'categoria', 'metrica', 'operador', 'limite', 'janela', 'severidade', 'mensagem',
+])
+
+# Métrica -> (coluna no formato armazenado, fator aplicado à média)
+METRICAS = {
+    'umidade_media': ('UMIDADE_DHT', 1 / ESCALA_UMIDADE),
+    'luz_media': ('LDR_VALOR', 1.0),
+    'taxa_irrigacao': ('RELAY_STATUS', 100.0),
+    'taxa_umidade_baixa': ('UMIDADE_BAIXA', 100.0),
+    'taxa_npk_ok': ('NPK_OK', 100.0),
+    'taxa_ph_ok': ('PH_OK', 100.0),
+}
+
+OPERADORES = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+}
+
+SEVERIDADES = ['alerta', 'info', 'ok']
+
+# Categorias na ordem dos painéis de sugestões
+CATEGORIAS = {
+    'umidade': "💧 Análise de Umidade",
+    'irrigacao': "🚿 Eficiência da Irrigação",
+    'ambiente': "☀️ Condições Ambientais",
+}
+
+COLUNAS_OCORRENCIAS = [
+    'REGRA', 'CAMPO', 'DISPOSITIVO', 'INICIO', 'FIM', 'LEITURAS',
+    'VALOR_MIN', 'VALOR_MAX', 'VALOR_FINAL', 'ATIVA',
+]
+
+# Ocorrências de uma avaliação e quantos dispositivos tinham leituras
+Avaliacao = namedtuple('Avaliacao', ['ocorrencias', 'dispositivos'])
+
+# Sugestão pronta para exibição: uma por regra ativa
+Sugestao = namedtuple('Sugestao', ['regra', 'categoria', 'severidade', 'mensagem', 'dispositivos'])
+
+# Mesmo peso da chave (DISPOSITIVO, TIMESTAMP) de irrigacao.carga
+_PESO_DISPOSITIVO = 10**10
+
+_UNIDADES_JANELA = {'s': 1, 'min': 60, 'h': 3600, 'd': 86400}
+
+
+def interpretar_janela(janela):
+    """Segundos de `janela` ("30min", "6h", "7d" ou um número), ou None
+    para o período inteiro."""
+    if janela is None or isinstance(janela, (int, float)):
+        return None if janela is None else int(janela)
+    encontrado = re.fullmatch(r'\s*(\d+)\s*(s|min|h|d)\s*', str(janela))
+    if not encontrado:
+        raise ValueError(f"Janela inválida: {janela!r}")
+    return int(encontrado.group(1)) * _UNIDADES_JANELA[encontrado.group(2)]
+
+
+def criar_regra(definicao):
+    """`Regra` validada a partir de um dict do arquivo de regras."""
+    try:
+        regra = Regra(
+            id=str(definicao['id']),
+            categoria=definicao.get('categoria', 'umidade'),
+            metrica=definicao['metrica'],
+            operador=definicao['operador'],
+            limite=definicao['limite'],
+            janela=interpretar_janela(definicao.get('janela')),
+            severidade=definicao.get('severidade', 'info'),
+            mensagem=definicao.get('mensagem', definicao['id']),
+        )
+    except KeyError as e:
+        raise ValueError(f"Regra sem o campo {e.args[0]!r}: {definicao!r}") from None
+    if regra.metrica not in METRICAS:
+        raise ValueError(f"Regra {regra.id!r}: métrica desconhecida {regra.metrica!r}")
+    if regra.operador == 'entre':
+        minimo, maximo = regra.limite
+        regra = regra._replace(limite=(float(minimo), float(maximo)))
+    elif regra.operador in OPERADORES:
+        regra = regra._replace(limite=float(regra.limite))
+    else:
+        raise ValueError(f"Regra {regra.id!r}: operador desconhecido {regra.operador!r}")
+    if regra.severidade not in SEVERIDADES:
+        raise ValueError(f"Regra {regra.id!r}: severidade desconhecida {regra.severidade!r}")
+    return regra
+
+
+def carregar_regras(caminho=None):
+    """Lista de `Regra` do arquivo JSON `caminho` (padrão `config.REGRAS`),
+    na ordem do arquivo."""
+    with open(caminho or config.REGRAS, encoding='utf-8') as arquivo:
+        definicoes = json.load(arquivo)
+    if isinstance(definicoes, dict):
+        definicoes = definicoes.get('regras', [])
+    regras = [criar_regra(definicao) for definicao in definicoes]
+    repetidos = {regra.id for regra in regras if [r.id for r in regras].count(regra.id) > 1}
+    if repetidos:
+        raise ValueError(f"Regras com id repetido: {sorted(repetidos)}")
+    return regras
+
+
+def colunas_necessarias(regras):
+    """Colunas que `avaliar` lê para as `regras` (TIMESTAMP é sempre
+    incluído pelas fontes)."""
+    colunas = {METRICAS[regra.metrica][0] for regra in regras}
+    return sorted(colunas) + ['CAMPO', 'DISPOSITIVO']
+
+
+def ocorrencias_vazias():
+    return pd.DataFrame({
+        'REGRA': pd.Series(dtype='object'),
+        'CAMPO': pd.Series(dtype='int64'),
+        'DISPOSITIVO': pd.Series(dtype='int64'),
+        'INICIO': pd.Series(dtype='int64'),
+        'FIM': pd.Series(dtype='int64'),
+        'LEITURAS': pd.Series(dtype='int64'),
+        'VALOR_MIN': pd.Series(dtype='float64'),
+        'VALOR_MAX': pd.Series(dtype='float64'),
+        'VALOR_FINAL': pd.Series(dtype='float64'),
+        'ATIVA': pd.Series(dtype='bool'),
+    })
+
+
+def ordem_por_dispositivo(timestamps, dispositivos):
+    """Índices que ordenam as leituras por DISPOSITIVO e depois TIMESTAMP.
+
+    As fontes entregam as linhas em ordem de TIMESTAMP (decrescente); com
+    ela aproveitada, basta uma ordenação estável pelo dispositivo, que para
+    inteiros pequenos é feita em tempo linear (radix)."""
+    indices = np.arange(len(timestamps))
+    diferencas = np.diff(timestamps)
+    if (diferencas <= 0).all():
+        indices = indices[::-1]
+    elif not (diferencas >= 0).all():
+        indices = np.argsort(timestamps, kind='stable')
+    dispositivos = dispositivos[indices]
+    if len(dispositivos) and dispositivos.min() >= 0 and dispositivos.max() < 2**16:
+        dispositivos = dispositivos.astype('uint16')
+    return indices[np.argsort(dispositivos, kind='stable')]
+
+
+def segmentos(mascara, novo, ultimo):
+    """Primeira e última posição de cada sequência de True de `mascara`,
+    sem atravessar a troca de dispositivo."""
+    anterior = np.empty_like(mascara)
+    anterior[0] = False
+    anterior[1:] = mascara[:-1]
+    seguinte = np.empty_like(mascara)
+    seguinte[-1] = False
+    seguinte[:-1] = mascara[1:]
+    inicios = np.flatnonzero(mascara & (novo | ~anterior))
+    fins = np.flatnonzero(mascara & (ultimo | ~seguinte))
+    return inicios, fins
+
+
+def _extremos(estendidos, inicios, fins):
+    """Mínimo e máximo de cada segmento [inicio, fim]; `estendidos` tem uma
+    posição a mais no fim, para o segmento que termina na última leitura."""
+    limites = np.empty(2 * len(inicios), dtype='int64')
+    limites[0::2] = inicios
+    limites[1::2] = fins + 1
+    return (np.minimum.reduceat(estendidos, limites)[0::2],
+            np.maximum.reduceat(estendidos, limites)[0::2])
+
+
+def _leituras_ordenadas(df, colunas):
+    """TIMESTAMP, DISPOSITIVO, CAMPO e as `colunas` de `df` em arrays, na
+    ordem (DISPOSITIVO, TIMESTAMP)."""
+    # Reordenações feitas nos tipos compactos das fontes, antes de converter
+    timestamps = df['TIMESTAMP'].to_numpy()
+    dispositivos = (df['DISPOSITIVO'].to_numpy() if 'DISPOSITIVO' in df
+                    else np.full(len(df), DISPOSITIVO_PADRAO))
+    ordem = ordem_por_dispositivo(timestamps, dispositivos)
+    leituras = {
+        'TIMESTAMP': timestamps[ordem].astype('int64'),
+        'DISPOSITIVO': dispositivos[ordem].astype('int64'),
+        'CAMPO': (df['CAMPO'].to_numpy()[ordem].astype('int64') if 'CAMPO' in df
+                  else np.full(len(df), CAMPO_PADRAO, dtype='int64')),
+    }
+    for coluna in colunas:
+        leituras[coluna] = df[coluna].to_numpy(dtype='float64')[ordem]
+    return leituras
+
+
+def _ocorrencias(leituras, regras, novas=None, bases=None):
+    """Ocorrências das `regras` nas leituras em ordem (DISPOSITIVO,
+    TIMESTAMP), sem ordem entre as linhas.
+
+    Com `novas` (máscara, um sufixo de cada dispositivo), só as posições
+    marcadas geram ocorrências; as demais são leituras guardadas de lotes
+    anteriores, que só entram nas janelas. `bases` (soma de cada coluna e
+    CONTAGEM, por posição) completa as médias acumuladas (janela None) com
+    as leituras anteriores às guardadas. A coluna CONTINUA marca as
+    ocorrências que começam na primeira leitura nova de um dispositivo com
+    leituras guardadas.
+    """
+    timestamps = leituras['TIMESTAMP']
+    dispositivos = leituras['DISPOSITIVO']
+    n = len(timestamps)
+    posicoes = np.arange(n)
+    troca = dispositivos[1:] != dispositivos[:-1]
+    novo = np.concatenate(([True], troca))
+    ultimo = np.concatenate((troca, [True]))
+    inicio_grupo = np.maximum.accumulate(np.where(novo, posicoes, 0))
+    chaves = dispositivos * _PESO_DISPOSITIVO + timestamps
+
+    # Posições que geram ocorrências; a primeira nova de cada dispositivo
+    # abre uma sequência mesmo depois das guardadas
+    if novas is None:
+        indices = posicoes
+        novo_avaliado = novo
+    else:
+        indices = np.flatnonzero(novas)
+        anterior_guardada = np.zeros(len(indices), dtype=bool)
+        anterior_guardada[indices > 0] = ~novas[indices[indices > 0] - 1]
+        novo_avaliado = novo[indices] | anterior_guardada
+    ultimo_avaliado = ultimo[indices]
+
+    # Somas acumuladas por coluna, início e inverso da contagem de leituras
+    # de cada janela, calculados uma vez e compartilhados pelas regras
+    acumulados = {}
+    janelas = {}
+
+    def metrica(nome, janela):
+        coluna, fator = METRICAS[nome]
+        if coluna not in acumulados:
+            soma = np.empty(n + 1)
+            soma[0] = 0.0
+            np.cumsum(leituras[coluna], out=soma[1:])
+            acumulados[coluna] = soma
+        if janela not in janelas:
+            if janela is None:
+                inicio = inicio_grupo
+            else:
+                # Janela (t - janela, t] de cada leitura do mesmo dispositivo
+                inicio = np.maximum(np.searchsorted(chaves, chaves - janela, side='right'), inicio_grupo)
+            contagem = posicoes + 1 - inicio
+            if janela is None and bases is not None:
+                contagem = contagem + bases['CONTAGEM']
+            janelas[janela] = (inicio, 1.0 / contagem)
+        soma = acumulados[coluna]
+        inicio, inverso = janelas[janela]
+        # Uma posição a mais como sentinela de `_extremos`
+        valores = np.empty(n + 1)
+        valores[-1] = 0.0
+        np.subtract(soma[1:], soma[inicio], out=valores[:-1])
+        if janela is None and bases is not None:
+            valores[:-1] += bases[coluna]
+        np.multiply(valores[:-1], inverso, out=valores[:-1])
+        if fator != 1.0:
+            valores[:-1] *= fator
+        if novas is not None:
+            valores = np.append(valores[indices], 0.0)
+        return valores
+
+    # Regras da mesma métrica e janela avaliadas juntas: cada série de
+    # valores existe só enquanto é usada
+    grupos = {}
+    for regra in regras:
+        grupos.setdefault((regra.metrica, regra.janela), []).append(regra)
+
+    partes = []
+    for (nome, janela), regras_grupo in grupos.items():
+        estendidos = metrica(nome, janela)
+        valores = estendidos[:-1]
+        for regra in regras_grupo:
+            if regra.operador == 'entre':
+                mascara = (valores >= regra.limite[0]) & (valores <= regra.limite[1])
+            else:
+                mascara = OPERADORES[regra.operador](valores, regra.limite)
+            inicios, fins = segmentos(mascara, novo_avaliado, ultimo_avaliado)
+            if not len(inicios):
+                continue
+            minimos, maximos = _extremos(estendidos, inicios, fins)
+            partes.append(pd.DataFrame({
+                'REGRA': regra.id,
+                'CAMPO': leituras['CAMPO'][indices[inicios]],
+                'DISPOSITIVO': dispositivos[indices[inicios]],
+                'INICIO': timestamps[indices[inicios]],
+                'FIM': timestamps[indices[fins]],
+                'LEITURAS': fins - inicios + 1,
+                'VALOR_MIN': minimos,
+                'VALOR_MAX': maximos,
+                'VALOR_FINAL': valores[fins],
+                'ATIVA': ultimo_avaliado[fins],
+                'CONTINUA': ~novo[indices[inicios]] & novo_avaliado[inicios],
+            }))
+    if not partes:
+        return ocorrencias_vazias().assign(CONTINUA=pd.Series(dtype='bool'))
+    return pd.concat(partes, ignore_index=True)
+
+
+def _ordenar(ocorrencias):
+    return ocorrencias.sort_values(['INICIO', 'DISPOSITIVO'], kind='stable').reset_index(drop=True)
+
+
+def avaliar(df, regras):
+    """Avalia as `regras` em todas as leituras de `df` (colunas de
+    `colunas_necessarias`, unidades armazenadas, qualquer ordem) e devolve
+    uma `Avaliacao` com as ocorrências em ordem de INICIO."""
+    if df.empty or not regras:
+        dispositivos = df['DISPOSITIVO'].nunique() if 'DISPOSITIVO' in df else 0
+        return Avaliacao(ocorrencias_vazias(), dispositivos)
+    leituras = _leituras_ordenadas(df, {METRICAS[regra.metrica][0] for regra in regras})
+    ocorrencias = _ocorrencias(leituras, regras).drop(columns='CONTINUA')
+    total_dispositivos = int(len(np.unique(leituras['DISPOSITIVO'])))
+    if len(ocorrencias) == 0:
+        return Avaliacao(ocorrencias_vazias(), total_dispositivos)
+    return Avaliacao(_ordenar(ocorrencias), total_dispositivos)
+
+
+class RegrasHistorico:
+    """Avaliação das `regras` em todo o histórico de uma fonte, mantida em
+    memória.
+
+    A primeira atualização lê o histórico inteiro uma vez; as seguintes só as
+    leituras recentes, com a mesma sobreposição e marca d'água por
+    dispositivo de `irrigacao.buffer`. O resultado é o de `avaliar` sobre o
+    histórico inteiro. `recarregar()` refaz do zero.
+    """
+
+    def __init__(self, fonte, regras, intervalo_minimo=0.0):
+        self.fonte = fonte
+        self.regras = regras
+        self.intervalo_minimo = intervalo_minimo
+        self.colunas = colunas_necessarias(regras)
+        self._metricas = sorted({METRICAS[regra.metrica][0] for regra in regras})
+        janelas = [regra.janela for regra in regras if regra.janela is not None]
+        self._maior_janela = max(janelas, default=0)
+        self._lock = threading.Lock()
+        self._ultima_busca = None
+        self._limpar()
+
+    def _limpar(self):
+        # Leituras ainda dentro da maior janela (e a última) de cada
+        # dispositivo, em ordem (DISPOSITIVO, TIMESTAMP)
+        self._guardadas = _leituras_ordenadas(
+            pd.DataFrame(columns=['TIMESTAMP', 'DISPOSITIVO', 'CAMPO'] + self._metricas), self._metricas
+        )
+        # Somas das colunas e CONTAGEM das leituras descartadas, por DISPOSITIVO
+        self._bases = pd.DataFrame(columns=self._metricas + ['CONTAGEM'], dtype='float64')
+        self._ocorrencias = ocorrencias_vazias()
+        self._dispositivos = set()
+        self.marcas = None  # maior TIMESTAMP já avaliado de cada DISPOSITIVO
+        self.marca_dagua = None
+        self.versao = 0
+
+    def recarregar(self):
+        """Descarta as ocorrências e reavalia o histórico inteiro."""
+        df = self.fonte.carregar(0, colunas=self.colunas)
+        with self._lock:
+            self._limpar()
+            self._incorporar(df)
+            self._ultima_busca = time.monotonic()
+        return len(df)
+
+    def atualizar(self, forcar=False):
+        """Avalia as leituras novas da fonte; devolve quantas chegaram."""
+        if self.marca_dagua is None:
+            return self.recarregar()
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima_busca < self.intervalo_minimo:
+            return 0
+        novos = self.fonte.carregar_desde(
+            self.marca_dagua - config.SOBREPOSICAO_INCREMENTAL, colunas=self.colunas
+        )
+        with self._lock:
+            self._ultima_busca = agora
+            novos = posteriores_as_marcas(novos, self.marcas)
+            if len(novos) == 0:
+                return 0
+            self._incorporar(novos)
+        return len(novos)
+
+    def anexar(self, df):
+        """Avalia leituras que não vieram da fonte (formato armazenado); as
+        que não passam da marca d'água do seu dispositivo ou estão fora do
+        escopo da fonte são ignoradas."""
+        df = filtrar_escopo(df, self.fonte.escopo)
+        with self._lock:
+            # Sem carga inicial, a primeira atualização já as trará
+            if self.marca_dagua is None:
+                return 0
+            df = posteriores_as_marcas(df, self.marcas)
+            if len(df) == 0:
+                return 0
+            self._incorporar(df)
+        return len(df)
+
+    def _incorporar(self, df):
+        # Chamado com o lock adquirido; as leituras de `df` são posteriores
+        # às guardadas do mesmo dispositivo
+        if len(df) == 0:
+            return
+        recebidas = _leituras_ordenadas(df, self._metricas)
+        quantidade = len(self._guardadas['TIMESTAMP'])
+        ordem = np.argsort(
+            np.concatenate((self._guardadas['DISPOSITIVO'], recebidas['DISPOSITIVO'])), kind='stable'
+        )
+        leituras = {
+            coluna: np.concatenate((self._guardadas[coluna], recebidas[coluna]))[ordem]
+            for coluna in self._guardadas
+        }
+        novas = (np.arange(len(ordem)) >= quantidade)[ordem]
+        dispositivos = leituras['DISPOSITIVO']
+        bases = {
+            coluna: self._bases[coluna].reindex(dispositivos, fill_value=0.0).to_numpy()
+            for coluna in self._bases.columns
+        }
+
+        if self.regras:
+            self._juntar(_ocorrencias(leituras, self.regras, novas, bases), np.unique(recebidas['DISPOSITIVO']))
+        self._descartar(leituras)
+        self._dispositivos.update(np.unique(recebidas['DISPOSITIVO']).tolist())
+        self.marcas = marcas_por_dispositivo(df, self.marcas)
+        self.marca_dagua = int(self.marcas.max())
+        self.versao += 1
+
+    def _juntar(self, ocorrencias, dispositivos):
+        # As ocorrências ativas dos dispositivos do lote terminaram na leitura
+        # anterior, a não ser que uma ocorrência nova da mesma regra as continue
+        guardadas = self._ocorrencias
+        ativas = guardadas['ATIVA'].to_numpy() & guardadas['DISPOSITIVO'].isin(dispositivos).to_numpy()
+        continuas = ocorrencias[ocorrencias['CONTINUA'].to_numpy()]
+        if len(continuas):
+            anteriores = guardadas[ativas].reset_index().merge(
+                continuas.reset_index(), on=['REGRA', 'DISPOSITIVO'], suffixes=('', '_nova')
+            )
+            estendidas = anteriores.set_index('index')
+            indices = estendidas.index.to_numpy()
+            guardadas = guardadas.copy()
+            guardadas.loc[indices, 'FIM'] = estendidas['FIM_nova'].to_numpy()
+            guardadas.loc[indices, 'LEITURAS'] += estendidas['LEITURAS_nova'].to_numpy()
+            guardadas.loc[indices, 'VALOR_MIN'] = np.minimum(
+                estendidas['VALOR_MIN'].to_numpy(), estendidas['VALOR_MIN_nova'].to_numpy())
+            guardadas.loc[indices, 'VALOR_MAX'] = np.maximum(
+                estendidas['VALOR_MAX'].to_numpy(), estendidas['VALOR_MAX_nova'].to_numpy())
+            guardadas.loc[indices, 'VALOR_FINAL'] = estendidas['VALOR_FINAL_nova'].to_numpy()
+            guardadas.loc[indices, 'ATIVA'] = estendidas['ATIVA_nova'].to_numpy()
+            ativas[indices] = False
+            ocorrencias = ocorrencias.drop(index=estendidas['index_nova'].to_numpy())
+        if ativas.any():
+            guardadas = guardadas.copy() if guardadas is self._ocorrencias else guardadas
+            guardadas.loc[ativas, 'ATIVA'] = False
+        ocorrencias = ocorrencias.drop(columns='CONTINUA')
+        if len(ocorrencias):
+            guardadas = pd.concat([guardadas, ocorrencias], ignore_index=True) if len(guardadas) else ocorrencias
+        self._ocorrencias = _ordenar(guardadas)
+
+    def _descartar(self, leituras):
+        # Mantém de cada dispositivo as leituras que ainda podem entrar em
+        # uma janela, (última - maior janela, última], e sempre a última
+        dispositivos = leituras['DISPOSITIVO']
+        timestamps = leituras['TIMESTAMP']
+        troca = dispositivos[1:] != dispositivos[:-1]
+        ultimas = np.flatnonzero(np.concatenate((troca, [True])))
+        grupos = np.cumsum(np.concatenate(([False], troca)))
+        limites = timestamps[ultimas][grupos] - self._maior_janela
+        manter = timestamps > limites
+        manter[ultimas] = True
+        if not manter.all():
+            descartadas = pd.DataFrame({coluna: leituras[coluna][~manter] for coluna in self._metricas})
+            descartadas['CONTAGEM'] = 1.0
+            somas = descartadas.groupby(dispositivos[~manter]).sum()
+            self._bases = somas if self._bases.empty else self._bases.add(somas, fill_value=0.0)
+        self._guardadas = {coluna: valores[manter] for coluna, valores in leituras.items()}
+
+    def avaliacao(self):
+        """`Avaliacao` do histórico, com as ocorrências em ordem de INICIO."""
+        with self._lock:
+            return Avaliacao(self._ocorrencias, len(self._dispositivos))
+
+
+def sugestoes(avaliacao, regras):
+    """Uma `Sugestao` por regra ativa na última leitura de pelo menos um
+    dispositivo, na ordem das `regras`. O valor da mensagem é a média dos
+    valores finais desses dispositivos."""
+    ativas = avaliacao.ocorrencias[avaliacao.ocorrencias['ATIVA']]
+    por_regra = ativas.groupby('REGRA')['VALOR_FINAL'].agg(['mean', 'size'])
+    resultado = []
+    for regra in regras:
+        if regra.id not in por_regra.index:
+            continue
+        valor, quantidade = por_regra.loc[regra.id]
+        mensagem = regra.mensagem.format(valor=valor)
+        if avaliacao.dispositivos > 1:
+            mensagem += f" ({int(quantidade)} de {avaliacao.dispositivos} dispositivos)"
+        resultado.append(Sugestao(regra.id, regra.categoria, regra.severidade, mensagem, int(quantidade)))
+    return resultado
@@ -0,0 +1,228 @@
+"""
+Execução do pacote de consultas de análise (scripts/consultas_analise.sql)
+
+O script era rodado à mão, uma consulta por vez, no SQL Developer. Aqui ele é
+lido como uma lista de consultas nomeadas (cada bloco "-- CONSULTA N: título"
+até o ";"), e as consultas, todas SELECTs independentes, rodam em paralelo
+em conexões do pool da fonte (`PoolConexoes`), até `paralelas` de uma vez.
+
+Cada resultado é gravado em Parquet no diretório `config.RESULTADOS_ANALISE`,
+com a versão dos dados (MAX(TIMESTAMP) e COUNT(*) da tabela, lidos a cada
+execução) e um resumo do SQL no nome do arquivo: rodar o pacote de novo sem
+leituras novas só lê os arquivos, sem ida ao banco. A contagem faz uma carga
+em lote ou uma leitura atrasada (TIMESTAMP menor que o máximo) também
+invalidar os resultados. Ao gravar uma versão
+nova, as anteriores da mesma consulta são apagadas.
+
+Funciona com o Oracle e com o banco SQLite local (IRRIGACAO_FONTE=sqlite);
+para o SQLite, `adaptar` troca as duas construções só do Oracle usadas no
+script (FETCH FIRST e TO_CHAR(TO_DATE(...) + TIMESTAMP/86400)).
+
+Uso, a partir da pasta `src/`:
+
+    python -m irrigacao.relatorio
+    python -m irrigacao.relatorio --consultas 2,7,12,13 --mostrar
+    IRRIGACAO_FONTE=sqlite python -m irrigacao.relatorio --paralelas 4 --forcar
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from irrigacao import config
+from irrigacao import metricas
+from irrigacao.consultas import Consulta, buscar, executar
+
+ConsultaAnalise = namedtuple('ConsultaAnalise', ['numero', 'titulo', 'descricao', 'sql'])
+
+# Resultado de uma consulta do pacote: de onde veio ('banco' ou 'arquivo')
+# e o tempo gasto em ms
+Resultado = namedtuple('Resultado', ['consulta', 'dados', 'origem', 'ms', 'arquivo'])
+
+_CABECALHO = re.compile(r'^--\s*CONSULTA\s+(\d+)\s*:\s*(.*?)\s*$', re.IGNORECASE)
+_FETCH_FIRST = re.compile(r'FETCH\s+FIRST\s+(\d+)\s+ROWS\s+ONLY', re.IGNORECASE)
+_DATA_HORA = re.compile(
+    r"TO_CHAR\(\s*TO_DATE\(\s*'1970-01-01'\s*,\s*'YYYY-MM-DD'\s*\)\s*\+\s*(\w+)\s*/\s*86400\s*,"
+    r"\s*'DD/MM/YYYY HH24:MI'\s*\)",
+    re.IGNORECASE,
+)
+
+
+def ler_consultas(caminho=None):
+    """Consultas do script `caminho` (padrão `config.SCRIPT_ANALISE`), na
+    ordem do arquivo. As linhas de comentário logo após o cabeçalho viram a
+    descrição."""
+    with open(caminho or config.SCRIPT_ANALISE, encoding='utf-8') as arquivo:
+        linhas = arquivo.read().splitlines()
+    consultas = []
+    atual = None
+    for linha in linhas:
+        cabecalho = _CABECALHO.match(linha)
+        if cabecalho:
+            atual = {'numero': int(cabecalho.group(1)), 'titulo': cabecalho.group(2),
+                     'descricao': [], 'sql': []}
+            consultas.append(atual)
+        elif atual is None:
+            continue
+        elif linha.lstrip().startswith('--'):
+            if not atual['sql']:
+                atual['descricao'].append(linha.lstrip()[2:].strip())
+        else:
+            atual['sql'].append(linha.rstrip())
+    resultado = []
+    for consulta in consultas:
+        sql = "\n".join(consulta['sql']).strip()
+        if not sql:
+            raise ValueError(f"Consulta {consulta['numero']} sem SQL")
+        resultado.append(ConsultaAnalise(
+            consulta['numero'], consulta['titulo'], " ".join(consulta['descricao']), sql.rstrip(';').rstrip(),
+        ))
+    numeros = [consulta.numero for consulta in resultado]
+    repetidos = sorted({numero for numero in numeros if numeros.count(numero) > 1})
+    if repetidos:
+        raise ValueError(f"Consultas com número repetido: {repetidos}")
+    return resultado
+
+
+def adaptar(sql, dialeto):
+    """SQL do script no `dialeto` do banco ('oracle' não muda nada)."""
+    if dialeto == 'oracle':
+        return sql
+    sql = _FETCH_FIRST.sub(r'LIMIT \1', sql)
+    return _DATA_HORA.sub(r"strftime('%d/%m/%Y %H:%M', \1, 'unixepoch')", sql)
+
+
+def _resumo_sql(sql, origem):
+    return hashlib.sha256(f"{origem}\n{' '.join(sql.split())}".encode('utf-8')).hexdigest()[:12]
+
+
+def caminho_resultado(diretorio, consulta, sql, origem, versao):
+    """Arquivo Parquet do resultado de `consulta` (com o `sql` já adaptado)
+    na `versao` dos dados."""
+    return os.path.join(
+        diretorio, f"consulta_{consulta.numero:02d}_{_resumo_sql(sql, origem)}_v{versao}.parquet"
+    )
+
+
+def _executar_consulta(fonte, consulta, diretorio, versao, forcar):
+    sql = adaptar(consulta.sql, fonte.dialeto)
+    caminho = caminho_resultado(diretorio, consulta, sql, fonte.origem, versao)
+    inicio = time.perf_counter()
+    if not forcar and os.path.exists(caminho):
+        dados = pd.read_parquet(caminho)
+        origem = 'arquivo'
+    else:
+        with metricas.cronometrar('consulta_analise', consulta=consulta.numero):
+            with fonte.pool.conexao() as conn:
+                dados = executar(conn, Consulta(sql, {}, None))
+        # Grava ao lado e renomeia: quem lê ao mesmo tempo nunca vê o arquivo pela metade
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        dados.to_parquet(temporario, index=False)
+        os.replace(temporario, caminho)
+        # Versões anteriores do mesmo SQL não serão mais pedidas
+        prefixo = caminho[:caminho.rindex('_v') + 2]
+        for antigo in glob.glob(glob.escape(prefixo) + '*.parquet'):
+            if antigo != caminho:
+                try:
+                    os.remove(antigo)
+                except FileNotFoundError:
+                    pass
+        origem = 'banco'
+    return Resultado(consulta, dados, origem, (time.perf_counter() - inicio) * 1000, caminho)
+
+
+def versao_dados(fonte):
+    """Versão dos dados para os nomes dos arquivos: "<MAX(TIMESTAMP)>-<COUNT(*)>",
+    lida direto do banco (sem o cache de consultas)."""
+    with fonte.pool.conexao() as conn:
+        _, linhas = buscar(conn, fonte.consultas.versao_contagem())
+    maximo, contagem = linhas[0]
+    return f"{maximo}-{contagem}"
+
+
+def executar_pacote(fonte, consultas=None, paralelas=None, diretorio=None, forcar=False):
+    """Roda as `consultas` (padrão: todas as do script) na `fonte` (Oracle
+    ou banco local), no máximo `paralelas` ao mesmo tempo (padrão: o
+    tamanho do pool), e devolve os `Resultado` na ordem das consultas.
+
+    Resultados já gravados para a versão atual dos dados são lidos do
+    arquivo; `forcar` consulta o banco mesmo assim.
+    """
+    if not hasattr(fonte, 'pool'):
+        raise ValueError("O pacote de consultas precisa de uma fonte com banco (IRRIGACAO_FONTE=oracle ou sqlite)")
+    consultas = ler_consultas() if consultas is None else consultas
+    diretorio = diretorio or config.RESULTADOS_ANALISE
+    os.makedirs(diretorio, exist_ok=True)
+    versao = versao_dados(fonte)
+    paralelas = paralelas or fonte.pool.maximo
+    with ThreadPoolExecutor(max_workers=max(1, min(paralelas, len(consultas) or 1))) as executor:
+        futuros = [
+            executor.submit(_executar_consulta, fonte, consulta, diretorio, versao, forcar)
+            for consulta in consultas
+        ]
+        return [futuro.result() for futuro in futuros]
+
+
+def _argumentos(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m irrigacao.relatorio',
+        description="Roda as consultas de scripts/consultas_analise.sql em paralelo, com resultados em Parquet.",
+    )
+    parser.add_argument('--script', default=None,
+                        help="arquivo SQL com as consultas (padrão: scripts/consultas_analise.sql)")
+    parser.add_argument('--consultas', default=None,
+                        help="números das consultas separados por vírgula (padrão: todas)")
+    parser.add_argument('--paralelas', type=int, default=None,
+                        help="consultas ao mesmo tempo (padrão: IRRIGACAO_POOL_MAXIMO)")
+    parser.add_argument('--diretorio', default=None,
+                        help="diretório dos resultados (padrão: IRRIGACAO_RESULTADOS_ANALISE)")
+    parser.add_argument('--forcar', action='store_true',
+                        help="consulta o banco mesmo com o resultado já gravado")
+    parser.add_argument('--mostrar', action='store_true',
+                        help="imprime as primeiras linhas de cada resultado")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from irrigacao.fonte_dados import criar_fonte
+
+    args = _argumentos(argv)
+    consultas = ler_consultas(args.script)
+    if args.consultas:
+        pedidas = {int(numero) for numero in args.consultas.split(',')}
+        desconhecidas = pedidas - {consulta.numero for consulta in consultas}
+        if desconhecidas:
+            print(f"Consultas inexistentes no script: {sorted(desconhecidas)}", file=sys.stderr)
+            return 2
+        consultas = [consulta for consulta in consultas if consulta.numero in pedidas]
+
+    fonte = criar_fonte()
+    if not hasattr(fonte, 'pool'):
+        print("O pacote de consultas precisa de IRRIGACAO_FONTE=oracle ou sqlite", file=sys.stderr)
+        return 2
+    print(f"{fonte.descricao}: {len(consultas)} consultas")
+    inicio = time.perf_counter()
+    resultados = executar_pacote(fonte, consultas, args.paralelas, args.diretorio, args.forcar)
+    for resultado in resultados:
+        print(f"{resultado.consulta.numero:3d}  {resultado.consulta.titulo:<50.50} "
+              f"{len(resultado.dados):>9,} linhas  {resultado.ms:9.1f} ms  ({resultado.origem})")
+        if args.mostrar:
+            print(resultado.dados.head(10).to_string(index=False))
+            print()
+    total = (time.perf_counter() - inicio) * 1000
+    do_banco = sum(resultado.origem == 'banco' for resultado in resultados)
+    print(f"Total: {total:.1f} ms, {do_banco} do banco, {len(resultados) - do_banco} dos arquivos "
+          f"em {args.diretorio or config.RESULTADOS_ANALISE}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
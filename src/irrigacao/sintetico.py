@@ -0,0 +1,207 @@
+"""
+Gerador de leituras sintéticas no formato de `dados_historicos_2024.csv`
+
+Produz, em lotes, quantas linhas forem pedidas com as mesmas colunas,
+unidades (UMIDADE_DHT em porcentagem) e distribuições do histórico real,
+segundo um `ModeloSintetico` ajustado ao CSV (`ajustar_modelo`):
+
+- umidade = perfil médio por hora do dia (mínimo de ~55% de madrugada,
+  máximo de ~85% à tarde) + ruído normal; UMIDADE_BAIXA abaixo de 60%
+- LDR normal em torno de 2000, limitado a 1000..3000
+- NPK (N, P, K e NPK_OK sempre iguais) em episódios longos, como no
+  histórico: cadeia de Markov com as probabilidades de troca observadas
+- BLOQUEIO_EXTERNO e PH_OK independentes, nas proporções observadas
+- RELAY_STATUS pela regra do controlador: umidade baixa, sem bloqueio
+  externo, NPK e pH OK
+
+Com isso as correlações entre flags e umidade (relé x umidade baixa, relé x
+NPK, etc.) saem iguais às do arquivo. Com vários dispositivos cada um tem
+seus próprios sorteios e um deslocamento fixo no nível de umidade (o
+dispositivo 1 fica no perfil do histórico), e as linhas saem em ordem de
+TIMESTAMP e depois de DISPOSITIVO. Cada lote é gerado de forma vetorizada
+e independente (semente por lote), então milhões de linhas são produzidas sem
+manter o conjunto inteiro em memória.
+"""
+
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from irrigacao.esquema import COLUNAS, FLAGS
+
+# Primeiro TIMESTAMP do histórico de 2024 e intervalo entre leituras (s)
+INICIO_PADRAO = 1704078000
+INTERVALO_PADRAO = 3600
+
+# Linhas do histórico de 2024 (escala 1x dos benchmarks)
+LINHAS_HISTORICO = 8784
+
+LIMIAR_UMIDADE_BAIXA = 60.0
+
+# Deslocamento máximo (pontos percentuais) da umidade de cada dispositivo
+DESLOCAMENTO_DISPOSITIVO = 8.0
+
+ModeloSintetico = namedtuple('ModeloSintetico', [
+    'perfil_umidade',   # média de UMIDADE_DHT (%) em cada hora do dia (UTC), 24 valores
+    'desvio_umidade',   # desvio do ruído em torno do perfil
+    'umidade_minima',
+    'umidade_maxima',
+    'media_ldr',
+    'desvio_ldr',
+    'prob_bloqueio',
+    'prob_ph_ok',
+    'prob_npk_sai',     # P(NPK_OK 1 -> 0) entre leituras consecutivas
+    'prob_npk_volta',   # P(NPK_OK 0 -> 1)
+])
+
+# Ajustado a dados_historicos_2024.csv com `ajustar_modelo`
+MODELO_PADRAO = ModeloSintetico(
+    perfil_umidade=(
+        59.52, 56.74, 55.57, 55.08, 55.56, 57.15, 59.18, 62.35, 66.25, 69.64, 73.57, 77.89,
+        80.62, 82.99, 84.93, 84.64, 84.33, 82.93, 80.57, 77.87, 74.07, 69.96, 65.94, 62.52,
+    ),
+    desvio_umidade=5.0,
+    umidade_minima=35.0,
+    umidade_maxima=101.3,
+    media_ldr=2000.0,
+    desvio_ldr=304.1,
+    prob_bloqueio=0.0976,
+    prob_ph_ok=0.9006,
+    prob_npk_sai=0.001035,
+    prob_npk_volta=0.008523,
+)
+
+
+def ajustar_modelo(df):
+    """`ModeloSintetico` com os parâmetros observados em `df` (colunas do
+    CSV, leituras em ordem de TIMESTAMP)."""
+    hora = (df['TIMESTAMP'] % 86400) // 3600
+    perfil = df.groupby(hora)['UMIDADE_DHT'].mean().reindex(range(24)).interpolate()
+    residuo = df['UMIDADE_DHT'] - hora.map(perfil)
+    npk = df['NPK_OK'].to_numpy()
+    anterior, seguinte = npk[:-1], npk[1:]
+    return ModeloSintetico(
+        perfil_umidade=tuple(round(float(v), 2) for v in perfil),
+        desvio_umidade=float(residuo.std()),
+        umidade_minima=float(df['UMIDADE_DHT'].min()),
+        umidade_maxima=float(df['UMIDADE_DHT'].max()),
+        media_ldr=float(df['LDR_VALOR'].mean()),
+        desvio_ldr=float(df['LDR_VALOR'].std()),
+        prob_bloqueio=float(df['BLOQUEIO_EXTERNO'].mean()),
+        prob_ph_ok=float(df['PH_OK'].mean()),
+        prob_npk_sai=float(((anterior == 1) & (seguinte == 0)).sum() / max((anterior == 1).sum(), 1)),
+        prob_npk_volta=float(((anterior == 0) & (seguinte == 1)).sum() / max((anterior == 0).sum(), 1)),
+    )
+
+
+def _episodios(rng, linhas, prob_sai, prob_volta):
+    # Cadeia de Markov 0/1 gerada por durações geométricas alternadas, com o
+    # estado inicial tirado da distribuição estacionária
+    proporcao_ligado = prob_volta / (prob_sai + prob_volta)
+    estado = rng.random() < proporcao_ligado
+    duracao_media = 1 / prob_sai + 1 / prob_volta
+    episodios = int(2 * linhas / duracao_media) + 16
+    valores = np.empty(0, dtype='int64')
+    while len(valores) < linhas:
+        probs = np.where((np.arange(episodios) % 2 == 0) == estado, prob_sai, prob_volta)
+        duracoes = rng.geometric(probs)
+        estados = ((np.arange(episodios) % 2 == 0) == estado).astype('int64')
+        valores = np.concatenate([valores, np.repeat(estados, duracoes)])
+        estado = not estado if episodios % 2 else estado
+    return valores[:linhas]
+
+
+def deslocamento_umidade(dispositivos):
+    """Deslocamento fixo da umidade de cada dispositivo (0 no dispositivo 1),
+    o mesmo em todos os lotes."""
+    return DESLOCAMENTO_DISPOSITIVO * np.sin((np.asarray(dispositivos) - 1) * 2.399963)
+
+
+def gerar_lote(inicio, linhas, intervalo=INTERVALO_PADRAO, semente=None, modelo=MODELO_PADRAO,
+               dispositivos=1, campos=1):
+    """DataFrame com `linhas` instantes de leitura a partir do TIMESTAMP
+    `inicio`, cada um com uma leitura de cada um dos `dispositivos`
+    (numerados a partir de 1 e distribuídos em `campos` campos)."""
+    rng = np.random.default_rng(semente)
+    forma = (linhas, dispositivos)
+    timestamps = inicio + np.arange(linhas, dtype='int64') * intervalo
+    ids = np.arange(1, dispositivos + 1)
+    # Perfil horário interpolado para qualquer intervalo entre leituras
+    horas = (timestamps % 86400) / 3600
+    perfil = np.asarray(modelo.perfil_umidade + modelo.perfil_umidade[:1])
+    umidade = (
+        np.interp(horas, np.arange(25), perfil)[:, None] + deslocamento_umidade(ids)
+        + rng.normal(0, modelo.desvio_umidade, forma)
+    )
+    umidade = np.round(np.clip(umidade, modelo.umidade_minima, modelo.umidade_maxima), 2)
+    ldr = np.rint(rng.normal(modelo.media_ldr, modelo.desvio_ldr, forma))
+    ldr = np.clip(ldr, 1000, 3000).astype('int64')
+
+    umidade_baixa = umidade < LIMIAR_UMIDADE_BAIXA
+    bloqueio = rng.random(forma) < modelo.prob_bloqueio
+    ph_ok = rng.random(forma) < modelo.prob_ph_ok
+    # Um trecho da cadeia de episódios para cada dispositivo
+    npk = _episodios(rng, linhas * dispositivos, modelo.prob_npk_sai, modelo.prob_npk_volta)
+    npk = npk.reshape(dispositivos, linhas).T.astype(bool)
+    relay = umidade_baixa & ~bloqueio & npk & ph_ok
+
+    df = pd.DataFrame({
+        'TIMESTAMP': np.repeat(timestamps, dispositivos),
+        'UMIDADE_DHT': umidade.ravel(),
+        'LDR_VALOR': ldr.ravel(),
+        'N_PRESENTE': npk.ravel(),
+        'P_PRESENTE': npk.ravel(),
+        'K_PRESENTE': npk.ravel(),
+        'BLOQUEIO_EXTERNO': bloqueio.ravel(),
+        'RELAY_STATUS': relay.ravel(),
+        'UMIDADE_BAIXA': umidade_baixa.ravel(),
+        'NPK_OK': npk.ravel(),
+        'PH_OK': ph_ok.ravel(),
+        'CAMPO': np.tile((ids - 1) * campos // dispositivos + 1, linhas),
+        'DISPOSITIVO': np.tile(ids, linhas),
+    })
+    df[FLAGS] = df[FLAGS].astype('int64')
+    return df[COLUNAS]
+
+
+def gerar_lotes(linhas, tamanho_lote=100_000, inicio=INICIO_PADRAO,
+                intervalo=INTERVALO_PADRAO, semente=0, apos=None, modelo=MODELO_PADRAO,
+                dispositivos=1, campos=1):
+    """Gera `linhas` leituras (divididas entre os `dispositivos`) em lotes de
+    até `tamanho_lote`, em ordem crescente de TIMESTAMP.
+
+    `apos` pula as leituras com TIMESTAMP menor que ele sem gerá-las
+    (retomada de uma carga interrompida; as do próprio `apos` são geradas de
+    novo, porque podem ter ficado pela metade entre os dispositivos); os
+    lotes seguintes são idênticos aos de uma geração completa com a mesma
+    semente.
+    """
+    instantes = linhas // dispositivos
+    por_lote = max(tamanho_lote // dispositivos, 1)
+    primeiro_lote = 0
+    if apos is not None and apos >= inicio:
+        primeiro_lote = int((apos - inicio) // intervalo) // por_lote
+    for indice in range(primeiro_lote, -(-instantes // por_lote)):
+        deslocamento = indice * por_lote
+        n = min(por_lote, instantes - deslocamento)
+        lote = gerar_lote(
+            inicio + deslocamento * intervalo, n, intervalo, semente=[semente, indice], modelo=modelo,
+            dispositivos=dispositivos, campos=campos,
+        )
+        if apos is not None:
+            lote = lote[lote['TIMESTAMP'] >= apos]
+        if len(lote):
+            yield lote
+
+
+def escrever_csv(caminho, linhas, tamanho_lote=100_000, **kwargs):
+    """Grava um CSV sintético lote a lote; devolve o número de linhas."""
+    total = 0
+    if os.path.exists(caminho):
+        os.remove(caminho)
+    for lote in gerar_lotes(linhas, tamanho_lote, **kwargs):
+        lote.to_csv(caminho, mode='a', header=total == 0, index=False)
+        total += len(lote)
+    return total
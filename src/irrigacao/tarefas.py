@@ -0,0 +1,258 @@
+"""
+Tarefas em segundo plano com prazo, cancelamento e progresso
+
+As cargas do Dash (primeira carga de um período, botão de recarga) rodavam
+dentro da requisição: com o Oracle lento ou fora do ar, o worker ficava preso
+até o timeout do driver. Com `FilaTarefas` a requisição só agenda a carga e
+volta; a carga roda em um pool de threads e os callbacks continuam servindo
+os últimos dados carregados enquanto ela não termina.
+
+- Uma tarefa por chave: agendar de novo a mesma chave enquanto ela está na
+  fila ou rodando devolve a tarefa existente
+- `Tarefa.informar(fração, mensagem)` publica o progresso e é também o ponto
+  em que uma tarefa cancelada (ou fora do prazo) é interrompida
+- Cada consulta ao banco feita de dentro de uma tarefa (`consultas.buscar`)
+  tem um tempo limite (`tempo_consulta`, nunca além do prazo da tarefa);
+  esgotado o tempo, ou cancelada a tarefa, a consulta é interrompida no
+  driver (`cancel()` no cx_Oracle, `interrupt()` no SQLite) e a conexão é
+  descartada pelo pool
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+ESTADOS = {
+    'na_fila': "Na fila",
+    'rodando': "Carregando",
+    'concluida': "Concluída",
+    'falhou': "Falhou",
+    'cancelada': "Cancelada",
+    'expirada': "Tempo esgotado",
+}
+
+_atual = threading.local()
+
+
+class TarefaInterrompida(Exception):
+    """A tarefa foi cancelada ou passou do prazo (ou uma consulta dela
+    passou do tempo limite)."""
+
+
+def tarefa_atual():
+    """Tarefa rodando nesta thread (None fora de uma `FilaTarefas`)."""
+    return getattr(_atual, 'tarefa', None)
+
+
+class Tarefa:
+    """Estado de uma execução agendada em uma `FilaTarefas`.
+
+    `estado` é uma das chaves de `ESTADOS`; `progresso` vai de 0 a 1 e
+    `mensagem` descreve a etapa atual (ou o erro, se falhou).
+    """
+
+    def __init__(self, chave, prazo=None, tempo_consulta=None):
+        self.chave = chave
+        self.prazo = prazo
+        self.tempo_consulta = tempo_consulta
+        self.estado = 'na_fila'
+        self.progresso = 0.0
+        self.mensagem = ESTADOS['na_fila']
+        self.erro = None
+        self.resultado = None
+        self.criada = time.monotonic()
+        self.inicio = None
+        self.fim = None
+        self._lock = threading.Lock()
+        self._terminada = threading.Event()
+        self._motivo = None  # 'cancelada' ou 'expirada', quando interrompida
+        self._interromper = None  # interrompe a consulta em andamento
+
+    @property
+    def ativa(self):
+        return self.estado in ('na_fila', 'rodando')
+
+    @property
+    def segundos(self):
+        inicio = self.inicio if self.inicio is not None else self.criada
+        return (self.fim if self.fim is not None else time.monotonic()) - inicio
+
+    def restante(self):
+        """Segundos até o prazo (None sem prazo)."""
+        if self.prazo is None:
+            return None
+        return self.prazo - (time.monotonic() - self.criada)
+
+    def cancelar(self, motivo='cancelada'):
+        """Pede a interrupção da tarefa; a consulta em andamento, se houver,
+        é interrompida no driver."""
+        with self._lock:
+            if self._motivo is None:
+                self._motivo = motivo
+            self._interromper_consulta()
+
+    def _interromper_consulta(self):
+        # Chamado com o lock adquirido: `consulta` só libera a conexão depois
+        # de retomar o lock, então a interrupção nunca alcança a conexão já
+        # devolvida ao pool (e usada por outra thread)
+        if self._interromper is not None:
+            try:
+                self._interromper()
+            except Exception:
+                pass
+
+    def verificar(self):
+        """Levanta `TarefaInterrompida` se a tarefa foi cancelada ou passou
+        do prazo."""
+        restante = self.restante()
+        if restante is not None and restante <= 0:
+            self.cancelar('expirada')
+        if self._motivo is not None:
+            raise TarefaInterrompida(ESTADOS[self._motivo])
+
+    def informar(self, progresso, mensagem):
+        self.verificar()
+        self.progresso = progresso
+        self.mensagem = mensagem
+
+    @contextmanager
+    def consulta(self, conn):
+        """Executa o bloco (uma consulta em `conn`) com o tempo limite da
+        tarefa, interrompendo-o se ela for cancelada."""
+        limite = self.tempo_consulta
+        restante = self.restante()
+        if restante is not None:
+            limite = restante if limite is None else min(limite, restante)
+        interromper_conn = getattr(conn, 'cancel', None) or getattr(conn, 'interrupt', None)
+        esgotado = threading.Event()
+
+        def esgotar():
+            with self._lock:
+                if self._interromper is interromper_conn:
+                    esgotado.set()
+                    self._interromper_consulta()
+
+        with self._lock:
+            self._interromper = interromper_conn
+        temporizador = None
+        if limite is not None:
+            temporizador = threading.Timer(max(limite, 0.0), esgotar)
+            temporizador.daemon = True
+            temporizador.start()
+        try:
+            self.verificar()
+            yield
+        except Exception as e:
+            if esgotado.is_set():
+                raise TarefaInterrompida(f"Consulta interrompida após {round(limite, 2):g} s") from e
+            if self._motivo is not None:
+                raise TarefaInterrompida(ESTADOS[self._motivo]) from e
+            raise
+        finally:
+            with self._lock:
+                self._interromper = None
+            if temporizador is not None:
+                temporizador.cancel()
+
+    def esperar(self, timeout=None):
+        """Espera a tarefa terminar; devolve False se `timeout` passou antes."""
+        return self._terminada.wait(timeout)
+
+    def resumo(self):
+        """Estado em dict serializável (para os eventos e a tela)."""
+        return {
+            'chave': self.chave,
+            'estado': self.estado,
+            'progresso': round(self.progresso, 3),
+            'mensagem': self.mensagem,
+            'segundos': round(self.segundos, 1),
+        }
+
+
+class FilaTarefas:
+    """Pool de `maximo` threads que roda as tarefas agendadas, uma por chave.
+
+    - `prazo`: segundos desde o agendamento até a tarefa ser interrompida
+    - `tempo_consulta`: tempo limite de cada consulta feita pela tarefa
+    - `ao_terminar(tarefa)`, se informado, é chamado no fim de cada tarefa
+      (concluída ou não), na thread da tarefa
+    """
+
+    def __init__(self, maximo=2, prazo=None, tempo_consulta=None, ao_terminar=None):
+        self.prazo = prazo
+        self.tempo_consulta = tempo_consulta
+        self.ao_terminar = ao_terminar
+        self._executor = ThreadPoolExecutor(max_workers=maximo, thread_name_prefix='tarefa')
+        self._lock = threading.Lock()
+        self._tarefas = {}  # chave -> última tarefa agendada
+
+    def agendar(self, chave, funcao, *args, prazo=None):
+        """Agenda `funcao(tarefa, *args)` e devolve a `Tarefa` (a que já
+        estava na fila ou rodando para a mesma chave, se houver)."""
+        with self._lock:
+            atual = self._tarefas.get(chave)
+            if atual is not None and atual.ativa:
+                return atual
+            tarefa = Tarefa(chave, prazo or self.prazo, self.tempo_consulta)
+            self._tarefas[chave] = tarefa
+        self._executor.submit(self._rodar, tarefa, funcao, args)
+        return tarefa
+
+    def _rodar(self, tarefa, funcao, args):
+        tarefa.inicio = time.monotonic()
+        _atual.tarefa = tarefa
+        try:
+            tarefa.verificar()
+            tarefa.estado = 'rodando'
+            tarefa.mensagem = ESTADOS['rodando']
+            tarefa.resultado = funcao(tarefa, *args)
+            tarefa.progresso = 1.0
+            tarefa.mensagem = ESTADOS['concluida']
+            tarefa.estado = 'concluida'
+        except TarefaInterrompida as e:
+            tarefa.erro = str(e)
+            tarefa.mensagem = str(e)
+            tarefa.estado = tarefa._motivo or 'expirada'
+        except Exception as e:
+            tarefa.erro = f"{type(e).__name__}: {e}"
+            tarefa.mensagem = tarefa.erro
+            tarefa.estado = 'falhou'
+        finally:
+            _atual.tarefa = None
+            tarefa.fim = time.monotonic()
+        if self.ao_terminar is not None:
+            try:
+                self.ao_terminar(tarefa)
+            except Exception:
+                pass
+        tarefa._terminada.set()
+
+    def tarefa(self, chave):
+        """Última tarefa agendada para a chave (None se nenhuma)."""
+        with self._lock:
+            return self._tarefas.get(chave)
+
+    def cancelar(self, chave):
+        tarefa = self.tarefa(chave)
+        if tarefa is not None and tarefa.ativa:
+            tarefa.cancelar()
+            return True
+        return False
+
+    def ativas(self):
+        with self._lock:
+            return [tarefa for tarefa in self._tarefas.values() if tarefa.ativa]
+
+    def limpar(self):
+        """Esquece as tarefas já terminadas."""
+        with self._lock:
+            for chave in [chave for chave, tarefa in self._tarefas.items() if not tarefa.ativa]:
+                del self._tarefas[chave]
+
+    def encerrar(self, cancelar=True):
+        """Cancela as tarefas ativas (se `cancelar`) e encerra o pool."""
+        if cancelar:
+            for tarefa in self.ativas():
+                tarefa.cancelar()
+        self._executor.shutdown(wait=False, cancel_futures=True)
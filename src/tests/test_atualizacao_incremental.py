@@ -0,0 +1,69 @@
+"""
+Leituras atrasadas de outro dispositivo com o cache de consultas ligado
+
+Rodar a partir da pasta `src/`: `python -m pytest -q tests`
+"""
+
+import pytest
+
+from irrigacao import config
+from irrigacao.banco_local import conectar_local, criar_banco_local
+from irrigacao.buffer import BufferJanela
+from irrigacao.cache import CacheCompartilhado
+from irrigacao.consolidacao import Consolidacoes
+from irrigacao.episodios import Episodios
+from irrigacao.esquema import COLUNAS, TABELA
+from irrigacao.fonte_dados import FonteBancoLocal
+
+
+@pytest.fixture
+def fonte(tmp_path, monkeypatch):
+    # Versão dos dados relida a cada consulta: só a chave do cache decide
+    monkeypatch.setattr(config, 'CACHE_VALIDADE_VERSAO', 0)
+    caminho = str(tmp_path / 'historico.sqlite')
+    criar_banco_local(caminho)
+    return FonteBancoLocal(caminho, cache=CacheCompartilhado(str(tmp_path / 'cache.sqlite')))
+
+
+def inserir_atrasada(fonte, segundos=10):
+    """Grava uma leitura do dispositivo 2 `segundos` antes da mais recente
+    (o MAX(TIMESTAMP) não muda) e devolve o seu TIMESTAMP."""
+    conn = conectar_local(fonte.caminho)
+    try:
+        colunas = ", ".join(COLUNAS)
+        ultima = conn.execute(
+            f"SELECT {colunas} FROM {TABELA} ORDER BY TIMESTAMP DESC LIMIT 1"
+        ).fetchone()
+        linha = dict(zip(COLUNAS, ultima), TIMESTAMP=ultima[COLUNAS.index('TIMESTAMP')] - segundos, DISPOSITIVO=2)
+        marcadores = ", ".join("?" for _ in COLUNAS)
+        conn.execute(f"INSERT INTO {TABELA} ({colunas}) VALUES ({marcadores})", [linha[c] for c in COLUNAS])
+        conn.commit()
+    finally:
+        conn.close()
+    return linha['TIMESTAMP']
+
+
+def test_buffer_recebe_leitura_atrasada(fonte):
+    buffer = BufferJanela(fonte, '24h')
+    buffer.atualizar()
+    # A primeira busca incremental deixa a mesma consulta pronta para o cache
+    assert buffer.atualizar(forcar=True) == 0
+    timestamp = inserir_atrasada(fonte)
+    assert buffer.atualizar(forcar=True) == 1
+    dados = buffer.dados()
+    assert ((dados['TIMESTAMP'] == timestamp) & (dados['DISPOSITIVO'] == 2)).sum() == 1
+    assert buffer.atualizar(forcar=True) == 0
+
+
+def test_consolidacoes_e_episodios_recebem_leitura_atrasada(fonte):
+    consolidacoes = Consolidacoes(fonte)
+    episodios = Episodios(fonte)
+    consolidacoes.atualizar()
+    episodios.atualizar()
+    assert consolidacoes.atualizar(forcar=True) == 0
+    assert episodios.atualizar(forcar=True) == 0
+    total = consolidacoes.agregados(0)['TOTAL_MEDICOES']
+    inserir_atrasada(fonte)
+    assert consolidacoes.atualizar(forcar=True) == 1
+    assert consolidacoes.agregados(0)['TOTAL_MEDICOES'] == total + 1
+    assert episodios.atualizar(forcar=True) == 1
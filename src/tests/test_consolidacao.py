@@ -0,0 +1,43 @@
+"""
+Janelas de tempo das consolidações com leituras fora da hora cheia
+
+Rodar a partir da pasta `src/`: `python -m pytest -q tests`
+"""
+
+import pandas as pd
+import pytest
+
+from irrigacao import config
+from irrigacao.banco_local import criar_banco_local
+from irrigacao.consolidacao import Consolidacoes
+from irrigacao.fonte_dados import FonteBancoLocal, FonteLocal
+
+
+@pytest.fixture
+def arquivo(tmp_path):
+    # Três dispositivos defasados em 20 minutos: as horas das bordas das
+    # janelas têm leituras dos dois lados do corte
+    df = pd.read_csv(config.ARQUIVO_LOCAL).tail(24 * 30)
+    partes = [
+        df.assign(TIMESTAMP=df['TIMESTAMP'] + 1200 * indice, DISPOSITIVO=indice + 1)
+        for indice in range(3)
+    ]
+    caminho = str(tmp_path / 'historico.csv')
+    pd.concat(partes).to_csv(caminho, index=False)
+    return caminho
+
+
+@pytest.mark.parametrize('tipo', ['local', 'sqlite'])
+@pytest.mark.parametrize('filtro', ['24h', '3d', '7d'])
+def test_janela_corta_horas_com_varios_dispositivos(arquivo, tmp_path, tipo, filtro):
+    if tipo == 'local':
+        fonte = FonteLocal(arquivo)
+    else:
+        caminho = str(tmp_path / 'historico.sqlite')
+        criar_banco_local(caminho, arquivo=arquivo)
+        fonte = FonteBancoLocal(caminho, cache=None)
+    esperado = fonte.agregados(filtro)
+    obtido = Consolidacoes(fonte).agregados(filtro)
+    assert obtido['TOTAL_MEDICOES'] == esperado['TOTAL_MEDICOES']
+    for chave in ['UMIDADE_MEDIA', 'UMIDADE_MIN', 'UMIDADE_MAX', 'LDR_MEDIA', 'TS_MIN', 'TS_MAX']:
+        assert obtido[chave] == pytest.approx(esperado[chave])